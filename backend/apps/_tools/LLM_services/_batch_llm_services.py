@@ -1,6 +1,7 @@
 from typing import List
 from ._generic_llm_services import GenericLLMService, LLMRequest
 from ._llm_data_types import BatchResult, LLMRequest
+from ._llm_scheduler import llm_work_context, BATCH
 import asyncio, logging, json
 
 
@@ -10,11 +11,12 @@ logger = logging.getLogger(__name__)
 class BatchLLMService(GenericLLMService):
     """批量LLM服务实现"""
     
-    async def batch_process(self, requests: List[LLMRequest], max_concurrent: int = 10, repeat: int = 1) -> List[BatchResult]:
+    async def batch_process(self, requests: List[LLMRequest], max_concurrent: int = 10, repeat: int = 1, priority: str = BATCH) -> List[BatchResult]:
         """
         批量处理LLM请求
         :param requests: LLM请求列表
         :param max_concurrent: 最大并发数量，默认为30
+        :param priority: 调度优先级，默认batch（与交互式请求竞争槽位时排在后面）
         :return: 处理结果列表
         """
         try:
@@ -72,7 +74,8 @@ class BatchLLMService(GenericLLMService):
                     for idx, request in enumerate(requests)]
 
             # 使用 asyncio 并发执行任务
-            results = await asyncio.gather(*tasks, return_exceptions=False)
+            with llm_work_context(priority=priority):
+                results = await asyncio.gather(*tasks, return_exceptions=False)
 
             return results
 
@@ -1,5 +1,8 @@
 from typing import Optional, Any, Dict, Callable, List
 from ._llm_data_types import LLMRequest, LLMConfig
+from ._llm_cache import LLMResponseCache
+from ._llm_telemetry import LLMCallRecord, LLMTelemetry, TelemetryCallbackHandler, count_tokens
+from ._llm_scheduler import LLMScheduler
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
 from langchain.callbacks import StreamingStdOutCallbackHandler
@@ -8,7 +11,8 @@ from langchain.callbacks.base import BaseCallbackHandler
 from concurrent.futures import ThreadPoolExecutor
 from openai import RateLimitError, APIError
 from requests.exceptions import Timeout
-import os, logging, tiktoken
+from asgiref.sync import sync_to_async
+import os, time, logging
 
 
 logger = logging.getLogger(__name__)
@@ -71,6 +75,9 @@ class RedisStreamingCallbackHandler(BaseCallbackHandler):
 
 class GenericLLMService:
     """通用LLM服务实现"""
+
+    SYSTEM_ROLE = "你是一个专业的招标文档分析助手，帮助用户分析文档的结构和内容。"
+
     def __init__(
         self,
         config: Optional[LLMConfig] = None,
@@ -93,15 +100,28 @@ class GenericLLMService:
             api_key=self.config.api_key or os.getenv("ALIBABA_API_KEY"),
             base_url=self.config.base_url,
             timeout=self.config.timeout,
+            stream_usage=True,
         )
 
-    async def process(self, request: LLMRequest, streaming_callback=None) -> Any:
+    async def process(self, request: LLMRequest, streaming_callback=None, bypass_cache: bool = False) -> Any:
         """
         处理LLM请求
         :param request: LLM请求对象
         :param streaming_callback: 流式处理回调
+        :param bypass_cache: 为True时跳过响应缓存（不读取，但仍写入新结果）
         :return: 处理结果
         """
+        record = LLMCallRecord.from_context(self.config.llm_model_name)
+        try:
+            return await self._process(request, record, streaming_callback, bypass_cache)
+        except BaseException:
+            record.outcome = "error"
+            raise
+        finally:
+            # 汇总写入使用同步的django_redis连接，放到线程中执行
+            await sync_to_async(LLMTelemetry.record)(record)
+
+    async def _process(self, request: LLMRequest, record: LLMCallRecord, streaming_callback=None, bypass_cache: bool = False) -> Any:
         try:
             if not self.prompt_template:
                 raise ValueError("Prompt template is required")
@@ -109,7 +129,7 @@ class GenericLLMService:
             # 创建聊天提示模板
             prompt = ChatPromptTemplate.from_messages([
                 SystemMessagePromptTemplate.from_template(
-                    "你是一个专业的招标文档分析助手，帮助用户分析文档的结构和内容。"
+                    self.SYSTEM_ROLE
                 ),
                 HumanMessagePromptTemplate.from_template(
                     self.prompt_template,
@@ -129,22 +149,53 @@ class GenericLLMService:
             formatted_prompt = await prompt.ainvoke(request_dict)
             logger.info(f"Final prompt:\n{formatted_prompt}")
 
-            input_tokens = self._count_tokens(str(formatted_prompt))
+            input_tokens = count_tokens(str(formatted_prompt))
+            record.input_tokens = input_tokens
             logger.info(f"Input tokens: {input_tokens}")
 
+            # 响应缓存（按模型参数 + 渲染后的prompt）
+            cache_key = None
+            if self.config.cache_enabled:
+                cache_key = LLMResponseCache.make_key(self.config, self.SYSTEM_ROLE, formatted_prompt.to_string())
+                if bypass_cache:
+                    LLMResponseCache.record_bypass()
+                else:
+                    cached = await LLMResponseCache.get(cache_key, input_tokens=input_tokens)
+                    if cached is not None:
+                        logger.info(f"命中LLM响应缓存: {cache_key}")
+                        record.cache_hit = True
+                        record.outcome = "cache_hit"
+                        if streaming_callback:
+                            # 把完整结果作为一次输出推送给流式回调，保持下游的流式状态一致
+                            streaming_callback.on_llm_start({}, [])
+                            streaming_callback.on_llm_new_token(cached)
+                            streaming_callback.on_llm_end(None)
+                        return cached
+
             # 配置回调
-            callbacks = []
+            telemetry = TelemetryCallbackHandler()
+            callbacks = [telemetry]
             if streaming_callback:
                 callbacks.append(streaming_callback)
             elif self.config.streaming:
                 callbacks.append(StreamingStdOutCallbackHandler())
             
             # 执行链 （callbacks 在这里通过chain_config传递给chain，被调用）
-            chain_config = {"callbacks": callbacks} if callbacks else {}
-            result = await chain.ainvoke(request_dict, config=chain_config)
-
-            output_tokens = self._count_tokens(str(result))
-            logger.info(f"Output tokens: {output_tokens}")
+            chain_config = {"callbacks": callbacks}
+            # 并发槽位按优先级和项目公平排队（见 _llm_scheduler）
+            async with LLMScheduler.slot():
+                start = time.monotonic()
+                result = await chain.ainvoke(request_dict, config=chain_config)
+            record.latency = time.monotonic() - start
+            record.ttft = telemetry.ttft
+
+            # 优先使用模型返回的usage，没有时再本地估算输出token
+            if not record.set_usage(telemetry.usage):
+                record.output_tokens = count_tokens(str(result))
+            logger.info(f"Output tokens: {record.output_tokens} ({record.usage_source})")
+
+            if cache_key:
+                await LLMResponseCache.set(cache_key, result)
 
             return result
 
@@ -166,9 +217,3 @@ class GenericLLMService:
             logger.error(f"未预期的错误: {str(e)}")
             raise
 
-
-    def _count_tokens(self, text: str) -> int:
-        """计算文本的token数量"""
-        encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")
-        return len(encoding.encode(text))
-
@@ -0,0 +1,153 @@
+from typing import Dict, Any, Optional
+from pathlib import Path
+from django.conf import settings
+from django.core.cache import cache
+from asgiref.sync import sync_to_async
+from ._llm_data_types import LLMConfig
+import asyncio, hashlib, json, re, time, logging
+
+
+logger = logging.getLogger(__name__)
+
+
+CACHE_KEY_PREFIX = "llm_cache"
+
+
+class LLMResponseCache:
+    """
+    LLM响应缓存（按prompt指纹）
+
+    - 键：hash(模型名, temperature, top_p, 系统角色, 渲染后的prompt)
+    - 存储：Django cache（django_redis，带TTL），配置了 LLM_CACHE_DIR 时同时持久化到磁盘
+    - get/set 在异步调用链中使用：Django cache 经 sync_to_async 调用，磁盘读写放到线程中，不阻塞事件循环
+    """
+
+    _stats: Dict[str, Any] = {
+        "hits": 0,
+        "misses": 0,
+        "disk_hits": 0,
+        "stores": 0,
+        "bypassed": 0,
+        "saved_input_tokens": 0,
+    }
+
+    @staticmethod
+    def _ttl() -> int:
+        return getattr(settings, "LLM_CACHE_TTL", 7 * 24 * 3600)
+
+    @staticmethod
+    def _cache_dir() -> Optional[Path]:
+        cache_dir = getattr(settings, "LLM_CACHE_DIR", None)
+        return Path(cache_dir) if cache_dir else None
+
+    @staticmethod
+    def _safe_model_name(model_name: str) -> str:
+        return re.sub(r"[^A-Za-z0-9._-]", "_", model_name)
+
+    @classmethod
+    def make_key(cls, config: LLMConfig, system_role: str, rendered_prompt: str) -> str:
+        """根据模型参数和渲染后的prompt生成缓存键"""
+        raw = json.dumps(
+            [config.llm_model_name, config.temperature, config.top_p, system_role, rendered_prompt],
+            ensure_ascii=False,
+        )
+        digest = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+        return f"{CACHE_KEY_PREFIX}:{cls._safe_model_name(config.llm_model_name)}:{digest}"
+
+    @classmethod
+    def _disk_path(cls, key: str) -> Optional[Path]:
+        cache_dir = cls._cache_dir()
+        if not cache_dir:
+            return None
+        _, model, digest = key.split(":", 2)
+        return cache_dir / model / digest[:2] / f"{digest}.json"
+
+    @classmethod
+    def _read_disk(cls, key: str) -> Optional[str]:
+        path = cls._disk_path(key)
+        if not path or not path.exists():
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("response")
+
+    @classmethod
+    def _write_disk(cls, key: str, response: str) -> None:
+        path = cls._disk_path(key)
+        if not path:
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"response": response, "created_at": time.time()}, f, ensure_ascii=False)
+        tmp_path.replace(path)
+
+    @classmethod
+    async def get(cls, key: str, input_tokens: int = 0) -> Optional[str]:
+        """读取缓存的响应，未命中返回None"""
+        response = await sync_to_async(cache.get)(key)
+
+        if response is None and cls._cache_dir():
+            try:
+                response = await asyncio.to_thread(cls._read_disk, key)
+                if response is not None:
+                    await sync_to_async(cache.set)(key, response, timeout=cls._ttl())
+                    cls._stats["disk_hits"] += 1
+            except Exception as e:
+                logger.warning(f"读取LLM响应磁盘缓存失败: {key}, error: {str(e)}")
+
+        if response is None:
+            cls._stats["misses"] += 1
+            return None
+
+        cls._stats["hits"] += 1
+        cls._stats["saved_input_tokens"] += input_tokens
+        return response
+
+    @classmethod
+    async def set(cls, key: str, response: Any) -> bool:
+        """写入缓存，只缓存非空字符串结果"""
+        if not isinstance(response, str) or not response.strip():
+            return False
+
+        await sync_to_async(cache.set)(key, response, timeout=cls._ttl())
+        if cls._cache_dir():
+            try:
+                await asyncio.to_thread(cls._write_disk, key, response)
+            except Exception as e:
+                logger.warning(f"写入LLM响应磁盘缓存失败: {key}, error: {str(e)}")
+        cls._stats["stores"] += 1
+        return True
+
+    @classmethod
+    def record_bypass(cls) -> None:
+        cls._stats["bypassed"] += 1
+
+    @classmethod
+    def invalidate(cls, key: str) -> None:
+        """删除单个缓存条目"""
+        cache.delete(key)
+        path = cls._disk_path(key)
+        if path and path.exists():
+            path.unlink()
+
+    @classmethod
+    def invalidate_model(cls, model_name: Optional[str] = None) -> int:
+        """删除某个模型的全部缓存；model_name为None时清空所有LLM响应缓存"""
+        model = cls._safe_model_name(model_name) if model_name else "*"
+        deleted = cache.delete_pattern(f"{CACHE_KEY_PREFIX}:{model}:*")
+
+        cache_dir = cls._cache_dir()
+        if cache_dir:
+            import shutil
+            target = cache_dir / model if model_name else cache_dir
+            shutil.rmtree(target, ignore_errors=True)
+        return deleted
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        """缓存命中率等统计信息"""
+        lookups = cls._stats["hits"] + cls._stats["misses"]
+        return {
+            **cls._stats,
+            "hit_rate": round(cls._stats["hits"] / lookups, 3) if lookups else 0.0,
+        }
@@ -15,6 +15,7 @@ class LLMConfig(BaseModel):
     max_workers: int = 4
     timeout: int = Field(default=30, description="API 调用超时时间(秒)")
     retry_times: int = Field(default=3, description="API 调用重试次数")
+    cache_enabled: bool = Field(default=False, description="是否启用响应缓存（相同模型参数和prompt直接返回缓存结果）")
     
     def to_model(self) -> Dict[str, Any]:
         """将LLMConfig转换为可存储到数据库JSONField的字典格式
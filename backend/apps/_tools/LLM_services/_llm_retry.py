@@ -0,0 +1,45 @@
+from typing import Optional
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import random
+
+
+# 与 bidlyzer-service 的 app/services/llm/rate_limiter.py 保持一致
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """
+    从API异常的响应头中解析 Retry-After（秒）
+    支持 retry-after-ms、retry-after（秒数或HTTP日期），解析不到返回None
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    try:
+        retry_after_ms = headers.get("retry-after-ms")
+        if retry_after_ms:
+            return max(0.0, float(retry_after_ms) / 1000)
+
+        retry_after = headers.get("retry-after")
+        if not retry_after:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            retry_at = parsedate_to_datetime(retry_after)
+            return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except Exception:
+        return None
+
+
+def retry_backoff(attempt: int, retry_after: Optional[float] = None, base: float = 1.0, cap: float = 60.0) -> float:
+    """
+    计算第attempt次重试的等待时间（秒）
+    - 服务端给出 Retry-After 时以其为准，再加少量抖动，避免所有协程同时醒来
+    - 否则使用带抖动的指数退避：[backoff/2, backoff]
+    """
+    if retry_after is not None:
+        return min(cap, retry_after) + random.uniform(0, 1)
+    backoff = min(cap, base * (2 ** attempt))
+    return backoff / 2 + random.uniform(0, backoff / 2)
@@ -0,0 +1,225 @@
+from typing import Dict, Any, Optional, Deque
+from collections import OrderedDict, deque
+from contextlib import contextmanager, asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from weakref import WeakKeyDictionary
+from django.conf import settings
+from prometheus_client import Counter, Histogram
+from ._llm_telemetry import _call_context
+import asyncio, time, logging
+
+
+logger = logging.getLogger(__name__)
+
+
+# 与 bidlyzer-service 的 app/services/llm/scheduler.py 保持一致
+INTERACTIVE = "interactive"   # 用户正在等待的工作
+BACKGROUND = "background"     # 后台工作（未指定优先级时的默认值）
+BATCH = "batch"               # 批量处理，排在其他工作之后
+PRIORITY_CLASSES = (INTERACTIVE, BACKGROUND, BATCH)
+
+
+class DeadlineExceeded(Exception):
+    """排队超过截止时间，请求未发出"""
+    pass
+
+
+_work_context: ContextVar[Dict[str, Any]] = ContextVar("llm_work_context", default={})
+
+
+@contextmanager
+def llm_work_context(priority: Optional[str] = None, deadline_seconds: Optional[float] = None, tenant: Optional[str] = None):
+    """为其中发起的LLM调用设置调度参数，可嵌套（内层覆盖优先级/租户，截止时间取更早的一个）"""
+    if priority is not None and priority not in PRIORITY_CLASSES:
+        raise ValueError(f"未知的优先级: {priority}，可选值: {PRIORITY_CLASSES}")
+    context = dict(_work_context.get())
+    if priority is not None:
+        context["priority"] = priority
+    if tenant is not None:
+        context["tenant"] = str(tenant)
+    if deadline_seconds is not None:
+        deadline = time.monotonic() + deadline_seconds
+        context["deadline"] = min(deadline, context.get("deadline", deadline))
+    token = _work_context.set(context)
+    try:
+        yield
+    finally:
+        _work_context.reset(token)
+
+
+@dataclass
+class WorkTicket:
+    """一个等待并发槽位的LLM请求"""
+    priority: str = BACKGROUND
+    tenant: str = "default"
+    deadline: Optional[float] = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+    future: Optional[asyncio.Future] = None
+
+    @classmethod
+    def from_context(cls) -> "WorkTicket":
+        context = _work_context.get()
+        return cls(
+            priority=context.get("priority", BACKGROUND),
+            tenant=context.get("tenant") or _call_context.get().get("project_id", "default"),
+            deadline=context.get("deadline"),
+        )
+
+
+class FairPriorityQueue:
+    """
+    按优先级分类、每类内按租户轮转的等待队列
+    出队顺序：interactive > 临近截止时间的请求（最早截止优先）> background > batch
+    """
+
+    def __init__(self, urgent_window: float = 5.0):
+        self.urgent_window = urgent_window
+        self._classes: Dict[str, "OrderedDict[str, Deque[WorkTicket]]"] = {
+            priority: OrderedDict() for priority in PRIORITY_CLASSES
+        }
+
+    def __len__(self) -> int:
+        return sum(len(tickets) for tenants in self._classes.values() for tickets in tenants.values())
+
+    def depth(self) -> Dict[str, int]:
+        return {
+            priority: sum(len(tickets) for tickets in tenants.values())
+            for priority, tenants in self._classes.items()
+        }
+
+    def push(self, ticket: WorkTicket) -> None:
+        self._classes[ticket.priority].setdefault(ticket.tenant, deque()).append(ticket)
+
+    def remove(self, ticket: WorkTicket) -> None:
+        tenants = self._classes[ticket.priority]
+        tickets = tenants.get(ticket.tenant)
+        if tickets is None or ticket not in tickets:
+            return
+        tickets.remove(ticket)
+        if not tickets:
+            del tenants[ticket.tenant]
+
+    def _pop_urgent(self, now: float) -> Optional[WorkTicket]:
+        urgent: Optional[WorkTicket] = None
+        for priority in (BACKGROUND, BATCH):
+            for tickets in self._classes[priority].values():
+                for ticket in tickets:
+                    if ticket.deadline is not None and ticket.deadline - now <= self.urgent_window:
+                        if urgent is None or ticket.deadline < urgent.deadline:
+                            urgent = ticket
+        if urgent is not None:
+            self.remove(urgent)
+        return urgent
+
+    def _pop_class(self, priority: str) -> Optional[WorkTicket]:
+        tenants = self._classes[priority]
+        if not tenants:
+            return None
+        tenant, tickets = next(iter(tenants.items()))
+        ticket = tickets.popleft()
+        if tickets:
+            tenants.move_to_end(tenant)
+        else:
+            del tenants[tenant]
+        return ticket
+
+    def pop(self) -> Optional[WorkTicket]:
+        ticket = self._pop_class(INTERACTIVE) or self._pop_urgent(time.monotonic())
+        if ticket is not None:
+            return ticket
+        return self._pop_class(BACKGROUND) or self._pop_class(BATCH)
+
+
+QUEUE_LATENCY = Histogram(
+    "llm_scheduler_queue_seconds", "按优先级统计的排队等待时间", ["priority"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30, 60, 120),
+)
+EXPIRED = Counter("llm_scheduler_expired_total", "排队超过截止时间的请求数", ["priority"])
+
+
+class PriorityScheduler:
+    """固定并发数的LLM调度器：槽位已满时按优先级和租户排队"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.in_flight = 0
+        self._queue = FairPriorityQueue()
+
+    @asynccontextmanager
+    async def slot(self):
+        """获取一个并发槽位（调度参数来自 llm_work_context），退出时释放"""
+        await self._acquire(WorkTicket.from_context())
+        try:
+            yield self
+        finally:
+            self._release()
+
+    async def _acquire(self, ticket: WorkTicket) -> None:
+        if self.in_flight < self.capacity and not len(self._queue):
+            self.in_flight += 1
+            QUEUE_LATENCY.labels(priority=ticket.priority).observe(0)
+            return
+
+        loop = asyncio.get_running_loop()
+        ticket.future = loop.create_future()
+        self._queue.push(ticket)
+        timer = None
+        if ticket.deadline is not None:
+            timer = loop.call_at(loop.time() + max(0.0, ticket.deadline - time.monotonic()), self._expire, ticket)
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket.future.done() and not ticket.future.cancelled() and ticket.future.exception() is None:
+                self._release()
+            else:
+                self._queue.remove(ticket)
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+    def _expire(self, ticket: WorkTicket) -> None:
+        if ticket.future.done():
+            return
+        self._queue.remove(ticket)
+        EXPIRED.labels(priority=ticket.priority).inc()
+        ticket.future.set_exception(DeadlineExceeded(
+            f"LLM请求排队超过截止时间: priority={ticket.priority}, tenant={ticket.tenant}"
+        ))
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        while self.in_flight < self.capacity:
+            ticket = self._queue.pop()
+            if ticket is None:
+                break
+            if not ticket.future.done():
+                self.in_flight += 1
+                QUEUE_LATENCY.labels(priority=ticket.priority).observe(time.monotonic() - ticket.enqueued_at)
+                ticket.future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"capacity": self.capacity, "in_flight": self.in_flight, "waiting": self._queue.depth()}
+
+
+class LLMScheduler:
+    """
+    进程内的LLM调度器，每个事件循环一个（Django中async_to_sync/asyncio.run会创建不同的循环）
+    并发数由 settings.LLM_SCHEDULER_CONCURRENCY 配置
+    """
+
+    _schedulers: "WeakKeyDictionary[asyncio.AbstractEventLoop, PriorityScheduler]" = WeakKeyDictionary()
+
+    @classmethod
+    def current(cls) -> PriorityScheduler:
+        loop = asyncio.get_running_loop()
+        scheduler = cls._schedulers.get(loop)
+        if scheduler is None:
+            scheduler = PriorityScheduler(getattr(settings, "LLM_SCHEDULER_CONCURRENCY", 10))
+            cls._schedulers[loop] = scheduler
+        return scheduler
+
+    @classmethod
+    def slot(cls):
+        return cls.current().slot()
@@ -0,0 +1,211 @@
+from typing import Dict, Any, Optional
+from dataclasses import dataclass
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from django.conf import settings
+from django.http import HttpResponse
+from langchain.callbacks.base import BaseCallbackHandler
+from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+import time, logging, tiktoken
+
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def _get_encoding():
+    """tokenizer 只加载一次，进程内复用"""
+    return tiktoken.encoding_for_model("gpt-3.5-turbo")
+
+
+def count_tokens(text: str) -> int:
+    """计算文本的token数量（模型未返回usage时的估算）"""
+    return len(_get_encoding().encode(text))
+
+
+# ------------------------------ 调用上下文 ------------------------------
+
+# 当前LLM调用的标签（project_id / stage / builder），与 bidlyzer-service 的遥测标签一致
+_call_context: ContextVar[Dict[str, str]] = ContextVar("llm_call_context", default={})
+
+
+@contextmanager
+def llm_call_context(**tags):
+    """为其中发起的LLM调用打标签，可嵌套（内层补充/覆盖外层）"""
+    token = _call_context.set({
+        **_call_context.get(),
+        **{name: str(value) for name, value in tags.items() if value is not None},
+    })
+    try:
+        yield
+    finally:
+        _call_context.reset(token)
+
+
+# ------------------------------ Prometheus 指标 ------------------------------
+
+_LABELS = ["stage", "model"]
+_LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+
+TIME_TO_FIRST_TOKEN = Histogram(
+    "llm_time_to_first_token_seconds", "首token延迟（仅流式调用）", _LABELS, buckets=_LATENCY_BUCKETS,
+)
+CALL_LATENCY = Histogram(
+    "llm_call_latency_seconds", "单次LLM调用总耗时", _LABELS, buckets=_LATENCY_BUCKETS,
+)
+CALLS = Counter("llm_calls_total", "LLM调用次数", _LABELS + ["outcome"])
+TOKENS = Counter("llm_tokens_total", "LLM token用量", _LABELS + ["direction"])
+RETRIES = Counter("llm_retries_total", "LLM调用重试次数", _LABELS)
+COST = Counter("llm_cost_total", "LLM调用费用（元）", _LABELS)
+
+# 各模型单价（元/千token）：(输入, 输出)，可在settings中用 LLM_PRICING 覆盖
+DEFAULT_PRICING = {
+    "qwen-turbo": (0.0003, 0.0006),
+    "qwen-plus": (0.0008, 0.002),
+    "qwen-max": (0.0024, 0.0096),
+}
+
+
+@dataclass
+class LLMCallRecord:
+    """一次LLM请求（含重试）的遥测数据"""
+    model: str
+    project_id: str = "unknown"
+    stage: str = "unknown"
+    builder: str = "unknown"
+    ttft: Optional[float] = None
+    latency: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    usage_source: str = "estimate"
+    retries: int = 0
+    cache_hit: bool = False
+    outcome: str = "success"
+
+    @classmethod
+    def from_context(cls, model: str) -> "LLMCallRecord":
+        context = _call_context.get()
+        return cls(
+            model=model,
+            project_id=context.get("project_id", "unknown"),
+            stage=context.get("stage", "unknown"),
+            builder=context.get("builder", "unknown"),
+        )
+
+    @property
+    def cost(self) -> float:
+        if self.cache_hit:
+            return 0.0
+        pricing = getattr(settings, "LLM_PRICING", DEFAULT_PRICING)
+        input_price, output_price = pricing.get(self.model, (0.0, 0.0))
+        return (self.input_tokens * input_price + self.output_tokens * output_price) / 1000
+
+    def set_usage(self, usage: Optional[Dict[str, Any]]) -> bool:
+        """使用模型返回的usage（兼容OpenAI与LangChain两种字段名），成功返回True"""
+        if not usage:
+            return False
+        input_tokens = usage.get("prompt_tokens", usage.get("input_tokens"))
+        output_tokens = usage.get("completion_tokens", usage.get("output_tokens"))
+        if input_tokens is None or output_tokens is None:
+            return False
+        self.input_tokens = int(input_tokens)
+        self.output_tokens = int(output_tokens)
+        self.usage_source = "provider"
+        return True
+
+
+class TelemetryCallbackHandler(BaseCallbackHandler):
+    """记录首token时间和模型返回的token用量"""
+
+    def __init__(self):
+        super().__init__()
+        self.start = time.monotonic()
+        self.first_token_at: Optional[float] = None
+        self.usage: Optional[Dict[str, Any]] = None
+
+    @property
+    def ttft(self) -> Optional[float]:
+        return self.first_token_at - self.start if self.first_token_at is not None else None
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        if self.first_token_at is None and token:
+            self.first_token_at = time.monotonic()
+
+    def on_llm_end(self, response, **kwargs):
+        if response is None:
+            return
+        llm_output = getattr(response, "llm_output", None) or {}
+        if llm_output.get("token_usage"):
+            self.usage = llm_output["token_usage"]
+            return
+        for generations in getattr(response, "generations", None) or []:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    self.usage = dict(usage)
+                    return
+
+
+class LLMTelemetry:
+    """
+    LLM调用遥测：导出Prometheus指标，并按项目/阶段汇总到Redis
+    汇总的键和字段格式与 bidlyzer-service 一致，两个服务的用量汇总在同一个项目下
+    """
+
+    USAGE_KEY_PREFIX = "llm_usage"
+
+    @classmethod
+    def record(cls, record: LLMCallRecord) -> None:
+        """记录一次调用，失败只记录日志，不影响主流程"""
+        try:
+            labels = {"stage": record.stage, "model": record.model}
+            CALLS.labels(outcome=record.outcome, **labels).inc()
+            if record.retries:
+                RETRIES.labels(**labels).inc(record.retries)
+            if not record.cache_hit:
+                if record.outcome == "success":
+                    CALL_LATENCY.labels(**labels).observe(record.latency)
+                    if record.ttft is not None:
+                        TIME_TO_FIRST_TOKEN.labels(**labels).observe(record.ttft)
+                TOKENS.labels(direction="input", **labels).inc(record.input_tokens)
+                TOKENS.labels(direction="output", **labels).inc(record.output_tokens)
+                COST.labels(**labels).inc(record.cost)
+        except Exception as e:
+            logger.warning(f"记录LLM指标失败: {str(e)}")
+
+        if record.project_id == "unknown":
+            return
+        try:
+            cls._add_to_summary(record)
+        except Exception as e:
+            logger.warning(f"记录项目LLM用量失败: {record.project_id}, error: {str(e)}")
+
+    @classmethod
+    def _add_to_summary(cls, record: LLMCallRecord) -> None:
+        from django_redis import get_redis_connection
+
+        values = {
+            "calls": 1,
+            "errors": int(record.outcome == "error"),
+            "cache_hits": int(record.cache_hit),
+            "retries": record.retries,
+            "input_tokens": record.input_tokens,
+            "output_tokens": record.output_tokens,
+            "cost": record.cost,
+            "latency_seconds": record.latency,
+            "ttft_seconds": record.ttft or 0.0,
+            "ttft_calls": int(record.ttft is not None),
+        }
+        key = f"{cls.USAGE_KEY_PREFIX}:{record.project_id}"
+        pipe = get_redis_connection("default").pipeline(transaction=False)
+        for name, value in values.items():
+            if value:
+                pipe.hincrbyfloat(key, f"{record.stage}|{record.builder}|{name}", value)
+        pipe.expire(key, getattr(settings, "LLM_USAGE_SUMMARY_TTL", 30 * 24 * 3600))
+        pipe.execute()
+
+
+def llm_metrics_view(request):
+    """Prometheus格式的LLM调用指标"""
+    return HttpResponse(generate_latest(), content_type=CONTENT_TYPE_LATEST)
@@ -1,3 +1,4 @@
+from django.db import transaction
 from rest_framework import viewsets, mixins, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
@@ -107,6 +108,47 @@ class ProjectAgentStorageViewSet(viewsets.GenericViewSet):
         
         return Response({"message": "数据保存成功", "updated_fields": updated_fields})
 
+    @action(detail=True, methods=['post'], permission_classes=[])
+    def batch_save(self, request, pk=None):
+        """
+        批量保存（bidlyzer侧的延迟写入按项目合并后一次提交）
+        请求体: {"items": [{"key_name": 字段名, "content": 值, "append": bool}, ...]}
+        append为True时content是新增的历史条目列表，追加到字段已有的列表之后；否则整体替换字段
+        """
+        try:
+            project = Project.objects.get(id=pk)
+        except Project.DoesNotExist:
+            return Response({"detail": "项目不存在"}, status=status.HTTP_404_NOT_FOUND)
+
+        items = request.data.get('items')
+        if not isinstance(items, list):
+            return Response({"detail": "缺少items参数"}, status=status.HTTP_400_BAD_REQUEST)
+
+        invalid_fields = [item.get('key_name') for item in items if not hasattr(ProjectAgentStorage, str(item.get('key_name')))]
+        if invalid_fields:
+            return Response({"detail": f"字段 {invalid_fields} 不存在"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # 追加需要读-改-写，锁住该项目的存储行，保证并发批次按提交顺序追加
+        with transaction.atomic():
+            self._get_or_create_storage(project)
+            storage = ProjectAgentStorage.objects.select_for_update().get(project=project)
+            updated_fields = []
+            appended = 0
+            for item in items:
+                field_name, content = item['key_name'], item.get('content')
+                if item.get('append'):
+                    existing = getattr(storage, field_name) or []
+                    setattr(storage, field_name, existing + list(content or []))
+                    appended += len(content or [])
+                else:
+                    setattr(storage, field_name, content)
+                if field_name not in updated_fields:
+                    updated_fields.append(field_name)
+            storage.save(update_fields=updated_fields + ['updated_at'])
+
+        logger.info(f"批量保存项目 {project.id} 的数据: {updated_fields}，追加历史 {appended} 条")
+        return Response({"message": "数据保存成功", "updated_fields": updated_fields, "appended": appended})
+
     @action(detail=True, methods=['get'], permission_classes=[])
     def get_from_django(self, request, pk=None):
         """重写retrieve方法，支持单个字段参数查询"""
@@ -56,7 +56,7 @@ class OutlineL1Analyzer:
         logger.debug(f"L1分析前的文档标题：\n{headings}")
         
         # 使用LLM处理
-        analyzer = LLMClient(prompt_config)
+        analyzer = LLMClient(prompt_config, stage="L1", builder=type(prompt_builder).__name__)
 
         if channel_layer and group_name:
             # 创建并行任务，每个任务有唯一ID
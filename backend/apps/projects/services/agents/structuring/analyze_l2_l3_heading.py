@@ -54,7 +54,7 @@ class OutlineL2L3Analyzer:
         logger.debug("已生成L2/L3提示参数")
         
         # 使用LLM处理
-        analyzer = LLMClient(prompt_config)
+        analyzer = LLMClient(prompt_config, stage="L2L3", builder=type(prompt_builder).__name__)
 
         if channel_layer and group_name:
             # 创建并行任务，每个任务有唯一ID
@@ -264,8 +264,14 @@ class StructuringAgentConsumer(AsyncWebsocketConsumer):
         """处理大模型的流式输出"""
         await self.send(text_data=json.dumps({
             'type': 'llm_stream',
+            # 增量协议：kind为delta时按offset拼接delta，snapshot/end时以content为准，reset时清空（重试）
+            'kind': event.get('kind', 'delta'),
+            'seq': event.get('seq'),
+            'generation': event.get('generation', 0),
+            'offset': event.get('offset', 0),
+            'delta': event.get('delta', ''),
             'token': event.get('token', ''),
-            'content': event.get('content', ''),
+            'content': event.get('content'),
             'task_id': event.get('task_id', None),
             'state': self.current_state.value if hasattr(self, 'current_state') else None,
             'finished': event.get('finished', False)
@@ -1,6 +1,9 @@
 from .llm_service import LLMService
 from .llm_models import LLMConfigModel, LLMRequestModel
-from typing import Any, List, Dict
+from apps._tools.LLM_services._llm_telemetry import llm_call_context
+from apps._tools.LLM_services._llm_scheduler import llm_work_context
+from typing import Any, List, Dict, Optional
+from contextlib import contextmanager
 import asyncio
 
 
@@ -9,6 +12,9 @@ class LLMClient:
 
     def __init__(self, 
                  prompt_config: Dict,
+                 stage: Optional[str] = None,
+                 builder: Optional[str] = None,
+                 priority: Optional[str] = None,
                  ):
         """
         初始化分析器
@@ -16,8 +22,19 @@ class LLMClient:
             prompt_template: 提示词模板
             llm_config: LLM配置参数字典
             output_format: 输出格式规范
+            stage / builder: 遥测标签（所属阶段、prompt构建器），用于按阶段统计延迟和费用
+            priority: 调度优先级（interactive/background/batch），不指定时沿用调用方的 llm_work_context
         """
         self.prompt_config = prompt_config
+        self.stage = stage
+        self.builder = builder
+        self.priority = priority
+
+    @contextmanager
+    def _call_context(self):
+        """为本客户端发起的LLM调用打上阶段标签和调度优先级"""
+        with llm_call_context(stage=self.stage, builder=self.builder), llm_work_context(priority=self.priority):
+            yield
 
 
     def create_service(self, ) -> LLMService:
@@ -37,7 +54,8 @@ class LLMClient:
             supplement=task_input["supplement"],
             output_format=task_input["output_format"]
         )
-        return await service.process(request)
+        with self._call_context():
+            return await service.process(request)
     
     async def process_multiple(self, tasks: List[Dict]) -> List[Any]:
         """并发处理多个分析任务"""
@@ -55,7 +73,8 @@ class LLMClient:
         ]
         
         # 并发执行所有请求
-        return await asyncio.gather(*[service.process(req) for req in requests])
+        with self._call_context():
+            return await asyncio.gather(*[service.process(req) for req in requests])
     
     async def process_with_limit(self, tasks: List[Dict], limit: int = 5) -> List[Any]:
         """带并发限制的处理"""
@@ -72,7 +91,8 @@ class LLMClient:
                 )
                 return await service.process(request)
         
-        return await asyncio.gather(*[process_task(task) for task in tasks])
+        with self._call_context():
+            return await asyncio.gather(*[process_task(task) for task in tasks])
 
     async def process_parallel_stream(self, tasks, channel_layer=None, group_name=None, limit=5) -> List[Any]:
         """
@@ -107,6 +127,7 @@ class LLMClient:
                 )
         
         # 并行执行所有任务
-        return await asyncio.gather(*[process_task(task_id, task_input) for task_id, task_input in tasks])
+        with self._call_context():
+            return await asyncio.gather(*[process_task(task_id, task_input) for task_id, task_input in tasks])
     
 
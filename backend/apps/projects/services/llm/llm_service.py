@@ -9,55 +9,64 @@ from concurrent.futures import ThreadPoolExecutor
 from openai import RateLimitError, APIError
 from requests.exceptions import Timeout
 from ..task_service import count_tokens
+from .stream_coalescer import StreamCoalescer, END
+from apps._tools.LLM_services._llm_telemetry import LLMCallRecord, LLMTelemetry, TelemetryCallbackHandler
+from apps._tools.LLM_services._llm_scheduler import LLMScheduler
+from apps._tools.LLM_services._llm_retry import get_retry_after, retry_backoff
 import os, logging
+import asyncio
 import time
-import random
-from asgiref.sync import async_to_sync
+from asgiref.sync import async_to_sync, sync_to_async
 
 
 logger = logging.getLogger(__name__)
 
 
 class WebSocketStreamingCallbackHandler(BaseCallbackHandler):
-    """自定义WebSocket流式输出回调处理器，支持任务ID"""
+    """
+    自定义WebSocket流式输出回调处理器，支持任务ID
+
+    token经StreamCoalescer合并为带序号的增量消息（kind: delta/snapshot/end/reset），
+    不再每个token都推送完整的累计内容；同一任务的重试共用一个处理器，seq持续递增
+    """
     
     def __init__(self, channel_layer, group_name, task_id=None):
         super().__init__()
         self.channel_layer = channel_layer
         self.group_name = group_name
         self.task_id = task_id
-        self.accumulated_content = ""
+        self.coalescer = StreamCoalescer(self._send)
         self.run_inline = True  # 添加run_inline属性，设置为True表示内联运行， 边生成边执行
         self.raise_error = False  # 添加raise_error属性，设置为False表示不抛出错误
-        
-    async def on_llm_new_token(self, token, **kwargs):
-        """处理生成的新token"""
-        self.accumulated_content += token
-        
-        # 将token发送到WebSocket组，包含任务ID
+
+    @property
+    def accumulated_content(self) -> str:
+        return self.coalescer.content
+
+    async def _send(self, message: dict):
+        """将合并后的消息发送到WebSocket组，包含任务ID"""
         await self.channel_layer.group_send(
             self.group_name,
             {
                 'type': 'llm_stream',
-                'token': token,
-                'content': self.accumulated_content,
+                **message,
+                'token': message.get('delta', ''),  # 兼容旧字段
                 'task_id': self.task_id,  # 传递任务ID
-                'finished': False
+                'finished': message['kind'] == END
             }
         )
+        
+    async def on_llm_new_token(self, token, **kwargs):
+        """处理生成的新token"""
+        await self.coalescer.push(token)
     
     async def on_llm_end(self, response, **kwargs):
         """标记LLM响应完成"""
-        await self.channel_layer.group_send(
-            self.group_name,
-            {
-                'type': 'llm_stream',
-                'token': '',
-                'content': self.accumulated_content,
-                'task_id': self.task_id,  # 传递任务ID
-                'finished': True
-            }
-        )
+        await self.coalescer.finish()
+
+    async def reset(self):
+        """请求重试前调用，通知客户端清空本次尝试已输出的内容"""
+        await self.coalescer.reset()
 
 
 class LLMService:
@@ -84,6 +93,7 @@ class LLMService:
             api_key=self.config.api_key or os.getenv("ALIBABA_API_KEY"),
             base_url=self.config.base_url,
             timeout=self.config.timeout,
+            stream_usage=True,
         )
 
     async def process(self, request: LLMRequestModel, channel_layer=None, group_name=None, task_id=None) -> Any:
@@ -92,9 +102,30 @@ class LLMService:
         :param request: LLM请求对象
         :return: 处理结果
         """
+        record = LLMCallRecord.from_context(self.config.llm_model_name)
+        try:
+            return await self._process(request, record, channel_layer, group_name, task_id)
+        except BaseException:
+            record.outcome = "error"
+            raise
+        finally:
+            # 汇总写入使用同步的django_redis连接，放到线程中执行
+            await sync_to_async(LLMTelemetry.record)(record)
+
+    async def _process(self, request: LLMRequestModel, record: LLMCallRecord, channel_layer=None, group_name=None, task_id=None) -> Any:
         max_retries = 3  # 最大重试次数
         retry_count = 0
-        
+
+        # 流式输出处理器在重试之间共用（按task_id区分并行任务），重试时发送reset而不是从seq=1重新开始
+        if self.config.streaming and channel_layer and group_name:
+            # 使用WebSocket流式输出
+            stream_callbacks = [WebSocketStreamingCallbackHandler(channel_layer, group_name, task_id)]
+        elif self.config.streaming:
+            # 使用标准输出流式输出
+            stream_callbacks = [StreamingStdOutCallbackHandler()]
+        else:
+            stream_callbacks = []
+
         while True:
             try:
                 if not self.prompt_template:
@@ -121,38 +152,44 @@ class LLMService:
                 # 处理请求, 构建prompt模板的输入
                 request_dict = request.dict()   #将LLMRequest对象转换为字典
 
-                # 配置流式输出
-                if self.config.streaming and channel_layer and group_name:
-                    # 使用WebSocket流式输出
-                    callbacks = [WebSocketStreamingCallbackHandler(channel_layer, group_name)]
-                elif self.config.streaming:
-                    # 使用标准输出流式输出
-                    callbacks = [StreamingStdOutCallbackHandler()]
-                else:
-                    callbacks = []
+                if retry_count:
+                    for callback in stream_callbacks:
+                        if hasattr(callback, "reset"):
+                            await callback.reset()
+                callbacks = list(stream_callbacks)
+                telemetry = TelemetryCallbackHandler()
+                callbacks.append(telemetry)
 
                 # 直接使用配置中的streaming设置
-                chain_config = {"callbacks": callbacks} if callbacks else {}
-
-
-
-                result = await chain.ainvoke(request_dict, config=chain_config)
-
-                # output_tokens = count_tokens(str(result))
-                # logger.info(f"Output tokens: {output_tokens}")
+                chain_config = {"callbacks": callbacks}
+
+                # 并发槽位按优先级和项目公平排队
+                async with LLMScheduler.slot():
+                    start = time.monotonic()
+                    result = await chain.ainvoke(request_dict, config=chain_config)
+                record.latency = time.monotonic() - start
+                record.ttft = telemetry.ttft
+
+                # 优先使用模型返回的usage，没有时再本地估算
+                if not record.set_usage(telemetry.usage):
+                    formatted_prompt = await prompt.ainvoke(request_dict)
+                    record.input_tokens = count_tokens(formatted_prompt.to_string())
+                    record.output_tokens = count_tokens(str(result))
+                logger.debug(f"Tokens: input={record.input_tokens}, output={record.output_tokens} ({record.usage_source})")
 
                 return result
 
             except RateLimitError as e:
                 retry_count += 1
+                record.retries = min(retry_count, max_retries)
                 if retry_count > max_retries:
                     logger.error(f"API 调用超过限制，已重试{max_retries}次后失败: {str(e)}")
                     raise
                 
-                # 计算指数退避等待时间（带抖动）
-                wait_time = (2 ** retry_count) + random.uniform(0, 1)
+                # 优先按服务端的Retry-After等待，否则带抖动的指数退避；异步等待，不阻塞事件循环
+                wait_time = retry_backoff(retry_count, get_retry_after(e))
                 logger.warning(f"API 调用超过限制，正在进行第{retry_count}次重试，等待{wait_time:.2f}秒: {str(e)}")
-                time.sleep(wait_time)
+                await asyncio.sleep(wait_time)
                 continue
             
             except Timeout as e:
@@ -0,0 +1,164 @@
+from typing import Dict, Any, Optional, Callable, Awaitable
+import asyncio
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# 消息类型
+DELTA = "delta"          # 增量：从offset开始追加delta
+SNAPSHOT = "snapshot"    # 快照：content为截至目前的完整内容，供中途加入或丢包的客户端重新同步
+END = "end"              # 结束：content为最终完整内容
+RESET = "reset"          # 重置：请求重试，之前的输出作废，客户端清空已拼接的内容（content为空），generation加一
+
+
+class StreamCoalescer:
+    """
+    流式输出合并器：把逐token的输出合并为带序号的增量消息
+
+    - token先进入缓冲区，距上次发送超过flush_interval秒、或缓冲超过flush_chars个字符时合并发送一次
+    - 每条消息带递增的seq和增量在全文中的起始offset，前端按offset拼接即可无损还原
+    - 每发送snapshot_every条增量附带一次完整快照，中途加入的客户端可据此同步
+    - 结束时先发送剩余缓冲，再发送带完整内容的结束消息
+    - 请求重试时调用reset：发送reset消息后从空内容重新开始，seq在整个任务内持续递增，generation标识第几次尝试
+
+    emit为异步回调，参数为消息字典；由调用方补充task_id等传输层字段。
+    """
+
+    def __init__(
+        self,
+        emit: Callable[[Dict[str, Any]], Awaitable[None]],
+        flush_interval: float = 0.05,
+        flush_chars: int = 256,
+        snapshot_every: int = 20,
+    ):
+        self.emit = emit
+        self.flush_interval = flush_interval
+        self.flush_chars = flush_chars
+        self.snapshot_every = snapshot_every
+
+        self.content = ""
+        self.seq = 0
+        self.generation = 0
+        self._buffer = ""
+        self._offset = 0            # 缓冲区在全文中的起始位置
+        self._deltas_since_snapshot = 0
+        self._last_flush = time.monotonic()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._lock = asyncio.Lock()
+        self.finished = False
+
+        # 监控数据
+        self.tokens = 0
+        self.messages = 0
+
+    async def push(self, token: str) -> None:
+        """追加一个token，满足时间或长度条件时发送合并后的增量"""
+        if not token or self.finished:
+            return
+        self.tokens += 1
+        self.content += token
+        self._buffer += token
+
+        if len(self._buffer) >= self.flush_chars or time.monotonic() - self._last_flush >= self.flush_interval:
+            await self.flush()
+        elif self._timer is None:
+            # token间隔较长时，由定时器保证缓冲不会滞留超过flush_interval
+            self._timer = asyncio.get_running_loop().call_later(self.flush_interval, self._flush_later)
+
+    def _flush_later(self) -> None:
+        self._timer = None
+        if self._buffer and not self.finished:
+            task = asyncio.ensure_future(self.flush())
+            task.add_done_callback(self._log_task_error)
+
+    @staticmethod
+    def _log_task_error(task: asyncio.Future) -> None:
+        if not task.cancelled() and task.exception():
+            logger.error(f"流式增量定时发送失败: {str(task.exception())}")
+
+    def _cancel_timer(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    async def flush(self) -> None:
+        """发送缓冲区中的增量，按需附带快照"""
+        async with self._lock:
+            self._cancel_timer()
+            if not self._buffer:
+                return
+            delta, offset = self._buffer, self._offset
+            self._buffer = ""
+            self._offset += len(delta)
+            self._last_flush = time.monotonic()
+
+            await self._send(DELTA, offset=offset, delta=delta)
+
+            self._deltas_since_snapshot += 1
+            if self.snapshot_every and self._deltas_since_snapshot >= self.snapshot_every:
+                await self.snapshot()
+
+    async def snapshot(self) -> None:
+        """发送当前已发送部分的完整快照（不含未发送的缓冲）"""
+        self._deltas_since_snapshot = 0
+        await self._send(SNAPSHOT, offset=0, content=self.content[:self._offset])
+
+    async def finish(self, content: Optional[str] = None) -> None:
+        """
+        发送剩余缓冲和结束消息
+        :param content: 最终完整内容，未传入时使用累计内容
+        """
+        if self.finished:
+            return
+        await self.flush()
+        self.finished = True
+        if content is not None:
+            self.content = content
+        await self._send(END, offset=0, content=self.content)
+
+    async def reset(self) -> None:
+        """请求重试前调用：丢弃本次尝试的输出，已有输出时发送reset消息（seq继续递增，generation加一）"""
+        async with self._lock:
+            self._cancel_timer()
+            had_output = bool(self.content) or self.finished
+            self.content = ""
+            self._buffer = ""
+            self._offset = 0
+            self._deltas_since_snapshot = 0
+            self._last_flush = time.monotonic()
+            self.finished = False
+            if had_output:
+                self.generation += 1
+                await self._send(RESET, offset=0, content="")
+
+    async def _send(self, kind: str, **fields) -> None:
+        self.seq += 1
+        self.messages += 1
+        await self.emit({"kind": kind, "seq": self.seq, "generation": self.generation, **fields})
+
+    def stats(self) -> Dict[str, Any]:
+        """合并效果统计"""
+        return {
+            "tokens": self.tokens,
+            "messages": self.messages,
+            "chars": len(self.content),
+        }
+
+
+def apply_stream_message(content: str, message: Dict[str, Any]) -> Optional[str]:
+    """
+    客户端还原逻辑（前端实现与此一致）：把一条消息应用到已拼接的内容上
+    :return: 新内容；出现缺口（offset超过当前长度）时返回None，应等待下一次快照
+    """
+    kind = message.get("kind")
+    if kind in (SNAPSHOT, END, RESET):
+        return message.get("content", "")
+
+    offset = message.get("offset", 0)
+    delta = message.get("delta", "")
+    if offset > len(content):
+        return None
+    # offset小于当前长度说明收到了重复部分，只追加新的字符
+    return content[:offset] + delta if offset + len(delta) >= len(content) else content
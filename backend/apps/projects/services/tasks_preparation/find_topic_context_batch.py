@@ -1,4 +1,4 @@
-import asyncio, os, nest_asyncio
+import asyncio, os, nest_asyncio, math, json, time
 from typing import List, Dict, Tuple, Any, Optional
 import logging
 logger = logging.getLogger(__name__)
@@ -10,7 +10,7 @@ from apps.projects.utils.redis_manager import RedisManager
 from apps._tools.LLM_services._llm_data_types import LLMConfig
 from apps._tools.LLM_services.llm_service import LLMService
 from langchain_core.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
-from apps.projects.services.task_service import count_tokens
+from apps.projects.services.task_service import count_tokens, _clean_llm_JSON_output
 
 
 # 目标 -> 准备好以下内容
@@ -20,32 +20,60 @@ from apps.projects.services.task_service import count_tokens
 
 
 class FindTopicContextBatch():
-    """文档大纲分析器，用于提取OutlineL1"""
+    """
+    为清单中的多个话题查找相关章节
 
-    def __init__(self, doc: Any, topics: List[str]):
+    packing=True（默认）: 每个请求询问K个话题，共享同一份目录上下文，K根据token预算自动确定；
+                          结果按话题拆分回逐话题的记录（见 split_results）
+    packing=False: 每个话题一个请求（每个请求都携带完整目录）
+    """
+
+    SYSTEM_ROLE = "你是一个专业的招标文档分析助手，帮助用户分析文档的结构和内容。"
+
+    # token预算（qwen-max 上下文约32k）
+    MODEL_CONTEXT_TOKENS = 30000        # 单次请求输入token上限
+    OUTPUT_TOKEN_BUDGET = 2000          # 单次请求期望的输出token上限，输出越长尾延迟越大
+    EST_OUTPUT_TOKENS_PER_TOPIC = 200   # 每个话题输出的估算token数
+    MAX_TOPICS_PER_REQUEST = 10         # 单次请求最多询问的话题数，过多会降低回答质量
+
+    def __init__(self, doc: Any, topics: List[str], packing: bool = True):
         # 类的传参都一定会经过__init__方法， 基本它写在类后面的（）里。  
         # 想让对象记住一个变量，都需要在变量前加self. 
         self.doc = doc
         self.topics = topics
+        self.packing = packing
         self.context, self.index_path_map = self._prepare_context()
-        self.instructions = self._prepare_instruction()
         self.supplement = self._prepare_supplement()
-        self.output_format = self._prepare_output_format()
+        self.output_format = self._prepare_packed_output_format() if packing else self._prepare_output_format()
         self.prompt_template = self._build_prompt_template()
         self.llm_config = self._build_llm_config().to_model()
 
         self.context_tokens = count_tokens(self.context)
-        self.instruction_tokens = sum([count_tokens(instruction) for instruction in self.instructions])
         self.supplement_tokens = count_tokens(self.supplement)
         self.output_format_tokens = count_tokens(self.output_format)
         self.prompt_template_tokens = count_tokens(self.prompt_template)
-        self.in_tokens = self.context_tokens + self.instruction_tokens + self.supplement_tokens + self.output_format_tokens + self.prompt_template_tokens
+
+        # 话题分组：每组一个请求
+        self.topics_per_request = self._choose_topics_per_request() if packing else 1
+        self.topic_groups = self._group_topics(self.topics_per_request)
+        self.instructions = self._prepare_instruction()
+
+        self.instruction_tokens = sum([count_tokens(instruction) for instruction in self.instructions])
+        # 每个请求都携带完整的上下文、补充、输出格式和模板
+        shared_tokens = self.context_tokens + self.supplement_tokens + self.output_format_tokens + self.prompt_template_tokens
+        self.in_tokens = shared_tokens * len(self.instructions) + self.instruction_tokens
+        # 对照：每个话题一个请求时的输入token数
+        self.unpacked_in_tokens = (
+            (self.context_tokens + self.supplement_tokens + count_tokens(self._prepare_output_format()) + self.prompt_template_tokens) * len(self.topics)
+            + sum(count_tokens(self._topic_instruction(topic)) for topic in self.topics)
+        )
 
     def output_params(self) -> Tuple[Dict[str,any], List[Dict[str,any]], Dict[str,any]]:
 
         model_params = {
             "llm_config": self.llm_config,
             "prompt_template": self.prompt_template,
+            "system_role": self.SYSTEM_ROLE,
         }
 
         tasks = []
@@ -60,7 +88,13 @@ class FindTopicContextBatch():
 
         meta = {
             "index_path_map": self.index_path_map,
+            "packing": self.packing,
+            "topics": len(self.topics),
+            "requests": len(tasks),
+            "topics_per_request": self.topics_per_request,
+            "topic_groups": self.topic_groups,
             "in_tokens" : self.in_tokens,
+            "unpacked_in_tokens": self.unpacked_in_tokens,
             "context_tokens": self.context_tokens,
             "instruction_tokens": self.instruction_tokens,
             "supplment_tokens":self.supplement_tokens,
@@ -70,6 +104,103 @@ class FindTopicContextBatch():
 
         return model_params, tasks, meta
 
+    async def run(self, limit: int = 5) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        执行全部请求，返回 (逐话题的记录列表, meta)
+        meta 中额外记录阶段耗时 stage_seconds
+        """
+        from apps.projects.services.llm.llm_client import LLMClient
+
+        model_params, tasks, meta = self.output_params()
+
+        start = time.perf_counter()
+        raw_results = await LLMClient(model_params, stage="topics", builder=type(self).__name__).process_with_limit(tasks, limit=limit)
+        meta["stage_seconds"] = round(time.perf_counter() - start, 3)
+
+        records = self.split_results(raw_results)
+        meta["missing_topics"] = [record["topic"] for record in records if record["missing"]]
+        logger.info(
+            f"话题定位完成: {len(self.topics)}个话题, {len(tasks)}个请求, 输入token {self.in_tokens}"
+            f"（逐话题请求需 {self.unpacked_in_tokens}）, 耗时 {meta['stage_seconds']}秒"
+        )
+        return records, meta
+
+    def split_results(self, raw_results: List[str]) -> List[Dict[str, Any]]:
+        """
+        将每个请求的输出拆分回逐话题的记录：
+        [{"topic": str, "sections": [{"path", "level", "title", "reason"}], "missing": bool}, ...]
+        """
+        sections_by_topic: Dict[str, List[Dict[str, Any]]] = {}
+
+        for group, raw in zip(self.topic_groups, raw_results):
+            try:
+                parsed = _clean_llm_JSON_output(raw) if isinstance(raw, str) else raw
+            except json.JSONDecodeError as e:
+                logger.error(f"话题定位结果解析失败: topics={group}, error={str(e)}")
+                continue
+
+            if not self.packing:
+                # 每个请求只有一个话题，输出即为该话题的章节列表
+                sections_by_topic[group[0]] = parsed if isinstance(parsed, list) else [parsed]
+                continue
+
+            for item in parsed if isinstance(parsed, list) else [parsed]:
+                if not isinstance(item, dict):
+                    continue
+                topic = self._match_topic(item, group)
+                if topic is not None:
+                    sections_by_topic.setdefault(topic, []).extend(item.get("sections") or [])
+
+        return [
+            {
+                "topic": topic,
+                "sections": sections_by_topic.get(topic, []),
+                "missing": topic not in sections_by_topic,
+            }
+            for topic in self.topics
+        ]
+
+    @staticmethod
+    def _match_topic(item: Dict[str, Any], group: List[str]) -> Optional[str]:
+        """按话题编号（组内从1开始）或话题名称匹配"""
+        topic_id = item.get("topic_id")
+        if isinstance(topic_id, int) and 1 <= topic_id <= len(group):
+            return group[topic_id - 1]
+        topic = item.get("topic")
+        return topic if topic in group else None
+
+    def _choose_topics_per_request(self) -> int:
+        """
+        根据token预算自动确定每个请求的话题数K：
+        - 输出：K * 每话题估算输出 <= 输出预算
+        - 输入：共享上下文 + K个话题的说明 <= 输入上限
+        """
+        if not self.topics:
+            return 1
+
+        by_output = self.OUTPUT_TOKEN_BUDGET // self.EST_OUTPUT_TOKENS_PER_TOPIC
+
+        shared_tokens = self.context_tokens + self.supplement_tokens + self.output_format_tokens + self.prompt_template_tokens
+        per_topic_tokens = max(count_tokens(f"{i}. {topic}") for i, topic in enumerate(self.topics, 1)) + 5
+        by_input = (self.MODEL_CONTEXT_TOKENS - shared_tokens - count_tokens(self._packed_instruction([]))) // per_topic_tokens
+
+        k = max(1, min(by_output, by_input, self.MAX_TOPICS_PER_REQUEST, len(self.topics)))
+        logger.debug(f"每个请求的话题数K={k} (输出预算允许{by_output}, 输入预算允许{by_input})")
+        return k
+
+    def _group_topics(self, k: int) -> List[List[str]]:
+        """按K把话题均匀分组（各组数量相差不超过1）"""
+        if not self.topics:
+            return []
+        groups_count = math.ceil(len(self.topics) / k)
+        size, extra = divmod(len(self.topics), groups_count)
+        groups, start = [], 0
+        for i in range(groups_count):
+            end = start + size + (1 if i < extra else 0)
+            groups.append(self.topics[start:end])
+            start = end
+        return groups
+
     def _prepare_context(self) -> Tuple[List[str], Dict[str, str]]:
         """
         准备请求数据
@@ -90,11 +221,13 @@ class FindTopicContextBatch():
         return "此任务无补充内容"
     
 
-    def _prepare_instruction(self) -> str:
+    def _prepare_instruction(self) -> List[str]:
+        if self.packing:
+            return [self._packed_instruction(group) for group in self.topic_groups]
+        return [self._topic_instruction(group[0]) for group in self.topic_groups]
 
-        instructions = []
-        for topic in self.topics:
-            instruction = f"""
+    def _topic_instruction(self, topic: str) -> str:
+        return f"""
 以下提供了招标文件的完整目录（材料A）。。
 
 请根据语义为我确定，是否存在一个章节关于“话题：{topic}” 进行了详细说明？
@@ -104,8 +237,22 @@ class FindTopicContextBatch():
 请精准地指出章节位置，列出章节的标题。 
 
 """
-            instructions.append(instruction)
-        return instructions
+
+    def _packed_instruction(self, topics: List[str]) -> str:
+        topic_lines = "\n".join(f"{i}. {topic}" for i, topic in enumerate(topics, 1))
+        return f"""
+以下提供了招标文件的完整目录（材料A），以及需要定位的话题清单（共{len(topics)}个）：
+
+{topic_lines}
+
+请对每个话题分别完成：
+1. 根据语义确定，是否存在一个章节对该话题进行了详细说明？
+2. 如果没有，请指出哪些章节可能涵盖了该话题的详细内容。
+3. 请精准地指出章节位置，列出章节的标题。
+
+每个话题都要输出一条记录，即使没有找到相关章节（此时 sections 为空列表）。
+
+"""
 
 
 
@@ -120,6 +267,23 @@ class FindTopicContextBatch():
 ]
 - 一个标题一条数据。 
 
+"""
+
+
+    def _prepare_packed_output_format(self) -> str:
+        return """
+        
+- 只输出符合JSON格式的数据，不要添加解释、注释或 Markdown 标记。
+- 每个话题一条记录，topic_id 为话题清单中的编号，topic 为话题原文。
+- 示例：
+[
+    {"topic_id": int, "topic": str, "sections": [
+        {"path": [int], "level": int, "title": str, "reason": str}
+    ]},
+    {"topic_id": int, "topic": str, "sections": []}
+]
+- sections 中一个标题一条数据。
+
 """
 
 
@@ -175,7 +339,7 @@ class FindTopicContextBatch():
         # 创建聊天提示模板
         prompt = ChatPromptTemplate.from_messages([
             SystemMessagePromptTemplate.from_template(
-                "你是一个专业的招标文档分析助手，帮助用户分析文档的结构和内容。"
+                self.SYSTEM_ROLE
             ),
             HumanMessagePromptTemplate.from_template(
                 # self.task.prompt_template,
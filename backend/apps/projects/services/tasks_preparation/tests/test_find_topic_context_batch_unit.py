@@ -0,0 +1,119 @@
+import json
+import pytest
+from apps.projects.services.tasks_preparation import find_topic_context_batch
+from apps.projects.services.tasks_preparation.find_topic_context_batch import FindTopicContextBatch
+
+pytestmark = [pytest.mark.unit]
+
+
+TOC = "1 投标人须知\n2 评标办法\n3 合同条款\n4 技术要求"
+
+
+@pytest.fixture(autouse=True)
+def stub_tokens_and_context(monkeypatch):
+    # token数按字符数估算，目录直接使用固定文本（不依赖tiktoken和tiptap文档）
+    monkeypatch.setattr(find_topic_context_batch, "count_tokens", lambda text: len(text))
+    monkeypatch.setattr(FindTopicContextBatch, "_prepare_context", lambda self: (TOC, {}))
+
+
+def make_topics(count: int) -> list:
+    return [f"话题{i}" for i in range(1, count + 1)]
+
+
+def make_batch(topics, **budgets) -> FindTopicContextBatch:
+    with pytest.MonkeyPatch.context() as patch:
+        for name, value in budgets.items():
+            patch.setattr(FindTopicContextBatch, name, value)
+        return FindTopicContextBatch(doc=None, topics=topics)
+
+
+# ------------------------------ K的选择 ------------------------------
+
+def test_topics_per_request_bounded_by_output_budget():
+    batch = make_batch(make_topics(20), OUTPUT_TOKEN_BUDGET=600, EST_OUTPUT_TOKENS_PER_TOPIC=200)
+    assert batch.topics_per_request == 3
+    assert len(batch.instructions) == 7
+
+
+def test_topics_per_request_bounded_by_max_topics():
+    batch = make_batch(make_topics(25), OUTPUT_TOKEN_BUDGET=100000, MAX_TOPICS_PER_REQUEST=10)
+    assert batch.topics_per_request == 10
+    assert [len(group) for group in batch.topic_groups] == [9, 8, 8]
+
+
+def test_topics_per_request_bounded_by_input_budget():
+    batch = make_batch(make_topics(20), OUTPUT_TOKEN_BUDGET=100000, MAX_TOPICS_PER_REQUEST=50)
+    shared = batch.context_tokens + batch.supplement_tokens + batch.output_format_tokens + batch.prompt_template_tokens
+    per_topic = max(len(f"{i}. {topic}") for i, topic in enumerate(batch.topics, 1)) + 5
+    # 输入上限只够再放下2个话题的说明
+    batch.MODEL_CONTEXT_TOKENS = shared + len(batch._packed_instruction([])) + 2 * per_topic + per_topic // 2
+    assert batch._choose_topics_per_request() == 2
+
+
+def test_topics_per_request_at_least_one_and_at_most_topic_count():
+    assert make_batch(make_topics(3), OUTPUT_TOKEN_BUDGET=100000).topics_per_request == 3
+    assert make_batch(make_topics(5), OUTPUT_TOKEN_BUDGET=10).topics_per_request == 1
+
+
+# ------------------------------ 分组 ------------------------------
+
+@pytest.mark.parametrize("count, k", [(11, 4), (20, 3), (7, 7), (10, 1), (23, 10)])
+def test_groups_are_even_and_keep_order(count, k):
+    batch = make_batch(make_topics(count))
+    groups = batch._group_topics(k)
+
+    sizes = [len(group) for group in groups]
+    assert max(sizes) - min(sizes) <= 1
+    assert max(sizes) <= k
+    assert [topic for group in groups for topic in group] == batch.topics
+
+
+# ------------------------------ 结果拆分 ------------------------------
+
+def test_split_results_maps_by_topic_id_and_falls_back_to_topic_name():
+    batch = make_batch(make_topics(4), OUTPUT_TOKEN_BUDGET=400, EST_OUTPUT_TOKENS_PER_TOPIC=200)
+    assert batch.topic_groups == [["话题1", "话题2"], ["话题3", "话题4"]]
+
+    section = {"path": [1], "level": 1, "title": "投标人须知", "reason": "相关"}
+    raw_results = [
+        # topic_id为组内编号；编号无效时按话题原文匹配
+        json.dumps([
+            {"topic_id": 2, "topic": "名称写错", "sections": [section]},
+            {"topic_id": 9, "topic": "话题1", "sections": []},
+        ], ensure_ascii=False),
+        # 代码块包裹的输出；话题4被模型跳过
+        "```json\n" + json.dumps([{"topic_id": 1, "topic": "话题3", "sections": [section]}], ensure_ascii=False) + "\n```",
+    ]
+
+    records = batch.split_results(raw_results)
+
+    assert [record["topic"] for record in records] == batch.topics
+    assert records[0] == {"topic": "话题1", "sections": [], "missing": False}
+    assert records[1] == {"topic": "话题2", "sections": [section], "missing": False}
+    assert records[2]["sections"] == [section]
+    assert records[3] == {"topic": "话题4", "sections": [], "missing": True}
+
+
+def test_split_results_marks_unparseable_group_missing():
+    batch = make_batch(make_topics(4), OUTPUT_TOKEN_BUDGET=400, EST_OUTPUT_TOKENS_PER_TOPIC=200)
+    raw_results = [
+        json.dumps([{"topic_id": 1, "sections": []}, {"topic_id": 2, "sections": []}]),
+        "无法识别",
+    ]
+
+    records = batch.split_results(raw_results)
+
+    assert [record["missing"] for record in records] == [False, False, True, True]
+
+
+def test_split_results_without_packing_uses_whole_output_per_topic():
+    batch = FindTopicContextBatch(doc=None, topics=make_topics(2), packing=False)
+    section = {"path": [2], "level": 1, "title": "评标办法", "reason": "相关"}
+
+    records = batch.split_results([json.dumps([section], ensure_ascii=False), "[]"])
+
+    assert batch.topic_groups == [["话题1"], ["话题2"]]
+    assert records == [
+        {"topic": "话题1", "sections": [section], "missing": False},
+        {"topic": "话题2", "sections": [], "missing": False},
+    ]
@@ -17,6 +17,17 @@ class RedisStreamStatus:
     FAILED = "FAILED"
 
 
+# 自动编号追加流块：LLEN + RPUSH + EXPIRE 在Redis端原子执行（一次往返）
+# ARGV[1]为不含index的块JSON（以"{"开头），脚本把当前列表长度作为index拼到开头
+ADD_CHUNK_SCRIPT = """
+local index = redis.call('LLEN', KEYS[1])
+local data = '{"index": ' .. index .. ', ' .. string.sub(ARGV[1], 2)
+redis.call('RPUSH', KEYS[1], data)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return index
+"""
+
+
 class RedisManager:
     """Redis 管理器，用于处理大模型流式输出的存储和检索"""
     
@@ -31,6 +42,7 @@ class RedisManager:
                 decode_responses=True  # 自动将字节解码为字符串
             )
             self.default_expiry = 3600  # 默认过期时间：1小时
+            self._add_chunk_script = self.redis_client.register_script(ADD_CHUNK_SCRIPT)
             
             # 测试连接(测试用)
             ping_result = self.redis_client.ping()
@@ -62,28 +74,32 @@ class RedisManager:
         try:
             stream_key = self.create_stream_key(stream_id)
             
-            # 如果没有提供索引，获取当前长度作为索引
+            # 如果没有提供索引，以当前长度作为索引（在Redis端取长度并追加，一次往返）
             if index is None:
-                index = self.redis_client.llen(stream_key)
-            
-            # 存储数据
-            data = json.dumps({
-                "index": index,
-                "content": chunk,
-                "timestamp": time.time()
-            })
-            
-            # 添加到列表
-            self.redis_client.rpush(stream_key, data)
+                data = json.dumps({"content": chunk, "timestamp": time.time()})
+                self._add_chunk_script(keys=[stream_key], args=[data, self.default_expiry])
+                return True
             
-            # 设置过期时间
-            self.redis_client.expire(stream_key, self.default_expiry)
+            pipe = self.redis_client.pipeline()
+            self._queue_chunk(pipe, stream_id, chunk, index)
+            pipe.execute()
             
             return True
         except Exception as e:
             logger.error(f"添加流块失败: {str(e)}, stream_id={stream_id}")
             return False
     
+    def _queue_chunk(self, pipe, stream_id: str, chunk: str, index: int) -> None:
+        """在管道中加入追加流块（指定index）和刷新过期时间的命令"""
+        stream_key = self.create_stream_key(stream_id)
+        data = json.dumps({
+            "index": index,
+            "content": chunk,
+            "timestamp": time.time()
+        })
+        pipe.rpush(stream_key, data)
+        pipe.expire(stream_key, self.default_expiry)
+
     def mark_stream_complete(self, stream_id: str) -> bool:
         """
         标记流式输出已完成
@@ -95,13 +111,13 @@ class RedisManager:
             bool: 操作是否成功
         """
         try:
-            # 添加完成标记
-            self.add_stream_chunk(stream_id, "DONE", -1)
-            
-            # 更新任务状态
+            # 添加完成标记并更新任务状态（一个事务，一次往返）
             status_key = self.create_status_key(stream_id)
-            self.redis_client.hset(status_key, "status", RedisStreamStatus.COMPLETED)
-            self.redis_client.expire(status_key, self.default_expiry)
+            pipe = self.redis_client.pipeline()
+            self._queue_chunk(pipe, stream_id, "DONE", -1)
+            pipe.hset(status_key, "status", RedisStreamStatus.COMPLETED)
+            pipe.expire(status_key, self.default_expiry)
+            pipe.execute()
             
             return True
         except Exception as e:
@@ -120,14 +136,13 @@ class RedisManager:
             bool: 操作是否成功
         """
         try:
-            # 添加错误标记
-            self.add_stream_chunk(stream_id, f"ERROR: {error_message}", -2)
-            
-            # 更新任务状态
+            # 添加错误标记并更新任务状态（一个事务，一次往返）
             status_key = self.create_status_key(stream_id)
-            self.redis_client.hset(status_key, "status", RedisStreamStatus.FAILED)
-            self.redis_client.hset(status_key, "error", error_message)
-            self.redis_client.expire(status_key, self.default_expiry)
+            pipe = self.redis_client.pipeline()
+            self._queue_chunk(pipe, stream_id, f"ERROR: {error_message}", -2)
+            pipe.hset(status_key, mapping={"status": RedisStreamStatus.FAILED, "error": error_message})
+            pipe.expire(status_key, self.default_expiry)
+            pipe.execute()
             
             return True
         except Exception as e:
@@ -178,13 +193,11 @@ class RedisManager:
 
         while not done:
             try:
-                # 获取新块
-                current_length = self.redis_client.llen(stream_key)
+                # 获取新块（直接读取上次位置之后的所有块，一次往返）
+                chunks = self.redis_client.lrange(stream_key, last_index + 1, -1)
                 
-                if current_length > last_index + 1:
+                if chunks:
                     # 有新块可用
-                    chunks = self.redis_client.lrange(stream_key, last_index + 1, current_length - 1)
-                    
                     for chunk in chunks:
                         try:
                             data = json.loads(chunk)
@@ -205,7 +218,7 @@ class RedisManager:
                             # 如果解析失败，以原始形式发送
                             yield f"data: {chunk}\n\n"
                     
-                    last_index = current_length - 1
+                    last_index += len(chunks)
                 else:
                     # 检查任务是否已完成或失败
                     status_key = self.create_status_key(stream_id)
@@ -239,19 +252,13 @@ class RedisManager:
         try:
             status_key = self.create_status_key(stream_id)
             
-            # 设置基本状态
-            self.redis_client.hset(status_key, "status", RedisStreamStatus.PENDING)
-            self.redis_client.hset(status_key, "start_time", time.time())
-            
-            # 添加元数据
-            if metadata:
-                for key, value in metadata.items():
-                    if isinstance(value, (dict, list)):
-                        value = json.dumps(value)
-                    self.redis_client.hset(status_key, key, value)
-            
-            # 设置过期时间
-            self.redis_client.expire(status_key, self.default_expiry)
+            # 基本状态和元数据一次写入，并设置过期时间（一个事务，一次往返）
+            fields = {"status": RedisStreamStatus.PENDING, "start_time": time.time()}
+            fields.update(self._encode_metadata(metadata))
+            pipe = self.redis_client.pipeline()
+            pipe.hset(status_key, mapping=fields)
+            pipe.expire(status_key, self.default_expiry)
+            pipe.execute()
             
             return True
         except Exception as e:
@@ -274,29 +281,31 @@ class RedisManager:
             status_key = self.create_status_key(stream_id)
             logger.info(f"更新流状态: stream_id={stream_id}, status={status}, key={status_key}")
             
-            # 更新状态
-            self.redis_client.hset(status_key, "status", status)
-            self.redis_client.hset(status_key, "update_time", time.time())
-            
-            # 更新元数据
-            if metadata:
-                for key, value in metadata.items():
-                    if isinstance(value, (dict, list)):
-                        value = json.dumps(value)
-                    self.redis_client.hset(status_key, key, value)
-            
-            # 刷新过期时间
-            self.redis_client.expire(status_key, self.default_expiry)
+            # 更新状态和元数据，并刷新过期时间（一个事务，一次往返）
+            fields = {"status": status, "update_time": time.time()}
+            fields.update(self._encode_metadata(metadata))
+            pipe = self.redis_client.pipeline()
+            pipe.hset(status_key, mapping=fields)
+            pipe.expire(status_key, self.default_expiry)
+            pipe.execute()
 
-            # 验证数据是否写入(测试用)
-            verification = self.redis_client.hgetall(status_key)
-            logger.info(f"验证流状态: key={status_key}, data={verification}")
+            # 验证数据是否写入(测试用，只在DEBUG日志级别时多读一次)
+            if logger.isEnabledFor(logging.DEBUG):
+                verification = self.redis_client.hgetall(status_key)
+                logger.debug(f"验证流状态: key={status_key}, data={verification}")
                         
             return True
         except Exception as e:
             logger.error(f"更新任务状态失败: {str(e)}, stream_id={stream_id}")
             return False
     
+    def _encode_metadata(self, metadata: Optional[Dict]) -> Dict:
+        """元数据中的dict/list序列化为JSON，用于写入状态hash"""
+        return {
+            key: json.dumps(value) if isinstance(value, (dict, list)) else value
+            for key, value in (metadata or {}).items()
+        }
+
     def get_stream_status(self, stream_id: str) -> Dict:
         """
         获取任务状态
@@ -26,6 +26,7 @@ from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
+from apps._tools.LLM_services._llm_telemetry import llm_metrics_view
 
 @csrf_exempt
 @api_view(['GET'])
@@ -41,6 +42,7 @@ urlpatterns = [
 
     # ------------------------------ 健康检查API ------------------------------
     path('api/health/', health_check, name='health_check'),
+    path('api/metrics/llm/', llm_metrics_view, name='llm_metrics'),
 
     # ------------------------------ 测试API ------------------------------
     path('api/testground/', include('apps.testground.urls')),
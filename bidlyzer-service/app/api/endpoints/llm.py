@@ -0,0 +1,58 @@
+from typing import Optional
+from fastapi import APIRouter, Response, status
+from app.services.llm.llm_registry import LLMServiceRegistry
+from app.services.llm.rate_limiter import LLMRateLimiter
+from app.services.llm.adaptive_limiter import LLMConcurrencyController
+from app.services.llm.llm_cache import LLMResponseCache
+from app.services.llm.telemetry import LLMTelemetry
+from app.services.llm.hedging import LLMHedging
+from app.services.llm.scheduler import LLMScheduler
+from app.services.llm.json_extractor import JSONExtractor
+
+router = APIRouter()
+
+
+@router.get("/stats", status_code=status.HTTP_200_OK)
+async def llm_stats():
+    """
+    LLM调用监控数据：限流器排队深度和等待时间、各端点自适应并发状态、响应缓存命中率、服务注册表命中情况、
+    各阶段对冲请求数及开启/未开启对冲时的p50/p95延迟、各优先级的排队延迟和抢占次数、输出JSON的解析/修复次数
+    """
+    return {
+        "rate_limiters": LLMRateLimiter.stats(),
+        "concurrency": LLMConcurrencyController.stats(),
+        "response_cache": LLMResponseCache.stats(),
+        "service_registry": LLMServiceRegistry.stats(),
+        "hedging": LLMHedging.stats(),
+        "scheduler": LLMScheduler.stats(),
+        "json_extraction": JSONExtractor.stats(),
+    }
+
+
+@router.delete("/cache", status_code=status.HTTP_200_OK)
+async def invalidate_llm_cache(model: Optional[str] = None):
+    """
+    清除LLM响应缓存，指定model时只清除该模型的缓存
+    """
+    deleted = await LLMResponseCache.invalidate_model(model)
+    return {
+        "model": model,
+        "deleted": deleted,
+    }
+
+
+@router.get("/metrics", status_code=status.HTTP_200_OK)
+async def llm_metrics():
+    """
+    Prometheus格式的LLM调用指标：排队时间、首token延迟、调用耗时直方图，按阶段/模型的token用量、费用、重试次数
+    """
+    content, content_type = LLMTelemetry.metrics()
+    return Response(content=content, media_type=content_type)
+
+
+@router.get("/usage/{project_id}", status_code=status.HTTP_200_OK)
+async def llm_project_usage(project_id: str):
+    """
+    某个项目按阶段汇总的LLM调用次数、token用量、费用和平均延迟
+    """
+    return await LLMTelemetry.project_summary(project_id)
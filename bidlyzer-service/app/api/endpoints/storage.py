@@ -0,0 +1,40 @@
+from fastapi import APIRouter, status
+from app.services.cache_persister import CachePersister
+from app.services.document_cache import DocumentCache
+from app.services.cache_fill import CacheFill
+from app.services.document_delta import DocumentDelta
+from app.core.redis_codec import RedisCodec
+
+router = APIRouter()
+
+
+@router.get("/stats", status_code=status.HTTP_200_OK)
+async def storage_stats():
+    """
+    缓存与存储的监控数据
+    - write_behind: 缓存到Django延迟写入的待写入项目/字段/历史条目数、合并的写入次数、提交批次大小、提交延迟p50/p95、失败次数
+      （Prometheus指标 cache_persist_* 见 /llm/metrics）
+    - document_cache: 进程内文档缓存的容量、淘汰次数，各处理步骤的命中率、Redis读取字节数和JSON解析耗时
+    - redis_codec: Redis值的编码/解码次数、压缩算法、压缩比和耗时
+    - document_delta: h1_document等按相对raw_document的节点差异保存的次数、节省的字节数（dedup_ratio）和计算/重建耗时
+    - cache_fill: 缓存未命中回源django的次数，按key_name统计合并的并发请求数（进程内/跨进程）和等待时间
+    """
+    return {
+        "write_behind": CachePersister.stats(),
+        "document_cache": DocumentCache.stats(),
+        "redis_codec": RedisCodec.stats(),
+        "cache_fill": CacheFill.stats(),
+        "document_delta": DocumentDelta.stats(),
+    }
+
+
+@router.post("/flush", status_code=status.HTTP_200_OK)
+async def storage_flush():
+    """
+    立即提交所有待写入的数据
+    """
+    success = await CachePersister.flush()
+    return {
+        "success": success,
+        "stats": CachePersister.stats(),
+    }
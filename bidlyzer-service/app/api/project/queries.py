@@ -56,14 +56,14 @@ async def get_agent_state(project_id: str):
 
 
 @router.get("/{project_id}/agent-message-history", response_model=SSEHistoryResponse)
-async def get_agent_message_history(project_id: str):
+async def get_agent_message_history(project_id: str, start: int = 0, end: int = -1):
     """
     额外端点: 查询SSE消息历史
-    用于前端主动查询SSE消息历史
+    用于前端主动查询SSE消息历史，start/end 为消息下标范围（闭区间，支持负数，如 start=-20 取最近20条）
     """
     try:
         cache = Cache(project_id)
-        _, message_history = await cache.get_agent_message()
+        message_history = await cache.get_agent_message_history(start, end)
         
         if not message_history:
             raise HTTPException(status_code=404, detail="项目消息历史未找到")
@@ -7,7 +7,9 @@ import json
 import logging
 from datetime import datetime
 from app.services.cache import Cache
-from app.core.redis_helper import RedisClient
+from app.core.config import settings
+from app.core.redis_helper import parse_stream_id
+from app.services.sse_hub import SSEHub, RESYNC
 from app.services.bp_msg import AgentMessage
 from app.services.broadcast import publish_state_update
 
@@ -18,8 +20,22 @@ router = APIRouter()
 
 # ========================= 端点实现 =========================
 
+def format_event(stream_id: Optional[str], agent_msg: Dict[str, Any]) -> str:
+    """
+    构建完整的SSE事件，使用AgentMessage的event/data/retry字段
+    id为消息在Stream中的ID（用于断线重连的Last-Event-ID）；不写入Stream的临时消息不带id，不改变客户端的Last-Event-ID
+    """
+    event_id = f"id: {stream_id}\n" if stream_id else ""
+    return (
+        f"{event_id}"
+        f"event: {agent_msg.get('event', 'message')}\n"
+        f"data: {json.dumps(agent_msg.get('data', {}))}\n"
+        f"retry: {agent_msg.get('retry', 3000)}\n\n"   # retry通常以毫秒为单位
+    )
+
+
 @router.get("/{project_id}/sse")
-async def sse_stream(project_id: str, request: Request):
+async def sse_stream(project_id: str, request: Request, last_event_id: Optional[str] = None):
     """
     端点4: SSE流 (使用中间件认证)
     Agent向前端实时推送状态更新和进度信息
@@ -28,7 +44,14 @@ async def sse_stream(project_id: str, request: Request):
     - HTTP请求: Authorization: Bearer <token>
     - SSE连接: URL参数 ?token=<token>
     - 认证由JWTAuthMiddleware统一处理
+
+    断线重连:
+    - agent消息的事件id是它在消息Stream中的ID，EventSource自动重连时带 Last-Event-ID 请求头（前端自行重建连接时可用URL参数 ?last_event_id=）
+    - 先补发该ID之后错过的消息，再继续推送实时消息；ID已不在Stream中时发送 resync 事件，前端需要重新读取消息历史
+    - 客户端接收太慢、连接的消息队列溢出时同样发送 resync 事件（reason为overflow）
     """
+    last_event_id = request.headers.get("Last-Event-ID") or last_event_id
+
     async def event_generator():
         """SSE事件生成器"""
         try:
@@ -36,79 +59,65 @@ async def sse_stream(project_id: str, request: Request):
             user_info = request.state.user
             user_id = user_info.get('user_id', 'unknown')
             
-            logger.info(f"SSE连接已建立 - 项目: {project_id}, 用户: {user_id}")
+            logger.info(f"SSE连接已建立 - 项目: {project_id}, 用户: {user_id}, Last-Event-ID: {last_event_id}")
             
-            # Redis订阅通道
-
+            # Redis订阅通道（由进程内的SSEHub统一订阅，每个连接只注册一个消息队列）
             cache = Cache(project_id)
             channel = cache.get_channel_keys()['sse_channel']
             
-            # 发送初始连接确认（包含用户信息）
-            yield f"event: connected\n"
-            yield f"data: {json.dumps({
-                'projectId': project_id,
-                'userId': user_id,
-                'message': '连接已建立'
-            })}\n\n"
-            
-            
-            # 添加心跳计时器
-            last_heartbeat = datetime.now()
-            HEARTBEAT_INTERVAL = 15  # 心跳间隔(秒)
+            async with SSEHub.connect(channel) as connection:
+                # 发送初始连接确认（包含用户信息）
+                connected = json.dumps({'projectId': project_id, 'userId': user_id, 'message': '连接已建立'})
+                yield f"event: connected\n"
+                yield f"data: {connected}\n\n"
 
+                # 补发断线期间错过的消息：连接已先注册，补发期间到达的实时消息在队列中等待，其中已补发的按Stream ID跳过
+                replayed_id = None
+                if last_event_id:
+                    missed = await cache.get_agent_messages_since(last_event_id)
+                    SSEHub.record_replay(None if missed is None else len(missed))
+                    if missed is None:
+                        resync = json.dumps({'projectId': project_id, 'lastEventId': last_event_id})
+                        yield f"event: resync\n"
+                        yield f"data: {resync}\n\n"
+                    else:
+                        replayed_id = parse_stream_id(last_event_id)
+                        for stream_id, agent_msg in missed:
+                            yield format_event(stream_id, agent_msg)
+                            replayed_id = parse_stream_id(stream_id)
 
-            # 监听Redis消息
-            pubsub = await RedisClient.subscribe(channel)
-            
-            try:
-                # 监听消息
+                # 阻塞等待消息，超过心跳间隔没有消息时发送心跳
                 while True:
+                    data = await connection.get(timeout=settings.SSE_HEARTBEAT_INTERVAL)
 
-                    # 发送心跳（如果超过间隔时间）
-                    if (datetime.now() - last_heartbeat).total_seconds() > HEARTBEAT_INTERVAL:
+                    if data is None:
                         yield ":heartbeat\n\n"  # 发送空注释作为心跳
-                        last_heartbeat = datetime.now()
-
-                    message = await pubsub.get_message(ignore_subscribe_messages=True) #拿掉timeout=1.0， 否则会阻塞
-
-                    print('监听到消息', message)
-                    if message is not None:
+                    elif data is RESYNC:
+                        # 队列溢出丢失了消息，无法按Stream ID补发，通知前端重新读取消息历史
+                        resync = json.dumps({'projectId': project_id, 'reason': 'overflow'})
+                        yield f"event: resync\n"
+                        yield f"data: {resync}\n\n"
+                    else:
                         try:
-                            # 解析AgentMessage
-                            if isinstance(message['data'], str):
-                                agent_msg = json.loads(message['data'])
-                            else:
-                                agent_msg = message['data']
-                            
-                            # 构建完整的SSE响应，使用AgentMessage的所有4个字段
-                            yield f"id: {agent_msg.get('id', '')}\n"
-                            yield f"event: {agent_msg.get('event', 'message')}\n"  
-                            yield f"data: {json.dumps(agent_msg.get('data', {}))}\n"
-                            yield f"retry: {agent_msg.get('retry', 3000)}\n\n"  # retry通常以毫秒为单位
+                            # 解析AgentMessage（写入消息Stream的消息带有stream_id）
+                            agent_msg = json.loads(data)
+                            stream_id = agent_msg.get('stream_id')
+                            if not (stream_id and replayed_id and parse_stream_id(stream_id) <= replayed_id):
+                                yield format_event(stream_id, agent_msg)
                             
                         except json.JSONDecodeError as e:
                             logger.error(f"Error parsing SSE message: {e}")
-                            continue
-                        
-                        await asyncio.sleep(0.1) # 添加短暂休眠避免CPU空转
                     
                     # 检查客户端是否断开连接
                     if await request.is_disconnected():
                         break
-                        
-            finally:
-                # 确保清理pubsub连接
-                await RedisClient.unsubscribe(pubsub, channel)
-                await pubsub.close()
             
         except Exception as e:
             logger.error(f"Error in SSE stream for project {project_id}: {str(e)}")
             # 发送错误消息
+            error = json.dumps({'projectId': project_id, 'error': str(e)})
             yield f"event: error\n"
-            yield f"data: {json.dumps({
-                'projectId': project_id,
-                'error': str(e)
-            })}\n\n"
+            yield f"data: {error}\n\n"
     
     return StreamingResponse(
         event_generator(),
@@ -119,4 +128,13 @@ async def sse_stream(project_id: str, request: Request):
             "Access-Control-Allow-Origin": "*",
             "Access-Control-Allow-Headers": "Cache-Control"
         }
-    )
\ No newline at end of file
+    )
+
+
+@router.get("/sse/stats")
+async def sse_stats():
+    """
+    当前进程的SSE连接监控：连接数/通道数、hub收到和分发的消息数、队列满丢弃的消息数、重新订阅次数、分发延迟p50/p95
+    （Prometheus指标 sse_* 见 /llm/metrics）
+    """
+    return SSEHub.stats()
@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from app.api.endpoints import users, events, django, celery
+from app.api.endpoints import users, events, django, celery, llm, storage
 from app.api.project import tests, sse, queries, documents, actions
 
 # 创建主路由
@@ -11,6 +11,10 @@ api_router.include_router(events.router, prefix="/events", tags=["tests"])
 api_router.include_router(celery.router, prefix="/tests", tags=["tests"])
 # 添加django路由, 用于处理django发出的请求，估计用处不大。
 api_router.include_router(django.router, prefix="/django", tags=["django"])
+# LLM调用监控
+api_router.include_router(llm.router, prefix="/llm", tags=["llm"])
+# 缓存到Django的延迟写入监控
+api_router.include_router(storage.router, prefix="/storage", tags=["storage"])
 
 api_router.include_router(actions.router, prefix="/projects", tags=["projects"])
 api_router.include_router(documents.router, prefix="/projects", tags=["projects"])
@@ -0,0 +1,124 @@
+import pytest
+from app.clients.tiptap.tools import (
+    DocumentTextIndex,
+    document_fingerprint,
+    get_headings,
+    get_paragraph_text_with_position,
+    formatted_chapters_md_with_position,
+    chapters_md_lines_with_position,
+)
+
+pytestmark = [pytest.mark.tiptap, pytest.mark.unit]
+
+
+@pytest.fixture
+def sample_doc():
+    """包含封面、一级标题、二级标题和表格的文档"""
+    return {
+        "type": "doc",
+        "content": [
+            {"type": "paragraph", "content": [{"type": "text", "text": "封面"}]},
+            {"type": "heading", "attrs": {"level": 1}, "content": [{"type": "text", "text": "第一章 总则"}]},
+            {"type": "paragraph", "content": [{"type": "text", "text": "正文"}, {"type": "text", "text": "内容"}]},
+            {"type": "table", "content": [{"type": "tableRow", "content": []}]},
+            {"type": "heading", "attrs": {"level": 2}, "content": [{"type": "text", "text": "1.1 说明"}]},
+        ]
+    }
+
+
+@pytest.fixture(autouse=True)
+def clear_index_cache():
+    DocumentTextIndex.clear_cache()
+    yield
+    DocumentTextIndex.clear_cache()
+
+
+def test_index_entries(sample_doc):
+    """测试索引的文本、类型和级别"""
+    index = DocumentTextIndex.from_doc(sample_doc)
+    assert len(index) == 5
+    assert index.text(2) == "正文内容"
+    assert index.get(3).type == "table"
+    assert [entry.position for entry in index.headings()] == [1, 4]
+    assert index.get(4).level == 2
+    assert index.text(99) == ""
+
+
+def test_index_cached_per_version(sample_doc):
+    """测试相同内容的文档共用一个索引，内容变化后重新构建"""
+    first = DocumentTextIndex.from_doc(sample_doc)
+    copied = {"type": "doc", "content": list(sample_doc["content"])}
+    assert DocumentTextIndex.from_doc(copied) is first
+
+    changed = {"type": "doc", "content": sample_doc["content"][:2]}
+    assert document_fingerprint(changed) != first.fingerprint
+    assert DocumentTextIndex.from_doc(changed) is not first
+
+
+def test_text_hash_stable(sample_doc):
+    """测试相同文本的哈希一致"""
+    index = DocumentTextIndex.from_doc(sample_doc)
+    other = DocumentTextIndex(sample_doc)
+    assert index.get(2).text_hash == other.get(2).text_hash
+    assert index.get(1).text_hash != index.get(2).text_hash
+
+
+def test_slice(sample_doc):
+    """测试按position范围切片"""
+    index = DocumentTextIndex.from_doc(sample_doc)
+    assert [entry.position for entry in index.slice(1, 3)] == [1, 2]
+    assert [entry.position for entry in index.slice(3)] == [3, 4]
+
+
+def test_tools_read_from_index(sample_doc):
+    """测试段落、标题、章节工具基于索引的输出"""
+    paragraphs = get_paragraph_text_with_position(sample_doc)
+    assert [p["position"] for p in paragraphs] == [0, 1, 2, 4]
+
+    headings, printed = get_headings(sample_doc)
+    assert [h["title"] for h in headings] == ["第一章 总则", "1.1 说明"]
+    assert headings[0]["node"] is sample_doc["content"][1]
+    assert "[H2] 1.1 说明 | position: 4" in printed
+
+    chapters = formatted_chapters_md_with_position(sample_doc)
+    assert len(chapters) == 1
+    assert "[table]: 表格内容此处省略... | position: 3" in chapters[0]["content"]
+
+
+def test_chapter_lines_match_formatted_chapters(sample_doc):
+    chapters = chapters_md_lines_with_position(sample_doc)
+
+    assert [position for position, _ in chapters[0]] == [1, 2, 3, 4]
+    assert chapters[0][0][1] == "章节标题: 第一章 总则 | position: 1"
+    assert "\n".join(line for _, line in chapters[0]) == formatted_chapters_md_with_position(sample_doc)[0]["content"]
+
+
+def test_same_document_object_hits_without_serializing(sample_doc, monkeypatch):
+    """测试同一文档对象按身份命中，已知版本时不计算指纹"""
+    from app.clients.tiptap.tools import text_index
+
+    first = DocumentTextIndex.from_doc(sample_doc, fingerprint="v1")
+    monkeypatch.setattr(text_index.orjson, "dumps", lambda *args, **kwargs: pytest.fail("不应序列化文档"))
+
+    assert DocumentTextIndex.from_doc(sample_doc) is first
+    get_headings(sample_doc)
+    get_paragraph_text_with_position(sample_doc)
+    formatted_chapters_md_with_position(sample_doc)
+
+
+def test_cache_is_bounded_by_bytes(sample_doc, monkeypatch):
+    """测试索引缓存按文档字节数淘汰，超过容量的文档不缓存"""
+    from app.core.config import settings
+
+    first = DocumentTextIndex.from_doc(sample_doc)
+    monkeypatch.setattr(settings, "DOCUMENT_INDEX_CACHE_MAX_BYTES", first.size)
+    smaller = DocumentTextIndex.from_doc({"type": "doc", "content": sample_doc["content"][:2]})
+
+    assert list(DocumentTextIndex._cache) == [smaller.fingerprint]
+    assert DocumentTextIndex._bytes == smaller.size
+    assert DocumentTextIndex.from_doc(sample_doc) is not first
+
+    monkeypatch.setattr(settings, "DOCUMENT_INDEX_CACHE_MAX_BYTES", 10)
+    DocumentTextIndex.clear_cache()
+    DocumentTextIndex.from_doc(sample_doc)
+    assert not DocumentTextIndex._cache
@@ -1,15 +1,20 @@
 # 导入并重新导出所有序列化器
 from .nodes import extract_text_from_node, turn_block_nodes_to_tiptap_doc
+from .text_index import DocumentTextIndex, IndexedNode, document_fingerprint
 from .paragraphs import get_paragraph_nodes_with_position, get_paragraph_text_with_position
 from .tables import (
     get_table_nodes_with_position, turn_tables_to_md_with_position, get_table_md_with_position, 
     update_all_tables_column_from_dict, print_defined_tables_columns
     )
 from .document import (
-    get_all_nodes_with_position, get_document_md_with_position, formatted_document_md_with_position
+    get_all_nodes_with_position, get_document_md_with_position, formatted_document_md_with_position,
+    format_md_element
     )
 from .headings import get_headings, update_nodes_to_headings
-from .chapters import extract_chapters_by_nodes, formatted_chapters_md_with_position, add_introduction_headings, extract_leaf_chapters
+from .chapters import (
+    extract_chapters_by_nodes, chapters_md_lines_with_position, formatted_chapters_md_with_position,
+    add_introduction_headings, extract_leaf_chapters
+    )
 
 __all__ = [
     
@@ -17,6 +22,11 @@ __all__ = [
     'extract_text_from_node',
     'turn_block_nodes_to_tiptap_doc',
 
+    # 文本索引
+    'DocumentTextIndex',
+    'IndexedNode',
+    'document_fingerprint',
+
     # 段落工具
     'get_paragraph_nodes_with_position',
     'get_paragraph_text_with_position',
@@ -32,6 +42,7 @@ __all__ = [
     'get_all_nodes_with_position',
     'get_document_md_with_position',
     'formatted_document_md_with_position',
+    'format_md_element',
 
     # 大纲工具
     'get_headings',
@@ -40,6 +51,7 @@ __all__ = [
 
     # 章节工具
     'extract_chapters_by_nodes',
+    'chapters_md_lines_with_position',
     'formatted_chapters_md_with_position',
     'add_introduction_headings',
     'extract_leaf_chapters'
@@ -1,7 +1,7 @@
 from typing import Dict, List, Any, Optional, Tuple
 import json
 from copy import deepcopy
-from app.clients.tiptap.tools import extract_text_from_node, get_headings
+from app.clients.tiptap.tools import extract_text_from_node, get_headings, DocumentTextIndex
 
 import logging
 
@@ -68,14 +68,13 @@ def extract_chapters_by_nodes(tiptap_doc: Dict[str, Any]) -> List[List[Dict[str,
     
     return chapters
 
-# 为h2h3大纲分析提供素材
-def formatted_chapters_md_with_position(tiptap_doc: Dict[str, Any]) -> List[str]:
+# 为h2h3大纲分析提供素材（逐行，供按token预算打包/切分章节使用）
+def chapters_md_lines_with_position(tiptap_doc: Dict[str, Any]) -> List[List[Tuple[int, str]]]:
     """
-    按一级标题将文档节点分块成章节， 输出的是列表， 每个章节是一个字符串， 格式为:
-    "章节标题: 章节标题 | position: 章节位置"
-    "content: 章节内容 | position: 章节位置"
-    "content: 章节内容 | position: 章节位置"
-    ...
+    按一级标题将文档节点分块成章节， 输出的是列表， 每个章节是 (position, 格式化行) 的列表：
+    [(章节位置, "章节标题: 章节标题 | position: 章节位置"),
+     (段落位置, "content: 章节内容 | position: 段落位置"),
+     ...]
     """
     if not isinstance(tiptap_doc, dict) or tiptap_doc.get("type") != "doc":
         raise ValueError("输入必须是有效的 Tiptap 文档")
@@ -88,46 +87,57 @@ def formatted_chapters_md_with_position(tiptap_doc: Dict[str, Any]) -> List[str]
     current_chapter = []
     found_first_chapter = False
     
-    for index, node in enumerate(content):
-        if not isinstance(node, dict):
-            continue
+    # 节点文本从文档索引中切片获取
+    text_index = DocumentTextIndex.from_doc(tiptap_doc)
+
+    for entry in text_index:
+        index = entry.position
         
         # 如果是一级标题
-        if (node.get("type") == "heading" and 
-            node.get("attrs", {}).get("level") == 1):
+        if entry.type == "heading" and entry.level == 1:
             
             # 如果当前章节不为空，保存它并开始新章节
             if current_chapter:
-                chapter_doc = {
-                    "type": "doc",
-                    "content": "\n".join(current_chapter)
-                }
-                chapters.append(chapter_doc)
+                chapters.append(current_chapter)
             
             # 开始新章节（包括第一个标题）
-            formatted_node = (f"章节标题: {extract_text_from_node(node)} | position: {index}")
-            current_chapter = [formatted_node]
+            formatted_node = (f"章节标题: {entry.text} | position: {index}")
+            current_chapter = [(index, formatted_node)]
             found_first_chapter = True
         else:
             # 只有找到第一个标题后，才开始收集内容
             if found_first_chapter:
-                if node.get("type") == "table":
+                if entry.type == "table":
                     formatted_node = (f"[table]: 表格内容此处省略... | position: {index}")
                 else:
-                    formatted_node = (f"content: {extract_text_from_node(node)} | position: {index}")
-                current_chapter.append(formatted_node)
+                    formatted_node = (f"content: {entry.text} | position: {index}")
+                current_chapter.append((index, formatted_node))
     
     # 添加最后一个章节
     if current_chapter:
-        chapter_doc = {
-            "type": "doc",
-            "content": "\n".join(current_chapter)
-        }
-        chapters.append(chapter_doc)
+        chapters.append(current_chapter)
     
     return chapters
 
 
+# 为h2h3大纲分析提供素材
+def formatted_chapters_md_with_position(tiptap_doc: Dict[str, Any]) -> List[str]:
+    """
+    按一级标题将文档节点分块成章节， 输出的是列表， 每个章节是一个字符串， 格式为:
+    "章节标题: 章节标题 | position: 章节位置"
+    "content: 章节内容 | position: 章节位置"
+    "content: 章节内容 | position: 章节位置"
+    ...
+    """
+    return [
+        {
+            "type": "doc",
+            "content": "\n".join(line for _, line in chapter_lines)
+        }
+        for chapter_lines in chapters_md_lines_with_position(tiptap_doc)
+    ]
+
+
 # 添加 "前言" 标题, 同时输出 前言章节 以tiptap json格式 , 同时包含了 前言章节 position
 @staticmethod
 def add_introduction_headings(doc: Dict[str, Any]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
@@ -151,8 +161,9 @@ def add_introduction_headings(doc: Dict[str, Any]) -> Tuple[Dict[str, Any], List
     # 创建文档的深拷贝，避免修改原始文档
     updated_doc = json.loads(json.dumps(doc))
     
-    # 查找所有标题及其位置
-    headings, _ = get_headings(updated_doc)
+    # 查找所有标题及其位置（插入前言标题前，updated_doc 与 doc 内容一致，共用同一个文档索引）
+    text_index = DocumentTextIndex.from_doc(doc)
+    headings, _ = get_headings(doc)
     
     # 按文档顺序排序（根据位置）
     headings.sort(key=lambda h: h["position"])
@@ -184,7 +195,7 @@ def add_introduction_headings(doc: Dict[str, Any]) -> Tuple[Dict[str, Any], List
                 # 检查中间节点是否为段落且包含非空文本
                 middle_node_contents = []
                 for idx in range(current_pos + 1, next_pos):
-                    middle_node_contents.append(extract_text_from_node(content[idx]))
+                    middle_node_contents.append(text_index.text(idx))
                 
                 text = "".join(middle_node_contents)
                 if text.strip():
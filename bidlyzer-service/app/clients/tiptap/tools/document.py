@@ -1,7 +1,7 @@
 from typing import Dict, List, Any, Optional, Tuple
 import json
 from copy import deepcopy
-from app.clients.tiptap.tools import get_paragraph_text_with_position, get_table_md_with_position, extract_text_from_node
+from app.clients.tiptap.tools import get_paragraph_text_with_position, extract_text_from_node, DocumentTextIndex
 
 import logging
 
@@ -44,14 +44,28 @@ async def get_document_md_with_position(tiptap_doc: Dict[str, Any]) -> List[Dict
     输入：tiptap_doc: List[Dict[str, Any]]
     输出：List[Dict[str, Any]]
     """
+    index = DocumentTextIndex.from_doc(tiptap_doc)
     paragraphs_md = get_paragraph_text_with_position(tiptap_doc)
-    tables_md = await get_table_md_with_position(tiptap_doc)
+    tables_md = [
+        {'content': table_md, 'position': position, 'type': 'table'}
+        for position, table_md in (await index.tables_markdown()).items()
+    ]
 
     document_md = paragraphs_md + tables_md
     document_md.sort(key=lambda x: x["position"])
 
     return document_md
 
+def format_md_element(ele: Dict[str, Any], max_length: Optional[int] = None) -> str:
+    """
+    输入：get_document_md_with_position 输出的单个元素
+    输出：str, 形如 "content: xxx | position: 12"
+    """
+    content = ele["content"]
+    if max_length and len(content) > max_length:
+        return f"content: {content[:max_length]}... | position: {ele['position']}"
+    return f"content: {content} | position: {ele['position']}"
+
 # 为h1大纲分析提供素材
 async def formatted_document_md_with_position(tiptap_doc: Dict[str, Any], max_length: Optional[int] = None) -> str:
     """
@@ -60,19 +74,10 @@ async def formatted_document_md_with_position(tiptap_doc: Dict[str, Any], max_le
     """
     document_md = await get_document_md_with_position(tiptap_doc)
 
-    formatted_elements = []
-    for ele in document_md:
-        if ele["content"] != "":
-            if max_length:
-                if len(ele["content"]) > max_length:
-                    formatted_element = (f"content: {ele['content'][:max_length]}... | position: {ele['position']}")
-                else:
-                    formatted_element = (f"content: {ele['content']} | position: {ele['position']}")
-            else:
-                formatted_element = (f"content: {ele['content']} | position: {ele['position']}")
-            formatted_elements.append(formatted_element)
-
-    return "\n".join(formatted_elements)
-
-
+    formatted_elements = [
+        format_md_element(ele, max_length)
+        for ele in document_md
+        if ele["content"] != ""
+    ]
 
+    return "\n".join(formatted_elements)
\ No newline at end of file
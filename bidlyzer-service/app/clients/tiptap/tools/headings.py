@@ -1,7 +1,7 @@
 from typing import Dict, List, Any, Optional, Tuple
 import json
 from copy import deepcopy
-from app.clients.tiptap.tools import extract_text_from_node
+from app.clients.tiptap.tools import extract_text_from_node, DocumentTextIndex
 
 import logging
 
@@ -113,23 +113,21 @@ def get_headings(tiptap_doc: Dict[str, Any], indent: bool = True) -> Tuple[List[
     heading_nodes = []
     formatted_headings = []
     
-    # 直接遍历第一层内容，找到标题节点
-    for position, node in enumerate(content):
-        if isinstance(node, dict) and node.get('type') == 'heading':
-            # 提取标题级别
-            level = node.get('attrs', {}).get('level', 1)
-            
-            # 提取标题文本
-            title = extract_text_from_node(node)
-            
-            heading_nodes.append({
-                "node": node,
-                "position": position,
-                "level": level,
-                "title": title
-            })
-            prefix = "  " * (level - 1) if indent else ""
-            formatted_headings.append(f"{prefix}[H{level}] {title} | position: {position}")
+    # 从文档索引中取第一层的标题节点（标题文本已在索引中提取）
+    index = DocumentTextIndex.from_doc(tiptap_doc)
+    for entry in index.headings():
+        position = entry.position
+        level = entry.level if entry.level is not None else 1
+        title = entry.text
+
+        heading_nodes.append({
+            "node": content[position],
+            "position": position,
+            "level": level,
+            "title": title
+        })
+        prefix = "  " * (level - 1) if indent else ""
+        formatted_headings.append(f"{prefix}[H{level}] {title} | position: {position}")
     
     print_headings = "\n".join(formatted_headings)
     return heading_nodes, print_headings
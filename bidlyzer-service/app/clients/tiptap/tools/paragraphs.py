@@ -1,7 +1,7 @@
 import json
 from typing import Dict, List, Any, Optional, Union, Callable
 import logging
-from app.clients.tiptap.tools import extract_text_from_node
+from app.clients.tiptap.tools import extract_text_from_node, DocumentTextIndex
 logger = logging.getLogger(__name__)
 
 def get_paragraph_nodes_with_position(tiptap_doc: Dict[str, Any]) -> List[Dict[str, Any]]:
@@ -43,26 +43,15 @@ def get_paragraph_text_with_position(tiptap_doc: Dict[str, Any]) -> List[Dict[st
     # 输出：包含段落节点和位置信息的列表，格式为:
     # [{"text": paragraph_text, "index": 0}, {"text": paragraph_text, "index": 2}, ...]
     # 注意：这里不包括嵌套在表格等其他节点中的段落
+    # 文本从文档索引（DocumentTextIndex）中切片获取，同一文档版本不重复遍历
     """
-    if not isinstance(tiptap_doc, dict):
-        raise ValueError("输入必须是字典格式")
-    
-    if tiptap_doc.get('type') != 'doc':
-        raise ValueError("输入必须是有效的 Tiptap 文档（根节点类型应为 'doc'）")
-    
-    content = tiptap_doc.get('content', [])
-    if not isinstance(content, list):
-        return []
-    
-    paragraphs_info = []
-    
-    # 遍历第一层节点，只收集段落节点及其位置
-    for index, node in enumerate(content):
-        if isinstance(node, dict) and node.get('type') in ['paragraph', 'heading']:
-            paragraphs_info.append({
-                "content": extract_text_from_node(node),
-                "position": index,
-                "type": node.get('type')
-            })
-    
-    return paragraphs_info
\ No newline at end of file
+    index = DocumentTextIndex.from_doc(tiptap_doc)
+
+    return [
+        {
+            "content": entry.text,
+            "position": entry.position,
+            "type": entry.type
+        }
+        for entry in index.of_types('paragraph', 'heading')
+    ]
@@ -0,0 +1,204 @@
+import orjson
+import hashlib
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Any, Optional, Iterator
+import logging
+from app.core.config import settings
+from app.clients.tiptap.tools import extract_text_from_node, turn_block_nodes_to_tiptap_doc
+
+logger = logging.getLogger(__name__)
+
+
+def document_fingerprint(tiptap_doc: Dict[str, Any]) -> str:
+    """
+    输入：tiptap json 文档
+    输出：文档内容的哈希值，作为文档版本标识。内容不变，指纹不变。
+    """
+    return hashlib.blake2b(orjson.dumps(tiptap_doc), digest_size=16).hexdigest()
+
+
+@dataclass
+class IndexedNode:
+    """文档第一层节点的扁平化信息"""
+    position: int
+    type: str
+    text: str
+    level: Optional[int]
+    text_hash: str
+    _token_count: Optional[int] = None
+
+    @property
+    def token_count(self) -> int:
+        """节点文本的token数（首次访问时计算）"""
+        if self._token_count is None:
+            from app.services.task_service import count_tokens
+            self._token_count = count_tokens(self.text) if self.text else 0
+        return self._token_count
+
+
+class DocumentTextIndex:
+    """
+    文档文本/位置索引，每个文档版本只构建一次
+
+    - position -> 纯文本、节点类型、标题级别、token数、文本哈希
+    - 表格的markdown按需（懒加载）通过 tiptap 服务转换，并缓存在索引中
+    - L1、L2/L3、前言标题、规划等 prompt builder 都从索引切片，而不是重复遍历 Tiptap JSON
+
+    使用 DocumentTextIndex.from_doc(doc) 获取索引，同一文档对象或相同内容的文档会命中进程内缓存。
+    缓存按文档序列化字节数淘汰（DOCUMENT_INDEX_CACHE_MAX_BYTES），索引持有文档对象，通常与DocumentCache中的是同一个。
+    """
+
+    _cache: "OrderedDict[str, DocumentTextIndex]" = OrderedDict()
+    _by_id: Dict[int, str] = {}    # id(文档对象) -> 指纹，只登记索引自身持有的文档对象，不会因id复用误命中
+    _bytes: int = 0
+
+    def __init__(self, tiptap_doc: Dict[str, Any], fingerprint: Optional[str] = None):
+        if not isinstance(tiptap_doc, dict):
+            raise ValueError("输入必须是字典格式")
+
+        if tiptap_doc.get('type') != 'doc':
+            raise ValueError("输入必须是有效的 Tiptap 文档（根节点类型应为 'doc'）")
+
+        self.doc = tiptap_doc
+        self.fingerprint = fingerprint or document_fingerprint(tiptap_doc)
+        self.size = 0    # 文档序列化后的字节数（缓存时设置），用于按大小淘汰
+        self.entries: List[IndexedNode] = []
+        self._by_position: Dict[int, IndexedNode] = {}
+        self._table_md: Dict[int, str] = {}
+
+        content = tiptap_doc.get('content', [])
+        if not isinstance(content, list):
+            content = []
+
+        for position, node in enumerate(content):
+            if not isinstance(node, dict):
+                continue
+            node_type = node.get('type')
+            text = extract_text_from_node(node)
+            level = (node.get('attrs') or {}).get('level')
+            entry = IndexedNode(
+                position=position,
+                type=node_type,
+                text=text,
+                level=level,
+                text_hash=hashlib.md5(text.encode("utf-8")).hexdigest(),
+            )
+            self.entries.append(entry)
+            self._by_position[position] = entry
+
+    # ------------------------------ 构建与缓存 ------------------------------
+
+    @classmethod
+    def from_doc(cls, tiptap_doc: Dict[str, Any], fingerprint: Optional[str] = None, size: Optional[int] = None) -> "DocumentTextIndex":
+        """
+        获取文档索引（同一文档版本只构建一次）
+
+        - 同一个文档对象（如Cache返回的共享只读文档）按对象身份命中，O(1)，不序列化文档
+        - 调用方已知文档版本时（Cache中的内容哈希，见 Cache.get_document_index）传入fingerprint和序列化字节数size，省去序列化和哈希
+        - 否则序列化文档计算内容指纹（O(文档大小)）
+        被索引的文档对象不应再原地修改（与DocumentCache的只读约定相同，tiptap工具函数修改前先deepcopy）
+        """
+        index = cls._cached(tiptap_doc)
+        if index is not None:
+            return index
+
+        if fingerprint is None:
+            raw = orjson.dumps(tiptap_doc)
+            fingerprint, size = hashlib.blake2b(raw, digest_size=16).hexdigest(), len(raw)
+        index = cls._cache.get(fingerprint)
+        if index is not None:
+            cls._cache.move_to_end(fingerprint)
+            return index
+
+        index = cls(tiptap_doc, fingerprint=fingerprint)
+        index.size = size if size is not None else len(orjson.dumps(tiptap_doc))
+        cls._store(index)
+        logger.debug(f"构建文档索引: fingerprint={fingerprint}, nodes={len(index.entries)}, bytes={index.size}")
+        return index
+
+    @classmethod
+    def _cached(cls, tiptap_doc: Dict[str, Any]) -> Optional["DocumentTextIndex"]:
+        """按文档对象身份查找已缓存的索引"""
+        fingerprint = cls._by_id.get(id(tiptap_doc))
+        index = cls._cache.get(fingerprint) if fingerprint is not None else None
+        if index is None or index.doc is not tiptap_doc:
+            return None
+        cls._cache.move_to_end(fingerprint)
+        return index
+
+    @classmethod
+    def _store(cls, index: "DocumentTextIndex") -> None:
+        """缓存索引，总字节数超过容量时从最久未使用的开始淘汰；单个文档超过容量时不缓存"""
+        max_bytes = settings.DOCUMENT_INDEX_CACHE_MAX_BYTES
+        if index.size > max_bytes:
+            return
+        cls._cache[index.fingerprint] = index
+        cls._by_id[id(index.doc)] = index.fingerprint
+        cls._bytes += index.size
+        while cls._bytes > max_bytes and cls._cache:
+            _, evicted = cls._cache.popitem(last=False)
+            cls._by_id.pop(id(evicted.doc), None)
+            cls._bytes -= evicted.size
+
+    @classmethod
+    def clear_cache(cls) -> None:
+        """清空进程内的索引缓存"""
+        cls._cache.clear()
+        cls._by_id.clear()
+        cls._bytes = 0
+
+    # ------------------------------ 查询 ------------------------------
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self) -> Iterator[IndexedNode]:
+        return iter(self.entries)
+
+    def get(self, position: int) -> Optional[IndexedNode]:
+        """按position获取节点信息"""
+        return self._by_position.get(position)
+
+    def node(self, position: int) -> Dict[str, Any]:
+        """按position获取原始节点"""
+        return self.doc["content"][position]
+
+    def text(self, position: int) -> str:
+        """按position获取纯文本，position不存在时返回空字符串"""
+        entry = self._by_position.get(position)
+        return entry.text if entry else ""
+
+    def slice(self, start: int, end: Optional[int] = None) -> List[IndexedNode]:
+        """获取 [start, end) 范围内的节点信息"""
+        end = len(self.doc.get("content", [])) if end is None else end
+        return [entry for entry in self.entries if start <= entry.position < end]
+
+    def of_types(self, *node_types: str) -> List[IndexedNode]:
+        """获取指定类型的节点信息"""
+        return [entry for entry in self.entries if entry.type in node_types]
+
+    def headings(self) -> List[IndexedNode]:
+        """获取所有标题节点信息"""
+        return self.of_types('heading')
+
+    def token_count(self, start: int = 0, end: Optional[int] = None) -> int:
+        """计算 [start, end) 范围内节点文本的token总数"""
+        return sum(entry.token_count for entry in self.slice(start, end))
+
+    # ------------------------------ 表格（懒加载） ------------------------------
+
+    async def table_markdown(self, position: int) -> str:
+        """获取表格节点的markdown（首次访问时调用tiptap服务转换）"""
+        if position not in self._table_md:
+            from app.clients.tiptap.client import TiptapClient
+            table_doc = turn_block_nodes_to_tiptap_doc([self.node(position)])
+            self._table_md[position] = await TiptapClient().json_to_markdown(table_doc)
+        return self._table_md[position]
+
+    async def tables_markdown(self) -> Dict[int, str]:
+        """并发获取所有表格的markdown，返回 position -> markdown"""
+        positions = [entry.position for entry in self.of_types('table')]
+        results = await asyncio.gather(*[self.table_markdown(position) for position in positions])
+        return dict(zip(positions, results))
@@ -3,7 +3,7 @@ import os
 from pathlib import Path
 from pydantic import Field, ConfigDict
 from pydantic_settings import BaseSettings
-from typing import Optional  # 添加Optional导入
+from typing import Optional, Dict, Tuple  # 添加Optional导入
 from dotenv import load_dotenv
 
 
@@ -44,10 +44,45 @@ class Settings(BaseSettings):
     REDIS_DB: int = Field(default=0, description="Redis数据库索引")
     REDIS_PASSWORD: str = Field(default="123456", description="Redis密码，如果有的话")
     REDIS_URL: str = ""
+    REDIS_CODEC_COMPRESSION: str = Field(default="zstd", description="Redis中较大的值的压缩算法：zstd（未安装zstandard时退化为gzip）、gzip、none")
+    REDIS_CODEC_COMPRESS_MIN_BYTES: int = Field(default=16 * 1024, description="序列化后超过该字节数的值才压缩")
+    REDIS_CODEC_COMPRESSION_LEVEL: Optional[int] = Field(default=None, description="压缩级别，不设置时使用默认值（zstd为3，gzip为6）")
 
 
     # 缓存配置 for cache_manager.py
     STRUCTURING_CACHE_TIMEOUT: int = Field(default=900, description="缓存超时时间（秒）")
+    AGENT_STATE_HISTORY_MAX_LEN: int = Field(default=500, description="Redis中保留的agent状态历史条数（列表截断到最近N条）")
+    AGENT_MESSAGE_HISTORY_MAX_LEN: int = Field(default=1000, description="Redis中保留的agent消息历史条数（列表截断到最近N条）")
+    CACHE_PERSIST_WRITE_BEHIND: bool = Field(default=True, description="缓存写入Django是否延迟批量提交（False时每次保存后立即提交）")
+    CACHE_PERSIST_FLUSH_INTERVAL: float = Field(default=1.0, description="延迟写入的提交间隔（秒）")
+    DOCUMENT_CACHE_ENABLED: bool = Field(default=True, description="是否在Redis之前使用进程内的文档缓存（按内容版本校验）")
+    DOCUMENT_CACHE_MAX_BYTES: int = Field(default=64 * 1024 * 1024, description="进程内文档缓存的容量（按文档序列化后的字节数计）")
+    DOCUMENT_INDEX_CACHE_MAX_BYTES: int = Field(default=64 * 1024 * 1024, description="进程内文档文本索引缓存的容量（按被索引文档序列化后的字节数计）")
+    DOCUMENT_DELTA_ENABLED: bool = Field(default=True, description="raw_document之后的各版本文档是否保存为相对raw_document的节点差异（Redis和django中都按差异保存）")
+    DOCUMENT_DELTA_MAX_RATIO: float = Field(default=0.5, description="变化的节点超过整篇文档的该比例（按字节数）时仍保存整篇")
+    CACHE_FILL_LOCK_TIMEOUT: int = Field(default=30, description="缓存未命中回源django时的跨进程锁过期时间（秒）")
+    CACHE_FILL_WAIT_TIMEOUT: float = Field(default=30.0, description="等待其他进程回源的最长时间（秒），超时后自行回源")
+    CACHE_FILL_POLL_INTERVAL: float = Field(default=0.05, description="等待其他进程回源时检查锁的间隔（秒）")
+    SSE_HUB_CHANNEL_PATTERN: str = Field(default="*:sse_channel", description="SSE hub按模式订阅的Redis通道（所有项目的SSE通道）")
+    SSE_HUB_QUEUE_SIZE: int = Field(default=256, description="每个SSE连接待发送消息的队列长度，满时清空队列并通知客户端重新同步（resync事件）")
+    SSE_STREAM_MAX_LEN: int = Field(default=1000, description="每个项目保存在Redis Stream中的最近agent消息数（约数），SSE断线重连时从中补发错过的消息")
+    SSE_HEARTBEAT_INTERVAL: float = Field(default=15.0, description="SSE连接空闲多久（秒）发送一次心跳，同时检查客户端是否已断开")
+
+    # 结构化分析的token预算
+    STRUCTURING_L1_CONTEXT_TOKEN_BUDGET: int = Field(default=20000, description="L1大纲分析单次请求的上下文token上限，超过则分窗口并发")
+    STRUCTURING_L1_WINDOW_OVERLAP_TOKENS: int = Field(default=500, description="L1分窗口时相邻窗口重叠的token数")
+    STRUCTURING_L2_PACKING: bool = Field(default=True, description="L2/L3分析是否按token数打包小章节、切分大章节")
+    STRUCTURING_L2_CONTEXT_TOKEN_BUDGET: int = Field(default=6000, description="L2/L3分析单次请求的上下文token上限")
+    STRUCTURING_L2_SPLIT_OVERLAP_TOKENS: int = Field(default=300, description="L2/L3切分大章节时带入的上文token数")
+    STRUCTURING_L2_MAX_CHAPTERS_PER_REQUEST: int = Field(default=6, description="L2/L3单次请求最多打包的章节数")
+    STRUCTURING_L2_PARTIAL_PUBLISH_INTERVAL: float = Field(default=2.0, description="L2/L3分析过程中发布部分结果（已识别标题的文档）的最小间隔（秒），0表示不发布")
+
+    # 标题候选预筛选（只把候选标题及少量上下文送入L1、L2/L3的prompt）
+    STRUCTURING_HEADING_PREFILTER_ENABLED: bool = Field(default=True, description="L1、L2/L3大纲分析前是否用规则预筛选标题候选")
+    STRUCTURING_HEADING_PREFILTER_THRESHOLD: float = Field(default=2.0, description="标题候选的最低得分")
+    STRUCTURING_HEADING_PREFILTER_CONTEXT_SIZE: int = Field(default=1, description="每个候选标题前后保留的上下文条数")
+    STRUCTURING_HEADING_PREFILTER_CONTEXT_CHARS: int = Field(default=40, description="上下文条目截断到的字符数")
+    STRUCTURING_HEADING_PREFILTER_MIN_CANDIDATES: int = Field(default=3, description="候选数少于该值时不筛选，使用完整上下文")
 
     # ----------------------------- Tiptap Service Configuration -----------------------------
     TIPTAP_SERVICE_URL: str = Field(default='http://localhost:3001', description="Tiptap Service URL")
@@ -71,6 +106,53 @@ class Settings(BaseSettings):
 
     # 阿里云API配置
     ALIBABA_API_KEY: str = Field(default="", description="阿里云API Key")
+    LLM_BASE_URL_OVERRIDE: Optional[str] = Field(default=None, description="覆盖所有LLM配置中的base_url（如指向本地桩服务 http://127.0.0.1:8900/v1，离线压测时使用）")
+    LLM_REGISTRY_MAX_LLMS: int = Field(default=32, description="进程内共享的模型实例数上限，超出时淘汰最久未使用的")
+    LLM_REGISTRY_MAX_SERVICES: int = Field(default=256, description="进程内共享的LLM服务（模型配置+prompt模板）数上限，超出时淘汰最久未使用的")
+
+    # ----------------------------- LLM 限流配置 -----------------------------
+    LLM_RATE_LIMIT_ENABLED: bool = Field(default=False, description="是否启用跨worker的LLM令牌桶限流（默认关闭，按账号配额设置RPM/TPM后再开启）")
+    LLM_RATE_LIMIT_RPM: int = Field(default=600, description="每个模型+API Key每分钟请求数上限（0表示不限）")
+    LLM_RATE_LIMIT_TPM: int = Field(default=1000000, description="每个模型+API Key每分钟输入token数上限（0表示不限）")
+    LLM_RATE_LIMIT_MAX_WAIT: int = Field(default=120, description="单个请求等待限流令牌的最长时间（秒）")
+
+    # ----------------------------- LLM 自适应并发配置 -----------------------------
+    LLM_CONCURRENCY_INITIAL: int = Field(default=5, description="每个模型端点的初始并发数")
+    LLM_CONCURRENCY_MIN: int = Field(default=1, description="每个模型端点的最小并发数")
+    LLM_CONCURRENCY_MAX: int = Field(default=32, description="每个模型端点的最大并发数")
+
+    # ----------------------------- LLM 对冲请求配置 -----------------------------
+    LLM_HEDGE_ENABLED: bool = Field(default=True, description="对冲请求总开关（还需在LLM配置中设置hedge_enabled）")
+    LLM_HEDGE_PERCENTILE: float = Field(default=0.9, description="主请求超过该分位数的首响应时间仍无首token时发出对冲请求")
+    LLM_HEDGE_MIN_SAMPLES: int = Field(default=20, description="首响应时间样本数达到该值后才开始对冲")
+    LLM_HEDGE_MIN_DELAY: float = Field(default=1.0, description="对冲触发时间的下限（秒）")
+    LLM_HEDGE_BUDGET_RATIO: float = Field(default=0.1, description="对冲预算：对冲请求数不超过主请求数的该比例")
+    LLM_HEDGE_BUDGET_BURST: float = Field(default=5.0, description="对冲预算可累积的最大额度（请求数）")
+
+    # ----------------------------- LLM 响应缓存配置 -----------------------------
+    LLM_CACHE_ENABLED: bool = Field(default=True, description="响应缓存总开关（还需在LLM配置中设置cache_enabled）")
+    LLM_CACHE_TTL: int = Field(default=7 * 24 * 3600, description="响应缓存在Redis中的过期时间（秒）")
+    LLM_CACHE_PERSIST: bool = Field(default=False, description="是否同时把响应缓存持久化到磁盘")
+    LLM_CACHE_DIR: Path = Field(
+        default=Path(__file__).resolve().parent.parent.parent / "data" / "llm_cache",
+        description="响应缓存的磁盘目录"
+    )
+
+    # ----------------------------- LLM 遥测配置 -----------------------------
+    LLM_PRICING: Dict[str, Tuple[float, float]] = Field(
+        default={
+            "qwen-turbo": (0.0003, 0.0006),
+            "qwen-plus": (0.0008, 0.002),
+            "qwen-max": (0.0024, 0.0096),
+        },
+        description="各模型单价（元/千token）：(输入, 输出)，用于按阶段统计费用"
+    )
+    LLM_USAGE_SUMMARY_TTL: int = Field(default=30 * 24 * 3600, description="按项目汇总的LLM用量在Redis中的保存时间（秒）")
+
+    # ----------------------------- LLM 流式输出配置 -----------------------------
+    LLM_STREAM_FLUSH_INTERVAL_MS: int = Field(default=50, description="流式输出的合并窗口（毫秒），窗口内的token合并为一条增量消息")
+    LLM_STREAM_FLUSH_CHARS: int = Field(default=256, description="缓冲超过该字符数时立即发送增量")
+    LLM_STREAM_SNAPSHOT_EVERY: int = Field(default=20, description="每发送多少条增量附带一次完整快照（0表示只在结束时发送）")
 
     # Pydantic v2 配置
     model_config = ConfigDict(
@@ -0,0 +1,187 @@
+# app/core/redis_codec.py
+"""
+RedisClient的值编码层
+
+写入格式：1字节头 + 数据
+- 0x01: orjson序列化的JSON（未压缩）
+- 0x02: gzip压缩的JSON
+- 0x03: zstd压缩的JSON
+超过 REDIS_CODEC_COMPRESS_MIN_BYTES 的值按 REDIS_CODEC_COMPRESSION 压缩；字符串、数字等基本类型仍按原文写入（版本号、锁、计数器不受影响）。
+读取时没有以上头字节的值按旧格式（json.dumps的原文）解析，升级前写入的数据仍可读取。
+"""
+
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Union
+from app.core.config import settings
+import gzip
+import time
+import orjson
+import logging
+
+try:
+    import zstandard
+except ImportError:  # 未安装时zstd压缩退化为gzip
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+
+HEADER_JSON = 0x01
+
+
+@dataclass
+class Compressor:
+    """一种压缩算法：header为写入数据的头字节，level为None时使用默认压缩级别"""
+    name: str
+    header: int
+    compress: Callable[[bytes, Optional[int]], bytes]
+    decompress: Callable[[bytes], bytes]
+
+
+def _zstd_compress(data: bytes, level: Optional[int]) -> bytes:
+    return zstandard.ZstdCompressor(level=level or 3).compress(data)
+
+
+def _zstd_decompress(data: bytes) -> bytes:
+    if zstandard is None:
+        raise RuntimeError("读取到zstd压缩的Redis值，但未安装zstandard")
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+class RedisCodec:
+    """
+    Redis值的编码/解码（类方法单例）
+
+    - encode: dict/list等对象用orjson序列化，超过阈值时压缩；可包含 orjson.Fragment（已序列化的JSON片段，避免重复序列化）
+    - decode: 按头字节解压、解析，兼容旧的JSON原文
+    - register: 注册新的压缩算法（头字节不能与已有的重复）
+    """
+
+    _compressors: Dict[str, Compressor] = {}
+    _by_header: Dict[int, Compressor] = {}
+    _warned: bool = False
+    _stats: Dict[str, Any] = {
+        "encoded": 0, "compressed": 0, "encoded_bytes": 0, "stored_bytes": 0, "encode_seconds": 0.0,
+        "decoded": 0, "legacy_decoded": 0, "decoded_bytes": 0, "decode_seconds": 0.0,
+    }
+
+    @classmethod
+    def register(cls, compressor: Compressor) -> None:
+        if compressor.header == HEADER_JSON or (
+            compressor.header in cls._by_header and cls._by_header[compressor.header].name != compressor.name
+        ):
+            raise ValueError(f"压缩算法 {compressor.name} 的头字节 {compressor.header:#04x} 已被占用")
+        cls._compressors[compressor.name] = compressor
+        cls._by_header[compressor.header] = compressor
+
+    @classmethod
+    def compressor(cls) -> Optional[Compressor]:
+        """当前配置的压缩算法（none时为None）"""
+        name = settings.REDIS_CODEC_COMPRESSION
+        if not name or name == "none":
+            return None
+        if name == "zstd" and zstandard is None:
+            if not cls._warned:
+                logger.warning("REDIS_CODEC_COMPRESSION=zstd 但未安装zstandard，改用gzip压缩")
+                cls._warned = True
+            name = "gzip"
+        if name not in cls._compressors:
+            raise ValueError(f"未知的Redis压缩算法: {name}")
+        return cls._compressors[name]
+
+    @classmethod
+    def encode(cls, value: Any) -> Union[bytes, str, int, float]:
+        """编码写入Redis的值：基本类型原样写入，其他对象序列化（超过阈值时压缩）并加头字节"""
+        if isinstance(value, (str, int, float, bool)):
+            return value
+
+        start = time.perf_counter()
+        data = orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+        compressor = cls.compressor()
+        if compressor is not None and len(data) >= settings.REDIS_CODEC_COMPRESS_MIN_BYTES:
+            encoded = bytes([compressor.header]) + compressor.compress(data, settings.REDIS_CODEC_COMPRESSION_LEVEL)
+            cls._stats["compressed"] += 1
+        else:
+            encoded = bytes([HEADER_JSON]) + data
+        cls._stats["encoded"] += 1
+        cls._stats["encoded_bytes"] += len(data)
+        cls._stats["stored_bytes"] += len(encoded)
+        cls._stats["encode_seconds"] += time.perf_counter() - start
+        return encoded
+
+    @classmethod
+    def decode(cls, value: Optional[Union[bytes, str]]) -> Any:
+        """解码从Redis读取的值：有头字节的解压后解析JSON；旧格式尝试解析JSON，失败时返回原文"""
+        if value is None:
+            return None
+        start = time.perf_counter()
+        data = cls._unwrap(value)
+        if data is None:
+            # 旧格式
+            cls._stats["legacy_decoded"] += 1
+            try:
+                result = orjson.loads(value)
+            except orjson.JSONDecodeError:
+                result = value.decode("utf-8") if isinstance(value, bytes) else value
+        else:
+            result = orjson.loads(data)
+        cls._stats["decoded"] += 1
+        cls._stats["decoded_bytes"] += len(value)
+        cls._stats["decode_seconds"] += time.perf_counter() - start
+        return result
+
+    @classmethod
+    def decode_text(cls, value: Optional[Union[bytes, str]]) -> Optional[str]:
+        """把读取的值还原为文本（解压但不解析JSON），用于版本号等字符串值"""
+        if value is None or isinstance(value, str):
+            return value
+        data = cls._unwrap(value)
+        return (value if data is None else data).decode("utf-8")
+
+    @classmethod
+    def decompress(cls, value: Union[bytes, str]) -> bytes:
+        """去掉头字节并解压，返回JSON数据（旧格式返回原文），由调用方自行解析"""
+        data = cls._unwrap(value)
+        if data is not None:
+            return data
+        return value.encode("utf-8") if isinstance(value, str) else value
+
+    @classmethod
+    def _unwrap(cls, value: Union[bytes, str]) -> Optional[bytes]:
+        """有头字节时返回解压后的JSON数据，旧格式返回None"""
+        if not isinstance(value, bytes) or not value:
+            return None
+        header = value[0]
+        if header == HEADER_JSON:
+            return value[1:]
+        if header in cls._by_header:
+            return cls._by_header[header].decompress(value[1:])
+        return None
+
+    # ----------------------------- 监控 -----------------------------
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        """编码/解码次数、压缩比和耗时"""
+        stats = cls._stats
+        compressor = cls.compressor()
+        return {
+            **stats,
+            "encode_seconds": round(stats["encode_seconds"], 4),
+            "decode_seconds": round(stats["decode_seconds"], 4),
+            "compression": compressor.name if compressor else "none",
+            "compress_min_bytes": settings.REDIS_CODEC_COMPRESS_MIN_BYTES,
+            "compression_ratio": round(stats["encoded_bytes"] / stats["stored_bytes"], 2) if stats["stored_bytes"] else None,
+        }
+
+    @classmethod
+    def reset_stats(cls) -> None:
+        cls._stats = {key: 0.0 if isinstance(value, float) else 0 for key, value in cls._stats.items()}
+
+
+RedisCodec.register(Compressor(
+    name="gzip", header=0x02,
+    compress=lambda data, level: gzip.compress(data, compresslevel=level or 6, mtime=0),
+    decompress=gzip.decompress,
+))
+RedisCodec.register(Compressor(name="zstd", header=0x03, compress=_zstd_compress, decompress=_zstd_decompress))
@@ -1,11 +1,12 @@
 # app/core/redis_helper.py
 import redis.asyncio as redis
-from typing import Optional, Any, Union
+from typing import Optional, Any, Union, List, Callable, Dict, Tuple
 import json
 import uuid
 import time
 import asyncio
 from app.core.config import settings
+from app.core.redis_codec import RedisCodec
 import logging
 
 # 配置日志
@@ -22,11 +23,166 @@ class LockTimeoutError(LockAcquireError):
     pass
 
 
+# 消息写入有上限的Stream并发布到通道（一次执行）：发布的消息是 '{"stream_id":"<ID>"' 加上 ARGV[5]，
+# ARGV[5] 由 stream_publish_tail 在Python端根据消息生成（消息去掉开头的"{"，非空对象时前面加逗号），订阅方据此得到消息在Stream中的ID
+# KEYS[1]=stream，ARGV=[max_len, expire, channel, message, tail]
+XADD_PUBLISH_SCRIPT = """
+local id = redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[1], '*', 'message', ARGV[4])
+if tonumber(ARGV[2]) > 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+redis.call('PUBLISH', ARGV[3], '{"stream_id":"' .. id .. '"' .. ARGV[5])
+return id
+"""
+
+
+def stream_publish_tail(message: str) -> str:
+    """
+    XADD_PUBLISH_SCRIPT 发布消息时接在 stream_id 字段之后的部分
+    message 须为JSON对象文本（允许前后空白和格式化缩进），空对象时不加逗号
+    """
+    text = message.strip()
+    if not (text.startswith("{") and text.endswith("}")):
+        raise ValueError("发布到Stream的消息必须是JSON对象")
+    body = text[1:].lstrip()
+    return body if body.startswith("}") else "," + body
+
+
+def parse_stream_id(stream_id: Optional[str]) -> Optional[Tuple[int, int]]:
+    """Stream消息ID（"毫秒-序号"）转为可比较的元组，格式不对时返回None"""
+    try:
+        ms, seq = stream_id.split("-")
+        return int(ms), int(seq)
+    except (AttributeError, ValueError):
+        return None
+
+
+class RedisPipeline:
+    """
+    管道/事务：排队的命令在execute时一次发送（一次网络往返），值经RedisCodec编码，读取类命令的结果按命令解码
+
+    用法：
+        async with RedisClient.pipeline() as pipe:
+            pipe.rpush(history_key, entry, max_len=500, expire=900)
+            pipe.publish(channel, message)
+        length, _ = pipe.results
+
+    transaction=True 时以MULTI/EXEC执行（原子），退出with时若还未执行则自动execute（发生异常时不执行）
+    """
+
+    def __init__(self, transaction: bool = True):
+        self.transaction = transaction
+        self.results: Optional[List[Any]] = None
+        self._pipe = None
+        self._commands: List[tuple] = []   # (命令数, 结果解码函数)：rpush等带截断/过期的命令对应多条底层命令，结果取第一条
+
+    async def __aenter__(self) -> "RedisPipeline":
+        client = await RedisClient.get_binary_client()
+        self._pipe = client.pipeline(transaction=self.transaction)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None and self.results is None:
+            await self.execute()
+
+    def _add(self, count: int = 1, decode: Optional[Callable[[Any], Any]] = None) -> "RedisPipeline":
+        self._commands.append((count, decode))
+        return self
+
+    def get(self, key: str) -> "RedisPipeline":
+        self._pipe.get(key)
+        return self._add(decode=RedisCodec.decode)
+
+    def get_raw(self, key: str) -> "RedisPipeline":
+        self._pipe.get(key)
+        return self._add(decode=RedisCodec.decode_text)
+
+    def set(self, key: str, value: Any, expire: int = None) -> "RedisPipeline":
+        if expire:
+            self._pipe.setex(key, expire, RedisCodec.encode(value))
+        else:
+            self._pipe.set(key, RedisCodec.encode(value))
+        return self._add()
+
+    def delete(self, *keys: str) -> "RedisPipeline":
+        self._pipe.delete(*keys)
+        return self._add()
+
+    def exists(self, *keys: str) -> "RedisPipeline":
+        self._pipe.exists(*keys)
+        return self._add()
+
+    def expire(self, key: str, seconds: int) -> "RedisPipeline":
+        self._pipe.expire(key, seconds)
+        return self._add()
+
+    def rpush(self, key: str, *values: Any, max_len: int = None, expire: int = None) -> "RedisPipeline":
+        """结果为追加后（截断前）的列表长度，与RedisClient.rpush相同"""
+        self._pipe.rpush(key, *[RedisCodec.encode(value) for value in values])
+        return self._add(count=1 + self._trim(key, max_len, expire))
+
+    def lpush(self, key: str, *values: Any, max_len: int = None, expire: int = None) -> "RedisPipeline":
+        """按原顺序插入到列表头部，与RedisClient.lpush相同"""
+        self._pipe.lpush(key, *[RedisCodec.encode(value) for value in reversed(values)])
+        return self._add(count=1 + self._trim(key, max_len, expire))
+
+    def _trim(self, key: str, max_len: Optional[int], expire: Optional[int]) -> int:
+        if max_len:
+            self._pipe.ltrim(key, -max_len, -1)
+        if expire:
+            self._pipe.expire(key, expire)
+        return bool(max_len) + bool(expire)
+
+    def lindex(self, key: str, index: int) -> "RedisPipeline":
+        self._pipe.lindex(key, index)
+        return self._add(decode=RedisCodec.decode)
+
+    def lrange(self, key: str, start: int = 0, end: int = -1) -> "RedisPipeline":
+        self._pipe.lrange(key, start, end)
+        return self._add(decode=lambda values: [RedisCodec.decode(value) for value in values])
+
+    def llen(self, key: str) -> "RedisPipeline":
+        self._pipe.llen(key)
+        return self._add()
+
+    def publish(self, channel: str, message: Union[str, dict]) -> "RedisPipeline":
+        if isinstance(message, dict):
+            message = json.dumps(message, ensure_ascii=False)
+        self._pipe.publish(channel, message)
+        return self._add()
+
+    def xadd_publish(self, stream: str, channel: str, message: str, max_len: int, expire: int = None) -> "RedisPipeline":
+        """
+        消息（JSON对象文本）追加到Stream（约max_len条，超出截断最旧的）并发布到通道，发布的消息带上 stream_id
+        结果为消息在Stream中的ID
+        """
+        tail = stream_publish_tail(message)
+        self._pipe.eval(XADD_PUBLISH_SCRIPT, 1, stream, max_len, expire or 0, channel, message, tail)
+        return self._add(decode=RedisCodec.decode_text)
+
+    async def execute(self) -> List[Any]:
+        """发送所有排队的命令，返回每条命令的结果（读取类命令已解码）"""
+        try:
+            raw = await self._pipe.execute()
+        except Exception as e:
+            logger.error(f"Redis管道执行失败: {str(e)}")
+            raise
+        results, i = [], 0
+        for count, decode in self._commands:
+            value = raw[i]
+            results.append(decode(value) if decode is not None and value is not None else value)
+            i += count
+        self.results = results
+        return results
+
+
 class RedisClient:
     """Redis客户端封装类，提供异步操作接口"""
     
     # 申明一个类变量，后面所有的连接都使用这个变量，意味着共享同一个连接
     _client: Optional[redis.Redis] = None
+    # 读写编码后的值（可能是压缩的二进制数据）使用不解码响应的连接，见 app/core/redis_codec.py
+    _binary_client: Optional[redis.Redis] = None
     
     @classmethod
     async def get_client(cls) -> redis.Redis:
@@ -49,6 +205,18 @@ class RedisClient:
                 logger.error(f"Redis连接失败: {str(e)}")
                 raise
         return cls._client
+
+    @classmethod
+    async def get_binary_client(cls) -> redis.Redis:
+        """获取返回bytes的Redis客户端连接（单例模式），用于set/get等经过RedisCodec编码的值"""
+        if cls._binary_client is None:
+            cls._binary_client = redis.from_url(
+                settings.REDIS_URL,
+                decode_responses=False,
+                socket_timeout=5,
+                socket_connect_timeout=5
+            )
+        return cls._binary_client
     
     @classmethod
     async def close(cls) -> None:
@@ -61,6 +229,13 @@ class RedisClient:
                 logger.error(f"Redis连接关闭失败: {str(e)}")
             finally:
                 cls._client = None
+        if cls._binary_client is not None:
+            try:
+                await cls._binary_client.close()
+            except Exception as e:
+                logger.error(f"Redis连接关闭失败: {str(e)}")
+            finally:
+                cls._binary_client = None
     
     @classmethod
     async def set(cls, key: str, value: Any, expire: int = None) -> bool:
@@ -70,11 +245,10 @@ class RedisClient:
         2. 永久存储： 未设置过期时间， 需要手动删除
         """
         try:
-            client = await cls.get_client()
+            client = await cls.get_binary_client()
             
-            # 如果value不是基本类型，则序列化为JSON
-            if not isinstance(value, (str, int, float, bool)):
-                value = json.dumps(value, ensure_ascii=False)
+            # 如果value不是基本类型，则序列化为JSON（较大的值压缩）
+            value = cls._dump(value)
                 
             if expire:
                 return await client.setex(key, expire, value)
@@ -90,29 +264,68 @@ class RedisClient:
         获取键值（从存储中取值， 可能是缓存的值，也可能是持久化的值，取决于之前的存储是否配置了expire）
         """
         try:
-            client = await cls.get_client()
+            client = await cls.get_binary_client()
             value = await client.get(key)
             
             if value is None:
                 return default
                 
-            # 尝试解析JSON
-            try:
-                return json.loads(value)
-            except (json.JSONDecodeError, TypeError):
-                return value
+            # 解压、解析JSON（兼容旧格式，非JSON的值返回原文）
+            return cls._load(value)
         except Exception as e:
             logger.error(f"Redis获取键值失败: {str(e)}")
             raise
     
     @classmethod
-    async def delete(cls, key: str) -> int:
+    async def get_raw(cls, key: str) -> Optional[str]:
+        """获取键值原文（解压，不做JSON解析），用于版本号等字符串值"""
+        try:
+            client = await cls.get_binary_client()
+            return RedisCodec.decode_text(await client.get(key))
+        except Exception as e:
+            logger.error(f"Redis获取键值失败: {str(e)}")
+            raise
+
+    @classmethod
+    async def get_bytes(cls, key: str) -> Optional[bytes]:
+        """获取编码后的键值（不解压、不解析），用于调用方自行统计传输字节数/解码耗时，用RedisCodec.decode解码"""
+        try:
+            client = await cls.get_binary_client()
+            return await client.get(key)
+        except Exception as e:
+            logger.error(f"Redis获取键值失败: {str(e)}")
+            raise
+
+    @classmethod
+    async def mset(cls, mapping: dict, expire: int = None) -> bool:
+        """在一个事务中写入多个键值（非基本类型序列化为JSON），可统一设置过期时间"""
+        try:
+            async with cls.pipeline() as pipe:
+                for key, value in mapping.items():
+                    pipe.set(key, value, expire=expire)
+            return all(pipe.results)
+        except Exception as e:
+            logger.error(f"Redis批量设置键值失败: {str(e)}")
+            raise
+
+    @classmethod
+    async def setnx(cls, key: str, value: Any, expire: int = None) -> bool:
+        """键不存在时才写入，返回是否写入"""
+        try:
+            client = await cls.get_binary_client()
+            return bool(await client.set(key, cls._dump(value), nx=True, ex=expire))
+        except Exception as e:
+            logger.error(f"Redis设置键值失败: {str(e)}")
+            raise
+
+    @classmethod
+    async def delete(cls, *keys: str) -> int:
         """
-        删除键(删除存储)， 返回删除的键数量(int)
+        删除键(删除存储)， 返回删除的键数量(int)；可一次删除多个键（一次往返）
         """
         try:
             client = await cls.get_client()
-            return await client.delete(key)
+            return await client.delete(*keys)
         except Exception as e:
             logger.error(f"Redis删除键失败: {str(e)}")
             raise
@@ -129,6 +342,26 @@ class RedisClient:
             logger.error(f"Redis检查键是否存在失败: {str(e)}")
             raise
         
+    @classmethod
+    async def mget(cls, keys: List[str]) -> List[Any]:
+        """一次读取多个键（一次往返），按顺序返回解码后的值，不存在的键为None"""
+        return [RedisCodec.decode(value) for value in await cls.mget_bytes(keys)]
+
+    @classmethod
+    async def mget_bytes(cls, keys: List[str]) -> List[Optional[bytes]]:
+        """一次读取多个键的编码后的值（不解码），用于调用方自行统计传输字节数/解码耗时"""
+        try:
+            client = await cls.get_binary_client()
+            return await client.mget(keys)
+        except Exception as e:
+            logger.error(f"Redis批量获取键值失败: {str(e)}")
+            raise
+
+    @classmethod
+    def pipeline(cls, transaction: bool = True) -> RedisPipeline:
+        """创建管道（async with 使用），多条命令一次往返发送，见 RedisPipeline"""
+        return RedisPipeline(transaction=transaction)
+
     @classmethod
     async def expire(cls, key: str, seconds: int) -> bool:
         """
@@ -140,7 +373,86 @@ class RedisClient:
         except Exception as e:
             logger.error(f"Redis设置过期时间失败: {str(e)}")
             raise
-    
+
+    # ----------------------------- 列表（追加式历史记录） -----------------------------
+
+    @staticmethod
+    def _dump(value: Any) -> Any:
+        return RedisCodec.encode(value)
+
+    @staticmethod
+    def _load(value: Any) -> Any:
+        return RedisCodec.decode(value)
+
+    @classmethod
+    async def rpush(cls, key: str, *values: Any, max_len: int = None, expire: int = None) -> int:
+        """
+        在列表尾部追加元素（非基本类型序列化为JSON），可同时截断到最近max_len条并刷新过期时间
+        返回追加后（截断前）的列表长度，为len(values)时说明列表是新建的
+        """
+        try:
+            async with cls.pipeline() as pipe:
+                pipe.rpush(key, *values, max_len=max_len, expire=expire)
+            return pipe.results[0]
+        except Exception as e:
+            logger.error(f"Redis追加列表失败 {key}: {str(e)}")
+            raise
+
+    @classmethod
+    async def lpush(cls, key: str, *values: Any, max_len: int = None, expire: int = None) -> int:
+        """
+        在列表头部按原顺序插入元素（用于把旧历史补到新记录之前），截断时保留尾部最近的max_len条
+        返回插入后（截断前）的列表长度
+        """
+        try:
+            async with cls.pipeline() as pipe:
+                pipe.lpush(key, *values, max_len=max_len, expire=expire)
+            return pipe.results[0]
+        except Exception as e:
+            logger.error(f"Redis插入列表失败 {key}: {str(e)}")
+            raise
+
+    @classmethod
+    async def lindex(cls, key: str, index: int, default: Any = None) -> Any:
+        """按下标读取列表元素（-1为最新一条），O(1)读取尾部"""
+        try:
+            client = await cls.get_binary_client()
+            value = await client.lindex(key, index)
+            return default if value is None else cls._load(value)
+        except Exception as e:
+            logger.error(f"Redis读取列表元素失败 {key}: {str(e)}")
+            raise
+
+    @classmethod
+    async def lrange(cls, key: str, start: int = 0, end: int = -1) -> list:
+        """按范围读取列表元素（闭区间，支持负数下标）"""
+        try:
+            client = await cls.get_binary_client()
+            return [cls._load(value) for value in await client.lrange(key, start, end)]
+        except Exception as e:
+            logger.error(f"Redis读取列表范围失败 {key}: {str(e)}")
+            raise
+
+    @classmethod
+    async def llen(cls, key: str) -> int:
+        """列表长度，键不存在时为0"""
+        try:
+            client = await cls.get_client()
+            return await client.llen(key)
+        except Exception as e:
+            logger.error(f"Redis获取列表长度失败 {key}: {str(e)}")
+            raise
+
+    @classmethod
+    async def xrange(cls, key: str, start: str = "-", end: str = "+", count: int = None) -> List[Tuple[str, Dict[str, str]]]:
+        """按ID范围读取Stream的消息 [(ID, 字段)]，start以"("开头时不包含该ID，键不存在时为空列表"""
+        try:
+            client = await cls.get_client()
+            return await client.xrange(key, min=start, max=end, count=count)
+        except Exception as e:
+            logger.error(f"Redis读取Stream失败 {key}: {str(e)}")
+            raise
+
     @classmethod
     async def publish(cls, channel: str, message: Union[str, dict]) -> int:
         """
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Redis值编码基准：旧的 json.dumps 原文 vs orjson vs orjson + gzip/zstd 压缩
+
+运行：
+    PYTHONPATH=. python app/core/tests/bench_redis_codec.py [文档...] [--redis]
+
+文档（任选其一）：
+- 不带参数：合成 2MB / 10MB / 30MB 左右的招标文件tiptap文档（中文段落 + 表格）
+- 一个或多个 .json 文件或目录（递归读取 *.json），内容为tiptap文档，或Redis中的缓存格式 {"key_name": ..., "content": 文档}
+- --redis-keys 模式：从 REDIS_URL 读取匹配 *:raw_document 等文档键的真实缓存（只读）
+
+报告每种编码的写入大小、编码/解码吞吐（按原始JSON大小计，MB/s）。
+加 --redis 时把每种编码写入 REDIS_URL 的临时键，用 MEMORY USAGE 统计Redis实际占用的内存，随后删除。
+"""
+
+import sys
+import gzip
+import json
+import random
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import orjson
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DOCUMENT_KEYS = ("raw_document", "h1_document", "h2h3_document", "intro_document", "final_document")
+
+
+def synthetic_document(target_bytes: int, seed: int = 42) -> dict:
+    rng = random.Random(seed)
+    words = ["投标人", "招标文件", "评标委员会", "技术参数", "商务条款", "合同", "报价", "资格审查", "履约保证金", "工期", "质量标准", "服务承诺"]
+    content, size, i = [], 0, 0
+    while size < target_bytes:
+        i += 1
+        if i % 40 == 0:
+            node = {"type": "table", "content": [
+                {"type": "tableRow", "content": [
+                    {"type": "tableCell", "attrs": {"colspan": 1, "rowspan": 1}, "content": [
+                        {"type": "paragraph", "content": [{"type": "text", "text": f"{rng.choice(words)}{rng.randint(1, 999)}"}]}
+                    ]} for _ in range(5)
+                ]} for _ in range(8)
+            ]}
+        elif i % 15 == 0:
+            node = {"type": "heading", "attrs": {"level": rng.randint(1, 3)}, "content": [{"type": "text", "text": f"第{i // 15}章 {rng.choice(words)}"}]}
+        else:
+            text = "，".join(rng.choice(words) + rng.choice(["应当", "不得", "须", "可以"]) + rng.choice(words) for _ in range(rng.randint(3, 12)))
+            node = {"type": "paragraph", "attrs": {"textAlign": "left"}, "content": [{"type": "text", "text": text + "。"}]}
+        content.append(node)
+        size += len(orjson.dumps(node))
+    return {"type": "doc", "content": content}
+
+
+def load_documents(sources: List[str]) -> List[Tuple[str, dict]]:
+    if not sources:
+        return [(f"合成{mb}MB", synthetic_document(mb * 1024 * 1024, seed=mb)) for mb in (2, 10, 30)]
+
+    documents = []
+    for source in sources:
+        path = Path(source)
+        files = sorted(path.rglob("*.json")) if path.is_dir() else [path]
+        for file in files:
+            data = orjson.loads(file.read_bytes())
+            if isinstance(data, dict) and isinstance(data.get("content"), dict):
+                data = data["content"]
+            if isinstance(data, dict) and data.get("type") == "doc":
+                documents.append((file.name, data))
+    return documents
+
+
+def load_documents_from_redis() -> List[Tuple[str, dict]]:
+    import redis
+    from app.core.config import settings
+    from app.core.redis_codec import RedisCodec
+
+    client = redis.from_url(settings.REDIS_URL, decode_responses=False)
+    documents = []
+    for key_name in DOCUMENT_KEYS:
+        for key in client.scan_iter(match=f"*:{key_name}", count=100):
+            data = RedisCodec.decode(client.get(key))
+            if isinstance(data, dict) and isinstance(data.get("content"), dict):
+                documents.append((key.decode("utf-8"), data["content"]))
+    return documents
+
+
+def codecs() -> Dict[str, Tuple[Callable[[dict], bytes], Callable[[bytes], dict]]]:
+    result = {
+        "json(旧)": (lambda doc: json.dumps(doc, ensure_ascii=False).encode("utf-8"), lambda data: json.loads(data)),
+        "orjson": (orjson.dumps, orjson.loads),
+        "orjson+gzip6": (lambda doc: gzip.compress(orjson.dumps(doc), compresslevel=6, mtime=0), lambda data: orjson.loads(gzip.decompress(data))),
+    }
+    if zstandard is not None:
+        for level in (1, 3, 9):
+            compressor, decompressor = zstandard.ZstdCompressor(level=level), zstandard.ZstdDecompressor()
+            result[f"orjson+zstd{level}"] = (
+                lambda doc, c=compressor: c.compress(orjson.dumps(doc)),
+                lambda data, d=decompressor: orjson.loads(d.decompress(data)),
+            )
+    return result
+
+
+def timed(func, arg, repeat: int = 3):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(arg)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def redis_memory(client, value: bytes) -> int:
+    key = "bench:redis_codec"
+    client.set(key, value)
+    try:
+        return client.memory_usage(key, samples=0)
+    finally:
+        client.delete(key)
+
+
+def main(args: List[str]):
+    use_redis = "--redis" in args
+    if "--redis-keys" in args:
+        documents = load_documents_from_redis()
+    else:
+        documents = load_documents([arg for arg in args if not arg.startswith("--")])
+    if not documents:
+        print("没有可用的文档")
+        return
+
+    client = None
+    if use_redis:
+        import redis
+        from app.core.config import settings
+        client = redis.from_url(settings.REDIS_URL, decode_responses=False)
+
+    for name, doc in documents:
+        raw_size = len(orjson.dumps(doc))
+        print(f"\n{name}: {len(doc.get('content', []))}个节点, orjson {raw_size / 1024 / 1024:.2f} MB")
+        for codec_name, (encode, decode) in codecs().items():
+            encode_seconds, data = timed(encode, doc)
+            decode_seconds, _ = timed(decode, data)
+            line = (f"  [{codec_name:<14}] 大小 {len(data) / 1024 / 1024:7.2f} MB ({raw_size / len(data):5.1f}x), "
+                    f"编码 {raw_size / encode_seconds / 1e6:7.1f} MB/s, 解码 {raw_size / decode_seconds / 1e6:7.1f} MB/s")
+            if client is not None:
+                line += f", Redis内存 {redis_memory(client, data) / 1024 / 1024:.2f} MB"
+            print(line)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
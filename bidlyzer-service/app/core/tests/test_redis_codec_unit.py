@@ -0,0 +1,101 @@
+import gzip
+import json
+import orjson
+import pytest
+from app.core.config import settings
+from app.core.redis_codec import HEADER_JSON, Compressor, RedisCodec
+from app.core.redis_helper import RedisClient
+from app.services.tests.fixtures.fake_redis import install_fake_redis
+
+pytestmark = [pytest.mark.unit]
+
+
+def make_doc(paragraphs: int) -> dict:
+    return {"type": "doc", "content": [
+        {"type": "paragraph", "content": [{"type": "text", "text": f"第{i}条 投标人须知前附表"}]} for i in range(paragraphs)
+    ]}
+
+
+@pytest.fixture(autouse=True)
+def codec(monkeypatch):
+    monkeypatch.setattr(settings, "REDIS_CODEC_COMPRESSION", "gzip")
+    monkeypatch.setattr(settings, "REDIS_CODEC_COMPRESS_MIN_BYTES", 1024)
+    RedisCodec.reset_stats()
+    yield RedisCodec
+    RedisCodec.reset_stats()
+
+
+def test_small_values_are_plain_json_with_header():
+    encoded = RedisCodec.encode({"a": "中文"})
+
+    assert encoded[0] == HEADER_JSON
+    assert orjson.loads(encoded[1:]) == {"a": "中文"}
+    assert RedisCodec.decode(encoded) == {"a": "中文"}
+
+
+def test_large_values_are_compressed():
+    doc = make_doc(500)
+    encoded = RedisCodec.encode(doc)
+
+    assert encoded[0] == 0x02
+    assert len(encoded) < len(orjson.dumps(doc)) / 3
+    assert RedisCodec.decode(encoded) == doc
+    assert RedisCodec.decompress(encoded) == orjson.dumps(doc)
+    assert RedisCodec.stats()["compressed"] == 1
+
+
+def test_zstd_round_trip(monkeypatch):
+    pytest.importorskip("zstandard")
+    monkeypatch.setattr(settings, "REDIS_CODEC_COMPRESSION", "zstd")
+    doc = make_doc(500)
+    encoded = RedisCodec.encode(doc)
+
+    assert encoded[0] == 0x03
+    assert RedisCodec.decode(encoded) == doc
+
+
+def test_scalars_are_stored_as_is():
+    assert RedisCodec.encode("3d8da60b") == "3d8da60b"
+    assert RedisCodec.encode(5) == 5
+    assert RedisCodec.decode(b"5") == 5
+    assert RedisCodec.decode(b"3d8da60b") == "3d8da60b"
+    assert RedisCodec.decode_text(b"3d8da60b") == "3d8da60b"
+
+
+def test_legacy_values_remain_readable():
+    legacy = json.dumps({"key_name": "raw_document", "content": make_doc(3)}, ensure_ascii=False)
+
+    assert RedisCodec.decode(legacy.encode("utf-8")) == json.loads(legacy)
+    assert RedisCodec.decode(legacy) == json.loads(legacy)
+    assert RedisCodec.decompress(legacy.encode("utf-8")) == legacy.encode("utf-8")
+    assert RedisCodec.stats()["legacy_decoded"] == 2
+
+
+def test_fragment_is_not_serialized_twice():
+    raw = orjson.dumps(make_doc(3))
+    encoded = RedisCodec.encode({"version": "v1", "content": orjson.Fragment(raw)})
+
+    assert RedisCodec.decode(encoded) == {"version": "v1", "content": make_doc(3)}
+
+
+def test_register_rejects_taken_header():
+    with pytest.raises(ValueError):
+        RedisCodec.register(Compressor(name="other", header=0x02, compress=gzip.compress, decompress=gzip.decompress))
+    with pytest.raises(ValueError):
+        RedisCodec.register(Compressor(name="other", header=HEADER_JSON, compress=gzip.compress, decompress=gzip.decompress))
+
+
+@pytest.mark.asyncio
+async def test_redis_client_round_trip(monkeypatch):
+    redis = install_fake_redis(monkeypatch)
+    doc = make_doc(500)
+    await RedisClient.set("doc", doc, expire=60)
+    redis.data["legacy"] = json.dumps(doc, ensure_ascii=False)
+
+    assert isinstance(redis.data["doc"], bytes)
+    assert await RedisClient.get("doc") == doc
+    assert await RedisClient.get("legacy") == doc
+    assert await RedisClient.get("missing", default={}) == {}
+
+    await RedisClient.rpush("history", {"i": 0}, {"i": 1})
+    assert await RedisClient.lrange("history") == [{"i": 0}, {"i": 1}]
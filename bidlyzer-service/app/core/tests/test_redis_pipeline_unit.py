@@ -0,0 +1,66 @@
+import json
+import pytest
+from app.core.redis_helper import RedisClient, stream_publish_tail
+from app.services.tests.fixtures.fake_redis import install_fake_redis
+
+pytestmark = [pytest.mark.unit]
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    return install_fake_redis(monkeypatch)
+
+
+@pytest.mark.asyncio
+async def test_pipeline_is_one_round_trip_and_decodes_results(redis):
+    await RedisClient.set("doc", {"type": "doc"})
+
+    redis.round_trips = 0
+    async with RedisClient.pipeline() as pipe:
+        pipe.get("doc")
+        pipe.set("version", "v1", expire=60)
+        pipe.rpush("log", {"i": 0}, {"i": 1}, max_len=10, expire=60)
+        pipe.lrange("log").exists("doc", "missing")
+        pipe.get_raw("version")
+
+    assert redis.round_trips == 1
+    assert pipe.results == [{"type": "doc"}, True, 2, [{"i": 0}, {"i": 1}], 1, "v1"]
+
+
+@pytest.mark.asyncio
+async def test_pipeline_is_not_executed_on_error(redis):
+    with pytest.raises(RuntimeError):
+        async with RedisClient.pipeline() as pipe:
+            pipe.set("key", "value")
+            raise RuntimeError("boom")
+
+    assert pipe.results is None
+    assert "key" not in redis.data
+
+
+@pytest.mark.asyncio
+async def test_mget_and_multi_key_delete(redis):
+    await RedisClient.mset({"a": {"x": 1}, "b": "text"}, expire=60)
+
+    redis.round_trips = 0
+    assert await RedisClient.mget(["a", "b", "missing"]) == [{"x": 1}, "text", None]
+    assert await RedisClient.delete("a", "b", "missing") == 2
+    assert redis.round_trips == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("message", ['{}', ' { } ', '{"id":"m1"}', '{\n  "id": "m1",\n  "data": {}\n}'])
+async def test_xadd_publish_adds_stream_id_to_any_json_object(redis, message):
+    async with RedisClient.pipeline() as pipe:
+        pipe.xadd_publish("stream", "channel", message, max_len=10)
+
+    stream_id = pipe.results[0]
+    published = json.loads(redis.published[-1][1])
+    assert published == {"stream_id": stream_id, **json.loads(message)}
+    assert redis.data["stream"][-1] == (stream_id, {"message": message})
+
+
+@pytest.mark.parametrize("message", ['', '[]', '"text"', '{"id": 1'])
+def test_stream_publish_tail_rejects_non_objects(message):
+    with pytest.raises(ValueError):
+        stream_publish_tail(message)
@@ -5,6 +5,8 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.config import settings
 from app.core.redis_helper import RedisClient
+from app.services.cache_persister import CachePersister
+from app.services.sse_hub import SSEHub
 from app.core.db_helper import init_db, close_db, generate_schemas
 from tortoise import Tortoise
 from app.auth.middleware import JWTAuthMiddleware
@@ -35,8 +37,13 @@ async def lifespan(app: FastAPI):
     # 如果需要自动生成数据库架构，取消下面这行的注释
     # await generate_schemas()
 
+    await CachePersister.start()
+
     yield
     # Shutdown  即便异常也执行
+    # 先提交缓存中延迟写入的数据、停止SSE订阅，再关闭Redis连接
+    await CachePersister.shutdown()
+    await SSEHub.shutdown()
     await RedisClient.close()
     print("Redis客户端连接关闭")
     await close_db()
@@ -101,6 +101,7 @@ class AgentStateManager:
         current_state,_ = await self.cache.get_agent_state()
         if not current_state:
             raise ValueError("AGENT未初始化或恢复状态，无法更新状态")
+        stage_boundary = current_state.active_stage != active_stage or stage_status in (StageStatus.COMPLETED, StageStatus.FAILED)
         current_state.overall_progress = overall_progress
         current_state.active_stage = active_stage
         current_state.stage_status = stage_status
@@ -108,6 +109,10 @@ class AgentStateManager:
         current_state.updated_at = datetime.now()
         await self.cache.save_agent_state(current_state)
 
+        # 阶段切换/结束时，立即把延迟写入的数据提交到django
+        if stage_boundary:
+            await self.cache.flush()
+
 
 
 
@@ -18,13 +18,8 @@ async def publish_state_update(project_id: str, agent_message: AgentMessage):
         cache = Cache(project_id)
         
         
-        # 发布到Redis通道
-        channel = cache.get_channel_keys()['sse_channel']
-        print('发布agent_message到Redis通道', channel)
-        await RedisClient.publish(channel, agent_message.model_dump_json())
-        
-        # 存储消息到历史记录
-        await cache.save_agent_message(agent_message)
+        # 发布到Redis通道，并存储消息到历史记录（同一个管道，一次往返）
+        await cache.save_agent_message(agent_message, publish=True)
         
         logger.debug(f"发布了agent_message")
         
@@ -32,6 +27,28 @@ async def publish_state_update(project_id: str, agent_message: AgentMessage):
         logger.error(f"Error publishing state update: {str(e)}")
 
 
+async def publish_partial_document(project_id: str, key_name: str, progress: Dict[str, Any]):
+    """
+    发布部分结果更新事件（如L2/L3分析过程中已识别的标题），前端据此拉取key_name对应的文档
+    临时事件，不写入消息历史
+    """
+    try:
+        cache = Cache(project_id)
+        channel = cache.get_channel_keys()['sse_channel']
+        await RedisClient.publish(channel, {
+            'id': str(uuid.uuid4()),
+            'event': 'partial_document',
+            'data': {
+                'key_name': key_name,
+                **progress,
+                'created_at': datetime.now().isoformat(),
+            },
+            'retry': 3000,
+        })
+    except Exception as e:
+        logger.error(f"Error publishing partial document: {str(e)}")
+
+
 # async def publish_error_event(project_id: str, agent_state: AgentStateData, error_message: str):
             
 
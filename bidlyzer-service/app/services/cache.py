@@ -1,11 +1,21 @@
 # app/core/cache_manager.py
 
 from datetime import datetime
+import hashlib
+import orjson
+import time
 from typing import Optional, Dict, Any, List, Tuple
-from app.core.redis_helper import RedisClient
-from app.services.bp_state import AgentStateHistory, AgentState, Document
+from app.core.redis_helper import RedisClient, parse_stream_id
+from app.core.redis_codec import RedisCodec
+from app.core.config import settings
+from app.services.bp_state import AgentStateHistory, AgentState
 from app.services.bp_msg import AgentMessageHistory, AgentMessage
 from app.services.storage import Storage
+from app.services.cache_persister import CachePersister
+from app.services.cache_fill import CacheFill
+from app.services.document_cache import DocumentCache, dump_document
+from app.services.document_delta import DocumentDelta, NodeDelta, BASE_DOCUMENT, DELTA_DOCUMENTS, is_delta
+from app.clients.tiptap.tools import DocumentTextIndex
 
 import logging
 logger = logging.getLogger(__name__)
@@ -18,7 +28,8 @@ class Cache:
 
     def __init__(self, project_id: str):
         self.project_id = project_id
-        self.max_message_history = 100  # 最大消息历史记录数
+        self.max_state_history = settings.AGENT_STATE_HISTORY_MAX_LEN  # 最大状态历史记录数
+        self.max_message_history = settings.AGENT_MESSAGE_HISTORY_MAX_LEN  # 最大消息历史记录数
         self.cache_expire_time = 900   # 缓存过期时间
         self.storage = Storage(project_id)
 
@@ -32,6 +43,7 @@ class Cache:
         """获取状态缓存键"""
         return {
             # 以下key_name必须和django后端的模型字段名称一样，持久化存储才能对上。 
+            # agent_state_history/agent_message_history 的这两个键是旧的整体存储格式，只用于迁移和清理，历史记录见 get_history_keys
             'agent_state_history': f"{self.project_id}{self.STRUCTURING_AGENT_PREFIX}:agent_state_history",
             'agent_message_history': f"{self.project_id}{self.STRUCTURING_AGENT_PREFIX}:agent_message_history",
             'raw_document': f"{self.project_id}{self.STRUCTURING_AGENT_PREFIX}:raw_document",
@@ -41,14 +53,25 @@ class Cache:
             'final_document': f"{self.project_id}{self.STRUCTURING_AGENT_PREFIX}:final_document",
             'review_suggestions': f"{self.project_id}{self.STRUCTURING_AGENT_PREFIX}:review_suggestions",
 
+            # 以下为只存在于Redis的临时数据，不持久化到django
+            'h2h3_document_partial': f"{self.project_id}{self.STRUCTURING_AGENT_PREFIX}:h2h3_document_partial",
+
             # planning agent cache keys
 
         }
     
+    def get_history_keys(self) -> Dict[str, str]:
+        """获取追加式历史记录的列表键（每条状态/消息是列表中的一个元素）"""
+        return {
+            'agent_state_history': f"{self.project_id}{self.STRUCTURING_AGENT_PREFIX}:agent_state_history:log",
+            'agent_message_history': f"{self.project_id}{self.STRUCTURING_AGENT_PREFIX}:agent_message_history:log",
+        }
+
     def get_channel_keys(self) -> str:
         """获取SSE通道键"""
         return {
-            'sse_channel': f"{self.project_id}:sse_channel"
+            'sse_channel': f"{self.project_id}:sse_channel",
+            'sse_stream': f"{self.project_id}:sse_stream",   # 最近的agent消息（Redis Stream），SSE断线重连时补发
         }
     
     def _generate_message_id(self) -> str:
@@ -59,114 +82,180 @@ class Cache:
 
 
     async def save_agent_state(self, agent_state: AgentState) -> bool:
-        """保存agent状态"""
+        """保存agent状态（追加到状态历史列表）"""
         try:
-            state_history_key = self.get_cache_keys().get('agent_state_history')
-            state_history_data = await RedisClient.get(state_history_key)
-            if not state_history_data:
-                state_history = AgentStateHistory(key_name='agent_state_history', content=[agent_state])
-            else:   
-                # 将字典转换为 AgentStateHistory 对象
-                state_history = AgentStateHistory(**state_history_data)
-                state_history.content.append(agent_state)
-            
-            # 将 Pydantic 对象转换为 JSON 兼容的字典
-            state_history_dict = state_history.model_dump(mode='json')
-
-            success = await RedisClient.set(state_history_key, state_history_dict, expire=self.cache_expire_time)
-            if success:               
-                await self.storage.save_to_django(state_history_dict)
-                return True
-            else:
-                return False
+            return await self._append_history('agent_state_history', agent_state.model_dump(mode='json'), self.max_state_history)
         except Exception as e:
             logger.error(f"保存agent状态失败: {str(e)}")
             return False
 
-    async def get_agent_state(self) -> Tuple[Optional[AgentState], Optional[AgentStateHistory]]:
-        """获取agent状态"""
+    async def get_agent_state(self, with_history: bool = False) -> Tuple[Optional[AgentState], Optional[AgentStateHistory]]:
+        """
+        获取agent状态：只读取列表最后一条（O(1)）
+        with_history=True 时同时返回完整历史，否则历史为None（需要历史时用 get_agent_state_history 按范围读取）
+        """
         try:
-            cache_key = self.get_cache_keys().get('agent_state_history')
-            cache_data = await RedisClient.get(cache_key)
-            if cache_data and cache_data['content']:
-                # 将字典转换为 AgentStateHistory 对象
-                state_history = AgentStateHistory(**cache_data)
-                # 获取最新的状态
-                agent_state = state_history.content[-1] if state_history.content else None
-                print(f"从Redis获取agent状态信息")
-                return agent_state, state_history
-            else:
-                # 如果缓存失败，从django获取历史记录storage_data, 格式为AgentStateHistory
-                storage_data = await self.storage.get_from_django(params={'fields': 'agent_state_history'})
-                if storage_data and storage_data['content']:
-                    # 恢复缓存数据
-                    state_history_dict = storage_data
-                    success_redis = await RedisClient.set(cache_key, state_history_dict, expire=self.cache_expire_time)
-                    if success_redis:
-                        state_history = AgentStateHistory(**state_history_dict)
-                        agent_state = state_history.content[-1] if state_history.content else None
-                        print(f"从Storage获取了agent状态信息")
-                        return agent_state, state_history
-                    else:
-                        logger.error(f"恢复缓存失败，项目号：{self.project_id}")
-                        return None, None
-                else:
-                    logger.debug(f"项目 {self.project_id} 没有历史状态记录，这是正常的初始状态")
-                    return None, None
+            entry = await self._latest_history_entry('agent_state_history', self.max_state_history)
+            agent_state = AgentState(**entry) if entry else None
+            if agent_state is None:
+                logger.debug(f"项目 {self.project_id} 没有历史状态记录，这是正常的初始状态")
+                return None, None
+            state_history = await self.get_agent_state_history() if with_history else None
+            return agent_state, state_history
         except Exception as e:
             logger.error(f"获取agent状态失败: {str(e)}")
             return None, None
 
+    async def get_agent_state_history(self, start: int = 0, end: int = -1) -> Optional[AgentStateHistory]:
+        """按范围获取agent状态历史（闭区间，支持负数下标，与LRANGE一致）"""
+        try:
+            entries = await self._history_range('agent_state_history', self.max_state_history, start, end)
+            if not entries:
+                return None
+            return AgentStateHistory(key_name='agent_state_history', content=[AgentState(**entry) for entry in entries])
+        except Exception as e:
+            logger.error(f"获取agent状态历史失败: {str(e)}")
+            return None
+
 
-    async def save_agent_message(self, agent_message: AgentMessage) -> bool:
-        """保存agent sse消息"""
+    async def save_agent_message(self, agent_message: AgentMessage, publish: bool = False) -> bool:
+        """
+        保存agent sse消息（追加到消息历史列表），publish=True 时在同一次往返中写入消息Stream并发布到SSE通道
+        （发布的消息带有Stream ID，作为SSE事件的id，断线重连时按 Last-Event-ID 补发，见 get_agent_messages_since）
+        """
         try:
-            message_key = self.get_cache_keys().get('agent_message_history')
-            message_history_data = await RedisClient.get(message_key)
-            if not message_history_data:
-                sse_message_history = AgentMessageHistory(key_name='agent_message_history', content=[agent_message])
-            else:
-                # 将字典转换为 AgentSSEMessageHistory 对象
-                sse_message_history = AgentMessageHistory(**message_history_data)
-                sse_message_history.content.append(agent_message)
-            
-            # 将 Pydantic 对象转换为 JSON 兼容的字典
-            message_history_dict = sse_message_history.model_dump(mode='json')
-
-            success = await RedisClient.set(message_key, message_history_dict, expire=self.cache_expire_time)
-            if success:
-                await self.storage.save_to_django(message_history_dict)
-                return True
-            else:
-                return False
+            channel_message = (self.get_channel_keys()['sse_channel'], agent_message.model_dump_json()) if publish else None
+            return await self._append_history('agent_message_history', agent_message.model_dump(mode='json'), self.max_message_history, publish=channel_message)
         except Exception as e:
             logger.error(f"保存agent sse消息失败: {str(e)}")
             return False
 
-    async def get_agent_message(self) -> Tuple[Optional[AgentMessage], Optional[AgentMessageHistory]]:
-        """获取agent sse消息"""
+    async def get_agent_message(self, with_history: bool = False) -> Tuple[Optional[AgentMessage], Optional[AgentMessageHistory]]:
+        """获取最新的agent sse消息（O(1)），with_history=True 时同时返回完整历史"""
         try:
-            cache_key = self.get_cache_keys().get('agent_message_history')
-            cache_data = await RedisClient.get(cache_key)
-            if cache_data and cache_data['content']:
-                # 将字典转换为 AgentSSEMessageHistory 对象
-                message_history = AgentMessageHistory(**cache_data)
-                agent_message = message_history.content[-1] if message_history.content else None
-                return agent_message, message_history
-            else:
-                storage_data = await self.storage.get_from_django(params={'fields': 'agent_message_history'})
-                if storage_data and storage_data['content']:
-                    message_history_dict = storage_data
-                    success_redis = await RedisClient.set(cache_key, message_history_dict, expire=self.cache_expire_time)
-                    if success_redis:
-                        message_history = AgentMessageHistory(**message_history_dict)
-                        agent_message = message_history.content[-1] if message_history.content else None
-                        return agent_message, message_history
+            entry = await self._latest_history_entry('agent_message_history', self.max_message_history)
+            if not entry:
                 return None, None
+            message_history = await self.get_agent_message_history() if with_history else None
+            return AgentMessage(**entry), message_history
         except Exception as e:
             logger.error(f"获取agent sse消息失败: {str(e)}")
             return None, None
 
+    async def get_agent_message_history(self, start: int = 0, end: int = -1) -> Optional[AgentMessageHistory]:
+        """按范围获取agent sse消息历史（闭区间，支持负数下标，与LRANGE一致）"""
+        try:
+            entries = await self._history_range('agent_message_history', self.max_message_history, start, end)
+            if not entries:
+                return None
+            return AgentMessageHistory(key_name='agent_message_history', content=[AgentMessage(**entry) for entry in entries])
+        except Exception as e:
+            logger.error(f"获取agent sse消息历史失败: {str(e)}")
+            return None
+
+
+    async def get_agent_messages_since(self, last_event_id: str) -> Optional[List[Tuple[str, Dict[str, Any]]]]:
+        """
+        SSE断线重连：消息Stream中 last_event_id 之后的消息 [(Stream ID, 消息)]，O(错过的消息数)
+        last_event_id 已不在Stream中（被截断、过期或不是Stream ID）时返回None，客户端需要重新读取消息历史
+        """
+        if parse_stream_id(last_event_id) is None:
+            return None
+        # 从 last_event_id 本身开始读取，第一条不是它说明它之前的消息可能已被截断
+        entries = await RedisClient.xrange(self.get_channel_keys()['sse_stream'], start=last_event_id)
+        if not entries or entries[0][0] != last_event_id:
+            return None
+        return [(stream_id, orjson.loads(fields['message'])) for stream_id, fields in entries[1:]]
+
+
+    # =============== 追加式历史记录（Redis列表，每条状态/消息一个元素） ===============
+
+    async def _append_history(self, key_name: str, entry: Dict[str, Any], max_len: int, publish: Optional[Tuple[str, str]] = None) -> bool:
+        """
+        追加一条历史记录（RPUSH + 截断），并标记这条记录待追加到django
+        publish为(通道, 消息)时同时写入消息Stream并发布（同一个事务）
+        """
+        history_key = self.get_history_keys()[key_name]
+        async with RedisClient.pipeline() as pipe:
+            pipe.rpush(history_key, entry, max_len=max_len, expire=self.cache_expire_time)
+            if publish:
+                pipe.xadd_publish(self.get_channel_keys()['sse_stream'], *publish, max_len=settings.SSE_STREAM_MAX_LEN, expire=self.cache_expire_time)
+        length = pipe.results[0]
+        if length == 1:
+            # 列表是新建的（首次写入、缓存过期或旧格式数据），把已有的历史补到这条记录之前
+            await self._restore_history(key_name, max_len)
+
+        # django侧保存完整历史（不截断），这里只发送新增的条目
+        await CachePersister.mark(self.project_id, key_name, [entry], append=True)
+        return True
+
+    async def _latest_history_entry(self, key_name: str, max_len: int) -> Optional[Dict[str, Any]]:
+        """最新一条历史记录（LINDEX -1），列表不存在时先恢复"""
+        entry = await RedisClient.lindex(self.get_history_keys()[key_name], -1)
+        if entry is None:
+            entries = await self._fill_history(key_name, max_len)
+            entry = entries[-1] if entries else None
+        return entry
+
+    async def _history_range(self, key_name: str, max_len: int, start: int, end: int) -> List[Dict[str, Any]]:
+        """按范围读取历史记录（LRANGE），列表不存在时先恢复"""
+        history_key = self.get_history_keys()[key_name]
+        async with RedisClient.pipeline(transaction=False) as pipe:
+            pipe.lrange(history_key, start, end).exists(history_key)
+        entries, exists = pipe.results
+        if not entries and not exists:
+            restored = (await self._fill_history(key_name, max_len))[-max_len:]
+            # 与LRANGE相同的闭区间语义
+            entries = restored[start:(end + 1) or None]
+        return entries
+
+    async def _fill_history(self, key_name: str, max_len: int) -> List[Dict[str, Any]]:
+        """读取时列表不存在：恢复历史，同一历史并发的未命中合并为一次回源"""
+        history_key = self.get_history_keys()[key_name]
+
+        async def probe() -> Optional[List[Dict[str, Any]]]:
+            return await RedisClient.lrange(history_key) or None
+
+        return await CacheFill.run(
+            self.project_id, key_name,
+            fetch=lambda: self._restore_history(key_name, max_len),
+            probe=probe,
+            lock_key=f"{history_key}:fill_lock",
+        )
+
+    async def _restore_history(self, key_name: str, max_len: int) -> List[Dict[str, Any]]:
+        """
+        把已有的历史恢复到列表头部（LPUSH，保持原顺序），返回恢复的历史条目
+        来源依次为：旧的整体存储键（GET/SET整个历史JSON，迁移后删除）、django持久化数据
+        并发恢复时只有拿到锁的请求写入Redis，其余请求只返回读到的历史，避免重复插入
+        """
+        history_key = self.get_history_keys()[key_name]
+        legacy_key = self.get_cache_keys()[key_name]
+
+        legacy_data = await RedisClient.get(legacy_key)
+        if legacy_data and legacy_data.get('content'):
+            entries, source = legacy_data['content'], "Redis旧格式缓存"
+        else:
+            storage_data = await self.storage.get_from_django(params={'fields': key_name})
+            entries, source = (storage_data.get('content') if storage_data else None) or [], "Storage"
+
+        lock_key = f"{history_key}:restore_lock"
+        lock_id = await RedisClient.acquire_lock(lock_key, expire=10)
+        if lock_id is None:
+            return entries
+        try:
+            if entries or legacy_data is not None:
+                async with RedisClient.pipeline() as pipe:
+                    if entries:
+                        pipe.lpush(history_key, *entries, max_len=max_len, expire=self.cache_expire_time)
+                    if legacy_data is not None:
+                        pipe.delete(legacy_key)
+            if entries:
+                logger.info(f"从{source}恢复了{len(entries)}条{key_name}，项目号：{self.project_id}")
+        finally:
+            await RedisClient.release_lock(lock_key, lock_id)
+        return entries
+
 
     async def save_document(self, key_name: str, content: Dict[str, Any]) -> bool:
         """保存文档数据到Redis"""
@@ -175,59 +264,175 @@ class Cache:
             if not cache_key: 
                 logger.error(f"无效的文档类型: {key_name}")
                 return False
-            
-            document = Document(key_name=key_name, content=content)
-            document_dict = document.model_dump(mode='json')
-
-            # 缓存到Redis
-            redis_success = await RedisClient.set(cache_key, document_dict, expire=self.cache_expire_time)
-            if redis_success:
-                # 如果缓存成功，将缓存的数据进行持久化到django 
-                success_storage = await self.storage.save_to_django(document_dict)
-                if success_storage:
-                    return True
-                else:
-                    logger.error(f"保存文档到Django失败，项目号：{self.project_id}")
-                    return False
-            else:
-                logger.error(f"保存文档到Redis失败，项目号：{self.project_id}")
-                return False
+
+            # 缓存到Redis（文档和版本号一起写入），并标记待持久化到django（延迟批量提交，同一文档只提交最新版本）
+            # h1_document等按相对raw_document的节点差异保存，django中同样只保存差异
+            _, delta = await self._store_document(key_name, content)
+            await CachePersister.mark(self.project_id, key_name, delta.to_storage() if delta else content)
+            return True
 
         except Exception as e:
-            logger.error(f"保存文档数据失败 {cache_key}: {str(e)}")
+            logger.error(f"保存文档数据失败 {key_name}: {str(e)}")
             return False
 
 
     
-    async def get_document(self, key_name: str) -> Optional[Dict[str, Any]]:
-        """从Redis获取文档数据"""
+    async def save_partial_document(self, key_name: str, content: Dict[str, Any]) -> bool:
+        """保存分析过程中的部分结果到Redis（临时数据，不持久化到django）"""
         try:
             cache_key = self.get_cache_keys().get(key_name)
-            cache_data = await RedisClient.get(cache_key)
-            if cache_data and cache_data['content']:
-                document = Document(**cache_data)
-                print(f"从Redis获取了文档数据")
-                return document.content
-            else:
-                # 如果缓存失败，从django获取文档数据
-                # 从storage返回的数据格式是{'key_name': 'raw_document', 'content': 'raw_document'}， 需要需要再取content
-                storage_data = await self.storage.get_from_django(params={'fields': key_name})
-                if storage_data and storage_data['content']:
-                    storage_data_dict = storage_data
-                    success_redis = await RedisClient.set(cache_key, storage_data_dict, expire=self.cache_expire_time)
-                    if success_redis:
-                        document = Document(**storage_data_dict)
-                        print(f"从Storage获取了文档数据")
-                        return document.content
-                    else:
-                        logger.error(f"恢复文档数据到Redis失败，项目号：{self.project_id}")
-                        return None     
-                else:
-                    logger.error(f"获取文档数据失败 {key_name}: {str(e)}")
-                    return None
+            if not cache_key:
+                logger.error(f"无效的文档类型: {key_name}")
+                return False
+
+            await self._store_document(key_name, content)
+            return True
+        except Exception as e:
+            logger.error(f"保存部分结果失败 {key_name}: {str(e)}")
+            return False
+
+
+    async def get_document(self, key_name: str) -> Optional[Dict[str, Any]]:
+        """
+        获取文档数据：进程内缓存（按Redis中的版本号校验） -> Redis -> django
+        返回的文档对象可能与其他调用方共享，只读
+        """
+        try:
+            loaded = await self._load_document(key_name)
+            return loaded[1] if loaded else None
+        except Exception as e:
+            logger.error(f"获取文档数据失败 {key_name}: {str(e)}")
+            return None
+
+
+    async def get_document_index(self, key_name: str) -> Optional[DocumentTextIndex]:
+        """
+        获取文档的文本/位置索引（同一文档版本只构建一次，供各prompt builder切片使用）
+        以Redis中的版本号作为指纹，不需要序列化整篇文档；返回的 index.doc 即共享的文档对象，之后以它调用 DocumentTextIndex.from_doc 按对象身份命中
+        """
+        try:
+            loaded = await self._load_document(key_name)
         except Exception as e:
             logger.error(f"获取文档数据失败 {key_name}: {str(e)}")
             return None
+        if not loaded:
+            return None
+        version, document = loaded
+        return DocumentTextIndex.from_doc(document, fingerprint=version)
+
+
+    # =============== 文档版本（内容哈希）和进程内缓存 ===============
+
+    def _version_key(self, key_name: str) -> str:
+        return f"{self.get_cache_keys()[key_name]}:version"
+
+    async def _store_document(self, key_name: str, content: Dict[str, Any]) -> Tuple[str, Optional[NodeDelta]]:
+        """文档（或相对raw_document的差异）和版本号在同一事务中写入Redis，并放入进程内缓存，返回 (版本号, 差异)"""
+        payload, version, size = dump_document(key_name, content)
+        delta = await self._document_delta(key_name, content, size)
+        if delta is not None:
+            payload = {"key_name": key_name, "version": version, "size": size, "delta": delta.to_redis()}
+        await RedisClient.mset({
+            self.get_cache_keys()[key_name]: payload,
+            self._version_key(key_name): version,
+        }, expire=self.cache_expire_time)
+        DocumentCache.put(self.project_id, key_name, version, content, size)
+        return version, delta
+
+    async def _document_delta(self, key_name: str, content: Dict[str, Any], size: int) -> Optional[NodeDelta]:
+        """相对raw_document的节点差异，不按差异保存的文档、Redis中没有基准文档（不为此回源django）或差异过大时为None"""
+        if not settings.DOCUMENT_DELTA_ENABLED or key_name not in DELTA_DOCUMENTS:
+            return None
+        base = await self._read_document(BASE_DOCUMENT)
+        if not base:
+            return None
+        return DocumentDelta.diff(self.project_id, *base, content, size)
+
+    async def _apply_delta(self, key_name: str, delta: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """在基准文档上重建按差异保存的文档，基准不存在或已变化时返回None"""
+        base = await self._load_document(delta['base'])
+        content = DocumentDelta.apply(self.project_id, *base, delta) if base else None
+        if content is None:
+            logger.warning(f"文档 {key_name} 的基准 {delta['base']} 不存在或已变化，无法重建，项目号：{self.project_id}")
+        return content
+
+    async def _load_document(self, key_name: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """读取文档，返回 (版本号, 文档内容)"""
+        loaded = await self._read_document(key_name)
+        if loaded or key_name.endswith('_partial'):
+            # 临时数据只存在于Redis
+            return loaded
+
+        # 3. 如果缓存失败，从django获取文档数据（同一文档并发的未命中合并为一次回源）
+        return await CacheFill.run(
+            self.project_id, key_name,
+            fetch=lambda: self._restore_document(key_name),
+            probe=lambda: self._read_document(key_name),
+            lock_key=f"{self.get_cache_keys()[key_name]}:fill_lock",
+        )
+
+    async def _read_document(self, key_name: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """从进程内缓存/Redis读取文档，未命中时返回None"""
+        cache_key = self.get_cache_keys()[key_name]
+
+        # 1. 版本探测：版本号与进程内缓存一致时直接返回
+        #    进程内没有该文档时，版本号和文档在一次往返（MGET）中读取
+        raw = None
+        if DocumentCache.cached_version(self.project_id, key_name) is not None:
+            version = await RedisClient.get_raw(self._version_key(key_name))
+            if version is not None:
+                content = DocumentCache.get(self.project_id, key_name, version)
+                if content is not None:
+                    DocumentCache.record(hit=True, redis_bytes=len(version))
+                    return version, content
+            raw = await RedisClient.get_bytes(cache_key)
+        else:
+            version_raw, raw = await RedisClient.mget_bytes([self._version_key(key_name), cache_key])
+            version = RedisCodec.decode_text(version_raw)
+
+        # 2. 解码整篇文档（统计传输字节数和解压、JSON解析耗时）
+        if raw is not None:
+            start = time.perf_counter()
+            data = RedisCodec.decompress(raw)
+            cache_data = orjson.loads(data)
+            DocumentCache.record(hit=False, redis_bytes=len(raw) + len(version or ""), decode_seconds=time.perf_counter() - start)
+            if cache_data and cache_data.get('delta'):
+                content = await self._apply_delta(key_name, cache_data['delta'])
+                if content is None:
+                    return None
+                DocumentCache.put(self.project_id, key_name, cache_data['version'], content, cache_data['size'])
+                return cache_data['version'], content
+            if cache_data and cache_data.get('content'):
+                version = cache_data.get('version')
+                if not version:
+                    # 旧格式（没有版本号）：以原文的哈希作为版本号补写版本键，已有新版本时不覆盖
+                    version = hashlib.blake2b(data, digest_size=16).hexdigest()
+                    await RedisClient.setnx(self._version_key(key_name), version, expire=self.cache_expire_time)
+                DocumentCache.put(self.project_id, key_name, version, cache_data['content'], len(data))
+                return version, cache_data['content']
+        return None
+
+    async def _restore_document(self, key_name: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """从django读取文档并写回Redis"""
+        # 从storage返回的数据格式是{'key_name': 'raw_document', 'content': 'raw_document'}， 需要需要再取content
+        storage_data = await self.storage.get_from_django(params={'fields': key_name})
+        if storage_data and storage_data.get('content'):
+            content = storage_data['content']
+            if is_delta(content):
+                content = await self._apply_delta(key_name, content)
+                if content is None:
+                    return None
+            version, _ = await self._store_document(key_name, content)
+            logger.info(f"从Storage恢复了文档数据 {key_name}，项目号：{self.project_id}")
+            return version, content
+
+        logger.error(f"获取文档数据失败 {key_name}，Redis和Storage中都没有，项目号：{self.project_id}")
+        return None
+
+
+    async def flush(self) -> bool:
+        """立即把该项目待写入的数据提交到django（阶段切换时调用）"""
+        return await CachePersister.flush(self.project_id)
 
 
     # 清空 特定字段或全部（清空时，后端也被清空）
@@ -240,6 +445,7 @@ class Cache:
                         可选值: ['agent_state_history', 'agent_message_history', 'raw_document', 
                                'h1_document', 'h2h3_document', 'intro_document', 
                                'final_document', 'review_suggestions']
+                        清理raw_document时，按差异保存的h1_document等依赖它，一并清理
         
         Returns:
             Dict[str, bool]: 每个缓存键的清理结果，True表示成功，False表示失败
@@ -261,31 +467,40 @@ class Cache:
             
             # 清理有效的缓存键
             valid_keys = [key for key in target_keys if key in cache_keys]
+            if BASE_DOCUMENT in valid_keys:
+                valid_keys += [key for key in DELTA_DOCUMENTS if key not in valid_keys]
             
-            # 1. 清理Redis缓存
-            for key in valid_keys:
-                cache_key = cache_keys[key]
-                try:
-                    # 先检查键是否存在
-                    key_exists = await RedisClient.exists(cache_key)
-                    deleted_count = await RedisClient.delete(cache_key)
-
+            # 1. 清理Redis缓存（所有键在一个管道中删除，一次往返）
+            try:
+                async with RedisClient.pipeline(transaction=False) as pipe:
+                    for key in valid_keys:
+                        # 历史记录同时删除列表键（消息历史还有SSE补发用的消息Stream），文档同时删除版本键
+                        extra_keys = [self.get_history_keys()[key]] if key in self.get_history_keys() else [self._version_key(key)]
+                        if key == 'agent_message_history':
+                            extra_keys.append(self.get_channel_keys()['sse_stream'])
+                        pipe.delete(cache_keys[key], *extra_keys)
+                for key, deleted_count in zip(valid_keys, pipe.results):
+                    if key not in self.get_history_keys():
+                        DocumentCache.invalidate(self.project_id, key)
                     # Redis delete返回删除的键数量，>=0都表示操作成功
                     # 即使键不存在(返回0)也应该认为是成功的清理
                     cleanup_results[key] = True
-                    
                     if deleted_count > 0:
-                        logger.debug(f"成功清理Redis缓存: {cache_key} (键存在: {key_exists})")
+                        logger.debug(f"成功清理Redis缓存: {cache_keys[key]}")
                     else:
-                        logger.debug(f"Redis缓存键不存在，跳过: {cache_key} (键存在: {key_exists})")
-                        
-                except Exception as e:
-                    logger.error(f"清理Redis缓存时出错 {cache_key}: {str(e)}")
+                        logger.debug(f"Redis缓存键不存在，跳过: {cache_keys[key]}")
+            except Exception as e:
+                logger.error(f"清理Redis缓存时出错 {valid_keys}: {str(e)}")
+                for key in valid_keys:
                     cleanup_results[key] = False
             
             # 2. 清理Django存储数据
             try:
-                storage_success = await self.storage.clear_storage(clear_fields=valid_keys)
+                # 临时数据（*_partial）只存在于Redis，不需要清理Django存储
+                storage_keys = [key for key in valid_keys if not key.endswith('_partial')]
+                # 先丢弃还没提交的写入，避免清空后又被写回
+                await CachePersister.discard(self.project_id, storage_keys)
+                storage_success = await self.storage.clear_storage(clear_fields=storage_keys)
                 if storage_success:
                     logger.debug(f"成功清理Django存储数据: {valid_keys}")
                 else:
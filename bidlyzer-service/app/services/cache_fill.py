@@ -0,0 +1,130 @@
+from typing import Dict, Any, Tuple, Callable, Awaitable, Optional
+from app.core.config import settings
+from app.core.redis_helper import RedisClient
+import asyncio
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CacheFill:
+    """
+    缓存未命中时的回源合并（singleflight）
+
+    - 进程内：同一 (project_id, key_name) 同时只有一个回源任务，其余请求等待同一个结果（回源在独立任务中执行，发起请求被取消不影响其他等待者）
+    - 跨进程：回源前获取短时Redis锁；拿不到锁说明其他进程正在回源，轮询probe（重新读取Redis）等待其结果，
+      锁释放或等待超时后仍未读到时再自己回源
+    - 按key_name统计回源、进程内合并、跨进程等待的次数和等待时间
+    """
+
+    _inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+    _waiters: Dict[Tuple[str, str], int] = {}
+    _stats: Dict[str, Dict[str, Any]] = {}
+
+    @classmethod
+    async def run(
+        cls,
+        project_id: str,
+        key_name: str,
+        fetch: Callable[[], Awaitable[Any]],
+        probe: Optional[Callable[[], Awaitable[Any]]] = None,
+        lock_key: Optional[str] = None,
+    ) -> Any:
+        """
+        执行一次回源：fetch 从django读取并写回Redis，返回结果
+        probe 重新读取Redis（其他进程回源完成后可读到，未完成时返回None），lock_key 为跨进程回源锁，两者都提供时才做跨进程合并
+        """
+        key = (project_id, key_name)
+        stats = cls._key_stats(key_name)
+        task = cls._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(cls._fill(key_name, fetch, probe, lock_key))
+            cls._inflight[key] = task
+            task.add_done_callback(lambda _: cls._done(key, task))
+        else:
+            stats["joined"] += 1
+
+        cls._waiters[key] = cls._waiters.get(key, 0) + 1
+        stats["max_waiters"] = max(stats["max_waiters"], cls._waiters[key])
+        start = time.monotonic()
+        try:
+            return await asyncio.shield(task)
+        finally:
+            stats["wait_seconds"] += time.monotonic() - start
+            cls._waiters[key] -= 1
+            if not cls._waiters[key]:
+                cls._waiters.pop(key, None)
+
+    @classmethod
+    def _done(cls, key: Tuple[str, str], task: asyncio.Task) -> None:
+        if cls._inflight.get(key) is task:
+            cls._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            cls._key_stats(key[1])["errors"] += 1
+
+    @classmethod
+    async def _fill(cls, key_name: str, fetch, probe, lock_key) -> Any:
+        stats = cls._key_stats(key_name)
+        if probe is None or lock_key is None:
+            stats["fills"] += 1
+            return await fetch()
+
+        deadline = time.monotonic() + settings.CACHE_FILL_WAIT_TIMEOUT
+        while True:
+            lock_id = await RedisClient.acquire_lock(lock_key, expire=settings.CACHE_FILL_LOCK_TIMEOUT)
+            if lock_id is not None:
+                try:
+                    # 拿到锁后再读一次：可能在等待期间其他进程已经回源完成
+                    result = await probe()
+                    if result is not None:
+                        stats["remote_hits"] += 1
+                        return result
+                    stats["fills"] += 1
+                    return await fetch()
+                finally:
+                    await RedisClient.release_lock(lock_key, lock_id)
+
+            # 其他进程正在回源：等待其写回Redis
+            stats["remote_waits"] += 1
+            while await RedisClient.exists(lock_key):
+                if time.monotonic() >= deadline:
+                    stats["timeouts"] += 1
+                    logger.warning(f"等待其他进程回源超时，自行回源：{lock_key}")
+                    stats["fills"] += 1
+                    return await fetch()
+                await asyncio.sleep(settings.CACHE_FILL_POLL_INTERVAL)
+            result = await probe()
+            if result is not None:
+                stats["remote_hits"] += 1
+                return result
+            # 锁已释放但仍未读到（对方回源失败或数据不存在）：重新竞争锁，自己回源
+
+    @classmethod
+    def _key_stats(cls, key_name: str) -> Dict[str, Any]:
+        return cls._stats.setdefault(key_name, {
+            "fills": 0, "joined": 0, "remote_waits": 0, "remote_hits": 0, "timeouts": 0, "errors": 0,
+            "max_waiters": 0, "wait_seconds": 0.0,
+        })
+
+    # ----------------------------- 监控 -----------------------------
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        """各key_name的回源次数、合并的请求数（进程内joined、跨进程remote_hits）、最大同时等待数和等待时间"""
+        return {
+            "inflight": len(cls._inflight),
+            "keys": {
+                key_name: {**stats, "wait_seconds": round(stats["wait_seconds"], 3)}
+                for key_name, stats in cls._stats.items()
+            },
+        }
+
+    @classmethod
+    def reset_stats(cls) -> None:
+        cls._stats = {}
+
+    @classmethod
+    def clear(cls) -> None:
+        cls._inflight = {}
+        cls._waiters = {}
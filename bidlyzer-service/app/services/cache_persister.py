@@ -0,0 +1,215 @@
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional
+from prometheus_client import Counter, Histogram
+from app.core.config import settings
+from app.services.storage import Storage
+from app.services.llm.hedging import LatencyWindow
+import asyncio
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+FLUSH_LAG = Histogram(
+    "cache_persist_flush_lag_seconds", "缓存数据从标记待写入到写入Django的延迟",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60),
+)
+BATCH_ITEMS = Histogram("cache_persist_batch_items", "每次提交Django的字段数", buckets=(1, 2, 3, 5, 8, 13))
+BATCH_ENTRIES = Histogram("cache_persist_batch_entries", "每次提交追加的历史条目数", buckets=(0, 1, 2, 5, 10, 20, 50, 100))
+FLUSH_FAILURES = Counter("cache_persist_flush_failures_total", "提交Django失败的次数")
+
+
+@dataclass
+class PendingWrite:
+    """某个项目某个字段待写入Django的数据"""
+    append: bool                  # True: content为新增的历史条目，追加到Django已有列表之后；False: 整体替换
+    content: Any = None
+    marked_at: float = field(default_factory=time.monotonic)   # 最早一次未提交写入的时间
+    writes: int = 1               # 合并的写入次数
+
+    @property
+    def entries(self) -> int:
+        return len(self.content) if self.append and self.content else 0
+
+    def merge(self, newer: "PendingWrite") -> None:
+        """合并同一字段之后的一次写入：整体替换覆盖之前的所有写入，追加则接在之后"""
+        if newer.append:
+            self.content = list(self.content or []) + list(newer.content or [])
+        else:
+            self.append, self.content = False, newer.content
+        self.marked_at = min(self.marked_at, newer.marked_at)
+        self.writes += newer.writes
+
+
+class CachePersister:
+    """
+    缓存到Django的延迟批量写入（进程内）
+
+    - Cache.save_* 写入Redis后只标记待写入，同一项目同一字段的多次写入合并（文档只保留最新值，历史只发送新增条目）
+    - 后台任务每隔 CACHE_PERSIST_FLUSH_INTERVAL 秒按项目提交一次；阶段切换时和应用关闭时（lifespan）立即提交
+    - 同一项目的提交串行执行，失败时数据放回队列（排在期间新标记的写入之前）下次重试，保证顺序
+    """
+
+    _pending: Dict[str, Dict[str, PendingWrite]] = {}   # project_id -> key_name -> 待写入数据（按标记顺序）
+    _locks: Dict[str, asyncio.Lock] = {}
+    _task: Optional[asyncio.Task] = None
+    _lag = LatencyWindow(size=1000)
+    _stats: Dict[str, int] = {
+        "marked": 0, "coalesced": 0, "batches": 0, "items_flushed": 0, "entries_flushed": 0,
+        "failures": 0, "max_batch_items": 0, "max_batch_entries": 0,
+    }
+
+    @classmethod
+    async def mark(cls, project_id: str, key_name: str, content: Any, append: bool = False) -> None:
+        """
+        标记待写入：append=False 时content为字段的最新值，append=True 时content为新增的历史条目列表
+        关闭延迟写入（CACHE_PERSIST_WRITE_BEHIND=False）时立即提交
+        """
+        write = PendingWrite(append=append, content=list(content) if append else content)
+        pending = cls._pending.setdefault(project_id, {})
+        if key_name in pending:
+            pending[key_name].merge(write)
+            cls._stats["coalesced"] += 1
+        else:
+            pending[key_name] = write
+        cls._stats["marked"] += 1
+
+        if not settings.CACHE_PERSIST_WRITE_BEHIND:
+            await cls.flush(project_id)
+        else:
+            cls._ensure_flusher()
+
+    @classmethod
+    async def flush(cls, project_id: Optional[str] = None) -> bool:
+        """立即提交某个项目（不指定时为所有项目）的待写入数据，全部成功时返回True"""
+        project_ids = [project_id] if project_id is not None else list(cls._pending)
+        results = [await cls._flush_project(pid) for pid in project_ids]
+        return all(results)
+
+    @classmethod
+    async def discard(cls, project_id: str, key_names: Optional[List[str]] = None) -> None:
+        """丢弃待写入数据（清理缓存和存储时调用，避免之后的提交把已清空的字段写回去）"""
+        async with cls._lock(project_id):
+            pending = cls._pending.get(project_id)
+            if not pending:
+                return
+            for key_name in (key_names if key_names is not None else list(pending)):
+                pending.pop(key_name, None)
+            if not pending:
+                cls._pending.pop(project_id, None)
+
+    @classmethod
+    async def _flush_project(cls, project_id: str) -> bool:
+        async with cls._lock(project_id):
+            batch = cls._pending.pop(project_id, None)
+            if not batch:
+                return True
+
+            items = [{"key_name": key_name, "content": write.content, "append": write.append} for key_name, write in batch.items()]
+            entries = sum(write.entries for write in batch.values())
+            try:
+                await Storage(project_id).save_batch_to_django(items)
+            except Exception as e:
+                # 放回队列，期间新标记的写入合并在后面，下次提交时一起重试
+                newer = cls._pending.pop(project_id, {})
+                for key_name, write in newer.items():
+                    if key_name in batch:
+                        batch[key_name].merge(write)
+                    else:
+                        batch[key_name] = write
+                cls._pending[project_id] = batch
+                cls._stats["failures"] += 1
+                FLUSH_FAILURES.inc()
+                logger.error(f"提交缓存数据到Django失败，项目号：{project_id}，字段：{list(batch)}，将重试: {str(e)}")
+                return False
+
+            now = time.monotonic()
+            for write in batch.values():
+                FLUSH_LAG.observe(now - write.marked_at)
+                cls._lag.add(now - write.marked_at)
+            BATCH_ITEMS.observe(len(items))
+            BATCH_ENTRIES.observe(entries)
+            cls._stats["batches"] += 1
+            cls._stats["items_flushed"] += len(items)
+            cls._stats["entries_flushed"] += entries
+            cls._stats["max_batch_items"] = max(cls._stats["max_batch_items"], len(items))
+            cls._stats["max_batch_entries"] = max(cls._stats["max_batch_entries"], entries)
+            logger.debug(f"提交缓存数据到Django，项目号：{project_id}，字段：{list(batch)}，追加历史{entries}条")
+            return True
+
+    @classmethod
+    def _lock(cls, project_id: str) -> asyncio.Lock:
+        if project_id not in cls._locks:
+            cls._locks[project_id] = asyncio.Lock()
+        return cls._locks[project_id]
+
+    # ----------------------------- 后台提交任务 -----------------------------
+
+    @classmethod
+    def _ensure_flusher(cls) -> None:
+        """在当前事件循环中启动后台提交任务（已在运行则跳过）"""
+        loop = asyncio.get_running_loop()
+        if cls._task is None or cls._task.done() or cls._task.get_loop() is not loop:
+            cls._task = loop.create_task(cls._run())
+
+    @classmethod
+    async def _run(cls) -> None:
+        while True:
+            await asyncio.sleep(settings.CACHE_PERSIST_FLUSH_INTERVAL)
+            try:
+                await cls.flush()
+            except Exception as e:
+                logger.error(f"延迟写入提交异常: {str(e)}")
+
+    @classmethod
+    async def start(cls) -> None:
+        """应用启动时调用（lifespan）"""
+        if settings.CACHE_PERSIST_WRITE_BEHIND:
+            cls._ensure_flusher()
+
+    @classmethod
+    async def shutdown(cls) -> None:
+        """应用关闭时调用（lifespan）：停止后台任务，并提交所有待写入数据"""
+        task, cls._task = cls._task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if not await cls.flush():
+            logger.error(f"关闭前提交缓存数据失败，未写入Django的字段：{ {pid: list(pending) for pid, pending in cls._pending.items()} }")
+
+    # ----------------------------- 监控 -----------------------------
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        """待写入数据量、提交批次大小和提交延迟（从标记到写入Django）"""
+        now = time.monotonic()
+        writes = [write for pending in cls._pending.values() for write in pending.values()]
+        batches = cls._stats["batches"]
+        return {
+            **cls._stats,
+            "write_behind": settings.CACHE_PERSIST_WRITE_BEHIND,
+            "pending_projects": len(cls._pending),
+            "pending_items": len(writes),
+            "pending_entries": sum(write.entries for write in writes),
+            "oldest_pending_seconds": round(now - min(write.marked_at for write in writes), 3) if writes else None,
+            "avg_batch_items": round(cls._stats["items_flushed"] / batches, 2) if batches else None,
+            "flush_lag": cls._lag.summary(),
+        }
+
+    @classmethod
+    def reset_stats(cls) -> None:
+        cls._lag = LatencyWindow(size=1000)
+        cls._stats = {key: 0 for key in cls._stats}
+
+    @classmethod
+    def clear(cls) -> None:
+        """清空待写入数据并停止后台任务（测试用）"""
+        if cls._task is not None and not cls._task.done() and not cls._task.get_loop().is_closed():
+            cls._task.cancel()
+        cls._task = None
+        cls._pending = {}
+        cls._locks = {}
@@ -0,0 +1,138 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, Tuple
+from app.core.config import settings
+import hashlib
+import orjson
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# 当前处理阶段（用于按阶段统计Redis读取字节数和JSON解析耗时），由Structuring.process设置
+_document_stage: ContextVar[str] = ContextVar("document_stage", default="unknown")
+
+
+@contextmanager
+def document_stage(stage: str):
+    """为其中的文档读取打上阶段标签"""
+    token = _document_stage.set(str(stage))
+    try:
+        yield
+    finally:
+        _document_stage.reset(token)
+
+
+def dump_document(key_name: str, content: Dict[str, Any]) -> Tuple[Dict[str, Any], str, int]:
+    """
+    序列化文档用于写入Redis，返回 (payload, version, 字节数)
+    version 为内容的哈希（与 document_fingerprint 相同），内容不变版本不变；
+    payload 中的content是已序列化的 orjson.Fragment，RedisCodec编码时不再重复序列化
+    """
+    raw = orjson.dumps(content)
+    version = hashlib.blake2b(raw, digest_size=16).hexdigest()
+    payload = {"key_name": key_name, "version": version, "content": orjson.Fragment(raw)}
+    return payload, version, len(raw)
+
+
+@dataclass
+class CachedDocument:
+    version: str
+    content: Dict[str, Any]
+    size: int          # 序列化后的字节数，用于按大小淘汰
+
+
+class DocumentCache:
+    """
+    进程内的文档LRU缓存（位于Redis之前）
+
+    - 每个 (project_id, key_name) 保存最新的一个版本，version是内容哈希，同一版本的内容不会变化
+    - 读取时先从Redis取版本号（几十字节）校验，版本一致直接返回进程内的对象，省去整篇文档的传输、JSON解析
+    - 按序列化字节数淘汰，总量不超过 DOCUMENT_CACHE_MAX_BYTES；同一文档写入新版本时旧版本直接移除
+    - 返回的文档对象在多个调用方之间共享，只读，需要修改时先deepcopy（tiptap工具函数已如此）
+    """
+
+    _entries: "OrderedDict[Tuple[str, str], CachedDocument]" = OrderedDict()
+    _bytes: int = 0
+    _stats: Dict[str, Any] = {"evictions": 0, "stages": {}}
+
+    @classmethod
+    def get(cls, project_id: str, key_name: str, version: str) -> Optional[Dict[str, Any]]:
+        """版本一致时返回缓存的文档内容"""
+        entry = cls._entries.get((project_id, key_name))
+        if entry is None or entry.version != version:
+            return None
+        cls._entries.move_to_end((project_id, key_name))
+        return entry.content
+
+    @classmethod
+    def cached_version(cls, project_id: str, key_name: str) -> Optional[str]:
+        """进程内缓存的文档版本号，没有缓存时为None"""
+        entry = cls._entries.get((project_id, key_name))
+        return entry.version if entry is not None else None
+
+    @classmethod
+    def put(cls, project_id: str, key_name: str, version: str, content: Dict[str, Any], size: int) -> None:
+        """缓存文档的一个版本（替换该文档的旧版本），超过容量时从最久未使用的开始淘汰"""
+        if not settings.DOCUMENT_CACHE_ENABLED:
+            return
+        cls.invalidate(project_id, key_name)
+        if size > settings.DOCUMENT_CACHE_MAX_BYTES:
+            return
+        cls._entries[(project_id, key_name)] = CachedDocument(version=version, content=content, size=size)
+        cls._bytes += size
+        while cls._bytes > settings.DOCUMENT_CACHE_MAX_BYTES and cls._entries:
+            _, evicted = cls._entries.popitem(last=False)
+            cls._bytes -= evicted.size
+            cls._stats["evictions"] += 1
+
+    @classmethod
+    def invalidate(cls, project_id: str, key_name: Optional[str] = None) -> None:
+        """移除某个文档（不指定key_name时为该项目的所有文档）"""
+        keys = [(project_id, key_name)] if key_name is not None else [key for key in cls._entries if key[0] == project_id]
+        for key in keys:
+            entry = cls._entries.pop(key, None)
+            if entry is not None:
+                cls._bytes -= entry.size
+
+    # ----------------------------- 监控 -----------------------------
+
+    @classmethod
+    def record(cls, hit: bool, redis_bytes: int = 0, decode_seconds: float = 0.0) -> None:
+        """记录一次文档读取（按当前阶段汇总）：是否命中进程内缓存、从Redis读取的字节数、JSON解析耗时"""
+        stage = cls._stats["stages"].setdefault(_document_stage.get(), {
+            "reads": 0, "hits": 0, "redis_bytes": 0, "decode_seconds": 0.0,
+        })
+        stage["reads"] += 1
+        stage["hits"] += int(hit)
+        stage["redis_bytes"] += redis_bytes
+        stage["decode_seconds"] += decode_seconds
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        """缓存的文档数、字节数、淘汰次数，以及各阶段的命中率、Redis读取字节数和JSON解析耗时"""
+        return {
+            "entries": len(cls._entries),
+            "bytes": cls._bytes,
+            "max_bytes": settings.DOCUMENT_CACHE_MAX_BYTES,
+            "evictions": cls._stats["evictions"],
+            "stages": {
+                name: {
+                    **stage,
+                    "hit_rate": round(stage["hits"] / stage["reads"], 3) if stage["reads"] else None,
+                    "decode_seconds": round(stage["decode_seconds"], 4),
+                }
+                for name, stage in cls._stats["stages"].items()
+            },
+        }
+
+    @classmethod
+    def reset_stats(cls) -> None:
+        cls._stats = {"evictions": 0, "stages": {}}
+
+    @classmethod
+    def clear(cls) -> None:
+        cls._entries.clear()
+        cls._bytes = 0
@@ -0,0 +1,228 @@
+from bisect import bisect_left
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Tuple
+from app.core.config import settings
+import hashlib
+import time
+import orjson
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# 结构化流程的各版本文档都由raw_document派生：之后的版本按节点差异保存（相对raw_document）
+BASE_DOCUMENT = "raw_document"
+DELTA_DOCUMENTS = ("h1_document", "h2h3_document", "intro_document", "final_document")
+DELTA_FORMAT = "node_delta"
+
+
+def is_delta(value: Any) -> bool:
+    """是否为差异格式的文档（Redis缓存和django中保存的都是同一格式）"""
+    return isinstance(value, dict) and value.get("format") == DELTA_FORMAT
+
+
+@dataclass
+class NodeList:
+    """文档顶层节点的内容哈希和序列化结果（按键排序序列化，django JSONB改变键顺序后哈希不变）"""
+    hashes: List[bytes]
+    raws: List[bytes]
+
+    @property
+    def base_id(self) -> str:
+        """整个节点序列的哈希，用于校验差异对应的基准文档"""
+        return hashlib.blake2b(b"".join(self.hashes), digest_size=16).hexdigest()
+
+
+@dataclass
+class NodeDelta:
+    """
+    相对基准文档的节点差异：ops为 (i1, i2, j1, j2)，表示基准的节点[i1:i2]替换为新文档的节点[j1:j2]
+    写入Redis时新节点用已序列化的JSON片段（不重复序列化），提交django时用节点对象
+    """
+    base_id: str
+    base_version: str
+    base_nodes: int
+    shell: Dict[str, Any]
+    ops: List[Tuple[int, int, int, int]]
+    nodes: List[Dict[str, Any]]
+    raws: List[bytes]
+
+    def _dump(self, nodes: List[Any]) -> Dict[str, Any]:
+        return {
+            "format": DELTA_FORMAT,
+            "base": BASE_DOCUMENT,
+            "base_id": self.base_id,
+            "base_version": self.base_version,
+            "base_nodes": self.base_nodes,
+            "shell": self.shell,
+            "ops": [[i1, i2, nodes[j1:j2]] for i1, i2, j1, j2 in self.ops],
+        }
+
+    def to_redis(self) -> Dict[str, Any]:
+        return self._dump([orjson.Fragment(raw) for raw in self.raws])
+
+    def to_storage(self) -> Dict[str, Any]:
+        return self._dump(self.nodes)
+
+
+class DocumentDelta:
+    """
+    文档的节点级去重（类方法单例）
+
+    raw/h1/h2h3/intro/final 五个版本的大部分顶层节点相同，每个阶段只修改部分节点（段落改为标题、调整属性）或插入少量节点。
+    - 之后的版本保存为相对raw_document的差异：按顶层节点的内容哈希对齐，只保存变化的节点，读取时在基准文档上重建
+    - 重建的文档与基准文档共享未变化的节点对象（文档只读）
+    - 差异记录基准的版本号和节点序列哈希，基准变化后差异失效（按不存在处理）
+    - 差异超过整篇文档的 DOCUMENT_DELTA_MAX_RATIO 时仍保存整篇
+    """
+
+    _bases: "OrderedDict[Tuple[str, str], NodeList]" = OrderedDict()   # (project_id, 基准版本号) -> 基准的节点哈希
+    _max_bases: int = 32
+    _stats: Dict[str, Any] = {
+        "deltas": 0, "full": 0, "document_bytes": 0, "delta_bytes": 0, "diff_seconds": 0.0,
+        "applied": 0, "apply_seconds": 0.0, "base_mismatches": 0,
+    }
+
+    @staticmethod
+    def nodes(content: Dict[str, Any]) -> Optional[NodeList]:
+        """文档顶层节点的哈希，不是tiptap文档（content不是列表）时为None"""
+        children = content.get("content") if isinstance(content, dict) else None
+        if not isinstance(children, list):
+            return None
+        raws = [orjson.dumps(node, option=orjson.OPT_SORT_KEYS) for node in children]
+        return NodeList(hashes=[hashlib.blake2b(raw, digest_size=8).digest() for raw in raws], raws=raws)
+
+    @classmethod
+    def base_nodes(cls, project_id: str, version: str, content: Dict[str, Any]) -> Optional[NodeList]:
+        """基准文档的节点哈希（按版本缓存，同一基准上的多次保存/重建只计算一次）"""
+        key = (project_id, version)
+        if key in cls._bases:
+            cls._bases.move_to_end(key)
+            return cls._bases[key]
+        nodes = cls.nodes(content)
+        if nodes is not None:
+            cls._bases[key] = nodes
+            while len(cls._bases) > cls._max_bases:
+                cls._bases.popitem(last=False)
+        return nodes
+
+    @classmethod
+    def diff(cls, project_id: str, base_version: str, base: Dict[str, Any], content: Dict[str, Any], size: int) -> Optional[NodeDelta]:
+        """计算content相对基准文档的差异，差异过大或不是tiptap文档时返回None（保存整篇）"""
+        start = time.perf_counter()
+        base_nodes = cls.base_nodes(project_id, base_version, base)
+        nodes = cls.nodes(content)
+        if base_nodes is None or nodes is None:
+            return None
+
+        ops = _diff(base_nodes.hashes, nodes.hashes)
+        changed = [j for _, _, j1, j2 in ops for j in range(j1, j2)]
+        delta_bytes = sum(len(nodes.raws[j]) for j in changed)
+        cls._stats["diff_seconds"] += time.perf_counter() - start
+        cls._stats["document_bytes"] += size
+        if delta_bytes > size * settings.DOCUMENT_DELTA_MAX_RATIO:
+            cls._stats["full"] += 1
+            cls._stats["delta_bytes"] += size
+            return None
+
+        # ops中的节点下标改为在变化节点列表中的下标
+        compact_ops, offset = [], 0
+        for i1, i2, j1, j2 in ops:
+            compact_ops.append((i1, i2, offset, offset + j2 - j1))
+            offset += j2 - j1
+        cls._stats["deltas"] += 1
+        cls._stats["delta_bytes"] += delta_bytes
+        return NodeDelta(
+            base_id=base_nodes.base_id,
+            base_version=base_version,
+            base_nodes=len(base_nodes.hashes),
+            shell={key: value for key, value in content.items() if key != "content"},
+            ops=compact_ops,
+            nodes=[content["content"][j] for j in changed],
+            raws=[nodes.raws[j] for j in changed],
+        )
+
+    @classmethod
+    def apply(cls, project_id: str, base_version: str, base: Dict[str, Any], delta: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """在基准文档上重建差异对应的文档，基准与差异记录的不一致时返回None"""
+        start = time.perf_counter()
+        children = base.get("content") if isinstance(base, dict) else None
+        if not isinstance(children, list) or len(children) != delta["base_nodes"] or (
+            base_version != delta["base_version"] and cls.base_nodes(project_id, base_version, base).base_id != delta["base_id"]
+        ):
+            cls._stats["base_mismatches"] += 1
+            return None
+
+        content, i = [], 0
+        for i1, i2, nodes in delta["ops"]:
+            content.extend(children[i:i1])
+            content.extend(nodes)
+            i = i2
+        content.extend(children[i:])
+        cls._stats["applied"] += 1
+        cls._stats["apply_seconds"] += time.perf_counter() - start
+        return {**delta["shell"], "content": content}
+
+    # ----------------------------- 监控 -----------------------------
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        """按差异/整篇保存的次数、保存的字节数与整篇文档字节数之比，以及计算差异和重建的耗时"""
+        stats = cls._stats
+        return {
+            **stats,
+            "diff_seconds": round(stats["diff_seconds"], 4),
+            "apply_seconds": round(stats["apply_seconds"], 4),
+            "dedup_ratio": round(stats["document_bytes"] / stats["delta_bytes"], 2) if stats["delta_bytes"] else None,
+            "cached_bases": len(cls._bases),
+        }
+
+    @classmethod
+    def reset_stats(cls) -> None:
+        cls._stats = {key: 0.0 if isinstance(value, float) else 0 for key, value in cls._stats.items()}
+
+    @classmethod
+    def clear(cls) -> None:
+        cls._bases.clear()
+
+
+def _diff(base: List[bytes], hashes: List[bytes]) -> List[Tuple[int, int, int, int]]:
+    """
+    按节点哈希对齐两个节点序列（线性时间），返回 (i1, i2, j1, j2) 替换操作列表
+    不一致时：新节点在基准后面出现（且下一个节点也对得上）视为删除了中间的基准节点，否则视为新节点（下一个能对上时视为替换）
+    对齐不一定最短，但按操作重建的结果总是与新文档一致
+    """
+    positions: Dict[bytes, List[int]] = {}
+    for i, h in enumerate(base):
+        positions.setdefault(h, []).append(i)
+
+    def find(h: bytes, i: int) -> Optional[int]:
+        found = positions.get(h)
+        if not found:
+            return None
+        k = bisect_left(found, i)
+        return found[k] if k < len(found) else None
+
+    ops, start = [], None
+    i, j, n, m = 0, 0, len(base), len(hashes)
+    while j < m:
+        if i < n and base[i] == hashes[j]:
+            if start is not None:
+                ops.append((start[0], i, start[1], j))
+                start = None
+            i, j = i + 1, j + 1
+            continue
+        if start is None:
+            start = (i, j)
+        p = find(hashes[j], i)
+        if p is not None and (p + 1 >= n or j + 1 >= m or base[p + 1] == hashes[j + 1]):
+            i = p
+            continue
+        j += 1
+        if i + 1 < n and j < m and base[i + 1] == hashes[j]:
+            i += 1
+    if start is not None or i < n:
+        i1, j1 = start if start is not None else (i, j)
+        ops.append((i1, n, j1, m))
+    return ops
@@ -0,0 +1,260 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Any, Optional, Set, Tuple, Iterable
+import re
+import logging
+
+from app.clients.tiptap.tools import DocumentTextIndex, IndexedNode, format_md_element
+
+logger = logging.getLogger(__name__)
+
+
+# 编号模式：(名称, 正则, 分值)，按顺序匹配，只取第一个命中的模式
+_CN_DIGITS = "一二三四五六七八九十百零〇"
+NUMBERING_PATTERNS: List[Tuple[str, "re.Pattern", float]] = [
+    ("chapter", re.compile(rf"^第[{_CN_DIGITS}\d]+[章节部分篇卷册]"), 4),          # 第一章 / 第二部分
+    ("appendix", re.compile(r"^(附件|附表|附录|附图)"), 3),                           # 附件1：投标函
+    ("cn_number", re.compile(rf"^[{_CN_DIGITS}]+\s*[、．.]"), 3),                     # 一、
+    ("multi_level", re.compile(r"^\d+(\.\d+)+(?![\d.])"), 3),                       # 1.1 / 1.1.1
+    ("cn_paren", re.compile(rf"^[（(][{_CN_DIGITS}]+[)）]"), 2),                      # （一）
+    ("arabic", re.compile(r"^\d+\s*[、．.](?!\d)"), 1),                              # 1、 / 1.
+    ("arabic_paren", re.compile(r"^[（(]\d+[)）]"), 1),                              # （1）
+]
+
+# 目录行：引导符/制表符 + 页码结尾
+TOC_LINE = re.compile(r"(\.{3,}|…+|·{3,}|-{3,}|\t)\s*\d+\s*$")
+
+# 样式提示（docx转换时 mammoth style_map 生成的class）
+HEADING_STYLE_HINTS = ("heading", "title")
+BODY_STYLE_HINTS = ("list-paragraph", "body-text", "table-text", "caption", "footnote-text", "endnote-text")
+TOC_STYLE_HINT = "toc-"
+
+SENTENCE_ENDINGS = ("。", "；", ";", "，", ",")
+
+
+@dataclass
+class HeadingCandidate:
+    """单个节点的标题候选打分"""
+    position: int
+    score: float
+    reasons: List[str] = field(default_factory=list)
+
+
+@dataclass
+class PrefilterResult:
+    """预筛选结果：保留的行（候选标题 + 上下文，省略的正文合并为一条提示）"""
+    lines: List[Tuple[int, str]]
+    lines_in: int
+    candidates: int
+    context: int
+    elided: int
+    applied: bool = True
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "applied": self.applied,
+            "lines_in": self.lines_in,
+            "lines_out": len(self.lines),
+            "candidates": self.candidates,
+            "context": self.context,
+            "elided": self.elided,
+        }
+
+
+def _style_class(node: Dict[str, Any]) -> str:
+    attrs = node.get("attrs") or {}
+    return " ".join(str(attrs.get(key) or "") for key in ("class", "styleName")).lower()
+
+
+def _is_bold(node: Dict[str, Any]) -> bool:
+    """段落内所有非空文本都带加粗标记"""
+    texts = []
+
+    def walk(current: Dict[str, Any]) -> None:
+        if current.get("type") == "text":
+            if (current.get("text") or "").strip():
+                texts.append(current)
+            return
+        for child in current.get("content") or []:
+            if isinstance(child, dict):
+                walk(child)
+
+    walk(node)
+    return bool(texts) and all(
+        any(mark.get("type") in ("bold", "strong") for mark in text.get("marks") or [])
+        for text in texts
+    )
+
+
+def normalize_title(text: str) -> str:
+    """用于目录匹配的标题规范化：去掉引导符、页码和空白"""
+    return re.sub(r"\s+", "", TOC_LINE.sub("", text))
+
+
+class HeadingCandidateFilter:
+    """
+    标题候选预筛选：在调用大模型之前，用规则和特征给每个节点打分，排除不可能是标题的节点
+
+    特征：中文编号（第X章 / 一、/（一）/ 1.1.1）、长度、句末标点、标题样式提示、加粗、与目录条目匹配。
+    只有候选标题及其前后少量上下文（截断后）进入prompt，其余正文和表格合并为"[省略N条]"提示。
+    候选数过少（文档没有可用的编号或格式特征）时不筛选，保持原有的完整上下文。
+    """
+
+    def __init__(self,
+                 threshold: float = 2.0,
+                 context_size: int = 1,
+                 context_chars: int = 40,
+                 min_candidates: int = 3):
+        self.threshold = threshold
+        self.context_size = context_size
+        self.context_chars = context_chars
+        self.min_candidates = min_candidates
+
+    @classmethod
+    def from_settings(cls) -> "HeadingCandidateFilter":
+        from app.core.config import settings
+        return cls(
+            threshold=settings.STRUCTURING_HEADING_PREFILTER_THRESHOLD,
+            context_size=settings.STRUCTURING_HEADING_PREFILTER_CONTEXT_SIZE,
+            context_chars=settings.STRUCTURING_HEADING_PREFILTER_CONTEXT_CHARS,
+            min_candidates=settings.STRUCTURING_HEADING_PREFILTER_MIN_CANDIDATES,
+        )
+
+    # ------------------------------ 打分 ------------------------------
+
+    @staticmethod
+    def is_toc_line(entry: IndexedNode, node: Dict[str, Any]) -> bool:
+        return TOC_STYLE_HINT in _style_class(node) or bool(TOC_LINE.search(entry.text.strip()))
+
+    def score(self, entry: IndexedNode, node: Dict[str, Any], toc_titles: Set[str]) -> HeadingCandidate:
+        """计算单个节点是标题的得分"""
+        candidate = HeadingCandidate(position=entry.position, score=0.0)
+        text = entry.text.strip()
+        if entry.type not in ("paragraph", "heading") or not text:
+            candidate.score = float("-inf")
+            return candidate
+
+        def add(points: float, reason: str) -> None:
+            candidate.score += points
+            candidate.reasons.append(reason)
+
+        if entry.type == "heading":
+            add(4, f"heading:{entry.level}")
+
+        style = _style_class(node)
+        if any(hint in style for hint in HEADING_STYLE_HINTS):
+            add(2, "style:heading")
+        elif any(hint in style for hint in BODY_STYLE_HINTS):
+            add(-2, "style:body")
+
+        for name, pattern, points in NUMBERING_PATTERNS:
+            if pattern.match(text):
+                add(points, f"numbering:{name}")
+                break
+
+        length = len(text)
+        if length <= 40:
+            add(1, "short")
+        elif length > 150:
+            add(-4, "long")
+        elif length > 80:
+            add(-2, "long")
+
+        if text.endswith(SENTENCE_ENDINGS):
+            add(-1, "sentence")
+
+        if _is_bold(node):
+            add(2, "bold")
+
+        if toc_titles and normalize_title(text) in toc_titles:
+            add(3, "toc_match")
+
+        return candidate
+
+    def candidates(self, index: DocumentTextIndex) -> Dict[int, HeadingCandidate]:
+        """文档中所有候选标题（得分不低于阈值，目录行除外），按position索引"""
+        toc_positions: Set[int] = set()
+        toc_titles: Set[str] = set()
+        for entry in index.of_types("paragraph"):
+            if self.is_toc_line(entry, index.node(entry.position)):
+                toc_positions.add(entry.position)
+                title = normalize_title(entry.text)
+                if title:
+                    toc_titles.add(title)
+
+        result = {}
+        for entry in index:
+            if entry.position in toc_positions:
+                continue
+            candidate = self.score(entry, index.node(entry.position), toc_titles)
+            if candidate.score >= self.threshold:
+                result[entry.position] = candidate
+        return result
+
+    # ------------------------------ 筛选 ------------------------------
+
+    def _context_line(self, entry: IndexedNode) -> str:
+        if entry.type == "table":
+            return f"[table]: 表格内容此处省略... | position: {entry.position}"
+        return format_md_element({"content": entry.text, "position": entry.position}, self.context_chars)
+
+    def filter_lines(self,
+                     lines: List[Tuple[int, str]],
+                     index: DocumentTextIndex,
+                     candidates: Iterable[int],
+                     keep: Iterable[int] = ()) -> PrefilterResult:
+        """
+        按候选标题筛选已格式化的行 [(position, line), ...]
+
+        - 候选标题和 keep 中的行原样保留
+        - 候选标题前后 context_size 行作为上下文，截断到 context_chars 个字符
+        - 其余行省略，连续省略的行合并为一条提示，附在下一条保留的行前面
+        """
+        candidates = set(candidates)
+        keep = set(keep) | candidates
+        order = {position: i for i, (position, _) in enumerate(lines)}
+
+        context: Set[int] = set()
+        for position in keep:
+            i = order.get(position)
+            if i is None:
+                continue
+            for j in range(max(0, i - self.context_size), min(len(lines), i + self.context_size + 1)):
+                context.add(lines[j][0])
+        context -= keep
+
+        kept: List[Tuple[int, str]] = []
+        elided = gap = 0
+        for position, line in lines:
+            if position in keep:
+                text = line
+            elif position in context:
+                entry = index.get(position)
+                text = self._context_line(entry) if entry is not None else line
+            else:
+                gap += 1
+                continue
+            if gap:
+                text = f"[省略{gap}条正文]\n{text}"
+                elided += gap
+                gap = 0
+            kept.append((position, text))
+        elided += gap
+
+        return PrefilterResult(
+            lines=kept,
+            lines_in=len(lines),
+            candidates=sum(1 for position, _ in lines if position in candidates),
+            context=sum(1 for position, _ in lines if position in context),
+            elided=elided,
+        )
+
+    def unfiltered(self, lines: List[Tuple[int, str]]) -> PrefilterResult:
+        return PrefilterResult(lines=list(lines), lines_in=len(lines), candidates=0, context=0, elided=0, applied=False)
+
+    def select(self, index: DocumentTextIndex) -> Optional[Set[int]]:
+        """文档的候选标题position集合；候选数不足 min_candidates 时返回None（不筛选）"""
+        positions = set(self.candidates(index))
+        if len(positions) < self.min_candidates:
+            logger.info(f"标题候选数不足({len(positions)} < {self.min_candidates})，不做预筛选")
+            return None
+        return positions
@@ -0,0 +1,370 @@
+from typing import Dict, Any, Optional, Deque, Set, Callable, Awaitable
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from .llm_models import LLMConfigModel
+from .scheduler import FairPriorityQueue, WorkTicket, LLMScheduler, DeadlineExceeded, INTERACTIVE, BATCH
+from app.core.config import settings
+import asyncio
+import math
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LatencyStats:
+    """某一阶段、某一类延迟信号的统计：短期EWMA反映当前延迟，长期EWMA作为基线"""
+    ewma: float
+    baseline: float
+    samples: int = 1
+
+    def update(self, value: float) -> None:
+        self.ewma = 0.8 * self.ewma + 0.2 * value
+        self.baseline = 0.98 * self.baseline + 0.02 * value
+        self.samples += 1
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD 自适应并发限制器
+
+    - 加性增：并发已用满且延迟正常时，每完成约一个并发窗口的请求，上限 +increase_step
+    - 乘性减：遇到429/超时/5xx，或延迟明显高于基线时，上限乘以decrease_factor
+    - 延迟按阶段（L1窗口、L2/L3分箱、主题批次...）分别统计基线，并优先使用首token时间，
+      没有首token时间时按输出token数归一化，避免输出长短不一被误判为过载
+    - 冷却期内只减一次，避免同一波在途请求的失败把上限连续打到最低
+
+    槽位已满时，等待的请求按优先级和租户调度（见 FairPriorityQueue），
+    interactive请求排队时可抢占尚未开始调用的batch请求的槽位（见 SlotHandle.run_preemptible）
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial_limit: float = 5,
+        min_limit: int = 1,
+        max_limit: int = 32,
+        increase_step: float = 1.0,
+        decrease_factor: float = 0.5,
+        latency_tolerance: float = 2.0,
+        error_rate_threshold: float = 0.2,
+        cooldown: float = 5.0,
+        window_size: int = 50,
+        urgent_window: float = 5.0,
+    ):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.error_rate_threshold = error_rate_threshold
+        self.cooldown = cooldown
+
+        self.in_flight = 0
+        self._queue = FairPriorityQueue(urgent_window)
+        self._holders: Set["SlotHandle"] = set()
+        self._outcomes: Deque[bool] = deque(maxlen=window_size)
+        self._last_decrease = 0.0
+
+        # 延迟统计，按 "阶段|信号" 分别记录（信号为 ttft / per_token / total）
+        self.latency: Dict[str, LatencyStats] = {}
+        self.latency_warmup = 5       # 样本数不足时不判断延迟升高
+
+        # 监控数据
+        self.successes = 0
+        self.errors = 0
+        self.overloads = 0
+        self.increases = 0
+        self.decreases = 0
+        self.max_waiters = 0
+
+    # ------------------------------ 并发槽位 ------------------------------
+
+    @property
+    def current_limit(self) -> int:
+        """当前允许的最大并发数（整数）"""
+        return max(self.min_limit, math.floor(self.limit))
+
+    @asynccontextmanager
+    async def slot(self, ticket: Optional[WorkTicket] = None):
+        """
+        获取一个并发槽位，退出时释放
+        :param ticket: 调度参数，默认从 llm_work_context 读取优先级、租户和截止时间
+        """
+        handle = SlotHandle(self, ticket or WorkTicket.from_context())
+        await self._acquire(handle.ticket)
+        self._holders.add(handle)
+        try:
+            yield handle
+        finally:
+            self._holders.discard(handle)
+            if handle.held:
+                self._release()
+
+    async def _acquire(self, ticket: Optional[WorkTicket] = None, front: bool = False) -> None:
+        ticket = ticket or WorkTicket.from_context()
+        ticket.enqueued_at = time.monotonic()
+        if self.in_flight < self.current_limit and not len(self._queue):
+            self.in_flight += 1
+            LLMScheduler.on_dispatch(ticket)
+            return
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        ticket.future = future
+        self._queue.push(ticket, front=front)
+        self.max_waiters = max(self.max_waiters, len(self._queue))
+        if ticket.priority == INTERACTIVE:
+            self._preempt_batch()
+
+        timer = None
+        if ticket.deadline is not None:
+            timer = loop.call_at(
+                loop.time() + max(0.0, ticket.deadline - time.monotonic()), self._expire, ticket
+            )
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # 已分到槽位但调用方被取消，归还槽位
+                self._release()
+            else:
+                self._queue.remove(ticket)
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+    def _expire(self, ticket: WorkTicket) -> None:
+        """排队超过截止时间：移出队列，请求不再发出"""
+        if ticket.future is None or ticket.future.done():
+            return
+        self._queue.remove(ticket)
+        LLMScheduler.on_expire(ticket)
+        ticket.future.set_exception(DeadlineExceeded(
+            f"LLM请求排队超过截止时间: {self.name}, priority={ticket.priority}, tenant={ticket.tenant}"
+        ))
+
+    def _preempt_batch(self) -> None:
+        """interactive请求排队时，让一个还未开始调用（仍在等待限流令牌）的batch请求让出槽位"""
+        for handle in self._holders:
+            if handle.ticket.priority == BATCH and handle.preemptible and not handle.preempt_requested:
+                handle.request_preempt()
+                return
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        self._wake_waiters()
+
+    def _wake_waiters(self) -> None:
+        while self.in_flight < self.current_limit:
+            ticket = self._queue.pop()
+            if ticket is None:
+                break
+            if not ticket.future.done():
+                self.in_flight += 1
+                LLMScheduler.on_dispatch(ticket)
+                ticket.future.set_result(None)
+
+    # ------------------------------ 反馈 ------------------------------
+
+    def on_success(
+        self,
+        latency: float,
+        ttft: Optional[float] = None,
+        output_tokens: Optional[int] = None,
+        stage: str = "unknown",
+    ) -> None:
+        """
+        请求成功
+        :param latency: 本次调用耗时（秒）
+        :param ttft: 首token时间（秒），流式调用时有
+        :param output_tokens: 输出token数，用于没有首token时间时归一化延迟
+        :param stage: 调用所属阶段，各阶段的请求规模不同，分别统计延迟基线
+        """
+        self.successes += 1
+        self._outcomes.append(True)
+        key = self._update_latency(latency, ttft, output_tokens, stage)
+
+        if self._latency_degraded(key):
+            self._decrease("延迟升高", factor=max(self.decrease_factor, 0.9))
+            return
+
+        # 只有并发真正用满时才加，避免空闲时上限无意义地上涨
+        if self.in_flight >= self.current_limit - 1 and self.limit < self.max_limit:
+            old = self.current_limit
+            self.limit = min(self.max_limit, self.limit + self.increase_step / self.limit)
+            if self.current_limit > old:
+                self.increases += 1
+                logger.debug(f"并发上限提升: {self.name}, {old} -> {self.current_limit}")
+            self._wake_waiters()
+
+    def on_overload(self) -> None:
+        """服务端过载信号：429、超时、5xx"""
+        self.overloads += 1
+        self._outcomes.append(False)
+        self._decrease("服务端限流或超时")
+
+    def on_error(self) -> None:
+        """其他错误，错误率超过阈值时同样降低并发"""
+        self.errors += 1
+        self._outcomes.append(False)
+        if len(self._outcomes) >= 10 and self.error_rate > self.error_rate_threshold:
+            self._decrease(f"错误率{self.error_rate:.0%}")
+
+    @property
+    def error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def _update_latency(
+        self, latency: float, ttft: Optional[float], output_tokens: Optional[int], stage: str
+    ) -> str:
+        """记录一个延迟样本，返回所属的统计key"""
+        # 首token时间与输出长度无关；否则用每个输出token的耗时，最后才用总耗时
+        if ttft is not None:
+            signal, value = "ttft", ttft
+        elif output_tokens:
+            signal, value = "per_token", latency / output_tokens
+        else:
+            signal, value = "total", latency
+        key = f"{stage}|{signal}"
+        stats = self.latency.get(key)
+        if stats is None:
+            self.latency[key] = LatencyStats(ewma=value, baseline=value)
+        else:
+            stats.update(value)
+        return key
+
+    def _latency_degraded(self, key: str) -> bool:
+        """短期延迟明显高于该阶段的长期基线"""
+        stats = self.latency.get(key)
+        if stats is None or stats.samples < self.latency_warmup or not stats.baseline:
+            return False
+        return stats.ewma > stats.baseline * self.latency_tolerance
+
+    def _decrease(self, reason: str, factor: Optional[float] = None) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        old = self.current_limit
+        self.limit = max(float(self.min_limit), self.limit * (factor or self.decrease_factor))
+        self.decreases += 1
+        logger.warning(f"并发上限下调({reason}): {self.name}, {old} -> {self.current_limit}")
+
+    def stats(self) -> Dict[str, Any]:
+        """限制器状态"""
+        return {
+            "name": self.name,
+            "limit": self.current_limit,
+            "limit_raw": round(self.limit, 3),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "waiting": len(self._queue),
+            "waiting_by_priority": self._queue.depth(),
+            "max_waiting": self.max_waiters,
+            "successes": self.successes,
+            "errors": self.errors,
+            "overloads": self.overloads,
+            "error_rate": round(self.error_rate, 3),
+            "latency": {
+                key: {"ewma": round(stats.ewma, 4), "baseline": round(stats.baseline, 4), "samples": stats.samples}
+                for key, stats in self.latency.items()
+            },
+            "increases": self.increases,
+            "decreases": self.decreases,
+        }
+
+
+class SlotHandle:
+    """已获取的并发槽位"""
+
+    def __init__(self, limiter: AdaptiveConcurrencyLimiter, ticket: WorkTicket):
+        self.limiter = limiter
+        self.ticket = ticket
+        self.held = True
+        self.preemptible = False
+        self._preempt = asyncio.Event()
+
+    @property
+    def preempt_requested(self) -> bool:
+        return self._preempt.is_set()
+
+    def request_preempt(self) -> None:
+        self._preempt.set()
+
+    async def run_preemptible(self, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行调用开始前的准备工作（如等待限流令牌），期间batch请求可被抢占：
+        取消准备工作、让出槽位并回到队首重新排队，拿回槽位后重新执行
+        """
+        while True:
+            self.preemptible = True
+            task = asyncio.ensure_future(factory())
+            preempt = asyncio.ensure_future(self._preempt.wait())
+            try:
+                await asyncio.wait([task, preempt], return_when=asyncio.FIRST_COMPLETED)
+            except asyncio.CancelledError:
+                task.cancel()
+                raise
+            finally:
+                self.preemptible = False
+                preempt.cancel()
+
+            if task.done():
+                return task.result()
+
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            self._preempt.clear()
+            self.ticket.preemptions += 1
+            LLMScheduler.on_preempt(self.ticket)
+            logger.debug(f"batch请求被抢占: {self.limiter.name}, tenant={self.ticket.tenant}")
+
+            self.held = False
+            self.limiter._release()
+            await self.limiter._acquire(self.ticket, front=True)
+            self.held = True
+
+
+class LLMConcurrencyController:
+    """按模型端点 (base_url, 模型名) 管理自适应并发限制器，所有分析器共享"""
+
+    _limiters: Dict[str, AdaptiveConcurrencyLimiter] = {}
+
+    @staticmethod
+    def endpoint_name(config: LLMConfigModel) -> str:
+        base_url, _ = config.resolved_endpoint()
+        return f"{base_url}|{config.llm_model_name}"
+
+    @classmethod
+    def for_config(cls, config: LLMConfigModel) -> AdaptiveConcurrencyLimiter:
+        """获取（或创建）该模型端点的限制器"""
+        name = cls.endpoint_name(config)
+        limiter = cls._limiters.get(name)
+        if limiter is None:
+            limiter = AdaptiveConcurrencyLimiter(
+                name=name,
+                initial_limit=settings.LLM_CONCURRENCY_INITIAL,
+                min_limit=settings.LLM_CONCURRENCY_MIN,
+                max_limit=settings.LLM_CONCURRENCY_MAX,
+            )
+            cls._limiters[name] = limiter
+        return limiter
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        """所有端点限制器的状态"""
+        return {name: limiter.stats() for name, limiter in cls._limiters.items()}
+
+    @classmethod
+    def clear(cls) -> None:
+        """清空进程内的限制器（测试时使用）"""
+        cls._limiters.clear()
@@ -0,0 +1,276 @@
+from typing import Dict, Any, List, Optional, Tuple, Callable, Awaitable, Deque
+from collections import deque
+from langchain.callbacks.base import BaseCallbackHandler
+from app.core.config import settings
+import asyncio
+import math
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class HedgeRejected(Exception):
+    """对冲请求未获得限流令牌，本次不发出（不影响主请求）"""
+    pass
+
+
+class LatencyWindow:
+    """最近N次的延迟样本（秒），用于计算分位数"""
+
+    def __init__(self, size: int = 200):
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """最近邻秩分位数，q取值0~1，没有样本时返回None"""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))
+        return ordered[index]
+
+    def summary(self) -> Dict[str, Any]:
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        return {
+            "samples": len(self._samples),
+            "p50_seconds": round(p50, 3) if p50 is not None else None,
+            "p95_seconds": round(p95, 3) if p95 is not None else None,
+        }
+
+
+class HedgeBudget:
+    """
+    对冲预算：每个主请求存入ratio个额度，每次对冲消耗1个，额度上限为burst
+    长期来看对冲请求数不超过主请求数的ratio倍
+    """
+
+    def __init__(self, ratio: float = 0.1, burst: float = 5.0):
+        self.ratio = ratio
+        self.burst = burst
+        self.balance = 0.0
+
+    def deposit(self) -> None:
+        self.balance = min(self.burst, self.balance + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self.balance < 1:
+            return False
+        self.balance -= 1
+        return True
+
+    def refund(self) -> None:
+        self.balance = min(self.burst, self.balance + 1)
+
+
+class HedgePolicy:
+    """
+    某个 (阶段, 模型) 的对冲策略：
+    主请求超过首响应时间的p90仍未返回首token时，发出一个重复请求，先返回首token的一方胜出，另一方被取消
+    """
+
+    def __init__(
+        self,
+        name: str,
+        percentile: float = 0.9,
+        min_samples: int = 20,
+        min_delay: float = 1.0,
+        budget_ratio: float = 0.1,
+        budget_burst: float = 5.0,
+        window_size: int = 200,
+    ):
+        self.name = name
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.budget = HedgeBudget(budget_ratio, budget_burst)
+
+        # 首响应时间（流式为首token，非流式为完整响应），决定对冲触发时间
+        self.first_response = LatencyWindow(window_size)
+        # 阶段延迟：开启对冲与未开启对冲的调用分别统计，便于对比
+        self.latency = {True: LatencyWindow(window_size), False: LatencyWindow(window_size)}
+
+        # 监控数据
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.skipped_budget = 0
+        self.skipped_capacity = 0
+        self.rejected_by_limiter = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """对冲触发时间（秒），样本不足时返回None（不对冲）"""
+        if len(self.first_response) < self.min_samples:
+            return None
+        return max(self.min_delay, self.first_response.percentile(self.percentile))
+
+    def observe(self, first_response: Optional[float], latency: float, hedging: bool) -> None:
+        """记录一次调用的首响应时间和总耗时"""
+        self.calls += 1
+        if first_response is not None:
+            self.first_response.add(first_response)
+        self.latency[hedging].add(latency)
+
+    def stats(self) -> Dict[str, Any]:
+        delay = self.hedge_delay()
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "hedges": self.hedges,
+            "hedge_rate": round(self.hedges / self.calls, 3) if self.calls else 0.0,
+            "hedge_wins": self.hedge_wins,
+            "skipped_budget": self.skipped_budget,
+            "skipped_capacity": self.skipped_capacity,
+            "rejected_by_limiter": self.rejected_by_limiter,
+            "budget_balance": round(self.budget.balance, 3),
+            "hedge_delay_seconds": round(delay, 3) if delay is not None else None,
+            "first_response": self.first_response.summary(),
+            "latency_with_hedging": self.latency[True].summary(),
+            "latency_without_hedging": self.latency[False].summary(),
+        }
+
+
+class HedgeGateCallbackHandler(BaseCallbackHandler):
+    """
+    对冲调用中单个请求的回调：第一个产生token（或完成）的请求胜出，
+    只有胜出请求的输出会转发给原始回调（WebSocket/SSE/增量JSON等），避免重复推送
+    """
+
+    def __init__(self, call: "HedgedCall", index: int):
+        super().__init__()
+        self.call = call
+        self.index = index
+        self.run_inline = True  # True表示内联运行， 边生成边执行
+        self.raise_error = False  # False表示不抛出错误
+
+    async def _forward(self, method: str, *args, **kwargs) -> None:
+        for callback in self.call.callbacks:
+            result = getattr(callback, method)(*args, **kwargs)
+            if asyncio.iscoroutine(result):
+                await result
+
+    async def on_llm_new_token(self, token, **kwargs):
+        if token:
+            self.call.claim(self.index)
+        if self.call.winner == self.index:
+            await self._forward("on_llm_new_token", token, **kwargs)
+
+    async def on_llm_end(self, response, **kwargs):
+        if self.call.claim(self.index):
+            await self._forward("on_llm_end", response, **kwargs)
+
+    async def on_llm_error(self, error, **kwargs):
+        if self.call.winner == self.index:
+            await self._forward("on_llm_error", error, **kwargs)
+
+
+class HedgedCall:
+    """
+    一次对冲调用：发出主请求，超过delay仍未决出胜者时（且允许对冲）再发出一个重复请求；
+    先产生首token的请求胜出，其余请求被取消。胜出前失败的请求不影响另一个请求继续。
+    """
+
+    def __init__(self, callbacks: List[Any]):
+        self.callbacks = callbacks
+        self.winner: Optional[int] = None
+        self.hedged = False
+        self._decided = asyncio.Event()
+
+    def claim(self, index: int) -> bool:
+        """请求index尝试成为胜者，返回它是否是胜者"""
+        if self.winner is None:
+            self.winner = index
+            self._decided.set()
+        return self.winner == index
+
+    def gate(self, index: int) -> HedgeGateCallbackHandler:
+        return HedgeGateCallbackHandler(self, index)
+
+    async def run(
+        self,
+        attempt: Callable[[int, List[Any]], Awaitable[Any]],
+        delay: Optional[float],
+        allow_hedge: Callable[[], bool],
+    ) -> Tuple[Any, int]:
+        """
+        :param attempt: attempt(index, callbacks) 发起第index个请求（0为主请求）
+        :param delay: 对冲触发时间，None表示不对冲
+        :param allow_hedge: 到达触发时间时检查是否允许对冲（预算、并发余量）
+        :return: (胜出请求的结果, 胜出请求的index)
+        """
+        tasks: Dict[int, asyncio.Task] = {0: asyncio.create_task(attempt(0, [self.gate(0)]))}
+        decided = asyncio.create_task(self._decided.wait())
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait([tasks[0], decided], timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done and allow_hedge():
+                    self.hedged = True
+                    tasks[1] = asyncio.create_task(attempt(1, [self.gate(1)]))
+
+            while self.winner is None:
+                pending = [task for task in tasks.values() if not task.done()]
+                if not pending:
+                    break
+                await asyncio.wait([*pending, decided], return_when=asyncio.FIRST_COMPLETED)
+                for index, task in tasks.items():
+                    # 非流式且未触发回调的请求，以完成先后决定胜者
+                    if task.done() and not task.cancelled() and task.exception() is None:
+                        self.claim(index)
+                        break
+
+            if self.winner is None:
+                # 所有请求都失败：优先抛出主请求的异常
+                raise next(task.exception() for task in tasks.values() if task.exception() is not None)
+
+            for index, task in tasks.items():
+                if index != self.winner:
+                    task.cancel()
+            return await tasks[self.winner], self.winner
+        finally:
+            decided.cancel()
+            losers = [task for task in tasks.values() if not task.done()]
+            for task in losers:
+                task.cancel()
+            if losers:
+                await asyncio.gather(*losers, return_exceptions=True)
+            # 已失败但未被取回的异常，避免 "Task exception was never retrieved"
+            for task in tasks.values():
+                if task.done() and not task.cancelled():
+                    task.exception()
+
+
+class LLMHedging:
+    """按 (阶段, 模型) 管理对冲策略，进程内共享"""
+
+    _policies: Dict[str, HedgePolicy] = {}
+
+    @classmethod
+    def for_call(cls, stage: str, model: str) -> HedgePolicy:
+        """获取（或创建）该阶段和模型的对冲策略"""
+        name = f"{stage}|{model}"
+        policy = cls._policies.get(name)
+        if policy is None:
+            policy = HedgePolicy(
+                name=name,
+                percentile=settings.LLM_HEDGE_PERCENTILE,
+                min_samples=settings.LLM_HEDGE_MIN_SAMPLES,
+                min_delay=settings.LLM_HEDGE_MIN_DELAY,
+                budget_ratio=settings.LLM_HEDGE_BUDGET_RATIO,
+                budget_burst=settings.LLM_HEDGE_BUDGET_BURST,
+            )
+            cls._policies[name] = policy
+        return policy
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        """所有对冲策略的状态，含开启/未开启对冲时的p50/p95延迟"""
+        return {name: policy.stats() for name, policy in cls._policies.items()}
+
+    @classmethod
+    def clear(cls) -> None:
+        """清空进程内的对冲策略（测试时使用）"""
+        cls._policies.clear()
@@ -0,0 +1,236 @@
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple
+from prometheus_client import Counter
+import json
+import re
+import orjson
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+EXTRACTIONS = Counter("llm_json_extract_total", "LLM输出JSON提取次数（clean/repaired/salvaged/failed）", ["outcome"])
+
+CLOSERS = {"[": "]", "{": "}"}
+SMART_QUOTES = "“”„‟"
+FULLWIDTH = {"，": ",", "：": ":"}
+STRING_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+# 扫描用的正则：字符串内的普通字符整段复制；字符串外跳过空白，取一个字面量（数字、true/null等）或结构字符
+STRING_RUN = re.compile(r'[^"\\\n\r\t“”„‟]+')
+STRUCTURAL = '"“”„‟[]{},:，：'
+TOKEN = re.compile(r'\s*([^\s"“”„‟\[\]{},:，：]+|[^\s])')
+
+
+@dataclass
+class ExtractResult:
+    """提取结果：解析后的值，以及为了解析做过的修复"""
+    value: Any
+    repairs: List[str] = field(default_factory=list)
+    salvaged: bool = False   # 输出被截断，只保留了其中完整的元素
+
+    @property
+    def outcome(self) -> str:
+        if self.salvaged:
+            return "salvaged"
+        return "repaired" if self.repairs else "clean"
+
+
+def _find_start(text: str) -> int:
+    """JSON起始位置：优先取 ``` 代码块内的第一个 [ 或 {"""
+    fence = text.find("```")
+    offset = 0
+    if fence != -1:
+        newline = text.find("\n", fence)
+        offset = newline + 1 if newline != -1 else fence + 3
+    starts = [i for i in (text.find("[", offset), text.find("{", offset)) if i != -1]
+    if not starts and offset:
+        starts = [i for i in (text.find("["), text.find("{")) if i != -1]
+    return min(starts) if starts else -1
+
+
+def _repair(text: str, start: int) -> Tuple[str, List[str], bool]:
+    """
+    从start开始单遍扫描，输出可被严格JSON解析器接受的文本
+
+    - 在括号配平处结束，忽略之后的说明文字和代码块标记
+    - 去掉尾随逗号和重复逗号，补上相邻的值（对象、数组、字符串、数字等字面量）之间缺失的逗号
+    - 字符串外的中文引号、全角逗号/冒号替换为ASCII符号；字符串内的换行、制表符转义
+    - 输入在中途截断时，回退到最后一个完整的数组元素，并补齐括号
+    :return: (修复后的文本, 修复类型列表, 是否截断)
+    """
+    out: List[str] = []      # 输出片段（结构字符逐个追加，字符串内容和字面量整段追加）
+    stack: List[str] = []
+    repairs: List[str] = []
+    safe: Optional[Tuple[int, Tuple[str, ...]]] = None   # 最后一个完整数组元素之后的位置及当时的括号栈
+    in_string = False
+    smart_string = False
+    escape = False
+    after_value = False      # 上一个输出的是完整的值（字面量、字符串结尾、右括号），下一个值之前需要逗号
+
+    def repaired(kind: str) -> None:
+        if kind not in repairs:
+            repairs.append(kind)
+
+    def separate() -> None:
+        """紧跟在一个值之后又出现新的值：补上缺失的逗号，避免相邻字面量被拼接（如 [1 2] 变成 [12]）"""
+        nonlocal safe
+        if after_value and stack:
+            repaired("missing_comma")
+            if stack[-1] == "[":
+                safe = (len(out), tuple(stack))
+            out.append(",")
+
+    i, n = start, len(text)
+    while i < n:
+        if in_string:
+            if escape:
+                escape = False
+                out.append(text[i])
+                i += 1
+                continue
+            # 字符串内连续的普通字符整段复制
+            run = STRING_RUN.match(text, i)
+            if run:
+                out.append(run.group())
+                i = run.end()
+                continue
+            ch = text[i]
+            i += 1
+            if ch == "\\":
+                escape = True
+                out.append(ch)
+            elif (ch in SMART_QUOTES) if smart_string else (ch == '"'):
+                in_string = False
+                after_value = True
+                out.append('"')
+            elif ch == '"':
+                out.append('\\"')
+            elif ch in STRING_ESCAPES:
+                repaired("control_char")
+                out.append(STRING_ESCAPES[ch])
+            else:
+                out.append(ch)
+            continue
+
+        # 字符串外：跳过空白，取下一个字面量或结构字符
+        token = TOKEN.match(text, i)
+        if token is None:
+            break
+        i = token.end()
+        ch = token.group(1)
+        if len(ch) > 1 or ch not in STRUCTURAL:
+            separate()
+            out.append(ch)
+            after_value = True
+            continue
+        if ch in FULLWIDTH:
+            repaired("fullwidth_punct")
+            ch = FULLWIDTH[ch]
+
+        if ch == '"' or ch in SMART_QUOTES:
+            if ch != '"':
+                repaired("smart_quotes")
+            separate()
+            in_string, smart_string = True, ch != '"'
+            out.append('"')
+        elif ch in CLOSERS:
+            separate()
+            stack.append(ch)
+            out.append(ch)
+            after_value = False
+        elif ch in "]}":
+            if not stack:
+                break
+            if out[-1] == ",":
+                repaired("trailing_comma")
+                out.pop()
+            expected = CLOSERS[stack.pop()]
+            if ch != expected:
+                repaired("mismatched_bracket")
+            out.append(expected)
+            after_value = True
+            if not stack:
+                return "".join(out), repairs, False
+            if stack[-1] == "[":
+                safe = (len(out), tuple(stack))
+        elif ch == ",":
+            if out[-1] in (",", "[", "{"):
+                repaired("extra_comma")
+                continue
+            if stack[-1] == "[":
+                safe = (len(out), tuple(stack))
+            out.append(",")
+            after_value = False
+        else:
+            out.append(ch)
+            after_value = False
+
+    # 截断：回退到最后一个完整的数组元素，补齐括号
+    if safe is None:
+        raise json.JSONDecodeError("JSON输出被截断，且没有完整的元素可以保留", text, len(text))
+    cut, open_brackets = safe
+    repaired("truncated")
+    return "".join(out[:cut]) + "".join(CLOSERS[b] for b in reversed(open_brackets)), repairs, True
+
+
+class JSONExtractor:
+    """
+    大模型输出的JSON提取器（进程内统计）
+
+    - 快速路径：定位JSON片段后直接用orjson解析
+    - 解析失败时单遍扫描修复常见问题（尾随逗号、截断、中文引号等），能保留的完整元素尽量保留，
+      避免因为一个多余的逗号丢掉整个章节的标题而整体重跑
+    """
+
+    _stats: Dict[str, Any] = {"clean": 0, "repaired": 0, "salvaged": 0, "failed": 0, "repairs": {}}
+
+    @classmethod
+    def extract(cls, text: str) -> ExtractResult:
+        """
+        :raises json.JSONDecodeError: 找不到JSON或修复后仍无法解析（orjson.JSONDecodeError 是其子类）
+        """
+        try:
+            result = cls._extract(text)
+        except json.JSONDecodeError:
+            cls._stats["failed"] += 1
+            EXTRACTIONS.labels(outcome="failed").inc()
+            raise
+
+        cls._stats[result.outcome] += 1
+        EXTRACTIONS.labels(outcome=result.outcome).inc()
+        for kind in result.repairs:
+            cls._stats["repairs"][kind] = cls._stats["repairs"].get(kind, 0) + 1
+        if result.repairs:
+            logger.info(f"LLM输出JSON已修复: {result.repairs}")
+        return result
+
+    @staticmethod
+    def _extract(text: str) -> ExtractResult:
+        start = _find_start(text)
+        if start == -1:
+            raise json.JSONDecodeError("输出中没有JSON", text, 0)
+
+        end = text.rfind(CLOSERS[text[start]])
+        if end > start:
+            try:
+                return ExtractResult(orjson.loads(text[start:end + 1]))
+            except orjson.JSONDecodeError:
+                pass
+
+        repaired, repairs, salvaged = _repair(text, start)
+        return ExtractResult(orjson.loads(repaired), repairs=repairs or ["trailing_text"], salvaged=salvaged)
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        """提取次数（按结果）和各类修复的次数"""
+        return {**cls._stats, "repairs": dict(cls._stats["repairs"])}
+
+    @classmethod
+    def reset_stats(cls) -> None:
+        cls._stats = {"clean": 0, "repaired": 0, "salvaged": 0, "failed": 0, "repairs": {}}
+
+
+def extract_json(text: str) -> Any:
+    """从大模型输出中提取JSON（见 JSONExtractor）"""
+    return JSONExtractor.extract(text).value
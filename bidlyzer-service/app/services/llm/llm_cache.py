@@ -0,0 +1,196 @@
+from typing import Dict, Any, Optional
+from pathlib import Path
+from .llm_models import LLMConfigModel
+from app.core.redis_helper import RedisClient
+from app.core.config import settings
+import hashlib
+import asyncio
+import shutil
+import json
+import time
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+CACHE_KEY_PREFIX = "llm_cache"
+
+
+class LLMResponseCache:
+    """
+    LLM响应缓存（按prompt指纹）
+
+    - 键：hash(模型名, temperature, top_p, 系统角色, 渲染后的prompt)，相同输入命中同一结果
+    - 存储：Redis（带TTL），可选同时持久化到磁盘，Redis过期后从磁盘回填
+    - 结构化任务重试、用户回滚后重跑、多个用户上传同一招标文件时，避免重复付费调用
+    """
+
+    _stats: Dict[str, Any] = {
+        "hits": 0,
+        "misses": 0,
+        "redis_hits": 0,
+        "disk_hits": 0,
+        "stores": 0,
+        "bypassed": 0,
+        "errors": 0,
+        "saved_input_tokens": 0,
+    }
+
+    # ------------------------------ 键 ------------------------------
+
+    @staticmethod
+    def _safe_model_name(model_name: str) -> str:
+        return re.sub(r"[^A-Za-z0-9._-]", "_", model_name)
+
+    @classmethod
+    def make_key(cls, config: LLMConfigModel, system_role: str, rendered_prompt: str) -> str:
+        """根据模型参数和渲染后的prompt生成缓存键"""
+        raw = json.dumps(
+            [config.llm_model_name, config.temperature, config.top_p, system_role, rendered_prompt],
+            ensure_ascii=False,
+        )
+        digest = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+        return f"{CACHE_KEY_PREFIX}:{cls._safe_model_name(config.llm_model_name)}:{digest}"
+
+    # ------------------------------ 磁盘持久化 ------------------------------
+
+    @staticmethod
+    def _disk_enabled() -> bool:
+        return settings.LLM_CACHE_PERSIST
+
+    @staticmethod
+    def _disk_path(key: str) -> Path:
+        _, model, digest = key.split(":", 2)
+        return Path(settings.LLM_CACHE_DIR) / model / digest[:2] / f"{digest}.json"
+
+    @classmethod
+    def _read_disk(cls, key: str) -> Optional[str]:
+        path = cls._disk_path(key)
+        if not path.exists():
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("response")
+
+    @classmethod
+    def _write_disk(cls, key: str, response: str) -> None:
+        path = cls._disk_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"response": response, "created_at": time.time()}, f, ensure_ascii=False)
+        tmp_path.replace(path)
+
+    # ------------------------------ 读写 ------------------------------
+
+    @classmethod
+    async def get(cls, key: str, input_tokens: int = 0) -> Optional[str]:
+        """
+        读取缓存的响应，未命中返回None
+        :param input_tokens: 本次请求的输入token数，仅用于统计节省的token
+        """
+        try:
+            client = await RedisClient.get_client()
+            response = await client.get(key)
+            if response is not None:
+                cls._record_hit("redis_hits", input_tokens)
+                return response
+
+            if cls._disk_enabled():
+                response = await asyncio.to_thread(cls._read_disk, key)
+                if response is not None:
+                    # 回填Redis
+                    await client.setex(key, settings.LLM_CACHE_TTL, response)
+                    cls._record_hit("disk_hits", input_tokens)
+                    return response
+        except Exception as e:
+            cls._stats["errors"] += 1
+            logger.warning(f"读取LLM响应缓存失败: {key}, error: {str(e)}")
+
+        cls._stats["misses"] += 1
+        return None
+
+    @classmethod
+    async def set(cls, key: str, response: Any) -> bool:
+        """写入缓存，只缓存非空字符串结果"""
+        if not isinstance(response, str) or not response.strip():
+            return False
+        try:
+            client = await RedisClient.get_client()
+            await client.setex(key, settings.LLM_CACHE_TTL, response)
+            if cls._disk_enabled():
+                await asyncio.to_thread(cls._write_disk, key, response)
+            cls._stats["stores"] += 1
+            return True
+        except Exception as e:
+            cls._stats["errors"] += 1
+            logger.warning(f"写入LLM响应缓存失败: {key}, error: {str(e)}")
+            return False
+
+    @classmethod
+    def _record_hit(cls, source: str, input_tokens: int) -> None:
+        cls._stats["hits"] += 1
+        cls._stats[source] += 1
+        cls._stats["saved_input_tokens"] += input_tokens
+
+    @classmethod
+    def record_bypass(cls) -> None:
+        """记录一次跳过缓存的请求"""
+        cls._stats["bypassed"] += 1
+
+    # ------------------------------ 失效 ------------------------------
+
+    @classmethod
+    async def invalidate(cls, key: str) -> int:
+        """删除单个缓存条目"""
+        deleted = await RedisClient.delete(key)
+        if cls._disk_enabled():
+            path = cls._disk_path(key)
+            if path.exists():
+                path.unlink()
+                deleted = max(deleted, 1)
+        return deleted
+
+    @classmethod
+    async def invalidate_model(cls, model_name: Optional[str] = None) -> int:
+        """
+        删除某个模型的全部缓存；model_name为None时清空所有LLM响应缓存
+        :return: 删除的Redis键数量
+        """
+        model = cls._safe_model_name(model_name) if model_name else "*"
+        client = await RedisClient.get_client()
+
+        deleted = 0
+        batch = []
+        async for key in client.scan_iter(match=f"{CACHE_KEY_PREFIX}:{model}:*", count=500):
+            batch.append(key)
+            if len(batch) >= 500:
+                deleted += await client.delete(*batch)
+                batch = []
+        if batch:
+            deleted += await client.delete(*batch)
+
+        if cls._disk_enabled():
+            cache_dir = Path(settings.LLM_CACHE_DIR)
+            target = cache_dir / model if model_name else cache_dir
+            if target.exists():
+                await asyncio.to_thread(shutil.rmtree, target, True)
+
+        logger.info(f"已清除LLM响应缓存: model={model_name or '全部'}, keys={deleted}")
+        return deleted
+
+    # ------------------------------ 统计 ------------------------------
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        """缓存命中率等统计信息"""
+        lookups = cls._stats["hits"] + cls._stats["misses"]
+        return {
+            **cls._stats,
+            "hit_rate": round(cls._stats["hits"] / lookups, 3) if lookups else 0.0,
+        }
+
+    @classmethod
+    def reset_stats(cls) -> None:
+        for name in cls._stats:
+            cls._stats[name] = 0
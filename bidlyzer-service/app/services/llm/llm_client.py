@@ -1,6 +1,10 @@
 from .llm_service import LLMService
+from .llm_registry import LLMServiceRegistry
 from .llm_models import LLMConfigModel, LLMRequestModel
-from typing import Any, List, Dict
+from .telemetry import llm_call_context
+from .scheduler import llm_work_context
+from typing import Any, List, Dict, Optional, Tuple, AsyncIterator, Callable, Awaitable
+from contextlib import nullcontext, contextmanager
 import asyncio
 
 
@@ -9,6 +13,10 @@ class LLMClient:
 
     def __init__(self, 
                  prompt_config: Dict,
+                 stage: Optional[str] = None,
+                 builder: Optional[str] = None,
+                 priority: Optional[str] = None,
+                 deadline_seconds: Optional[float] = None,
                  ):
         """
         初始化分析器
@@ -16,13 +24,27 @@ class LLMClient:
             prompt_template: 提示词模板
             llm_config: LLM配置参数字典
             output_format: 输出格式规范
+            stage / builder: 遥测标签（所属阶段、prompt构建器），用于按阶段统计延迟和费用
+            priority / deadline_seconds: 调度优先级（interactive/background/batch）和排队截止时间，
+                不指定时沿用调用方的 llm_work_context
         """
         self.prompt_config = prompt_config
+        self.stage = stage
+        self.builder = builder
+        self.priority = priority
+        self.deadline_seconds = deadline_seconds
+
+    @contextmanager
+    def _call_context(self):
+        """为本客户端发起的LLM调用打上阶段标签和调度参数"""
+        with llm_call_context(stage=self.stage, builder=self.builder), \
+                llm_work_context(priority=self.priority, deadline_seconds=self.deadline_seconds):
+            yield
 
 
     def create_service(self, ) -> LLMService:
-        """创建LLM服务实例"""
-        return LLMService(
+        """获取LLM服务实例（同一配置和模板在进程内共享，chain只编译一次）"""
+        return LLMServiceRegistry.get_service(
             config=LLMConfigModel().from_model(self.prompt_config['llm_config']), 
             prompt_template=self.prompt_config['prompt_template'],
             system_role = self.prompt_config['system_role']
@@ -37,7 +59,8 @@ class LLMClient:
             supplement=task_input["supplement"],
             output_format=task_input["output_format"]
         )
-        return await service.process(request)
+        with self._call_context():
+            return await service.process(request)
     
     async def process_multiple(self, tasks: List[Dict]) -> List[Any]:
         """并发处理多个分析任务"""
@@ -55,12 +78,21 @@ class LLMClient:
         ]
         
         # 并发执行所有请求
-        return await asyncio.gather(*[service.process(req) for req in requests])
+        with self._call_context():
+            return await asyncio.gather(*[service.process(req) for req in requests])
     
-    async def process_with_limit(self, tasks: List[Dict], limit: int = 5) -> List[Any]:
+    @staticmethod
+    def _call_site_limit(limit: Optional[int]):
+        """
+        调用方额外的并发上限（可选）。
+        模型端点的并发由LLMService内的自适应并发控制器统一调节，这里默认不再限制。
+        """
+        return asyncio.Semaphore(limit) if limit else nullcontext()
+
+    async def process_with_limit(self, tasks: List[Dict], limit: Optional[int] = None) -> List[Any]:
         """带并发限制的处理"""
         service = self.create_service()
-        semaphore = asyncio.Semaphore(limit)
+        semaphore = self._call_site_limit(limit)
         
         async def process_task(task):
             async with semaphore:
@@ -72,9 +104,10 @@ class LLMClient:
                 )
                 return await service.process(request)
         
-        return await asyncio.gather(*[process_task(task) for task in tasks])
+        with self._call_context():
+            return await asyncio.gather(*[process_task(task) for task in tasks])
 
-    async def process_parallel_stream(self, tasks, channel_layer=None, group_name=None, limit=5) -> List[Any]:
+    async def process_parallel_stream(self, tasks, channel_layer=None, group_name=None, limit: Optional[int] = None) -> List[Any]:
         """
         并行执行多个分析任务，支持流式输出
         
@@ -82,13 +115,13 @@ class LLMClient:
             tasks: 包含(task_id, task_input)元组的列表
             channel_layer: Channels层用于WebSocket通信
             group_name: WebSocket组名称
-            limit: 最大并行数
+            limit: 调用方额外的最大并行数（可选，默认由自适应并发控制器决定）
         
         返回:
             处理结果的列表
         """
         service = self.create_service()
-        semaphore = asyncio.Semaphore(limit)
+        semaphore = self._call_site_limit(limit)
         
         async def process_task(task_id, task_input):
             async with semaphore:
@@ -107,6 +140,56 @@ class LLMClient:
                 )
         
         # 并行执行所有任务
-        return await asyncio.gather(*[process_task(task_id, task_input) for task_id, task_input in tasks])
-    
+        with self._call_context():
+            return await asyncio.gather(*[process_task(task_id, task_input) for task_id, task_input in tasks])
+
+    async def process_as_completed(
+        self,
+        tasks,
+        channel_layer=None,
+        group_name=None,
+        limit: Optional[int] = None,
+        on_json_object: Optional[Callable[[Any, Any], Awaitable[None]]] = None,
+    ) -> AsyncIterator[Tuple[Any, Any]]:
+        """
+        并行执行多个分析任务，按完成顺序逐个产出结果（而不是等待全部完成）
+
+        参数:
+            tasks: 包含(task_id, task_input)元组的列表
+            channel_layer / group_name: WebSocket流式输出（可选）
+            limit: 调用方额外的最大并行数（可选，默认由自适应并发控制器决定）
+            on_json_object: 流式输出中每个JSON对象闭合时的回调 on_json_object(task_id, obj)（可选）
+
+        产出:
+            (task_id, 结果)；任一任务失败时抛出异常，并取消其余未完成的任务
+        """
+        service = self.create_service()
+        semaphore = self._call_site_limit(limit)
+
+        async def process_task(task_id, task_input):
+            async with semaphore:
+                request = LLMRequestModel.create(
+                    context=task_input["context"],
+                    instruction=task_input["instruction"],
+                    supplement=task_input["supplement"],
+                    output_format=task_input["output_format"]
+                )
+                result = await service.process(
+                    request,
+                    channel_layer=channel_layer,
+                    group_name=group_name,
+                    task_id=task_id,
+                    on_json_object=on_json_object,
+                )
+                return task_id, result
 
+        # 任务创建时复制当前上下文，遥测标签随之传递
+        with self._call_context():
+            pending = [asyncio.ensure_future(process_task(task_id, task_input)) for task_id, task_input in tasks]
+        try:
+            for future in asyncio.as_completed(pending):
+                yield await future
+        finally:
+            for future in pending:
+                if not future.done():
+                    future.cancel()
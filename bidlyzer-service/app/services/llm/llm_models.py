@@ -3,6 +3,7 @@ from pydantic import BaseModel, Field
 from dataclasses import dataclass
 from collections import Counter
 import json
+from app.core.config import settings
 
 class LLMConfigModel(BaseModel):
     """LLM配置模型"""
@@ -15,7 +16,19 @@ class LLMConfigModel(BaseModel):
     max_workers: int = 4
     timeout: int = Field(default=30, description="API 调用超时时间(秒)")
     retry_times: int = Field(default=3, description="API 调用重试次数")
+    cache_enabled: bool = Field(default=False, description="是否启用响应缓存（相同模型参数和prompt直接返回缓存结果）")
+    hedge_enabled: bool = Field(default=False, description="是否启用对冲请求（首token迟迟未返回时发出重复请求，适用于并行扇出的阶段）")
     
+    def resolved_endpoint(self) -> Tuple[Optional[str], Optional[str]]:
+        """
+        实际请求使用的 (base_url, api_key)
+        设置了 LLM_BASE_URL_OVERRIDE 时所有模型都指向该地址（如离线桩服务），未配置Key时使用占位Key
+        """
+        api_key = self.api_key or settings.ALIBABA_API_KEY
+        if settings.LLM_BASE_URL_OVERRIDE:
+            return settings.LLM_BASE_URL_OVERRIDE, api_key or "stub"
+        return self.base_url, api_key
+
     def to_model(self) -> Dict[str, Any]:
         """将LLMConfig转换为可存储到数据库JSONField的字典格式
         """
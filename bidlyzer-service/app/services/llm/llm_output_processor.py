@@ -1,6 +1,6 @@
 # llm_output_processor.py
 from typing import Any
-import re
+from .json_extractor import JSONExtractor
 import json
 import logging
 
@@ -30,23 +30,13 @@ class LLMOutputProcessor:
         
         转换为:
         {"key": "value"}
+
+        尾随逗号、中文引号、输出被截断等常见问题会被修复（见 JSONExtractor），截断时保留其中完整的元素
         
         :param output: 大模型原始输出
         :return: 清洗后的输出
         """
-        
-        # 移除开头的 ```json、```javascript 等代码块标记
-        output = re.sub(r'^```\w*\n', '', output)
-        
-        # 移除结尾的 ``` 标记
-        output = re.sub(r'\n```$', '', output)
-        
-        # 如果整个字符串被代码块包裹，也进行处理
-        output = re.sub(r'^```\w*\n(.*)\n```$', r'\1', output, flags=re.DOTALL)
-        
-        output_json = json.loads(output.strip())
-
-        return output_json
+        return JSONExtractor.extract(output).value
 
 
     def merge_outputs(self, outputs: list, flatten: bool = True) -> str:
@@ -76,9 +66,96 @@ class LLMOutputProcessor:
                     merged_data.append(cleaned_parsed_output)
                     
             except json.JSONDecodeError as e:
-                logger = logging.getLogger(__name__)
-                logger.error(f"合并JSON时解析错误: {str(e)}, 输出: {cleaned_parsed_output[:100]}...")
+                logger.error(f"合并JSON时解析错误: {str(e)}, 输出: {output[:100]}...")
         
         # 合并后的结果是Json Dict格式。
         # 如果 将合并后的结果转换为JSON字符串，可return json.dumps(merged_data, ensure_ascii=False, indent=2)
-        return merged_data
\ No newline at end of file
+        return merged_data
+
+
+    def dedupe_by_position(self, items: list) -> list:
+        """
+        按position去重合并（多个窗口/分块的结果有重叠时使用），保留首次出现的条目，并按position排序
+
+        :param items: merge_outputs 的输出，元素为包含 position 的字典
+        :return: 去重后的列表；不含 position 的元素原样保留在末尾
+        """
+        seen = {}
+        others = []
+        for item in items:
+            if isinstance(item, dict) and isinstance(item.get("position"), int):
+                seen.setdefault(item["position"], item)
+            else:
+                others.append(item)
+        return [seen[position] for position in sorted(seen)] + others
+
+
+class IncrementalJSONParser:
+    """
+    增量JSON解析器：在流式输出过程中，逐段喂入token，提取已经完整的顶层对象
+
+    适用于输出为对象数组（如 [{"level": 1, "position": 12, "title": "..."}, ...]）的场景，
+    每当一个 {...} 闭合即解析并返回，不必等待整个数组输出完毕。
+    - 忽略对象之外的字符（```json 代码块标记、数组括号、逗号等）
+    - 正确处理字符串内的括号和转义字符
+    - 解析失败的片段记录日志后丢弃，最终结果仍以完整输出为准
+    """
+
+    def __init__(self):
+        self._current = []       # 当前未闭合对象的字符
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.objects_parsed = 0
+        self.errors = 0
+
+    def feed(self, chunk: str) -> list:
+        """
+        喂入一段输出
+        :return: 本段输出中新闭合的对象列表
+        """
+        completed = []
+        for char in chunk:
+            if self._depth == 0:
+                if char == '{':
+                    self._current = [char]
+                    self._depth = 1
+                continue
+
+            self._current.append(char)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == '{':
+                self._depth += 1
+            elif char == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    parsed = self._parse(''.join(self._current))
+                    self._current = []
+                    if parsed is not None:
+                        completed.append(parsed)
+        return completed
+
+    def _parse(self, text: str) -> Any:
+        try:
+            parsed = json.loads(text)
+            self.objects_parsed += 1
+            return parsed
+        except json.JSONDecodeError as e:
+            self.errors += 1
+            logger.debug(f"增量解析JSON对象失败: {str(e)}, 片段: {text[:100]}...")
+            return None
+
+    def reset(self) -> None:
+        """丢弃未闭合的内容（如重试时重新开始解析）"""
+        self._current = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
@@ -0,0 +1,129 @@
+from collections import OrderedDict
+from typing import Dict, Tuple, Any
+from langchain_openai import ChatOpenAI
+from langchain_core.language_models import BaseChatModel
+from .llm_models import LLMConfigModel
+from .llm_service import LLMService
+from app.core.config import settings
+import hashlib
+import json
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LLMServiceRegistry:
+    """
+    LLM服务注册表（进程内单例）
+
+    - 同一模型配置共享一个ChatOpenAI实例（及其HTTP连接池）
+    - 同一 (模型配置, prompt模板, 系统角色) 共享一个已编译好prompt和chain的LLMService
+    L2/L3等并发扇出场景下，避免每个请求都重新构建模型客户端和处理链。
+    两者都是LRU，数量超过 LLM_REGISTRY_MAX_LLMS / LLM_REGISTRY_MAX_SERVICES 时淘汰最久未使用的
+    （按请求变化的配置不会让注册表无限增长；被淘汰的实例仍可被持有它的服务继续使用）
+    """
+
+    # 类变量，进程内所有请求共享
+    _llms: "OrderedDict[str, BaseChatModel]" = OrderedDict()
+    _services: "OrderedDict[Tuple[str, str], LLMService]" = OrderedDict()
+    _lock = threading.Lock()
+    _stats: Dict[str, int] = {"llm_created": 0, "service_created": 0, "service_hits": 0, "evictions": 0}
+
+    @staticmethod
+    def config_key(config: LLMConfigModel) -> str:
+        """模型配置的指纹（api_key只参与哈希，不以明文出现在键中）"""
+        raw = json.dumps(config.model_dump(), sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+    @staticmethod
+    def prompt_key(prompt_template: str, system_role: str) -> str:
+        """prompt模板和系统角色的指纹"""
+        raw = json.dumps([prompt_template, system_role], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+    @classmethod
+    def _create_llm(cls, config: LLMConfigModel) -> BaseChatModel:
+        """创建模型实例"""
+        base_url, api_key = config.resolved_endpoint()
+        return ChatOpenAI(
+            model_name=config.llm_model_name,
+            temperature=config.temperature,
+            top_p=config.top_p,
+            streaming=config.streaming,
+            api_key=api_key,
+            base_url=base_url,
+            timeout=config.timeout,
+            stream_usage=True,  # 流式调用时同样返回token用量
+        )
+
+    @classmethod
+    def get_llm(cls, config: LLMConfigModel) -> BaseChatModel:
+        """获取（或创建）该配置共享的模型实例"""
+        key = cls.config_key(config)
+        with cls._lock:
+            llm = cls._llms.get(key)
+            if llm is not None:
+                cls._llms.move_to_end(key)
+                return llm
+            llm = cls._create_llm(config)
+            cls._insert(cls._llms, key, llm, settings.LLM_REGISTRY_MAX_LLMS)
+            cls._stats["llm_created"] += 1
+            logger.debug(f"创建共享LLM实例: model={config.llm_model_name}, key={key}")
+            return llm
+
+    @classmethod
+    def get_service(cls, config: LLMConfigModel, prompt_template: str, system_role: str) -> LLMService:
+        """获取（或创建）已编译好chain的LLM服务"""
+        key = (cls.config_key(config), cls.prompt_key(prompt_template, system_role))
+        with cls._lock:
+            service = cls._services.get(key)
+            if service is not None:
+                cls._services.move_to_end(key)
+                cls._stats["service_hits"] += 1
+                return service
+
+        llm = cls.get_llm(config)
+        service = LLMService(
+            config=config,
+            prompt_template=prompt_template,
+            system_role=system_role,
+            llm=llm,
+        )
+        with cls._lock:
+            # 并发创建时以先注册的为准，只统计实际注册的
+            registered = cls._services.get(key)
+            if registered is not None:
+                cls._services.move_to_end(key)
+                cls._stats["service_hits"] += 1
+                return registered
+            cls._insert(cls._services, key, service, settings.LLM_REGISTRY_MAX_SERVICES)
+            cls._stats["service_created"] += 1
+        return service
+
+    @classmethod
+    def _insert(cls, entries: OrderedDict, key: Any, value: Any, max_size: int) -> None:
+        """插入新条目，超过上限时淘汰最久未使用的（调用方持有锁）"""
+        entries[key] = value
+        while len(entries) > max(max_size, 1):
+            entries.popitem(last=False)
+            cls._stats["evictions"] += 1
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        """注册表统计信息"""
+        with cls._lock:
+            return {
+                **cls._stats,
+                "llms": len(cls._llms),
+                "services": len(cls._services),
+            }
+
+    @classmethod
+    def clear(cls) -> None:
+        """清空注册表（测试或配置热更新时使用）"""
+        with cls._lock:
+            cls._llms.clear()
+            cls._services.clear()
+            for name in cls._stats:
+                cls._stats[name] = 0
@@ -1,18 +1,25 @@
-from typing import Optional, Any
+from typing import Optional, Any, Callable, Awaitable
 from .llm_models import LLMRequestModel, LLMConfigModel
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
 from langchain.callbacks import StreamingStdOutCallbackHandler
 from langchain_core.output_parsers import StrOutputParser
 from langchain.callbacks.base import BaseCallbackHandler
+from langchain_core.language_models import BaseChatModel
 from concurrent.futures import ThreadPoolExecutor
-from openai import RateLimitError, APIError
+from openai import RateLimitError, APIError, APIStatusError, APITimeoutError
 from requests.exceptions import Timeout
 from ..task_service import count_tokens
+from .rate_limiter import LLMRateLimiter, TokenBucketLimiter, get_retry_after, retry_backoff
+from .adaptive_limiter import LLMConcurrencyController
+from .llm_cache import LLMResponseCache
+from .stream_coalescer import StreamCoalescer, END
+from .llm_output_processor import IncrementalJSONParser
+from .telemetry import LLMCallRecord, LLMTelemetry, TelemetryCallbackHandler
+from .hedging import HedgedCall, HedgePolicy, HedgeRejected, LLMHedging
 import os, logging
-import time
-import random
 import asyncio
+import time
 import json
 from app.core.config import settings
 
@@ -21,96 +28,103 @@ logger = logging.getLogger(__name__)
 
 
 class WebSocketStreamingCallbackHandler(BaseCallbackHandler):
-    """自定义WebSocket流式输出回调处理器，支持任务ID"""
+    """
+    自定义WebSocket流式输出回调处理器，支持任务ID
+
+    token经StreamCoalescer合并为带序号的增量消息（kind: delta/snapshot/end），
+    不再每个token都推送完整的累计内容
+    """
     
     def __init__(self, channel_layer, group_name, task_id=None):
         super().__init__()
         self.channel_layer = channel_layer
         self.group_name = group_name
         self.task_id = task_id
-        self.accumulated_content = ""
+        self.coalescer = _create_coalescer(self._send)
         self.run_inline = True  # 添加run_inline属性，设置为True表示内联运行， 边生成边执行
         self.raise_error = False  # 添加raise_error属性，设置为False表示不抛出错误
-        
-    async def on_llm_new_token(self, token, **kwargs):
-        """处理生成的新token"""
-        self.accumulated_content += token
-        
-        # 将token发送到WebSocket组，包含任务ID
+
+    @property
+    def accumulated_content(self) -> str:
+        return self.coalescer.content
+
+    async def _send(self, message: dict):
+        """将合并后的消息发送到WebSocket组，包含任务ID"""
         await self.channel_layer.group_send(
             self.group_name,
             {
                 'type': 'llm_stream',
-                'token': token,
-                'content': self.accumulated_content,
+                **message,
+                'token': message.get('delta', ''),  # 兼容旧字段
                 'task_id': self.task_id,  # 传递任务ID
-                'finished': False
+                'finished': message['kind'] == END
             }
         )
+        
+    async def on_llm_new_token(self, token, **kwargs):
+        """处理生成的新token"""
+        await self.coalescer.push(token)
     
     async def on_llm_end(self, response, **kwargs):
         """标记LLM响应完成"""
-        await self.channel_layer.group_send(
-            self.group_name,
-            {
-                'type': 'llm_stream',
-                'token': '',
-                'content': self.accumulated_content,
-                'task_id': self.task_id,  # 传递任务ID
-                'finished': True
-            }
-        )
+        await self.coalescer.finish()
+
+    async def reset(self):
+        """请求重试前调用，通知客户端清空本次尝试已输出的内容"""
+        await self.coalescer.reset()
 
 
 class SSEStreamingCallbackHandler(BaseCallbackHandler):
-    """FastAPI SSE流式输出回调处理器"""
+    """
+    FastAPI SSE流式输出回调处理器
+
+    token经StreamCoalescer合并为带序号的增量消息放入队列，type为 delta/snapshot/end/error
+    """
     
     def __init__(self, queue: asyncio.Queue, task_id=None):
         super().__init__()
         self.queue = queue
         self.task_id = task_id
-        self.accumulated_content = ""
+        self.coalescer = _create_coalescer(self._send)
         self.run_inline = True  # True表示内联运行， 边生成边执行 
         self.raise_error = False  # False表示不抛出错误
-        
-    async def on_llm_new_token(self, token, **kwargs):
-        """处理生成的新token，将数据放入队列"""
-        self.accumulated_content += token
-        
-        # 构建SSE格式的数据
+
+    @property
+    def accumulated_content(self) -> str:
+        return self.coalescer.content
+
+    async def _send(self, message: dict):
+        """将合并后的消息放入队列，供SSE endpoint消费"""
         sse_data = {
-            'token': token,
-            'content': self.accumulated_content,
+            **message,
+            'type': message['kind'],
+            'token': message.get('delta', ''),  # 兼容旧字段
             'task_id': self.task_id,
-            'finished': False,
-            'type': 'token'
+            'finished': message['kind'] == END
         }
-        
-        # 将数据放入队列，供SSE endpoint消费
         try:
             await self.queue.put(sse_data)
         except Exception as e:
-            logger.error(f"Failed to put token data into SSE queue: {str(e)}")
+            logger.error(f"Failed to put {message['kind']} data into SSE queue: {str(e)}")
+        
+    async def on_llm_new_token(self, token, **kwargs):
+        """处理生成的新token，合并后放入队列"""
+        await self.coalescer.push(token)
     
     async def on_llm_end(self, response, **kwargs):
-        """标记LLM响应完成，发送结束信号"""
-        final_data = {
-            'token': '',
-            'content': self.accumulated_content,
-            'task_id': self.task_id,
-            'finished': True,
-            'type': 'end'
-        }
-        
-        try:
-            await self.queue.put(final_data)
-        except Exception as e:
-            logger.error(f"Failed to put end data into SSE queue: {str(e)}")
+        """标记LLM响应完成，发送剩余增量和结束信号"""
+        await self.coalescer.finish()
+
+    async def reset(self):
+        """请求重试前调用，通知客户端清空本次尝试已输出的内容"""
+        await self.coalescer.reset()
     
     async def on_llm_error(self, error, **kwargs):
         """处理LLM错误"""
+        await self.coalescer.flush()
         error_data = {
             'error': str(error),
+            'seq': self.coalescer.seq + 1,
             'task_id': self.task_id,
             'finished': True,
             'type': 'error'
@@ -122,6 +136,38 @@ class SSEStreamingCallbackHandler(BaseCallbackHandler):
             logger.error(f"Failed to put error data into SSE queue: {str(e)}")
 
 
+class JSONObjectStreamCallbackHandler(BaseCallbackHandler):
+    """
+    流式输出的增量JSON回调处理器：每当输出中的一个JSON对象闭合，立即回调 on_object(task_id, obj)
+    供调用方在整个请求完成前提前使用部分结果（如提前应用已识别的标题）
+    """
+
+    def __init__(self, on_object: Callable[[Any, Any], Awaitable[None]], task_id=None):
+        super().__init__()
+        self.on_object = on_object
+        self.task_id = task_id
+        self.parser = IncrementalJSONParser()
+        self.run_inline = True  # True表示内联运行， 边生成边执行
+        self.raise_error = False  # False表示不抛出错误
+
+    async def on_llm_new_token(self, token, **kwargs):
+        """解析新token，回调新闭合的对象"""
+        for obj in self.parser.feed(token):
+            try:
+                await self.on_object(self.task_id, obj)
+            except Exception as e:
+                logger.error(f"增量JSON对象回调失败: task_id={self.task_id}, error: {str(e)}")
+
+
+def _create_coalescer(emit) -> StreamCoalescer:
+    return StreamCoalescer(
+        emit,
+        flush_interval=settings.LLM_STREAM_FLUSH_INTERVAL_MS / 1000,
+        flush_chars=settings.LLM_STREAM_FLUSH_CHARS,
+        snapshot_every=settings.LLM_STREAM_SNAPSHOT_EVERY,
+    )
+
+
 class LLMService:
     """通用LLM服务实现"""
     def __init__(
@@ -129,95 +175,330 @@ class LLMService:
         config: LLMConfigModel,
         prompt_template: str,
         system_role: str,
+        llm: Optional[BaseChatModel] = None,
     ):
         self.config = config
         self.prompt_template = prompt_template
         self.system_role = system_role
         self.output_parser = StrOutputParser()
-        self._init_llm()
+        if llm is None:
+            self._init_llm()
+        else:
+            # 由LLMServiceRegistry传入，同一配置下共享模型实例（及其HTTP连接池）
+            self.llm = llm
+        self._build_chain()
 
     def _init_llm(self):
         """初始化LLM模型"""
+        base_url, api_key = self.config.resolved_endpoint()
         self.llm = ChatOpenAI(
             model_name=self.config.llm_model_name,
             temperature=self.config.temperature,
             top_p=self.config.top_p,
             streaming=self.config.streaming,
-            api_key=self.config.api_key or settings.ALIBABA_API_KEY,
-            base_url=self.config.base_url,
+            api_key=api_key,
+            base_url=base_url,
             timeout=self.config.timeout,
+            stream_usage=True,  # 流式调用时同样返回token用量
         )
 
-    async def process(self, request: LLMRequestModel, channel_layer=None, group_name=None, task_id=None, sse_queue=None) -> Any:
+    def _build_chain(self):
+        """编译提示模板和处理链（每个服务实例只编译一次，所有请求复用）"""
+        if not self.prompt_template:
+            self.prompt = None
+            self.chain = None
+            self._template_tokens = 0
+            return
+
+        # 模板和系统角色的token数，用于限流时估算请求的token数
+        self._template_tokens = count_tokens(self.system_role or "") + count_tokens(self.prompt_template)
+
+        # 创建聊天提示模板
+        self.prompt = ChatPromptTemplate.from_messages([
+            SystemMessagePromptTemplate.from_template(
+                self.system_role
+            ),
+            HumanMessagePromptTemplate.from_template(
+                self.prompt_template,
+                input_variables=["context",  
+                                 "instruction",
+                                 "supplement",
+                                 "output_format"
+                                 ]
+            )
+        ])
+
+        # 构建处理链
+        self.chain = self.prompt | self.llm | self.output_parser
+
+    def _estimate_tokens(self, request_dict: dict) -> int:
+        """估算请求的输入token数（模板 + 各输入字段）"""
+        return self._template_tokens + sum(
+            count_tokens(str(value)) for value in request_dict.values() if value
+        )
+
+    async def _attempt(
+        self,
+        chain,
+        request_dict: dict,
+        callbacks: list,
+        limiter: TokenBucketLimiter,
+        input_tokens: int,
+        telemetry: TelemetryCallbackHandler,
+        record: LLMCallRecord,
+        hedge: bool = False,
+    ) -> Any:
+        """
+        在模型端点的自适应并发槽位内调用一次chain，并把耗时和错误类型反馈给并发控制器
+        :param hedge: 对冲请求不排队等待限流令牌，令牌不足时抛出HedgeRejected
+        """
+        concurrency = LLMConcurrencyController.for_config(self.config)
+        queued_at = time.monotonic()
+        # 槽位已满时按优先级（llm_work_context）和项目公平排队
+        async with concurrency.slot() as slot:
+            if hedge:
+                if not await limiter.try_acquire(input_tokens):
+                    raise HedgeRejected(f"对冲请求未获得限流令牌: {limiter.name}")
+            else:
+                # 跨worker的令牌桶限流（请求数/分钟 + token数/分钟），令牌不足时异步等待；
+                # 等待期间batch请求可被interactive请求抢占槽位
+                await slot.run_preemptible(lambda: limiter.acquire(input_tokens))
+
+            start = time.monotonic()
+            if not hedge:
+                record.queue_wait += start - queued_at
+            telemetry.mark_start()
+            try:
+                result = await chain.ainvoke(request_dict, config={"callbacks": [*callbacks, telemetry]})
+            except (RateLimitError, APITimeoutError, Timeout, asyncio.TimeoutError):
+                concurrency.on_overload()
+                raise
+            except APIStatusError as e:
+                if e.status_code >= 500:
+                    concurrency.on_overload()
+                else:
+                    concurrency.on_error()
+                raise
+            except Exception:
+                concurrency.on_error()
+                raise
+
+            # 按阶段反馈延迟，流式调用用首token时间，否则按输出token数归一化
+            output_tokens = None
+            if telemetry.ttft is None:
+                usage = telemetry.usage or {}
+                output_tokens = usage.get("completion_tokens", usage.get("output_tokens")) or count_tokens(str(result))
+            concurrency.on_success(
+                time.monotonic() - start, ttft=telemetry.ttft, output_tokens=output_tokens, stage=record.stage
+            )
+            return result
+
+    @staticmethod
+    def _finish_record(record: LLMCallRecord, telemetry: TelemetryCallbackHandler, result: Any, started_at: float) -> None:
+        """记录总耗时、首token时间和token用量（started_at为主请求开始调用的时间）"""
+        record.latency = time.monotonic() - started_at
+        record.ttft = telemetry.first_token_at - started_at if telemetry.first_token_at is not None else None
+        if not record.set_usage(telemetry.usage):
+            # 模型未返回usage时使用本地估算
+            record.output_tokens = count_tokens(str(result))
+
+    async def _invoke(
+        self,
+        chain,
+        request_dict: dict,
+        callbacks: list,
+        limiter: TokenBucketLimiter,
+        input_tokens: int,
+        record: LLMCallRecord,
+    ) -> Any:
+        """调用chain并记录遥测数据，LLM配置开启hedge_enabled时使用对冲调用"""
+        policy = LLMHedging.for_call(record.stage, record.model)
+        if self.config.hedge_enabled and settings.LLM_HEDGE_ENABLED:
+            return await self._invoke_hedged(chain, request_dict, callbacks, limiter, input_tokens, record, policy)
+
+        telemetry = TelemetryCallbackHandler()
+        result = await self._attempt(chain, request_dict, callbacks, limiter, input_tokens, telemetry, record)
+        self._finish_record(record, telemetry, result, telemetry.start)
+        policy.observe(record.ttft if record.ttft is not None else record.latency, record.latency, hedging=False)
+        return result
+
+    async def _invoke_hedged(
+        self,
+        chain,
+        request_dict: dict,
+        callbacks: list,
+        limiter: TokenBucketLimiter,
+        input_tokens: int,
+        record: LLMCallRecord,
+        policy: HedgePolicy,
+    ) -> Any:
+        """
+        对冲调用：主请求超过该阶段首响应时间的p90仍没有首token时，再发出一个相同的请求，
+        先产生首token的请求胜出，另一个被取消。
+        对冲请求受预算限制（默认不超过主请求数的10%），并且只在并发有余量、限流器没有排队时发出
+        """
+        concurrency = LLMConcurrencyController.for_config(self.config)
+        telemetries = [TelemetryCallbackHandler(), TelemetryCallbackHandler()]
+        call = HedgedCall(callbacks)
+        policy.budget.deposit()
+
+        async def attempt(index: int, gate_callbacks: list) -> Any:
+            try:
+                return await self._attempt(
+                    chain, request_dict, gate_callbacks, limiter, input_tokens, telemetries[index], record, hedge=index > 0
+                )
+            except HedgeRejected:
+                policy.rejected_by_limiter += 1
+                policy.budget.refund()
+                raise
+
+        def allow_hedge() -> bool:
+            if concurrency.in_flight >= concurrency.current_limit or limiter.queue_depth > 0:
+                policy.skipped_capacity += 1
+                return False
+            if not policy.budget.try_spend():
+                policy.skipped_budget += 1
+                return False
+            policy.hedges += 1
+            return True
+
+        result, winner = await call.run(attempt, policy.hedge_delay(), allow_hedge)
+
+        started_at = telemetries[0].start if telemetries[0].start is not None else telemetries[winner].start
+        self._finish_record(record, telemetries[winner], result, started_at)
+        record.hedged = call.hedged
+        record.hedge_won = winner > 0
+        if record.hedge_won:
+            policy.hedge_wins += 1
+            logger.debug(f"对冲请求胜出: {policy.name}, 耗时{record.latency:.2f}秒")
+        policy.observe(record.ttft if record.ttft is not None else record.latency, record.latency, hedging=True)
+        return result
+
+    @staticmethod
+    async def _replay_cached(callbacks: list, content: str) -> None:
+        """缓存命中时，把完整结果作为一次输出推送给流式回调，保持前端的流式行为一致"""
+        for callback in callbacks:
+            result = callback.on_llm_new_token(content)
+            if asyncio.iscoroutine(result):
+                await result
+            result = callback.on_llm_end(None)
+            if asyncio.iscoroutine(result):
+                await result
+
+    async def process(self, request: LLMRequestModel, channel_layer=None, group_name=None, task_id=None, sse_queue=None, bypass_cache: bool = False, on_json_object: Optional[Callable[[Any, Any], Awaitable[None]]] = None) -> Any:
         """
         处理LLM请求
         :param request: LLM请求对象
+        :param bypass_cache: 为True时跳过响应缓存（不读取，但仍写入新结果）
+        :param on_json_object: 流式输出时，每个JSON对象闭合即回调 on_json_object(task_id, obj)
         :return: 处理结果
+
+        每次请求（含重试）记录一条遥测数据：排队时间、首token延迟、总耗时、token用量、重试次数、缓存命中，
+        标签（project_id / stage / builder）来自调用方设置的 llm_call_context
         """
-        max_retries = 3  # 最大重试次数
+        record = LLMCallRecord.from_context(self.config.llm_model_name)
+        try:
+            return await self._process(
+                request, record,
+                channel_layer=channel_layer, group_name=group_name, task_id=task_id,
+                sse_queue=sse_queue, bypass_cache=bypass_cache, on_json_object=on_json_object,
+            )
+        except asyncio.CancelledError:
+            record.outcome = "cancelled"
+            raise
+        except Exception:
+            record.outcome = "error"
+            raise
+        finally:
+            await LLMTelemetry.record(record)
+
+    async def _process(self, request: LLMRequestModel, record: LLMCallRecord, channel_layer=None, group_name=None, task_id=None, sse_queue=None, bypass_cache: bool = False, on_json_object=None) -> Any:
+        """处理LLM请求（重试、限流、缓存），参数同process"""
+        max_retries = self.config.retry_times  # 最大重试次数
         retry_count = 0
+        limiter = LLMRateLimiter.for_config(self.config)
+        use_cache = self.config.cache_enabled and settings.LLM_CACHE_ENABLED
         
+        # 流式输出回调在整个任务内只创建一次：重试时发送reset消息，seq持续递增，不会出现重复的seq
+        if self.config.streaming and sse_queue:
+            # 使用SSE流式输出
+            stream_callbacks = [SSEStreamingCallbackHandler(sse_queue, task_id)]
+        elif self.config.streaming and channel_layer and group_name:
+            # 使用WebSocket流式输出
+            stream_callbacks = [WebSocketStreamingCallbackHandler(channel_layer, group_name, task_id)]
+        elif self.config.streaming:
+            # 使用标准输出流式输出
+            stream_callbacks = [StreamingStdOutCallbackHandler()]
+        else:
+            stream_callbacks = []
+
         while True:
             try:
                 if not self.prompt_template:
                     raise ValueError("Prompt template is required")
                 
-                # 创建聊天提示模板
-                prompt = ChatPromptTemplate.from_messages([
-                    SystemMessagePromptTemplate.from_template(
-                        self.system_role
-                    ),
-                    HumanMessagePromptTemplate.from_template(
-                        self.prompt_template,
-                        input_variables=["context",  
-                                         "instruction",
-                                         "supplement",
-                                         "output_format"
-                                         ]
-                    )
-                ])
-
-                # 构建处理链
-                chain = prompt | self.llm | self.output_parser
+                # 处理链已在初始化时编译
+                chain = self.chain
 
                 # 处理请求, 构建prompt模板的输入
                 request_dict = request.dict()   #将LLMRequest对象转换为字典
 
-                # 配置流式输出
-                if self.config.streaming and sse_queue:
-                    # 使用SSE流式输出
-                    callbacks = [SSEStreamingCallbackHandler(sse_queue, task_id)]
-                elif self.config.streaming and channel_layer and group_name:
-                    # 使用WebSocket流式输出
-                    callbacks = [WebSocketStreamingCallbackHandler(channel_layer, group_name, task_id)]
-                elif self.config.streaming:
-                    # 使用标准输出流式输出
-                    callbacks = [StreamingStdOutCallbackHandler()]
-                else:
-                    callbacks = []
+                if retry_count:
+                    for callback in stream_callbacks:
+                        if hasattr(callback, "reset"):
+                            await callback.reset()
+                callbacks = list(stream_callbacks)
 
-                # 直接使用配置中的streaming设置
-                chain_config = {"callbacks": callbacks} if callbacks else {}
+                # 增量解析输出中的JSON对象（每次重试使用新的解析器）
+                if self.config.streaming and on_json_object:
+                    callbacks.append(JSONObjectStreamCallbackHandler(on_json_object, task_id))
 
+                input_tokens = self._estimate_tokens(request_dict)
+                record.input_tokens = input_tokens
+
+                # 响应缓存（按模型参数 + 渲染后的prompt）
+                cache_key = None
+                if use_cache:
+                    cache_key = LLMResponseCache.make_key(
+                        self.config, self.system_role, self.prompt.format(**request_dict)
+                    )
+                    if bypass_cache:
+                        LLMResponseCache.record_bypass()
+                    else:
+                        cached = await LLMResponseCache.get(cache_key, input_tokens=input_tokens)
+                        if cached is not None:
+                            record.cache_hit = True
+                            record.outcome = "cache_hit"
+                            record.output_tokens = count_tokens(cached)
+                            await self._replay_cached(callbacks, cached)
+                            return cached
 
+                result = await self._invoke(chain, request_dict, callbacks, limiter, input_tokens, record)
 
-                result = await chain.ainvoke(request_dict, config=chain_config)
+                if cache_key:
+                    await LLMResponseCache.set(cache_key, result)
 
-                # output_tokens = count_tokens(str(result))
-                # logger.info(f"Output tokens: {output_tokens}")
+                logger.debug(
+                    f"LLM调用完成: stage={record.stage}, model={record.model}, "
+                    f"tokens={record.input_tokens}/{record.output_tokens}({record.usage_source}), 耗时{record.latency:.2f}秒"
+                )
 
                 return result
 
             except RateLimitError as e:
                 retry_count += 1
+                record.retries = retry_count
                 if retry_count > max_retries:
                     logger.error(f"API 调用超过限制，已重试{max_retries}次后失败: {str(e)}")
                     raise
                 
-                # 计算指数退避等待时间（带抖动）
-                wait_time = (2 ** retry_count) + random.uniform(0, 1)
+                # 服务端给出 Retry-After 时，所有worker一起暂停；否则使用带抖动的指数退避
+                retry_after = get_retry_after(e)
+                if retry_after:
+                    await limiter.block_for(retry_after)
+                wait_time = retry_backoff(retry_count, retry_after)
                 logger.warning(f"API 调用超过限制，正在进行第{retry_count}次重试，等待{wait_time:.2f}秒: {str(e)}")
-                time.sleep(wait_time)
+                await asyncio.sleep(wait_time)
                 continue
             
             except Timeout as e:
@@ -0,0 +1,297 @@
+from typing import Dict, Any, Optional
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from .llm_models import LLMConfigModel
+from app.core.redis_helper import RedisClient
+from app.core.config import settings
+import hashlib
+import asyncio
+import random
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitTimeoutError(Exception):
+    """等待限流令牌超时异常"""
+    pass
+
+
+# 双令牌桶（请求数/分钟 + token数/分钟）原子扣减脚本，使用Redis服务器时间，保证多worker之间时钟一致
+# KEYS[1]: 请求数桶, KEYS[2]: token数桶, KEYS[3]: Retry-After 全局暂停键
+# ARGV[1]: 每分钟请求数上限, ARGV[2]: 每分钟token数上限, ARGV[3]: 本次请求的token数
+# 返回: 0 表示已获取令牌；>0 表示需要等待的毫秒数
+TOKEN_BUCKET_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+
+local blocked = redis.call('PTTL', KEYS[3])
+if blocked > 0 then
+    return blocked
+end
+
+local function load(key, capacity)
+    local v = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(v[1])
+    local ts = tonumber(v[2])
+    if tokens == nil or ts == nil then
+        return capacity
+    end
+    return math.min(capacity, tokens + math.max(0, now - ts) * capacity / 60000)
+end
+
+local function save(key, tokens)
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('PEXPIRE', key, 120000)
+end
+
+local req_cap = tonumber(ARGV[1])
+local tok_cap = tonumber(ARGV[2])
+local need = tonumber(ARGV[3])
+local wait = 0
+
+local req = 0
+if req_cap > 0 then
+    req = load(KEYS[1], req_cap)
+    if req < 1 then
+        wait = math.max(wait, math.ceil((1 - req) * 60000 / req_cap))
+    end
+end
+
+local tok = 0
+if tok_cap > 0 then
+    -- 单个请求超过桶容量时按桶容量计，避免永远无法获取
+    need = math.min(need, tok_cap)
+    tok = load(KEYS[2], tok_cap)
+    if tok < need then
+        wait = math.max(wait, math.ceil((need - tok) * 60000 / tok_cap))
+    end
+end
+
+if wait == 0 then
+    req = req - 1
+    tok = tok - need
+end
+if req_cap > 0 then save(KEYS[1], req) end
+if tok_cap > 0 then save(KEYS[2], tok) end
+return wait
+"""
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """
+    从API异常的响应头中解析 Retry-After（秒）
+    支持 retry-after-ms、retry-after（秒数或HTTP日期），解析不到返回None
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    try:
+        retry_after_ms = headers.get("retry-after-ms")
+        if retry_after_ms:
+            return max(0.0, float(retry_after_ms) / 1000)
+
+        retry_after = headers.get("retry-after")
+        if not retry_after:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            retry_at = parsedate_to_datetime(retry_after)
+            return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except Exception:
+        return None
+
+
+def retry_backoff(attempt: int, retry_after: Optional[float] = None, base: float = 1.0, cap: float = 60.0) -> float:
+    """
+    计算第attempt次重试的等待时间（秒）
+    - 服务端给出 Retry-After 时以其为准，再加少量抖动，避免所有协程同时醒来
+    - 否则使用带抖动的指数退避：[backoff/2, backoff]
+    """
+    if retry_after is not None:
+        return min(cap, retry_after) + random.uniform(0, 1)
+    backoff = min(cap, base * (2 ** attempt))
+    return backoff / 2 + random.uniform(0, backoff / 2)
+
+
+class TokenBucketLimiter:
+    """
+    基于Redis的分布式令牌桶限流器（跨worker共享）
+
+    同时限制每分钟请求数和每分钟token数，任一维度不足时协程异步等待（不阻塞事件循环）。
+    Redis不可用时放行（fail-open），只记录告警，不影响主流程。
+    """
+
+    def __init__(self, name: str, requests_per_minute: int, tokens_per_minute: int, max_wait: float):
+        self.name = name
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_wait = max_wait
+
+        # {}为Redis Cluster的hash tag，保证三个键落在同一个slot，脚本可以原子执行
+        prefix = f"llm_rate_limit:{{{name}}}"
+        self.keys = [f"{prefix}:requests", f"{prefix}:tokens", f"{prefix}:blocked"]
+
+        # 监控数据
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.acquired = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+        self.last_wait = 0.0
+        self.retry_after_blocks = 0
+        self.redis_errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests_per_minute > 0 or self.tokens_per_minute > 0
+
+    async def _try_acquire(self, tokens: int) -> int:
+        """尝试获取令牌，返回需要等待的毫秒数"""
+        client = await RedisClient.get_client()
+        return int(await client.eval(
+            TOKEN_BUCKET_SCRIPT, 3, *self.keys,
+            self.requests_per_minute, self.tokens_per_minute, tokens,
+        ))
+
+    async def acquire(self, tokens: int = 0) -> float:
+        """
+        获取一次请求的令牌（1个请求 + tokens个token）
+        :return: 实际等待的秒数
+        :raises RateLimitTimeoutError: 累计等待超过max_wait
+        """
+        if not self.enabled:
+            return 0.0
+
+        start = time.monotonic()
+        queued = False
+        try:
+            while True:
+                try:
+                    wait_ms = await self._try_acquire(tokens)
+                except Exception as e:
+                    self.redis_errors += 1
+                    logger.warning(f"限流器访问Redis失败，本次请求直接放行: {self.name}, error: {str(e)}")
+                    wait_ms = 0
+
+                if wait_ms <= 0:
+                    break
+
+                if not queued:
+                    queued = True
+                    self.throttled += 1
+                    self.queue_depth += 1
+                    self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+                waited = time.monotonic() - start
+                if waited + wait_ms / 1000 > self.max_wait:
+                    raise RateLimitTimeoutError(
+                        f"等待限流令牌超时: {self.name}, 已等待{waited:.2f}秒, 还需等待{wait_ms / 1000:.2f}秒"
+                    )
+
+                # 加少量抖动，避免多个协程在同一时刻重试
+                await asyncio.sleep(wait_ms / 1000 + random.uniform(0, 0.05))
+        finally:
+            if queued:
+                self.queue_depth -= 1
+
+        waited = time.monotonic() - start
+        self.acquired += 1
+        self.last_wait = waited
+        self.total_wait += waited
+        self.max_wait_seen = max(self.max_wait_seen, waited)
+        if waited > 1:
+            logger.info(f"限流等待: {self.name}, 等待{waited:.2f}秒, tokens={tokens}")
+        return waited
+
+    async def try_acquire(self, tokens: int = 0) -> bool:
+        """
+        不等待地尝试获取令牌，用于对冲等可有可无的请求
+        令牌不足或Redis不可用时返回False（与acquire不同，这里不放行）
+        """
+        if not self.enabled:
+            return True
+        try:
+            wait_ms = await self._try_acquire(tokens)
+        except Exception as e:
+            self.redis_errors += 1
+            logger.warning(f"限流器访问Redis失败，放弃可选请求: {self.name}, error: {str(e)}")
+            return False
+        if wait_ms > 0:
+            return False
+        self.acquired += 1
+        return True
+
+    async def block_for(self, seconds: float) -> None:
+        """服务端返回 Retry-After 时，让所有worker在该时间内暂停发送请求"""
+        if not self.enabled or seconds <= 0:
+            return
+        try:
+            client = await RedisClient.get_client()
+            await client.set(self.keys[2], "1", px=int(seconds * 1000))
+            self.retry_after_blocks += 1
+        except Exception as e:
+            self.redis_errors += 1
+            logger.warning(f"限流器设置暂停失败: {self.name}, error: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """限流器监控数据"""
+        return {
+            "name": self.name,
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "acquired": self.acquired,
+            "throttled": self.throttled,
+            "total_wait_seconds": round(self.total_wait, 3),
+            "avg_wait_seconds": round(self.total_wait / self.acquired, 3) if self.acquired else 0.0,
+            "max_wait_seconds": round(self.max_wait_seen, 3),
+            "last_wait_seconds": round(self.last_wait, 3),
+            "retry_after_blocks": self.retry_after_blocks,
+            "redis_errors": self.redis_errors,
+        }
+
+
+class LLMRateLimiter:
+    """按 (模型, API Key) 管理限流器，进程内共享"""
+
+    _limiters: Dict[str, TokenBucketLimiter] = {}
+
+    @staticmethod
+    def limiter_name(config: LLMConfigModel) -> str:
+        """限流器名称：模型名 + API Key指纹（不暴露明文Key）"""
+        api_key = config.api_key or settings.ALIBABA_API_KEY or ""
+        key_hash = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+        return f"{config.llm_model_name}:{key_hash}"
+
+    @classmethod
+    def for_config(cls, config: LLMConfigModel) -> TokenBucketLimiter:
+        """获取（或创建）该模型配置对应的限流器"""
+        name = cls.limiter_name(config)
+        limiter = cls._limiters.get(name)
+        if limiter is None:
+            enabled = settings.LLM_RATE_LIMIT_ENABLED
+            limiter = TokenBucketLimiter(
+                name=name,
+                requests_per_minute=settings.LLM_RATE_LIMIT_RPM if enabled else 0,
+                tokens_per_minute=settings.LLM_RATE_LIMIT_TPM if enabled else 0,
+                max_wait=settings.LLM_RATE_LIMIT_MAX_WAIT,
+            )
+            cls._limiters[name] = limiter
+        return limiter
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        """所有限流器的监控数据"""
+        return {name: limiter.stats() for name, limiter in cls._limiters.items()}
+
+    @classmethod
+    def clear(cls) -> None:
+        """清空进程内的限流器（测试时使用）"""
+        cls._limiters.clear()
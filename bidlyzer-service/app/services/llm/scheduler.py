@@ -0,0 +1,224 @@
+from typing import Dict, Any, Optional, Deque
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from prometheus_client import Counter, Histogram
+from .telemetry import current_call_context
+from .hedging import LatencyWindow
+import asyncio
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------------------ 优先级 ------------------------------
+
+INTERACTIVE = "interactive"   # 用户正在等待的工作（如前端正在看SSE流的结构化分析）
+BACKGROUND = "background"     # 后台工作（未指定优先级时的默认值）
+BATCH = "batch"               # 批量重跑等，可被抢占
+PRIORITY_CLASSES = (INTERACTIVE, BACKGROUND, BATCH)
+
+
+class DeadlineExceeded(Exception):
+    """排队超过截止时间，请求未发出"""
+    pass
+
+
+# 当前工作的优先级、租户和截止时间，由各入口设置，asyncio任务创建时自动继承
+_work_context: ContextVar[Dict[str, Any]] = ContextVar("llm_work_context", default={})
+
+
+@contextmanager
+def llm_work_context(priority: Optional[str] = None, deadline_seconds: Optional[float] = None, tenant: Optional[str] = None):
+    """
+    为其中发起的LLM调用设置调度参数，可嵌套（内层覆盖优先级/租户，截止时间取更早的一个）
+
+    with llm_work_context(priority=BATCH, deadline_seconds=600):
+        ...
+    """
+    if priority is not None and priority not in PRIORITY_CLASSES:
+        raise ValueError(f"未知的优先级: {priority}，可选值: {PRIORITY_CLASSES}")
+    context = dict(_work_context.get())
+    if priority is not None:
+        context["priority"] = priority
+    if tenant is not None:
+        context["tenant"] = str(tenant)
+    if deadline_seconds is not None:
+        deadline = time.monotonic() + deadline_seconds
+        context["deadline"] = min(deadline, context.get("deadline", deadline))
+    token = _work_context.set(context)
+    try:
+        yield
+    finally:
+        _work_context.reset(token)
+
+
+@dataclass
+class WorkTicket:
+    """一个等待并发槽位的LLM请求"""
+    priority: str = BACKGROUND
+    tenant: str = "default"
+    deadline: Optional[float] = None        # time.monotonic() 时间
+    enqueued_at: float = field(default_factory=time.monotonic)
+    future: Optional[asyncio.Future] = None
+    preemptions: int = 0
+
+    @classmethod
+    def from_context(cls) -> "WorkTicket":
+        """从 llm_work_context 读取优先级和截止时间，租户默认取遥测上下文中的project_id"""
+        context = _work_context.get()
+        return cls(
+            priority=context.get("priority", BACKGROUND),
+            tenant=context.get("tenant") or current_call_context().get("project_id", "default"),
+            deadline=context.get("deadline"),
+        )
+
+
+# ------------------------------ 等待队列 ------------------------------
+
+class FairPriorityQueue:
+    """
+    按优先级分类、每类内按租户轮转的等待队列
+
+    出队顺序：interactive > 临近截止时间的请求（最早截止优先）> background > batch；
+    同一优先级内各租户轮流出队，避免单个项目的大量请求占满槽位；已超过截止时间的请求直接失败
+    """
+
+    def __init__(self, urgent_window: float = 5.0):
+        self.urgent_window = urgent_window
+        self._classes: Dict[str, "OrderedDict[str, Deque[WorkTicket]]"] = {
+            priority: OrderedDict() for priority in PRIORITY_CLASSES
+        }
+
+    def __len__(self) -> int:
+        return sum(len(tickets) for tenants in self._classes.values() for tickets in tenants.values())
+
+    def depth(self) -> Dict[str, int]:
+        """各优先级的排队数"""
+        return {
+            priority: sum(len(tickets) for tickets in tenants.values())
+            for priority, tenants in self._classes.items()
+        }
+
+    def push(self, ticket: WorkTicket, front: bool = False) -> None:
+        """入队；被抢占的请求放回其租户队列的队首"""
+        tickets = self._classes[ticket.priority].setdefault(ticket.tenant, deque())
+        if front:
+            tickets.appendleft(ticket)
+        else:
+            tickets.append(ticket)
+
+    def remove(self, ticket: WorkTicket) -> None:
+        tenants = self._classes[ticket.priority]
+        tickets = tenants.get(ticket.tenant)
+        if tickets is None or ticket not in tickets:
+            return
+        tickets.remove(ticket)
+        if not tickets:
+            del tenants[ticket.tenant]
+
+    def _expire(self, now: float) -> None:
+        for tenants in self._classes.values():
+            for tenant in list(tenants):
+                tickets = tenants[tenant]
+                for ticket in [t for t in tickets if t.deadline is not None and t.deadline <= now]:
+                    tickets.remove(ticket)
+                    LLMScheduler.on_expire(ticket)
+                    if ticket.future is not None and not ticket.future.done():
+                        ticket.future.set_exception(DeadlineExceeded(
+                            f"LLM请求排队超过截止时间: priority={ticket.priority}, tenant={ticket.tenant}, "
+                            f"已排队{now - ticket.enqueued_at:.2f}秒"
+                        ))
+                if not tickets:
+                    del tenants[tenant]
+
+    def _pop_urgent(self, now: float) -> Optional[WorkTicket]:
+        urgent: Optional[WorkTicket] = None
+        for priority in (BACKGROUND, BATCH):
+            for tickets in self._classes[priority].values():
+                for ticket in tickets:
+                    if ticket.deadline is not None and ticket.deadline - now <= self.urgent_window:
+                        if urgent is None or ticket.deadline < urgent.deadline:
+                            urgent = ticket
+        if urgent is not None:
+            self.remove(urgent)
+        return urgent
+
+    def _pop_class(self, priority: str) -> Optional[WorkTicket]:
+        tenants = self._classes[priority]
+        if not tenants:
+            return None
+        # 轮转：取队首租户的第一个请求，然后把该租户移到末尾
+        tenant, tickets = next(iter(tenants.items()))
+        ticket = tickets.popleft()
+        if tickets:
+            tenants.move_to_end(tenant)
+        else:
+            del tenants[tenant]
+        return ticket
+
+    def pop(self) -> Optional[WorkTicket]:
+        """按调度顺序取出下一个请求，队列为空时返回None"""
+        now = time.monotonic()
+        self._expire(now)
+        ticket = self._pop_class(INTERACTIVE) or self._pop_urgent(now)
+        if ticket is not None:
+            return ticket
+        for priority in (BACKGROUND, BATCH):
+            ticket = self._pop_class(priority)
+            if ticket is not None:
+                return ticket
+        return None
+
+
+# ------------------------------ 监控 ------------------------------
+
+QUEUE_LATENCY = Histogram(
+    "llm_scheduler_queue_seconds", "按优先级统计的排队等待时间", ["priority"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30, 60, 120),
+)
+PREEMPTIONS = Counter("llm_scheduler_preemptions_total", "被抢占的未开始请求数", ["priority"])
+EXPIRED = Counter("llm_scheduler_expired_total", "排队超过截止时间的请求数", ["priority"])
+
+
+class LLMScheduler:
+    """调度统计（进程内，所有模型端点汇总）：各优先级的排队延迟、抢占和超时次数"""
+
+    _queue_latency: Dict[str, LatencyWindow] = {priority: LatencyWindow(500) for priority in PRIORITY_CLASSES}
+    _counters: Dict[str, Dict[str, int]] = {
+        priority: {"dispatched": 0, "preempted": 0, "expired": 0} for priority in PRIORITY_CLASSES
+    }
+
+    @classmethod
+    def on_dispatch(cls, ticket: WorkTicket) -> None:
+        wait = time.monotonic() - ticket.enqueued_at
+        cls._queue_latency[ticket.priority].add(wait)
+        cls._counters[ticket.priority]["dispatched"] += 1
+        QUEUE_LATENCY.labels(priority=ticket.priority).observe(wait)
+
+    @classmethod
+    def on_preempt(cls, ticket: WorkTicket) -> None:
+        cls._counters[ticket.priority]["preempted"] += 1
+        PREEMPTIONS.labels(priority=ticket.priority).inc()
+
+    @classmethod
+    def on_expire(cls, ticket: WorkTicket) -> None:
+        cls._counters[ticket.priority]["expired"] += 1
+        EXPIRED.labels(priority=ticket.priority).inc()
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        """各优先级的排队延迟p50/p95和计数"""
+        return {
+            priority: {**cls._counters[priority], "queue_latency": cls._queue_latency[priority].summary()}
+            for priority in PRIORITY_CLASSES
+        }
+
+    @classmethod
+    def clear(cls) -> None:
+        """清空统计（测试时使用）"""
+        for priority in PRIORITY_CLASSES:
+            cls._queue_latency[priority] = LatencyWindow(500)
+            cls._counters[priority] = {"dispatched": 0, "preempted": 0, "expired": 0}
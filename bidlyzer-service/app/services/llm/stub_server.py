@@ -0,0 +1,326 @@
+"""
+离线LLM桩服务（OpenAI兼容接口）
+
+用于压测和延迟测试，不产生API费用、不依赖外网：
+- replay：按prompt指纹回放录制的响应，未录制的请求生成合成输出
+- record：转发到真实上游（如DashScope），同时录制响应
+- synthetic：总是生成合成输出
+
+可配置首token延迟分布、输出速率、429/超时注入和流式输出。
+启动后将 LLM_BASE_URL_OVERRIDE 设置为 http://<host>:<port>/v1，整个结构化流程即可离线运行。
+
+启动：
+    PYTHONPATH=. python -m app.services.llm.stub_server --mode replay --port 8900
+"""
+
+from typing import Dict, Any, List, Optional
+from dataclasses import dataclass, asdict, fields
+from pathlib import Path
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from ..task_service import count_tokens
+import argparse
+import asyncio
+import hashlib
+import random
+import json
+import time
+import uuid
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+MODES = ("replay", "record", "synthetic")
+
+
+@dataclass
+class StubBehavior:
+    """桩服务行为配置（运行时可通过 POST /stub/config 修改）"""
+    mode: str = "replay"
+    # 首token延迟：对数正态分布，中位数 ttft_median 秒，sigma 越大长尾越重
+    ttft_median: float = 0.8
+    ttft_sigma: float = 0.5
+    # 输出速率（token/秒），0表示不限速
+    tokens_per_second: float = 40.0
+    # 每个流式分片的token数（近似）
+    chunk_tokens: int = 4
+    # 故障注入
+    error_429_rate: float = 0.0
+    retry_after: float = 1.0
+    timeout_rate: float = 0.0
+    timeout_seconds: float = 120.0
+    # 合成输出
+    synthetic_max_items: int = 8
+    seed: Optional[int] = None
+
+    def update(self, values: Dict[str, Any]) -> None:
+        names = {f.name for f in fields(self)}
+        for name, value in values.items():
+            if name not in names:
+                raise ValueError(f"未知的配置项: {name}")
+            if name == "mode" and value not in MODES:
+                raise ValueError(f"mode必须是 {MODES} 之一")
+            setattr(self, name, value)
+
+
+class RecordingStore:
+    """录制的响应（每个prompt指纹一个JSON文件）"""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+
+    @staticmethod
+    def prompt_key(model: str, messages: List[Dict[str, Any]]) -> str:
+        """prompt指纹：模型名 + 全部消息"""
+        raw = json.dumps([model, messages], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        if not path.exists():
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def put(self, key: str, model: str, content: str, usage: Optional[Dict[str, Any]] = None) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"model": model, "content": content, "usage": usage, "created_at": time.time()},
+                f, ensure_ascii=False,
+            )
+        tmp_path.replace(path)
+
+    def count(self) -> int:
+        if not self.directory.exists():
+            return 0
+        return sum(1 for _ in self.directory.glob("*/*.json"))
+
+
+def synthetic_output(messages: List[Dict[str, Any]], max_items: int, rng: random.Random) -> str:
+    """
+    生成合成输出：从prompt中取出若干段落位置，返回标题列表JSON
+    结构与大纲分析的输出格式一致，保证下游解析流程能完整走通
+    """
+    prompt = "\n".join(str(message.get("content", "")) for message in messages)
+    positions = sorted({int(p) for p in re.findall(r"(?:position|Position|index)\W{0,3}(\d+)", prompt)})
+    if len(positions) > max_items:
+        positions = sorted(rng.sample(positions, max_items))
+    items = [{"level": 1, "position": p, "title": f"合成标题{p}"} for p in positions]
+    return json.dumps(items, ensure_ascii=False)
+
+
+def split_chunks(content: str, chunk_tokens: int) -> List[str]:
+    """按近似token数切分流式分片（中文约1字/token，英文约4字符/token）"""
+    size = max(1, chunk_tokens)
+    return [content[i:i + size] for i in range(0, len(content), size)] or [""]
+
+
+def create_stub_app(
+    behavior: Optional[StubBehavior] = None,
+    recordings_dir: Optional[Path] = None,
+    upstream_url: Optional[str] = None,
+    upstream_api_key: Optional[str] = None,
+) -> FastAPI:
+    """
+    创建桩服务应用
+    :param recordings_dir: 录制文件目录
+    :param upstream_url / upstream_api_key: record模式下转发的真实上游
+    """
+    behavior = behavior or StubBehavior()
+    store = RecordingStore(recordings_dir or Path("data/llm_recordings"))
+    rng = random.Random(behavior.seed)
+    stats: Dict[str, int] = {
+        "requests": 0, "streaming": 0, "replayed": 0, "recorded": 0,
+        "synthetic": 0, "injected_429": 0, "injected_timeouts": 0,
+    }
+
+    app = FastAPI(title="LLM Stub Server")
+    app.state.behavior = behavior
+    app.state.store = store
+    app.state.stats = stats
+
+    async def forward_upstream(body: Dict[str, Any]) -> Dict[str, Any]:
+        """record模式：以非流式方式请求真实上游"""
+        import httpx
+        if not upstream_url:
+            raise ValueError("record模式需要配置上游地址")
+        payload = {**body, "stream": False}
+        payload.pop("stream_options", None)
+        async with httpx.AsyncClient(timeout=behavior.timeout_seconds) as client:
+            response = await client.post(
+                f"{upstream_url.rstrip('/')}/chat/completions",
+                json=payload,
+                headers={"Authorization": f"Bearer {upstream_api_key or ''}"},
+            )
+            response.raise_for_status()
+            return response.json()
+
+    async def resolve_content(model: str, messages: List[Dict[str, Any]], body: Dict[str, Any]) -> str:
+        key = store.prompt_key(model, messages)
+        if behavior.mode == "record":
+            data = await forward_upstream(body)
+            content = data["choices"][0]["message"]["content"]
+            await asyncio.to_thread(store.put, key, model, content, data.get("usage"))
+            stats["recorded"] += 1
+            return content
+
+        if behavior.mode == "replay":
+            recording = await asyncio.to_thread(store.get, key)
+            if recording is not None:
+                stats["replayed"] += 1
+                return recording["content"]
+
+        stats["synthetic"] += 1
+        return synthetic_output(messages, behavior.synthetic_max_items, rng)
+
+    def usage_of(messages: List[Dict[str, Any]], content: str) -> Dict[str, int]:
+        prompt_tokens = sum(count_tokens(str(message.get("content", ""))) for message in messages)
+        completion_tokens = count_tokens(content)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    def ttft() -> float:
+        if behavior.ttft_median <= 0:
+            return 0.0
+        return rng.lognormvariate(0, behavior.ttft_sigma) * behavior.ttft_median
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "stub"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "stub")
+        messages = body.get("messages", [])
+        stream = bool(body.get("stream"))
+        stats["requests"] += 1
+
+        # 故障注入
+        if behavior.error_429_rate and rng.random() < behavior.error_429_rate:
+            stats["injected_429"] += 1
+            return JSONResponse(
+                status_code=429,
+                headers={"retry-after": str(behavior.retry_after)},
+                content={"error": {"message": "Rate limit exceeded (stub)", "type": "rate_limit_error", "code": "rate_limit"}},
+            )
+        if behavior.timeout_rate and rng.random() < behavior.timeout_rate:
+            stats["injected_timeouts"] += 1
+            await asyncio.sleep(behavior.timeout_seconds)
+
+        content = await resolve_content(model, messages, body)
+        usage = usage_of(messages, content)
+        completion_id = f"chatcmpl-stub-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        await asyncio.sleep(ttft())
+
+        if not stream:
+            if behavior.tokens_per_second > 0:
+                await asyncio.sleep(usage["completion_tokens"] / behavior.tokens_per_second)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage,
+            }
+
+        stats["streaming"] += 1
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None, chunk_usage=None) -> str:
+            data = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+            }
+            if chunk_usage is not None:
+                data["usage"] = chunk_usage
+            return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+        async def event_stream():
+            yield chunk({"role": "assistant", "content": ""})
+            interval = behavior.chunk_tokens / behavior.tokens_per_second if behavior.tokens_per_second > 0 else 0
+            for piece in split_chunks(content, behavior.chunk_tokens):
+                if interval:
+                    await asyncio.sleep(interval)
+                yield chunk({"content": piece})
+            yield chunk({}, finish_reason="stop")
+            if include_usage:
+                yield chunk(None, chunk_usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+    @app.get("/stub/stats")
+    async def get_stats():
+        return {**stats, "recordings": store.count(), "behavior": asdict(behavior)}
+
+    @app.post("/stub/config")
+    async def update_config(request: Request):
+        values = await request.json()
+        try:
+            behavior.update(values)
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"error": str(e)})
+        if "seed" in values:
+            rng.seed(behavior.seed)
+        return asdict(behavior)
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="离线LLM桩服务（OpenAI兼容接口）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--mode", choices=MODES, default="replay")
+    parser.add_argument("--dir", default="data/llm_recordings", help="录制文件目录")
+    parser.add_argument("--upstream", default=None, help="record模式的上游地址")
+    parser.add_argument("--upstream-api-key", default=None)
+    parser.add_argument("--ttft-median", type=float, default=0.8, help="首token延迟中位数（秒）")
+    parser.add_argument("--ttft-sigma", type=float, default=0.5, help="首token延迟的对数正态sigma")
+    parser.add_argument("--tokens-per-second", type=float, default=40.0)
+    parser.add_argument("--error-429-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    upstream_url, upstream_api_key = args.upstream, args.upstream_api_key
+    if args.mode == "record" and not upstream_url:
+        from app.core.config import settings
+        upstream_url = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+        upstream_api_key = upstream_api_key or settings.ALIBABA_API_KEY
+
+    behavior = StubBehavior(
+        mode=args.mode,
+        ttft_median=args.ttft_median,
+        ttft_sigma=args.ttft_sigma,
+        tokens_per_second=args.tokens_per_second,
+        error_429_rate=args.error_429_rate,
+        timeout_rate=args.timeout_rate,
+        seed=args.seed,
+    )
+    app = create_stub_app(behavior, Path(args.dir), upstream_url, upstream_api_key)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
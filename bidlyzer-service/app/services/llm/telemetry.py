@@ -0,0 +1,276 @@
+from typing import Dict, Any, Optional
+from dataclasses import dataclass
+from contextlib import contextmanager
+from contextvars import ContextVar
+from langchain.callbacks.base import BaseCallbackHandler
+from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from app.core.redis_helper import RedisClient
+from app.core.config import settings
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------------------ 调用上下文 ------------------------------
+
+# 当前LLM调用的标签（project_id / stage / builder），由各阶段入口设置，asyncio任务创建时自动继承
+_call_context: ContextVar[Dict[str, str]] = ContextVar("llm_call_context", default={})
+
+
+@contextmanager
+def llm_call_context(**tags):
+    """
+    为其中发起的LLM调用打标签，可嵌套（内层补充/覆盖外层）
+
+    with llm_call_context(project_id=project_id):
+        with llm_call_context(stage="L1", builder="TenderOutlinesL1PromptBuilder"):
+            ...
+    """
+    token = _call_context.set({
+        **_call_context.get(),
+        **{name: str(value) for name, value in tags.items() if value is not None},
+    })
+    try:
+        yield
+    finally:
+        _call_context.reset(token)
+
+
+def current_call_context() -> Dict[str, str]:
+    return dict(_call_context.get())
+
+
+# ------------------------------ Prometheus 指标 ------------------------------
+
+# project_id 基数不可控，不作为Prometheus标签，按项目的汇总存在Redis中
+_LABELS = ["stage", "model"]
+_LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+
+QUEUE_WAIT = Histogram(
+    "llm_queue_wait_seconds", "等待并发槽位和限流令牌的时间", _LABELS,
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30, 60, 120),
+)
+TIME_TO_FIRST_TOKEN = Histogram(
+    "llm_time_to_first_token_seconds", "首token延迟（仅流式调用）", _LABELS, buckets=_LATENCY_BUCKETS,
+)
+CALL_LATENCY = Histogram(
+    "llm_call_latency_seconds", "单次LLM调用总耗时（不含排队）", _LABELS, buckets=_LATENCY_BUCKETS,
+)
+CALLS = Counter("llm_calls_total", "LLM调用次数", _LABELS + ["outcome"])
+TOKENS = Counter("llm_tokens_total", "LLM token用量", _LABELS + ["direction"])
+RETRIES = Counter("llm_retries_total", "LLM调用重试次数", _LABELS)
+COST = Counter("llm_cost_total", "LLM调用费用（元）", _LABELS)
+HEDGES = Counter("llm_hedges_total", "发出的对冲请求数（won: 对冲请求胜出；lost: 主请求胜出）", _LABELS + ["result"])
+
+
+# ------------------------------ 单次调用记录 ------------------------------
+
+@dataclass
+class LLMCallRecord:
+    """一次LLM请求（含重试）的遥测数据"""
+    model: str
+    project_id: str = "unknown"
+    stage: str = "unknown"
+    builder: str = "unknown"
+    queue_wait: float = 0.0
+    ttft: Optional[float] = None
+    latency: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    usage_source: str = "estimate"   # provider: 来自模型返回的usage；estimate: 本地tokenizer估算
+    retries: int = 0
+    cache_hit: bool = False
+    hedged: bool = False             # 是否发出了对冲请求
+    hedge_won: bool = False          # 对冲请求是否胜出
+    outcome: str = "success"         # success / cache_hit / error
+
+    @classmethod
+    def from_context(cls, model: str) -> "LLMCallRecord":
+        context = current_call_context()
+        return cls(
+            model=model,
+            project_id=context.get("project_id", "unknown"),
+            stage=context.get("stage", "unknown"),
+            builder=context.get("builder", "unknown"),
+        )
+
+    @property
+    def cost(self) -> float:
+        """按 LLM_PRICING（元/千token）计算费用，缓存命中不计费"""
+        if self.cache_hit:
+            return 0.0
+        input_price, output_price = settings.LLM_PRICING.get(self.model, (0.0, 0.0))
+        return (self.input_tokens * input_price + self.output_tokens * output_price) / 1000
+
+    def set_usage(self, usage: Optional[Dict[str, Any]]) -> bool:
+        """使用模型返回的usage（兼容OpenAI与LangChain两种字段名），成功返回True"""
+        if not usage:
+            return False
+        input_tokens = usage.get("prompt_tokens", usage.get("input_tokens"))
+        output_tokens = usage.get("completion_tokens", usage.get("output_tokens"))
+        if input_tokens is None or output_tokens is None:
+            return False
+        self.input_tokens = int(input_tokens)
+        self.output_tokens = int(output_tokens)
+        self.usage_source = "provider"
+        return True
+
+
+class TelemetryCallbackHandler(BaseCallbackHandler):
+    """记录首token时间和模型返回的token用量"""
+
+    def __init__(self):
+        super().__init__()
+        self.start: Optional[float] = None
+        self.first_token_at: Optional[float] = None
+        self.usage: Optional[Dict[str, Any]] = None
+        self.run_inline = True
+        self.raise_error = False
+
+    def mark_start(self) -> None:
+        """chain开始调用（排队结束）的时间"""
+        self.start = time.monotonic()
+        self.first_token_at = None
+
+    @property
+    def ttft(self) -> Optional[float]:
+        if self.start is None or self.first_token_at is None:
+            return None
+        return self.first_token_at - self.start
+
+    async def on_llm_new_token(self, token, **kwargs):
+        if self.first_token_at is None and token:
+            self.first_token_at = time.monotonic()
+
+    async def on_llm_end(self, response, **kwargs):
+        self.usage = self._extract_usage(response)
+
+    @staticmethod
+    def _extract_usage(response) -> Optional[Dict[str, Any]]:
+        if response is None:
+            return None
+        llm_output = getattr(response, "llm_output", None) or {}
+        if llm_output.get("token_usage"):
+            return llm_output["token_usage"]
+        # 流式调用时usage在消息的usage_metadata中（需要ChatOpenAI开启stream_usage）
+        for generations in getattr(response, "generations", None) or []:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None)
+                if usage:
+                    return dict(usage)
+        return None
+
+
+# ------------------------------ 汇总 ------------------------------
+
+USAGE_KEY_PREFIX = "llm_usage"
+_SUMMARY_FIELDS = (
+    "calls", "errors", "cache_hits", "retries", "input_tokens", "output_tokens",
+    "cost", "latency_seconds", "queue_wait_seconds", "ttft_seconds", "ttft_calls",
+    "hedges", "hedge_wins",
+)
+
+
+class LLMTelemetry:
+    """LLM调用遥测：导出Prometheus指标，并按项目/阶段汇总到Redis（跨worker）"""
+
+    @staticmethod
+    def usage_key(project_id: str) -> str:
+        return f"{USAGE_KEY_PREFIX}:{project_id}"
+
+    @classmethod
+    async def record(cls, record: LLMCallRecord) -> None:
+        """记录一次调用，失败只记录日志，不影响主流程"""
+        try:
+            cls._observe(record)
+        except Exception as e:
+            logger.warning(f"记录LLM指标失败: {str(e)}")
+
+        if record.project_id == "unknown":
+            return
+        try:
+            await cls._add_to_summary(record)
+        except Exception as e:
+            logger.warning(f"记录项目LLM用量失败: {record.project_id}, error: {str(e)}")
+
+    @staticmethod
+    def _observe(record: LLMCallRecord) -> None:
+        labels = {"stage": record.stage, "model": record.model}
+        CALLS.labels(outcome=record.outcome, **labels).inc()
+        if record.retries:
+            RETRIES.labels(**labels).inc(record.retries)
+        if record.hedged:
+            HEDGES.labels(result="won" if record.hedge_won else "lost", **labels).inc()
+        if record.cache_hit:
+            return
+        QUEUE_WAIT.labels(**labels).observe(record.queue_wait)
+        if record.outcome == "success":
+            CALL_LATENCY.labels(**labels).observe(record.latency)
+            if record.ttft is not None:
+                TIME_TO_FIRST_TOKEN.labels(**labels).observe(record.ttft)
+        TOKENS.labels(direction="input", **labels).inc(record.input_tokens)
+        TOKENS.labels(direction="output", **labels).inc(record.output_tokens)
+        COST.labels(**labels).inc(record.cost)
+
+    @classmethod
+    async def _add_to_summary(cls, record: LLMCallRecord) -> None:
+        values = {
+            "calls": 1,
+            "errors": int(record.outcome == "error"),
+            "cache_hits": int(record.cache_hit),
+            "retries": record.retries,
+            "input_tokens": record.input_tokens,
+            "output_tokens": record.output_tokens,
+            "cost": record.cost,
+            "latency_seconds": record.latency,
+            "queue_wait_seconds": record.queue_wait,
+            "ttft_seconds": record.ttft or 0.0,
+            "ttft_calls": int(record.ttft is not None),
+            "hedges": int(record.hedged),
+            "hedge_wins": int(record.hedge_won),
+        }
+        key = cls.usage_key(record.project_id)
+        client = await RedisClient.get_client()
+        async with client.pipeline(transaction=False) as pipe:
+            for name, value in values.items():
+                if value:
+                    pipe.hincrbyfloat(key, f"{record.stage}|{record.builder}|{name}", value)
+            pipe.expire(key, settings.LLM_USAGE_SUMMARY_TTL)
+            await pipe.execute()
+
+    @classmethod
+    async def project_summary(cls, project_id: str) -> Dict[str, Any]:
+        """某个项目按阶段汇总的调用次数、token、费用和延迟"""
+        client = await RedisClient.get_client()
+        raw = await client.hgetall(cls.usage_key(project_id))
+
+        stages: Dict[str, Dict[str, Any]] = {}
+        for field_name, value in raw.items():
+            if isinstance(field_name, bytes):
+                field_name = field_name.decode()
+            stage, builder, name = field_name.split("|", 2)
+            stage_summary = stages.setdefault(stage, {"builders": [], **{f: 0.0 for f in _SUMMARY_FIELDS}})
+            if builder not in stage_summary["builders"]:
+                stage_summary["builders"].append(builder)
+            stage_summary[name] += float(value)
+
+        total = {f: sum(s[f] for s in stages.values()) for f in _SUMMARY_FIELDS}
+        for summary in [*stages.values(), total]:
+            cls._finalize(summary)
+        return {"project_id": project_id, "stages": stages, "total": total}
+
+    @staticmethod
+    def _finalize(summary: Dict[str, Any]) -> None:
+        provider_calls = summary["calls"] - summary["cache_hits"]
+        summary["avg_latency_seconds"] = round(summary["latency_seconds"] / provider_calls, 3) if provider_calls else 0.0
+        summary["avg_ttft_seconds"] = round(summary["ttft_seconds"] / summary["ttft_calls"], 3) if summary["ttft_calls"] else None
+        summary["cost"] = round(summary["cost"], 4)
+        for name in ("calls", "errors", "cache_hits", "retries", "input_tokens", "output_tokens", "ttft_calls", "hedges", "hedge_wins"):
+            summary[name] = int(summary[name])
+
+    @staticmethod
+    def metrics() -> tuple:
+        """Prometheus文本格式的指标，返回 (内容, content_type)"""
+        return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+LLM输出JSON提取基准：旧的 正则清洗 + json.loads vs JSONExtractor
+
+运行：
+    PYTHONPATH=. python app/services/llm/tests/bench_json_extractor.py [语料]
+
+语料（任选其一）：
+- 不带参数：读取 LLM_CACHE_DIR 下磁盘缓存的真实响应（需开启 LLM_CACHE_PERSIST）；没有缓存时使用合成语料
+- 目录：递归读取其中的 *.json 缓存文件（{"response": ...}）
+- .jsonl 文件：每行一个字符串，或包含 "response"/"output" 字段的对象
+
+合成语料按一定比例注入常见缺陷（尾随逗号、截断、中文引号、代码块前后的说明文字）。
+报告两种方式的解析成功率、保留的元素数和单条耗时（含修复路径），以及旧方法可解析的输出上两者的单条耗时。
+"""
+
+import sys
+import json
+import random
+import re
+import time
+from pathlib import Path
+from typing import List
+
+from app.services.llm.json_extractor import JSONExtractor
+
+
+def legacy_parse(output: str):
+    output = re.sub(r'^```\w*\n', '', output)
+    output = re.sub(r'\n```$', '', output)
+    output = re.sub(r'^```\w*\n(.*)\n```$', r'\1', output, flags=re.DOTALL)
+    return json.loads(output.strip())
+
+
+def synthetic_corpus(count: int = 500, seed: int = 42) -> List[str]:
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        headings = [
+            {"position": position, "level": rng.randint(1, 3), "title": f"第{position}节 关于“投标文件”的说明"}
+            for position in sorted(rng.sample(range(2000), rng.randint(5, 60)))
+        ]
+        text = json.dumps(headings, ensure_ascii=False, indent=2)
+        defect = rng.random()
+        if defect < 0.05:
+            text = text[:-2] + ",\n]"
+        elif defect < 0.08:
+            text = text[:rng.randint(len(text) // 2, len(text) - 5)]
+        elif defect < 0.10:
+            text = text.replace('"title"', "“title”")
+        elif defect < 0.15:
+            text = f"以下是识别结果：\n```json\n{text}\n```\n以上标题按position排序。"
+        else:
+            text = f"```json\n{text}\n```"
+        corpus.append(text)
+    return corpus
+
+
+def load_corpus(source: str = None) -> List[str]:
+    if source is None:
+        from app.core.config import settings
+        source = settings.LLM_CACHE_DIR
+        if not Path(source).is_dir():
+            return synthetic_corpus()
+
+    path = Path(source)
+    corpus = []
+    if path.is_dir():
+        for file in path.rglob("*.json"):
+            with open(file, "r", encoding="utf-8") as f:
+                response = json.load(f).get("response")
+            if isinstance(response, str):
+                corpus.append(response)
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                corpus.append(record if isinstance(record, str) else record.get("response") or record.get("output"))
+    return [text for text in corpus if text] or synthetic_corpus()
+
+
+def run(corpus: List[str], parse) -> dict:
+    ok = items = 0
+    start = time.perf_counter()
+    for text in corpus:
+        try:
+            value = parse(text)
+        except (ValueError, json.JSONDecodeError):
+            continue
+        ok += 1
+        items += len(value) if isinstance(value, list) else 1
+    elapsed = time.perf_counter() - start
+    return {"ok": ok, "items": items, "us_per_output": elapsed / len(corpus) * 1e6}
+
+
+def main(source: str = None):
+    corpus = load_corpus(source)
+    print(f"语料: {len(corpus)}条, 平均长度 {sum(map(len, corpus)) // len(corpus)} 字符")
+
+    extract = lambda text: JSONExtractor.extract(text).value
+    JSONExtractor.reset_stats()
+    for name, parse in (("正则+json.loads", legacy_parse), ("JSONExtractor", extract)):
+        result = run(corpus, parse)
+        print(f"[{name}] 解析成功 {result['ok']}/{len(corpus)} ({result['ok'] / len(corpus):.1%}), "
+              f"保留元素 {result['items']}, 单条 {result['us_per_output']:.1f} µs")
+    print(f"JSONExtractor统计: {JSONExtractor.stats()}")
+
+    # 只比较旧方法也能解析的输出（即 JSONExtractor 的快速路径）
+    parsable = []
+    for text in corpus:
+        try:
+            legacy_parse(text)
+            parsable.append(text)
+        except (ValueError, json.JSONDecodeError):
+            pass
+    if parsable:
+        legacy, fast = run(parsable, legacy_parse), run(parsable, extract)
+        print(f"旧方法可解析的{len(parsable)}条: 正则+json.loads {legacy['us_per_output']:.1f} µs, "
+              f"JSONExtractor {fast['us_per_output']:.1f} µs")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+对冲请求基准测试（模拟长尾延迟，不访问网络）
+
+模拟L2/L3阶段的并行扇出：每轮N个章节请求，阶段耗时取决于最慢的请求。
+首token延迟服从对数正态分布，另有少量请求落入长尾（p99约为中位数的5~10倍）。
+对比开启/未开启对冲时，单个请求和整个阶段的p50/p95耗时，以及额外发出的请求比例。
+
+运行：PYTHONPATH=. python app/services/llm/tests/bench_llm_hedging.py
+"""
+
+import asyncio
+import random
+import time
+
+from app.services.llm.hedging import HedgedCall, HedgePolicy, LatencyWindow
+
+
+N_ROUNDS = 30
+N_CHAPTERS = 20
+TTFT_MEDIAN = 0.05          # 秒（按比例缩小的真实延迟）
+TAIL_RATE = 0.05            # 落入长尾的请求比例
+TAIL_FACTOR = 8.0           # 长尾请求的延迟倍数
+GENERATION_SECONDS = 0.05   # 首token之后的生成耗时
+
+
+def sample_ttft(rng: random.Random) -> float:
+    ttft = rng.lognormvariate(0, 0.3) * TTFT_MEDIAN
+    if rng.random() < TAIL_RATE:
+        ttft *= TAIL_FACTOR
+    return ttft
+
+
+async def run_stage(policy: HedgePolicy, rng: random.Random, hedging: bool, counters: dict) -> float:
+    """执行一轮扇出，返回阶段耗时"""
+
+    async def one_call() -> None:
+        call = HedgedCall([])
+        ttfts = [sample_ttft(rng), sample_ttft(rng)]
+
+        async def attempt(index, callbacks):
+            counters["requests"] += 1
+            await asyncio.sleep(ttfts[index])
+            for callback in callbacks:
+                await callback.on_llm_new_token("x")
+            await asyncio.sleep(GENERATION_SECONDS)
+
+        def allow_hedge() -> bool:
+            if not policy.budget.try_spend():
+                policy.skipped_budget += 1
+                return False
+            policy.hedges += 1
+            return True
+
+        start = time.monotonic()
+        policy.budget.deposit()
+        _, winner = await call.run(attempt, policy.hedge_delay() if hedging else None, allow_hedge)
+        latency = time.monotonic() - start
+        policy.hedge_wins += winner > 0
+        policy.observe(latency - GENERATION_SECONDS, latency, hedging=hedging)
+
+    start = time.monotonic()
+    await asyncio.gather(*[one_call() for _ in range(N_CHAPTERS)])
+    return time.monotonic() - start
+
+
+async def bench(hedging: bool) -> dict:
+    rng = random.Random(42)
+    policy = HedgePolicy("bench", percentile=0.9, min_samples=20, min_delay=0.0, budget_ratio=0.1, budget_burst=5)
+    # 预热：积累首响应时间样本
+    for _ in range(50):
+        policy.first_response.add(sample_ttft(rng))
+
+    counters = {"requests": 0}
+    stage = LatencyWindow(N_ROUNDS)
+    for _ in range(N_ROUNDS):
+        stage.add(await run_stage(policy, rng, hedging, counters))
+
+    calls = N_ROUNDS * N_CHAPTERS
+    return {
+        "call": policy.latency[hedging].summary(),
+        "stage": stage.summary(),
+        "extra_requests": (counters["requests"] - calls) / calls,
+        "hedge_wins": policy.hedge_wins,
+    }
+
+
+def fmt(summary: dict) -> str:
+    return f"p50 {summary['p50_seconds'] * 1000:7.1f} ms   p95 {summary['p95_seconds'] * 1000:7.1f} ms"
+
+
+async def main():
+    print(f"每轮章节数: {N_CHAPTERS}, 轮数: {N_ROUNDS}, 长尾比例: {TAIL_RATE:.0%} x{TAIL_FACTOR}")
+    for hedging in (False, True):
+        result = await bench(hedging)
+        label = "开启对冲" if hedging else "未开启对冲"
+        print(f"[{label}] 单个请求: {fmt(result['call'])}")
+        print(f"[{label}] 整个阶段: {fmt(result['stage'])}")
+        print(f"[{label}] 额外请求比例: {result['extra_requests']:.1%}, 对冲胜出: {result['hedge_wins']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
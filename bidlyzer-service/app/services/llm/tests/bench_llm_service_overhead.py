@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+LLM服务单次请求开销基准测试（使用模拟模型，不访问网络）
+
+对比两种路径：
+- 旧路径：每个请求新建 ChatOpenAI、编译 prompt 模板和 chain
+- 注册表路径：LLMServiceRegistry 按 (模型配置, 模板, 系统角色) 复用已编译的服务
+
+运行：PYTHONPATH=. python app/services/llm/tests/bench_llm_service_overhead.py
+"""
+
+import asyncio
+import time
+from langchain_openai import ChatOpenAI
+from langchain_core.language_models import FakeListChatModel
+
+from app.services.llm.llm_models import LLMConfigModel, LLMRequestModel
+from app.services.llm.llm_service import LLMService
+from app.services.llm.llm_registry import LLMServiceRegistry
+
+
+N_REQUESTS = 200
+
+PROMPT_TEMPLATE = """
+# 上下文
+{context}
+
+# 任务
+{instruction}
+
+# 补充
+{supplement}
+
+# 输出格式
+{output_format}
+"""
+
+SYSTEM_ROLE = "你是一个招标文件分析专家"
+
+
+def make_config() -> LLMConfigModel:
+    return LLMConfigModel(
+        llm_model_name="qwen-max-0125",
+        temperature=0.2,
+        top_p=0.6,
+        streaming=False,
+        api_key="bench-dummy-key",
+    )
+
+
+def make_request(i: int) -> LLMRequestModel:
+    return LLMRequestModel(
+        context=f"第{i}章 内容" * 20,
+        instruction="识别章节标题",
+        supplement="",
+        output_format="JSON",
+    )
+
+
+def fake_model() -> FakeListChatModel:
+    return FakeListChatModel(responses=['[{"position": 1, "level": 2}]'])
+
+
+async def bench_per_request_path(n: int) -> float:
+    """旧路径：每个请求都新建模型客户端并重新编译chain"""
+    config = make_config()
+    start = time.perf_counter()
+    for i in range(n):
+        # 原先 create_service 中每次都会构建的 ChatOpenAI（构建开销计入，但不发起调用）
+        ChatOpenAI(
+            model_name=config.llm_model_name,
+            temperature=config.temperature,
+            top_p=config.top_p,
+            api_key=config.api_key,
+            base_url=config.base_url,
+            timeout=config.timeout,
+        )
+        service = LLMService(config, PROMPT_TEMPLATE, SYSTEM_ROLE, llm=fake_model())
+        await service.process(make_request(i))
+    return (time.perf_counter() - start) / n
+
+
+async def bench_registry_path(n: int) -> float:
+    """注册表路径：同一配置和模板只构建一次"""
+    LLMServiceRegistry.clear()
+    original = LLMServiceRegistry._create_llm
+    LLMServiceRegistry._create_llm = classmethod(lambda cls, config: fake_model())
+    try:
+        config = make_config()
+        start = time.perf_counter()
+        for i in range(n):
+            service = LLMServiceRegistry.get_service(config, PROMPT_TEMPLATE, SYSTEM_ROLE)
+            await service.process(make_request(i))
+        return (time.perf_counter() - start) / n
+    finally:
+        LLMServiceRegistry._create_llm = original
+
+
+async def main():
+    per_request = await bench_per_request_path(N_REQUESTS)
+    registry = await bench_registry_path(N_REQUESTS)
+    print(f"请求数: {N_REQUESTS}")
+    print(f"旧路径   单次请求耗时: {per_request * 1000:.3f} ms")
+    print(f"注册表路径 单次请求耗时: {registry * 1000:.3f} ms")
+    print(f"每请求节省: {(per_request - registry) * 1000:.3f} ms ({per_request / registry:.1f}x)")
+    print(f"注册表统计: {LLMServiceRegistry.stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,121 @@
+import asyncio
+import random
+import pytest
+from app.services.llm.adaptive_limiter import AdaptiveConcurrencyLimiter
+
+pytestmark = [pytest.mark.unit]
+
+
+def make_limiter(**kwargs) -> AdaptiveConcurrencyLimiter:
+    params = dict(initial_limit=4, min_limit=1, max_limit=8, cooldown=0)
+    params.update(kwargs)
+    return AdaptiveConcurrencyLimiter("test", **params)
+
+
+@pytest.mark.asyncio
+async def test_slot_caps_in_flight():
+    limiter = make_limiter(initial_limit=2)
+    peak = 0
+
+    async def work():
+        nonlocal peak
+        async with limiter.slot():
+            peak = max(peak, limiter.in_flight)
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*[work() for _ in range(10)])
+    assert peak == 2
+    assert limiter.in_flight == 0
+    assert limiter.stats()["max_waiting"] > 0
+
+
+def test_additive_increase_when_saturated():
+    limiter = make_limiter()
+    limiter.in_flight = limiter.current_limit
+    for _ in range(20):
+        limiter.on_success(1.0)
+    assert limiter.current_limit > 4
+    assert limiter.current_limit <= 8
+
+
+def test_no_increase_when_underutilized():
+    limiter = make_limiter()
+    for _ in range(20):
+        limiter.on_success(1.0)
+    assert limiter.current_limit == 4
+
+
+def test_multiplicative_decrease_on_overload():
+    limiter = make_limiter(initial_limit=8)
+    limiter.on_overload()
+    assert limiter.current_limit == 4
+    limiter.on_overload()
+    limiter.on_overload()
+    limiter.on_overload()
+    assert limiter.current_limit == 1
+
+
+def test_cooldown_limits_decrease_to_once():
+    limiter = make_limiter(initial_limit=8, cooldown=60)
+    for _ in range(5):
+        limiter.on_overload()
+    assert limiter.current_limit == 4
+    assert limiter.stats()["decreases"] == 1
+
+
+def test_latency_degradation_backs_off():
+    limiter = make_limiter(initial_limit=8)
+    limiter.on_success(1.0)
+    for _ in range(10):
+        limiter.on_success(5.0)
+    assert limiter.current_limit < 8
+
+
+def test_mixed_completion_sizes_do_not_shrink_limit():
+    """各阶段输出长短不一但服务端并未过载：总耗时相差几十倍，上限不应下调"""
+    limiter = make_limiter(initial_limit=4)
+    limiter.in_flight = limiter.current_limit
+    rng = random.Random(0)
+    for _ in range(200):
+        stage, tokens = rng.choice([("L1", (20, 200)), ("L2L3", (200, 4000)), ("topic", (50, 1500))])
+        output_tokens = rng.randint(*tokens)
+        latency = 0.5 + 0.02 * output_tokens * rng.uniform(0.8, 1.2)
+        limiter.on_success(latency, output_tokens=output_tokens, stage=stage)
+    assert limiter.stats()["decreases"] == 0
+    assert limiter.current_limit >= 4
+    assert set(limiter.stats()["latency"]) == {"L1|per_token", "L2L3|per_token", "topic|per_token"}
+
+
+def test_ttft_degradation_backs_off_per_stage():
+    limiter = make_limiter(initial_limit=8)
+    for _ in range(10):
+        limiter.on_success(30.0, ttft=0.5, stage="L2L3")
+    # 其他阶段的慢请求不影响L2L3的基线
+    for _ in range(10):
+        limiter.on_success(2.0, ttft=0.3, stage="L1")
+    assert limiter.current_limit == 8
+    for _ in range(5):
+        limiter.on_success(30.0, ttft=3.0, stage="L2L3")
+    assert limiter.current_limit < 8
+
+
+def test_error_rate_backs_off():
+    limiter = make_limiter(initial_limit=8)
+    for _ in range(10):
+        limiter.on_error()
+    assert limiter.current_limit < 8
+    assert limiter.stats()["error_rate"] == 1.0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_leak_slot():
+    limiter = make_limiter(initial_limit=1)
+    await limiter._acquire()
+    waiter = asyncio.ensure_future(limiter._acquire())
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    limiter._release()
+    assert limiter.in_flight == 0
+    assert limiter.stats()["waiting"] == 0
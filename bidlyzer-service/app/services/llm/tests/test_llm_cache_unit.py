@@ -0,0 +1,81 @@
+import pytest
+import pytest_asyncio
+from conftest import skip_if_no_redis
+from app.core.config import settings
+from app.core.redis_helper import RedisClient
+from app.services.llm.llm_models import LLMConfigModel
+from app.services.llm.llm_cache import LLMResponseCache
+
+pytestmark = [pytest.mark.unit]
+
+TEST_MODEL = "unit-test-model"
+
+
+def make_config(**kwargs) -> LLMConfigModel:
+    params = dict(llm_model_name=TEST_MODEL, temperature=0.2, top_p=0.6, api_key="k1")
+    params.update(kwargs)
+    return LLMConfigModel(**params)
+
+
+def test_key_depends_on_sampling_params_and_prompt():
+    base = LLMResponseCache.make_key(make_config(), "role", "prompt")
+
+    assert base == LLMResponseCache.make_key(make_config(), "role", "prompt")
+    assert base != LLMResponseCache.make_key(make_config(temperature=0.7), "role", "prompt")
+    assert base != LLMResponseCache.make_key(make_config(top_p=0.9), "role", "prompt")
+    assert base != LLMResponseCache.make_key(make_config(), "other role", "prompt")
+    assert base != LLMResponseCache.make_key(make_config(), "role", "prompt 2")
+
+
+def test_key_ignores_api_key_and_transport_settings():
+    base = LLMResponseCache.make_key(make_config(), "role", "prompt")
+    other = LLMResponseCache.make_key(make_config(api_key="k2", timeout=90, streaming=False), "role", "prompt")
+    assert base == other
+
+
+def test_key_is_grouped_by_model():
+    key = LLMResponseCache.make_key(make_config(llm_model_name="qwen/max"), "role", "prompt")
+    assert key.startswith("llm_cache:qwen_max:")
+
+
+@pytest_asyncio.fixture
+async def llm_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_CACHE_PERSIST", True)
+    monkeypatch.setattr(settings, "LLM_CACHE_DIR", tmp_path)
+    LLMResponseCache.reset_stats()
+    yield LLMResponseCache
+    await LLMResponseCache.invalidate_model(TEST_MODEL)
+    LLMResponseCache.reset_stats()
+    await RedisClient.close()
+
+
+@skip_if_no_redis
+@pytest.mark.redis
+@pytest.mark.asyncio
+async def test_cache_roundtrip_and_disk_backfill(llm_cache):
+    key = llm_cache.make_key(make_config(), "role", "prompt")
+
+    assert await llm_cache.get(key) is None
+    assert await llm_cache.set(key, '{"ok": true}')
+    assert await llm_cache.get(key, input_tokens=100) == '{"ok": true}'
+
+    # Redis中过期后从磁盘回填
+    await RedisClient.delete(key)
+    assert await llm_cache.get(key) == '{"ok": true}'
+
+    stats = llm_cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+    assert stats["disk_hits"] == 1
+    assert stats["saved_input_tokens"] == 100
+
+
+@skip_if_no_redis
+@pytest.mark.redis
+@pytest.mark.asyncio
+async def test_invalidate_model(llm_cache):
+    key = llm_cache.make_key(make_config(), "role", "prompt")
+    await llm_cache.set(key, "result")
+
+    assert await llm_cache.invalidate_model(TEST_MODEL) == 1
+    assert await llm_cache.get(key) is None
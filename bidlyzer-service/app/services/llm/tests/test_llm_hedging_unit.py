@@ -0,0 +1,147 @@
+import asyncio
+import pytest
+from app.services.llm.hedging import HedgeBudget, HedgedCall, HedgePolicy, HedgeRejected, LatencyWindow
+
+pytestmark = [pytest.mark.unit]
+
+
+class _Recorder:
+    """记录转发到原始回调的token"""
+
+    def __init__(self):
+        self.tokens = []
+        self.ended = 0
+
+    async def on_llm_new_token(self, token, **kwargs):
+        self.tokens.append(token)
+
+    def on_llm_end(self, response, **kwargs):
+        self.ended += 1
+
+
+def streaming_attempt(first_token_delays, output="ok", errors=None, started=None):
+    """模拟流式请求：第index个请求在first_token_delays[index]秒后产生首token"""
+    errors = errors or {}
+
+    async def attempt(index, callbacks):
+        if started is not None:
+            started.append(index)
+        await asyncio.sleep(first_token_delays[index])
+        if index in errors:
+            raise errors[index]
+        for callback in callbacks:
+            await callback.on_llm_new_token(f"{index}:{output}")
+        await asyncio.sleep(0.01)
+        for callback in callbacks:
+            await callback.on_llm_end(None)
+        return f"{index}:{output}"
+
+    return attempt
+
+
+def test_latency_window_percentiles():
+    window = LatencyWindow(size=100)
+    assert window.percentile(0.9) is None
+    for value in range(1, 101):
+        window.add(value / 100)
+    assert window.percentile(0.5) == 0.5
+    assert window.percentile(0.9) == 0.9
+    assert window.summary()["p95_seconds"] == 0.95
+
+
+def test_budget_caps_hedges_to_ratio():
+    budget = HedgeBudget(ratio=0.1, burst=5)
+    spent = 0
+    for _ in range(1000):
+        budget.deposit()
+        spent += budget.try_spend()
+    assert 99 <= spent <= 100
+
+    budget = HedgeBudget(ratio=0.1, burst=2)
+    for _ in range(100):
+        budget.deposit()
+    assert budget.balance == 2
+
+
+def test_policy_waits_for_samples_before_hedging():
+    policy = HedgePolicy("L2L3|qwen", percentile=0.9, min_samples=10, min_delay=0.5)
+    for _ in range(9):
+        policy.observe(2.0, 3.0, hedging=False)
+    assert policy.hedge_delay() is None
+
+    policy.observe(2.0, 3.0, hedging=False)
+    assert policy.hedge_delay() == 2.0
+    assert policy.stats()["latency_without_hedging"]["samples"] == 10
+
+
+@pytest.mark.asyncio
+async def test_fast_primary_is_not_hedged():
+    recorder = _Recorder()
+    call = HedgedCall([recorder])
+    started = []
+    result, winner = await call.run(streaming_attempt([0.01, 0.01], started=started), delay=0.1, allow_hedge=lambda: True)
+    assert (result, winner) == ("0:ok", 0)
+    assert started == [0]
+    assert not call.hedged
+    assert recorder.tokens == ["0:ok"]
+
+
+@pytest.mark.asyncio
+async def test_slow_primary_is_hedged_and_cancelled():
+    recorder = _Recorder()
+    call = HedgedCall([recorder])
+    result, winner = await call.run(streaming_attempt([5, 0.01]), delay=0.05, allow_hedge=lambda: True)
+    assert (result, winner) == ("1:ok", 1)
+    assert call.hedged
+    # 只有胜出请求的输出转发给原始回调
+    assert recorder.tokens == ["1:ok"]
+    assert recorder.ended == 1
+
+
+@pytest.mark.asyncio
+async def test_primary_wins_after_hedge_issued():
+    recorder = _Recorder()
+    call = HedgedCall([recorder])
+    result, winner = await call.run(streaming_attempt([0.1, 5]), delay=0.05, allow_hedge=lambda: True)
+    assert (result, winner) == ("0:ok", 0)
+    assert call.hedged
+    assert recorder.tokens == ["0:ok"]
+
+
+@pytest.mark.asyncio
+async def test_hedge_not_allowed_waits_for_primary():
+    call = HedgedCall([])
+    started = []
+    result, winner = await call.run(
+        streaming_attempt([0.1, 0.01], started=started), delay=0.02, allow_hedge=lambda: False,
+    )
+    assert (result, winner) == ("0:ok", 0)
+    assert started == [0]
+
+
+@pytest.mark.asyncio
+async def test_failed_attempt_falls_back_to_other():
+    call = HedgedCall([])
+    attempt = streaming_attempt([0.1, 0.2], errors={0: ValueError("primary failed")})
+    result, winner = await call.run(attempt, delay=0.02, allow_hedge=lambda: True)
+    assert (result, winner) == ("1:ok", 1)
+
+
+@pytest.mark.asyncio
+async def test_rejected_hedge_keeps_primary_error():
+    call = HedgedCall([])
+    attempt = streaming_attempt(
+        [0.1, 0.01], errors={0: ValueError("primary failed"), 1: HedgeRejected("no tokens")},
+    )
+    with pytest.raises(ValueError):
+        await call.run(attempt, delay=0.02, allow_hedge=lambda: True)
+
+
+@pytest.mark.asyncio
+async def test_non_streaming_winner_is_first_to_complete():
+    async def attempt(index, callbacks):
+        await asyncio.sleep([1, 0.01][index])
+        return index
+
+    call = HedgedCall([])
+    assert await call.run(attempt, delay=0.02, allow_hedge=lambda: True) == (1, 1)
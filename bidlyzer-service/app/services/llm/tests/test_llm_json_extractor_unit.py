@@ -0,0 +1,109 @@
+import json
+import pytest
+from app.services.llm.json_extractor import JSONExtractor, extract_json
+from app.services.llm.llm_output_processor import LLMOutputProcessor
+
+pytestmark = [pytest.mark.unit]
+
+
+HEADINGS = [
+    {"level": 1, "position": 12, "title": "一、投标人须知"},
+    {"level": 2, "position": 15, "title": "1.1 说明[含括号]和\"引号\""},
+    {"level": 1, "position": 30, "title": "二、评标办法"},
+]
+RAW = json.dumps(HEADINGS, ensure_ascii=False, indent=2)
+
+
+@pytest.fixture(autouse=True)
+def reset_stats():
+    JSONExtractor.reset_stats()
+    yield
+    JSONExtractor.reset_stats()
+
+
+@pytest.mark.parametrize("output", [
+    RAW,
+    f"```json\n{RAW}\n```",
+    f"以下是识别结果：\n```json\n{RAW}\n```\n如有疑问请告知[备注]。",
+    f"结果如下 {RAW} 以上。",
+])
+def test_clean_outputs(output):
+    result = JSONExtractor.extract(output)
+    assert result.value == HEADINGS
+    assert result.outcome in ("clean", "repaired")
+
+
+def test_fast_path_counts_as_clean():
+    assert extract_json(f"```json\n{RAW}\n```") == HEADINGS
+    assert JSONExtractor.stats()["clean"] == 1
+
+
+@pytest.mark.parametrize("output, repair", [
+    ('[{"level": 1, "position": 12, "title": "a"},]', "trailing_comma"),
+    ('[{"level": 1, "position": 12, "title": "a",}]', "trailing_comma"),
+    ('[{"level": 1, "position": 12, "title": "a"}\n{"level": 1, "position": 13, "title": "b"}]', "missing_comma"),
+    ('[{“level”: 1, “position”: 12, “title”: “a”}]', "smart_quotes"),
+    ('[{"level"：1，"position"：12，"title"："a"}]', "fullwidth_punct"),
+    ('[{"level": 1, "position": 12, "title": "a\nb"}]', "control_char"),
+    ('[{"level": 1, "position": 12, "title": "a"},, {"level": 1, "position": 13, "title": "b"}]', "extra_comma"),
+])
+def test_repairs(output, repair):
+    result = JSONExtractor.extract(output)
+    assert repair in result.repairs
+    assert result.outcome == "repaired"
+    assert result.value[0]["position"] == 12
+    assert JSONExtractor.stats()["repairs"][repair] == 1
+
+
+@pytest.mark.parametrize("output, expected", [
+    ("[1 2]", [1, 2]),
+    ("[true null 3.5]", [True, None, 3.5]),
+    ('["a" "b" 1]', ["a", "b", 1]),
+    ('{"position": 1 "level": 2}', {"position": 1, "level": 2}),
+    ("[[1] 2 [3]]", [[1], 2, [3]]),
+])
+def test_adjacent_values_are_not_merged(output, expected):
+    result = JSONExtractor.extract(output)
+    assert result.value == expected
+    assert result.repairs == ["missing_comma"]
+
+
+def test_smart_quotes_inside_strings_are_kept():
+    value = extract_json('[{"title": "关于“投标保证金”的说明", "position": 3},]')
+    assert value == [{"title": "关于“投标保证金”的说明", "position": 3}]
+
+
+def test_truncated_stream_keeps_complete_objects():
+    output = "```json\n" + RAW[:RAW.index('"二、评标办法"')]
+    result = JSONExtractor.extract(output)
+
+    assert result.salvaged
+    assert result.value == HEADINGS[:2]
+    assert JSONExtractor.stats()["salvaged"] == 1
+
+
+def test_truncated_nested_object_closes_brackets():
+    value = extract_json('{"headings": [{"position": 1, "title": "a"}, {"position": 2, "ti')
+    assert value == {"headings": [{"position": 1, "title": "a"}]}
+
+
+@pytest.mark.parametrize("output", ["没有识别到标题", '[{"position": 1, "ti'])
+def test_unrecoverable_outputs_raise(output):
+    with pytest.raises(json.JSONDecodeError):
+        extract_json(output)
+    assert JSONExtractor.stats()["failed"] == 1
+
+
+def test_merge_outputs_salvages_instead_of_dropping_chunk():
+    outputs = [
+        '[{"position": 1, "level": 1, "title": "a"},]',
+        '```json\n[{"position": 2, "level": 1, "title": "b"}, {"position": 3, "le',
+        "无法识别",
+    ]
+    merged = LLMOutputProcessor().merge_outputs(outputs)
+    assert [item["position"] for item in merged] == [1, 2]
+
+
+def test_escapes_inside_strings_survive_repair():
+    value = extract_json('[{"title": "a\\"b\\\\", "note": "c\\nd“e”"}, ]')
+    assert value == [{"title": 'a"b\\', "note": "c\nd“e”"}]
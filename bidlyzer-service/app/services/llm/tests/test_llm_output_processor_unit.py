@@ -0,0 +1,44 @@
+import json
+import pytest
+from app.services.llm.llm_output_processor import IncrementalJSONParser, LLMOutputProcessor
+
+pytestmark = [pytest.mark.unit]
+
+
+HEADINGS = [
+    {"level": 1, "position": 12, "title": "一、投标人须知"},
+    {"level": 2, "position": 15, "title": "1.1 说明{含括号}和\"引号\""},
+    {"level": 1, "position": 30, "title": "二、评标办法"},
+]
+
+
+def stream(text: str, size: int):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 1000])
+def test_incremental_parser_matches_full_parse(size):
+    output = "```json\n" + json.dumps(HEADINGS, ensure_ascii=False, indent=2) + "\n```"
+    parser = IncrementalJSONParser()
+    objects = []
+    for chunk in stream(output, size):
+        objects.extend(parser.feed(chunk))
+
+    assert objects == HEADINGS
+    assert objects == LLMOutputProcessor().merge_outputs([output])
+
+
+def test_incremental_parser_emits_objects_as_soon_as_closed():
+    parser = IncrementalJSONParser()
+    assert parser.feed('[{"level": 1, "position": 3, "title": "a"}, {"level": 2,') == [
+        {"level": 1, "position": 3, "title": "a"}
+    ]
+    assert parser.feed(' "position": 5, "title": "b\\\\"}') == [{"level": 2, "position": 5, "title": "b\\"}]
+    assert parser.feed("]") == []
+
+
+def test_incremental_parser_skips_broken_objects():
+    parser = IncrementalJSONParser()
+    objects = parser.feed('[{"level": 1, position: 3}, {"level": 1, "position": 4, "title": "ok"}]')
+    assert objects == [{"level": 1, "position": 4, "title": "ok"}]
+    assert parser.errors == 1
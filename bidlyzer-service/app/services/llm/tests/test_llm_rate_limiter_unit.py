@@ -0,0 +1,120 @@
+import time
+import uuid
+import pytest
+import pytest_asyncio
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from conftest import skip_if_no_redis
+from app.core.redis_helper import RedisClient
+from app.services.llm.rate_limiter import (
+    TokenBucketLimiter,
+    RateLimitTimeoutError,
+    get_retry_after,
+    retry_backoff,
+)
+
+pytestmark = [pytest.mark.unit]
+
+
+class _Response:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+class _RateLimitError(Exception):
+    def __init__(self, headers):
+        super().__init__("429")
+        self.response = _Response(headers)
+
+
+def test_retry_after_seconds():
+    assert get_retry_after(_RateLimitError({"retry-after": "3"})) == 3.0
+
+
+def test_retry_after_ms_takes_priority():
+    error = _RateLimitError({"retry-after-ms": "1500", "retry-after": "3"})
+    assert get_retry_after(error) == 1.5
+
+
+def test_retry_after_http_date():
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+    error = _RateLimitError({"retry-after": format_datetime(retry_at, usegmt=True)})
+    assert 25 <= get_retry_after(error) <= 30
+
+
+def test_retry_after_missing():
+    assert get_retry_after(_RateLimitError({})) is None
+    assert get_retry_after(ValueError("no response")) is None
+
+
+def test_retry_backoff_is_jittered_exponential():
+    for attempt in range(1, 5):
+        wait = retry_backoff(attempt)
+        assert 2 ** attempt / 2 <= wait <= 2 ** attempt
+
+
+def test_retry_backoff_honours_retry_after():
+    wait = retry_backoff(1, retry_after=5)
+    assert 5 <= wait <= 6
+
+
+def test_retry_backoff_is_capped():
+    assert retry_backoff(20, cap=10) <= 10
+
+
+@pytest.mark.asyncio
+async def test_disabled_limiter_never_waits():
+    limiter = TokenBucketLimiter("disabled", requests_per_minute=0, tokens_per_minute=0, max_wait=1)
+    assert await limiter.acquire(10_000) == 0.0
+    assert limiter.stats()["acquired"] == 0
+
+
+@pytest_asyncio.fixture
+async def redis_limiter():
+    """每个测试使用独立的限流器名称，测试结束后清理键"""
+    limiter = TokenBucketLimiter(
+        f"test-{uuid.uuid4().hex[:8]}", requests_per_minute=120, tokens_per_minute=1200, max_wait=5
+    )
+    yield limiter
+    client = await RedisClient.get_client()
+    await client.delete(*limiter.keys)
+    await RedisClient.close()
+
+
+@skip_if_no_redis
+@pytest.mark.redis
+@pytest.mark.asyncio
+async def test_token_bucket_throttles_by_tokens(redis_limiter):
+    # 桶容量1200 token，按 1200/60 = 20 token/秒 补充
+    assert await redis_limiter.acquire(1200) < 0.5
+
+    start = time.monotonic()
+    await redis_limiter.acquire(20)
+    assert time.monotonic() - start >= 0.5
+
+    stats = redis_limiter.stats()
+    assert stats["acquired"] == 2
+    assert stats["throttled"] == 1
+    assert stats["queue_depth"] == 0
+
+
+@skip_if_no_redis
+@pytest.mark.redis
+@pytest.mark.asyncio
+async def test_block_for_pauses_all_callers(redis_limiter):
+    await redis_limiter.block_for(10)
+    with pytest.raises(RateLimitTimeoutError):
+        await redis_limiter.acquire(1)
+    assert redis_limiter.stats()["queue_depth"] == 0
+
+
+@skip_if_no_redis
+@pytest.mark.redis
+@pytest.mark.asyncio
+async def test_try_acquire_does_not_wait(redis_limiter):
+    assert await redis_limiter.try_acquire(1200)
+
+    start = time.monotonic()
+    assert not await redis_limiter.try_acquire(20)
+    assert time.monotonic() - start < 0.5
+    assert redis_limiter.stats()["throttled"] == 0
@@ -0,0 +1,109 @@
+import pytest
+from langchain_core.language_models import FakeListChatModel
+
+from app.core.config import settings
+from app.services.llm import llm_registry
+from app.services.llm.llm_models import LLMConfigModel, LLMRequestModel
+from app.services.llm.llm_registry import LLMServiceRegistry
+
+pytestmark = [pytest.mark.unit]
+
+
+@pytest.fixture
+def fake_registry(monkeypatch):
+    """用模拟模型替换 ChatOpenAI，测试结束后清空注册表"""
+    LLMServiceRegistry.clear()
+    monkeypatch.setattr(
+        LLMServiceRegistry,
+        "_create_llm",
+        classmethod(lambda cls, config: FakeListChatModel(responses=["ok"])),
+    )
+    yield LLMServiceRegistry
+    LLMServiceRegistry.clear()
+
+
+def make_config(**kwargs) -> LLMConfigModel:
+    return LLMConfigModel(api_key="test-key", **kwargs)
+
+
+def test_same_config_and_template_share_service(fake_registry):
+    config = make_config()
+    a = fake_registry.get_service(config, "{context}", "role")
+    b = fake_registry.get_service(make_config(), "{context}", "role")
+
+    assert a is b
+    assert a.chain is not None
+    stats = fake_registry.stats()
+    assert stats["services"] == 1
+    assert stats["service_hits"] == 1
+
+
+def test_different_template_shares_llm(fake_registry):
+    config = make_config()
+    a = fake_registry.get_service(config, "{context}", "role")
+    b = fake_registry.get_service(config, "{instruction}", "role")
+
+    assert a is not b
+    assert a.llm is b.llm
+    assert fake_registry.stats()["llms"] == 1
+
+
+def test_different_config_gets_new_llm(fake_registry):
+    a = fake_registry.get_service(make_config(temperature=0.2), "{context}", "role")
+    b = fake_registry.get_service(make_config(temperature=0.7), "{context}", "role")
+
+    assert a.llm is not b.llm
+    assert fake_registry.stats()["llms"] == 2
+
+
+def test_config_key_hides_api_key():
+    key = LLMServiceRegistry.config_key(make_config())
+    assert "test-key" not in key
+
+
+@pytest.mark.asyncio
+async def test_cached_service_processes_requests(fake_registry):
+    service = fake_registry.get_service(make_config(), "{context}", "role")
+    request = LLMRequestModel(context="内容", instruction="", supplement="", output_format="")
+
+    assert await service.process(request) == "ok"
+    assert await service.process(request) == "ok"
+
+
+def test_concurrent_creation_counts_only_registered_service(fake_registry, monkeypatch):
+    """并发创建同一服务时，后注册的一方拿到先注册的服务，service_created只计一次"""
+    service_class = llm_registry.LLMService
+    created = []
+
+    def create_service(**kwargs):
+        created.append(kwargs)
+        if len(created) == 1:
+            # 构建期间另一个请求先完成了注册
+            fake_registry.get_service(make_config(), "{context}", "role")
+        return service_class(**kwargs)
+
+    monkeypatch.setattr(llm_registry, "LLMService", create_service)
+    service = fake_registry.get_service(make_config(), "{context}", "role")
+
+    assert len(created) == 2
+    assert fake_registry.get_service(make_config(), "{context}", "role") is service
+    stats = fake_registry.stats()
+    assert (stats["service_created"], stats["services"]) == (1, 1)
+
+
+def test_registry_evicts_least_recently_used(fake_registry, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_REGISTRY_MAX_SERVICES", 2)
+    monkeypatch.setattr(settings, "LLM_REGISTRY_MAX_LLMS", 2)
+    config = make_config()
+    a = fake_registry.get_service(config, "{a}", "role")
+    fake_registry.get_service(config, "{b}", "role")
+    assert fake_registry.get_service(config, "{a}", "role") is a
+    fake_registry.get_service(config, "{c}", "role")
+
+    assert fake_registry.get_service(config, "{a}", "role") is a   # 最近使用过，未被淘汰
+    for temperature in (0.1, 0.2, 0.3):
+        fake_registry.get_llm(make_config(temperature=temperature))
+
+    stats = fake_registry.stats()
+    assert (stats["services"], stats["llms"]) == (2, 2)
+    assert stats["evictions"] == 3
@@ -0,0 +1,127 @@
+import asyncio
+import time
+import pytest
+from app.services.llm.adaptive_limiter import AdaptiveConcurrencyLimiter
+from app.services.llm.scheduler import (
+    BACKGROUND, BATCH, INTERACTIVE, DeadlineExceeded, FairPriorityQueue, LLMScheduler, WorkTicket,
+    llm_work_context,
+)
+
+pytestmark = [pytest.mark.unit]
+
+
+def drain(queue: FairPriorityQueue):
+    order = []
+    while (ticket := queue.pop()) is not None:
+        order.append((ticket.priority, ticket.tenant))
+    return order
+
+
+def test_priority_classes_are_served_in_order():
+    queue = FairPriorityQueue()
+    queue.push(WorkTicket(priority=BATCH, tenant="a"))
+    queue.push(WorkTicket(priority=BACKGROUND, tenant="a"))
+    queue.push(WorkTicket(priority=INTERACTIVE, tenant="b"))
+    assert [priority for priority, _ in drain(queue)] == [INTERACTIVE, BACKGROUND, BATCH]
+
+
+def test_tenants_take_turns_within_class():
+    queue = FairPriorityQueue()
+    for _ in range(3):
+        queue.push(WorkTicket(priority=BATCH, tenant="bulk"))
+    queue.push(WorkTicket(priority=BATCH, tenant="small"))
+    assert [tenant for _, tenant in drain(queue)] == ["bulk", "small", "bulk", "bulk"]
+
+
+def test_urgent_deadline_jumps_lower_classes():
+    queue = FairPriorityQueue(urgent_window=5)
+    queue.push(WorkTicket(priority=BACKGROUND, tenant="a"))
+    queue.push(WorkTicket(priority=BATCH, tenant="b", deadline=time.monotonic() + 1))
+    queue.push(WorkTicket(priority=INTERACTIVE, tenant="c"))
+    assert drain(queue) == [(INTERACTIVE, "c"), (BATCH, "b"), (BACKGROUND, "a")]
+
+
+def test_work_context_nests_and_keeps_earliest_deadline():
+    with llm_work_context(priority=BATCH, deadline_seconds=60, tenant="p1"):
+        with llm_work_context(priority=INTERACTIVE, deadline_seconds=600):
+            ticket = WorkTicket.from_context()
+            assert ticket.priority == INTERACTIVE
+            assert ticket.tenant == "p1"
+            assert ticket.deadline - time.monotonic() <= 60
+    assert WorkTicket.from_context().priority == BACKGROUND
+
+    with pytest.raises(ValueError):
+        with llm_work_context(priority="urgent"):
+            pass
+
+
+@pytest.mark.asyncio
+async def test_interactive_work_overtakes_queued_batch():
+    limiter = AdaptiveConcurrencyLimiter("sched", initial_limit=1, max_limit=1)
+    order = []
+
+    async def work(name, priority):
+        with llm_work_context(priority=priority, tenant=name):
+            async with limiter.slot():
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+    blocker = asyncio.ensure_future(work("first", BATCH))
+    await asyncio.sleep(0)
+    batch = [asyncio.ensure_future(work(f"batch{i}", BATCH)) for i in range(3)]
+    await asyncio.sleep(0)
+    interactive = asyncio.ensure_future(work("user", INTERACTIVE))
+    await asyncio.gather(blocker, *batch, interactive)
+
+    assert order[:2] == ["first", "user"]
+    assert limiter.stats()["waiting"] == 0
+
+
+@pytest.mark.asyncio
+async def test_batch_waiting_for_tokens_is_preempted():
+    LLMScheduler.clear()
+    limiter = AdaptiveConcurrencyLimiter("preempt", initial_limit=1, max_limit=1)
+    tokens_ready = asyncio.Event()
+    order = []
+
+    async def batch_work():
+        with llm_work_context(priority=BATCH):
+            async with limiter.slot() as slot:
+                # 模拟等待限流令牌（调用尚未开始）
+                await slot.run_preemptible(tokens_ready.wait)
+                order.append("batch")
+
+    async def interactive_work():
+        with llm_work_context(priority=INTERACTIVE):
+            async with limiter.slot():
+                order.append("user")
+                tokens_ready.set()
+
+    batch = asyncio.ensure_future(batch_work())
+    await asyncio.sleep(0.01)
+    await asyncio.wait_for(asyncio.gather(interactive_work(), batch), timeout=1)
+
+    assert order == ["user", "batch"]
+    assert LLMScheduler.stats()[BATCH]["preempted"] == 1
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_queued_work_past_deadline_is_rejected():
+    limiter = AdaptiveConcurrencyLimiter("deadline", initial_limit=1, max_limit=1)
+    release = asyncio.Event()
+
+    async def holder():
+        async with limiter.slot():
+            await release.wait()
+
+    task = asyncio.ensure_future(holder())
+    await asyncio.sleep(0)
+    with llm_work_context(priority=BACKGROUND, deadline_seconds=0.02):
+        with pytest.raises(DeadlineExceeded):
+            async with limiter.slot():
+                pass
+    release.set()
+    await task
+    assert limiter.stats()["waiting"] == 0
+    assert limiter.in_flight == 0
@@ -0,0 +1,131 @@
+import asyncio
+import httpx
+import pytest
+from langchain_core.language_models import FakeListChatModel
+from openai import RateLimitError
+from app.services.llm import llm_service as llm_service_module
+from app.services.llm.llm_models import LLMConfigModel, LLMRequestModel
+from app.services.llm.llm_service import LLMService
+from app.services.llm.stream_coalescer import StreamCoalescer, apply_stream_message
+
+pytestmark = [pytest.mark.unit]
+
+
+def make_coalescer(**kwargs):
+    messages = []
+
+    async def emit(message):
+        messages.append(message)
+
+    params = dict(flush_interval=60, flush_chars=10, snapshot_every=0)
+    params.update(kwargs)
+    return StreamCoalescer(emit, **params), messages
+
+
+def reassemble(messages, content=""):
+    for message in messages:
+        content = apply_stream_message(content, message)
+    return content
+
+
+@pytest.mark.asyncio
+async def test_tokens_are_coalesced_by_size():
+    coalescer, messages = make_coalescer()
+    tokens = ["ab", "cd", "efg", "hij", "k", "lmnopq", "r"]
+    for token in tokens:
+        await coalescer.push(token)
+    await coalescer.finish()
+
+    deltas = [m for m in messages if m["kind"] == "delta"]
+    assert len(deltas) < len(tokens)
+    assert [m["seq"] for m in messages] == list(range(1, len(messages) + 1))
+    assert messages[-1]["kind"] == "end"
+    assert messages[-1]["content"] == "".join(tokens)
+    assert reassemble(messages[:-1]) == "".join(tokens)
+
+
+@pytest.mark.asyncio
+async def test_buffer_flushed_by_timer():
+    coalescer, messages = make_coalescer(flush_interval=0.01, flush_chars=1000)
+    await coalescer.push("a")
+    await asyncio.sleep(0.001)
+    await coalescer.push("b")
+    assert messages == []
+
+    await asyncio.sleep(0.05)
+    assert [(m["kind"], m["offset"], m["delta"]) for m in messages] == [("delta", 0, "ab")]
+
+
+@pytest.mark.asyncio
+async def test_periodic_snapshot_for_late_joiners():
+    coalescer, messages = make_coalescer(flush_chars=1, snapshot_every=3)
+    for token in "abcdefg":
+        await coalescer.push(token)
+
+    snapshots = [m for m in messages if m["kind"] == "snapshot"]
+    assert [s["content"] for s in snapshots] == ["abc", "abcdef"]
+
+    # 从第一个快照之后加入的客户端，同样可以还原完整内容
+    late = messages[messages.index(snapshots[0]):]
+    assert reassemble(late) == "abcdefg"
+
+
+def test_apply_handles_duplicates_and_gaps():
+    assert apply_stream_message("abc", {"kind": "delta", "offset": 3, "delta": "de"}) == "abcde"
+    # 重复收到的增量不会重复拼接
+    assert apply_stream_message("abcde", {"kind": "delta", "offset": 3, "delta": "de"}) == "abcde"
+    assert apply_stream_message("abcd", {"kind": "delta", "offset": 3, "delta": "def"}) == "abcdef"
+    # 出现缺口时等待快照
+    assert apply_stream_message("ab", {"kind": "delta", "offset": 5, "delta": "x"}) is None
+    assert apply_stream_message("ab", {"kind": "snapshot", "offset": 0, "content": "abcdef"}) == "abcdef"
+
+
+@pytest.mark.asyncio
+async def test_reset_continues_seq_and_clears_content():
+    coalescer, messages = make_coalescer(flush_chars=1)
+    await coalescer.reset()
+    assert messages == []   # 还没有输出时不发送reset
+
+    await coalescer.push("错误")
+    await coalescer.reset()
+    await coalescer.push("正确")
+    await coalescer.finish()
+
+    assert [m["kind"] for m in messages] == ["delta", "reset", "delta", "end"]
+    assert [m["seq"] for m in messages] == [1, 2, 3, 4]
+    assert [m["generation"] for m in messages] == [0, 1, 1, 1]
+    assert reassemble(messages[:-1]) == "正确"
+
+
+@pytest.mark.asyncio
+async def test_retry_streams_one_sequence_per_task(monkeypatch):
+    """限流重试后，同一任务的消息seq不重复，客户端还原为最后一次尝试的输出"""
+    config = LLMConfigModel(api_key="test-key", llm_model_name="stream-retry-test", streaming=True, cache_enabled=False)
+    service = LLMService(config, "{context}", "role", llm=FakeListChatModel(responses=["unused"]))
+    attempts = []
+
+    async def invoke(chain, request_dict, callbacks, limiter, input_tokens, record):
+        attempts.append(callbacks)
+        for token in ("第一次" if len(attempts) == 1 else "第二次"):
+            for callback in callbacks:
+                await callback.on_llm_new_token(token)
+        if len(attempts) == 1:
+            raise RateLimitError("429", response=httpx.Response(429, request=httpx.Request("POST", "http://llm")), body=None)
+        for callback in callbacks:
+            await callback.on_llm_end(None)
+        return "第二次"
+
+    monkeypatch.setattr(service, "_invoke", invoke)
+    monkeypatch.setattr(llm_service_module, "retry_backoff", lambda attempt, retry_after=None: 0)
+    monkeypatch.setattr(llm_service_module.settings, "LLM_STREAM_FLUSH_CHARS", 1)
+    queue = asyncio.Queue()
+    request = LLMRequestModel(context="内容", instruction="", supplement="", output_format="")
+
+    assert await service.process(request, task_id="t1", sse_queue=queue) == "第二次"
+
+    messages = [queue.get_nowait() for _ in range(queue.qsize())]
+    assert attempts[0][0] is attempts[1][0]
+    assert [m["seq"] for m in messages] == list(range(1, len(messages) + 1))
+    assert "reset" in [m["kind"] for m in messages]
+    assert messages[-1]["kind"] == "end" and messages[-1]["content"] == "第二次"
+    assert reassemble(messages[:-1]) == "第二次"
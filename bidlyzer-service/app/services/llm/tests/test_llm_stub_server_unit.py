@@ -0,0 +1,67 @@
+import json
+import pytest
+from fastapi.testclient import TestClient
+from app.services.llm.stub_server import StubBehavior, RecordingStore, create_stub_app
+
+pytestmark = [pytest.mark.unit]
+
+
+MESSAGES = [
+    {"role": "system", "content": "你是招标文件分析专家"},
+    {"role": "user", "content": "Position： 3 第一章\nPosition： 10 第二章"},
+]
+
+
+def make_client(tmp_path, **behavior) -> TestClient:
+    params = dict(mode="synthetic", ttft_median=0, tokens_per_second=0, seed=1)
+    params.update(behavior)
+    return TestClient(create_stub_app(StubBehavior(**params), recordings_dir=tmp_path))
+
+
+def test_non_streaming_synthetic_output(tmp_path):
+    client = make_client(tmp_path)
+    response = client.post("/v1/chat/completions", json={"model": "qwen-plus", "messages": MESSAGES})
+
+    assert response.status_code == 200
+    data = response.json()
+    headings = json.loads(data["choices"][0]["message"]["content"])
+    assert [h["position"] for h in headings] == [3, 10]
+    assert data["usage"]["prompt_tokens"] > 0
+
+
+def test_streaming_chunks_reassemble_to_full_content(tmp_path):
+    client = make_client(tmp_path, chunk_tokens=3)
+    body = {"model": "qwen-plus", "messages": MESSAGES, "stream": True, "stream_options": {"include_usage": True}}
+    response = client.post("/v1/chat/completions", json=body)
+
+    events = [line[len("data: "):] for line in response.text.splitlines() if line.startswith("data: ")]
+    assert events[-1] == "[DONE]"
+    chunks = [json.loads(event) for event in events[:-1]]
+    content = "".join(c["choices"][0]["delta"].get("content", "") for c in chunks if c["choices"])
+    assert json.loads(content)[0]["position"] == 3
+    assert "usage" in chunks[-1]
+
+
+def test_replays_recorded_response(tmp_path):
+    store = RecordingStore(tmp_path)
+    store.put(store.prompt_key("qwen-plus", MESSAGES), "qwen-plus", '[{"level": 1, "position": 99, "title": "录制"}]')
+
+    client = make_client(tmp_path, mode="replay")
+    response = client.post("/v1/chat/completions", json={"model": "qwen-plus", "messages": MESSAGES})
+
+    assert json.loads(response.json()["choices"][0]["message"]["content"])[0]["title"] == "录制"
+    assert client.get("/stub/stats").json()["replayed"] == 1
+
+
+def test_injects_429_with_retry_after(tmp_path):
+    client = make_client(tmp_path, error_429_rate=1.0, retry_after=2)
+    response = client.post("/v1/chat/completions", json={"model": "qwen-plus", "messages": MESSAGES})
+
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "2"
+
+
+def test_update_config_at_runtime(tmp_path):
+    client = make_client(tmp_path)
+    assert client.post("/stub/config", json={"error_429_rate": 0.5}).json()["error_429_rate"] == 0.5
+    assert client.post("/stub/config", json={"mode": "unknown"}).status_code == 400
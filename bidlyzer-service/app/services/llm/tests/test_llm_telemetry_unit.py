@@ -0,0 +1,71 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from langchain_core.language_models import FakeListChatModel
+
+from app.services.llm.llm_models import LLMConfigModel, LLMRequestModel
+from app.services.llm.llm_service import LLMService
+from app.services.llm.telemetry import (
+    CALLS, LLMCallRecord, LLMTelemetry, TelemetryCallbackHandler,
+    current_call_context, llm_call_context,
+)
+
+pytestmark = [pytest.mark.unit]
+
+
+def calls_count(stage: str, model: str, outcome: str) -> float:
+    return CALLS.labels(stage=stage, model=model, outcome=outcome)._value.get()
+
+
+def test_call_context_nests_and_resets():
+    with llm_call_context(project_id="p1"):
+        with llm_call_context(stage="L1", builder="Builder"):
+            assert current_call_context() == {"project_id": "p1", "stage": "L1", "builder": "Builder"}
+        assert current_call_context() == {"project_id": "p1"}
+    assert current_call_context() == {}
+
+
+@pytest.mark.asyncio
+async def test_call_context_is_inherited_by_tasks():
+    async def read():
+        return LLMCallRecord.from_context("qwen-plus").stage
+
+    with llm_call_context(stage="L2L3"):
+        task = asyncio.ensure_future(read())
+    assert await task == "L2L3"
+
+
+def test_record_prefers_provider_usage_and_prices_it():
+    record = LLMCallRecord(model="qwen-plus", input_tokens=999)
+    assert record.set_usage({"input_tokens": 1000, "output_tokens": 500, "total_tokens": 1500})
+    assert record.usage_source == "provider"
+    assert record.cost == pytest.approx((1000 * 0.0008 + 500 * 0.002) / 1000)
+
+    record.cache_hit = True
+    assert record.cost == 0.0
+    assert not LLMCallRecord(model="qwen-plus").set_usage({})
+
+
+def test_callback_extracts_usage_from_streamed_message():
+    message = SimpleNamespace(usage_metadata={"input_tokens": 10, "output_tokens": 3, "total_tokens": 13})
+    response = SimpleNamespace(llm_output=None, generations=[[SimpleNamespace(message=message)]])
+    assert TelemetryCallbackHandler._extract_usage(response)["output_tokens"] == 3
+
+    response = SimpleNamespace(llm_output={"token_usage": {"prompt_tokens": 7, "completion_tokens": 2}}, generations=[])
+    assert TelemetryCallbackHandler._extract_usage(response)["prompt_tokens"] == 7
+
+
+@pytest.mark.asyncio
+async def test_process_records_call_with_stage_tags():
+    config = LLMConfigModel(api_key="test-key", llm_model_name="telemetry-test", streaming=False)
+    service = LLMService(config, "{context}", "role", llm=FakeListChatModel(responses=["结果"]))
+    request = LLMRequestModel(context="内容", instruction="", supplement="", output_format="")
+
+    before = calls_count("telemetry-stage", "telemetry-test", "success")
+    with llm_call_context(stage="telemetry-stage"):
+        assert await service.process(request) == "结果"
+    assert calls_count("telemetry-stage", "telemetry-test", "success") == before + 1
+
+    content, content_type = LLMTelemetry.metrics()
+    assert b"llm_call_latency_seconds" in content
+    assert content_type.startswith("text/plain")
@@ -0,0 +1,222 @@
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Any, Optional, Set, Tuple, AsyncIterator
+from prometheus_client import Counter, Gauge, Histogram
+from app.core.config import settings
+from app.core.redis_helper import RedisClient
+from app.services.llm.hedging import LatencyWindow
+import asyncio
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+SSE_CONNECTIONS = Gauge("sse_connections", "当前进程的SSE连接数")
+SSE_DISPATCH_LATENCY = Histogram(
+    "sse_dispatch_latency_seconds", "SSE消息从hub收到到连接取出发送的延迟",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+SSE_DROPPED = Counter("sse_dropped_messages_total", "连接的消息队列溢出时丢弃的SSE消息数")
+
+# 连接的队列溢出后 SSEConnection.get 返回的标记：期间的消息已丢弃，客户端需要重新读取消息历史
+RESYNC = object()
+
+
+@dataclass(eq=False)
+class SSEConnection:
+    """一个SSE连接：hub把所订阅通道的消息放入queue，由连接的生成器取出发送"""
+    channel: str
+    queue: "asyncio.Queue[Tuple[float, Any]]"
+    connected_at: float = field(default_factory=time.monotonic)
+    overflowed: bool = False   # 队列已溢出，RESYNC标记取出之前不再接收新消息
+
+    async def get(self, timeout: Optional[float] = None) -> Any:
+        """
+        等待下一条消息（阻塞等待，不轮询），超时返回None
+        队列溢出后返回 RESYNC，取出之后恢复接收新消息
+        """
+        try:
+            received_at, data = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if data is RESYNC:
+            self.overflowed = False
+            return RESYNC
+        SSEHub.record_dispatch(time.monotonic() - received_at)
+        return data
+
+    def overflow(self) -> int:
+        """队列已满：丢弃所有待发送的消息，只留一个RESYNC标记，返回丢弃的消息数"""
+        dropped = 0
+        while not self.queue.empty():
+            self.queue.get_nowait()
+            dropped += 1
+        self.queue.put_nowait((time.monotonic(), RESYNC))
+        self.overflowed = True
+        return dropped
+
+
+class SSEHub:
+    """
+    进程内的SSE消息分发（类方法单例）
+
+    - 整个进程只用一个Redis pubsub连接，按模式 SSE_HUB_CHANNEL_PATTERN 订阅所有项目的SSE通道，收到的消息按通道分发到各连接的队列
+    - 每个浏览器连接只是一个asyncio队列，空闲连接阻塞在队列上，不占用Redis连接，也不轮询
+    - 连接的队列已满（客户端太慢）时不静默丢弃：清空队列并让连接发送 resync 事件，前端重新读取消息历史，
+      之后的消息照常推送（溢出到resync之间的消息按丢弃计数）
+    - 第一个连接建立时启动监听任务，Redis连接断开后自动重新订阅；应用关闭时（lifespan）停止
+    """
+
+    _task: Optional[asyncio.Task] = None
+    _connections: Dict[str, Set[SSEConnection]] = {}
+    _idle_timeout: float = 30.0   # 等待消息的最长时间（秒），超时后继续等待（Redis客户端的socket_timeout不适用于订阅连接）
+    _retry_delay: float = 0.5     # 订阅中断后重新订阅的初始等待时间（秒），之后倍增，最长10秒
+    _latency = LatencyWindow(size=1000)
+    _stats: Dict[str, int] = {
+        "connected": 0, "disconnected": 0, "max_connections": 0,
+        "received": 0, "dispatched": 0, "dropped": 0, "overflows": 0, "unrouted": 0, "reconnects": 0,
+        "replays": 0, "replayed": 0, "resyncs": 0,
+    }
+
+    @classmethod
+    @asynccontextmanager
+    async def connect(cls, channel: str) -> AsyncIterator[SSEConnection]:
+        """注册一个连接（async with 使用），退出时注销"""
+        connection = SSEConnection(channel=channel, queue=asyncio.Queue(maxsize=settings.SSE_HUB_QUEUE_SIZE))
+        cls._connections.setdefault(channel, set()).add(connection)
+        count = cls.connection_count()
+        cls._stats["connected"] += 1
+        cls._stats["max_connections"] = max(cls._stats["max_connections"], count)
+        SSE_CONNECTIONS.set(count)
+        cls._ensure_listener()
+        try:
+            yield connection
+        finally:
+            connections = cls._connections.get(channel)
+            if connections is not None:
+                connections.discard(connection)
+                if not connections:
+                    cls._connections.pop(channel, None)
+            cls._stats["disconnected"] += 1
+            SSE_CONNECTIONS.set(cls.connection_count())
+
+    @classmethod
+    def connection_count(cls) -> int:
+        return sum(len(connections) for connections in cls._connections.values())
+
+    @classmethod
+    def dispatch(cls, channel: str, data: str) -> int:
+        """把一条消息放入该通道所有连接的队列，返回分发的连接数"""
+        cls._stats["received"] += 1
+        connections = cls._connections.get(channel)
+        if not connections:
+            cls._stats["unrouted"] += 1
+            return 0
+        item = (time.monotonic(), data)
+        dispatched = 0
+        for connection in connections:
+            if not connection.overflowed and connection.queue.full():
+                # 丢掉的消息无法再按Stream ID补发，改为通知客户端整体重新同步
+                dropped = connection.overflow()
+                cls._stats["overflows"] += 1
+                cls._stats["dropped"] += dropped
+                SSE_DROPPED.inc(dropped)
+                logger.warning(f"SSE连接的消息队列已满，丢弃{dropped}条消息并要求客户端重新同步: {channel}")
+            if connection.overflowed:
+                cls._stats["dropped"] += 1
+                SSE_DROPPED.inc()
+                continue
+            connection.queue.put_nowait(item)
+            dispatched += 1
+        cls._stats["dispatched"] += dispatched
+        return dispatched
+
+    @classmethod
+    def record_dispatch(cls, seconds: float) -> None:
+        SSE_DISPATCH_LATENCY.observe(seconds)
+        cls._latency.add(seconds)
+
+    @classmethod
+    def record_replay(cls, replayed: Optional[int]) -> None:
+        """记录一次按 Last-Event-ID 的断线重连：补发的消息数，None表示无法补发（客户端需要重新读取历史）"""
+        if replayed is None:
+            cls._stats["resyncs"] += 1
+        else:
+            cls._stats["replays"] += 1
+            cls._stats["replayed"] += replayed
+
+    # ----------------------------- 监听任务 -----------------------------
+
+    @classmethod
+    def _ensure_listener(cls) -> None:
+        """在当前事件循环中启动监听任务（已在运行则跳过）"""
+        loop = asyncio.get_running_loop()
+        if cls._task is None or cls._task.done() or cls._task.get_loop() is not loop:
+            cls._task = loop.create_task(cls._listen())
+
+    @classmethod
+    async def _listen(cls) -> None:
+        delay = cls._retry_delay
+        while True:
+            pubsub = None
+            try:
+                client = await RedisClient.get_client()
+                pubsub = client.pubsub()
+                await pubsub.psubscribe(settings.SSE_HUB_CHANNEL_PATTERN)
+                logger.info(f"SSE hub已订阅: {settings.SSE_HUB_CHANNEL_PATTERN}")
+                delay = cls._retry_delay
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=cls._idle_timeout)
+                    if message is not None and message.get("type") == "pmessage":
+                        cls.dispatch(message["channel"], message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                cls._stats["reconnects"] += 1
+                logger.error(f"SSE hub订阅中断，{delay}秒后重新订阅: {str(e)}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 10)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.close()
+                    except Exception as e:
+                        logger.debug(f"关闭SSE hub的pubsub失败: {str(e)}")
+
+    @classmethod
+    async def shutdown(cls) -> None:
+        """应用关闭时调用（lifespan）：停止监听任务"""
+        task, cls._task = cls._task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    # ----------------------------- 监控 -----------------------------
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        """当前连接数/通道数、收到和分发的消息数、丢弃数、重新订阅次数、断线重连的补发次数，以及分发延迟p50/p95"""
+        return {
+            **cls._stats,
+            "connections": cls.connection_count(),
+            "channels": len(cls._connections),
+            "listening": cls._task is not None and not cls._task.done(),
+            "dispatch_latency": cls._latency.summary(),
+        }
+
+    @classmethod
+    def reset_stats(cls) -> None:
+        cls._latency = LatencyWindow(size=1000)
+        cls._stats = {key: 0 for key in cls._stats}
+
+    @classmethod
+    def clear(cls) -> None:
+        """注销所有连接并停止监听任务（测试用）"""
+        if cls._task is not None and not cls._task.done() and not cls._task.get_loop().is_closed():
+            cls._task.cancel()
+        cls._task = None
+        cls._connections = {}
@@ -59,6 +59,17 @@ class Storage:
             return False
 
 
+    async def save_batch_to_django(self, items: List[Dict[str, Any]]) -> bool:
+        """
+        批量保存到Django服务（一次请求）
+        items: [{"key_name": 字段名, "content": 值, "append": bool}]，append为True时content为追加到历史末尾的新条目
+        失败时抛出异常，由调用方（CachePersister）保留数据重试
+        """
+        endpoint = f"api/internal/projects/{self.project_id}/batch_save/"
+        await self.django_client._make_request(endpoint, data={"items": items}, method='post')
+        return True
+
+
     async def get_from_django(self, params: Dict[str, Any]) -> bool:
         """从Django服务获取数据"""
         try:
@@ -17,6 +17,9 @@ from .step_funcs.docx_extractor import DocxExtractor
 from .step_funcs.analyze_l1_headings import OutlineL1Analyzer
 from .step_funcs.analyze_l2_l3_headings import OutlineL2L3Analyzer
 from .step_funcs.add_intro_headings import AddIntroHeadings
+from app.services.broadcast import publish_partial_document
+from app.services.llm.telemetry import llm_call_context
+from app.services.llm.scheduler import llm_work_context, INTERACTIVE
 
 logger = logging.getLogger(__name__)
 
@@ -234,7 +237,8 @@ class StructuringAgent:
             
             # 执行H1分析
             analyzer = await self.outline_l1_analyzer
-            h1_document = await analyzer.analyze(document, self.project_id)
+            with llm_call_context(project_id=self.project_id), llm_work_context(priority=INTERACTIVE):
+                h1_document = await analyzer.analyze(document, self.project_id)
             
             if not h1_document:
                 raise ProcessingError("H1大纲分析失败，结果为空")
@@ -274,7 +278,9 @@ class StructuringAgent:
             
             # 执行H2H3分析
             analyzer = await self.outline_l2_l3_analyzer
-            h2h3_document = await analyzer.analyze(h1_document, self.project_id)
+            # 分析过程中按完成顺序发布已识别标题的部分文档
+            with llm_call_context(project_id=self.project_id), llm_work_context(priority=INTERACTIVE):
+                h2h3_document = await analyzer.analyze(h1_document, on_partial=self._publish_partial_h2h3)
             
             if not h2h3_document:
                 raise ProcessingError("H2H3大纲分析失败，结果为空")
@@ -297,6 +303,11 @@ class StructuringAgent:
             logger.error(f"[{trace_id}] H2H3分析失败: {str(e)}")
             raise ProcessingError(f"H2H3分析失败: {str(e)}")
     
+    async def _publish_partial_h2h3(self, partial_document: Dict[str, Any], progress: Dict[str, Any]) -> None:
+        """发布H2H3分析的部分结果（只写Redis，并推送SSE事件通知前端拉取）"""
+        if await self.state_manager.cache.save_partial_document('h2h3_document_partial', partial_document):
+            await publish_partial_document(self.project_id, 'h2h3_document_partial', progress)
+    
     async def _process_add_introduction(self, trace_id: str) -> Dict[str, Any]:
         """处理引言添加步骤"""
         try:
@@ -1,11 +1,14 @@
 import os
-from typing import List, Dict, Tuple, Any
+from typing import List, Dict, Tuple, Any, Optional
 import logging
 logger = logging.getLogger(__name__)
 
 from app.services.llm.llm_models import LLMConfigModel
 from langchain_core.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
 from app.services.task_service import count_tokens
+from app.services.token_budget import BudgetItem, TokenWindow, plan_windows, total_tokens
+from app.services.heading_candidates import HeadingCandidateFilter, PrefilterResult
+from app.core.config import settings
 
 
 
@@ -20,15 +23,27 @@ class TenderOutlinesL1PromptBuilder():
     输出： prompt_config:Dict, task_inputs:List[Dict], meta:Dict
     附带： 模拟的prompt： raw_prompt, formatted_prompt:List[Dict]
 
-    大模型调用： 单个调用
+    大模型调用： 文档上下文不超过 context_token_budget 时单个调用；
+               超过时按token预算切分为相互重叠的窗口，每个窗口一个调用（并发执行，结果按position去重合并）
+    上下文预筛选： prefilter=True 时只保留规则打分选出的标题候选及少量上下文（见 HeadingCandidateFilter）
     
     
     """
 
-    def __init__(self, doc: Any):
+    def __init__(self, doc: Any, context_token_budget: Optional[int] = None, overlap_tokens: Optional[int] = None, prefilter: Optional[bool] = None):
         # 输入参数
         self.doc = doc
 
+        # 标题候选预筛选
+        self.prefilter = settings.STRUCTURING_HEADING_PREFILTER_ENABLED if prefilter is None else prefilter
+        self.prefilter_result: Optional[PrefilterResult] = None
+        self.unfiltered_context_tokens = 0
+
+        # 上下文token预算（超过则分窗口）与窗口间重叠的token数
+        self.context_token_budget = context_token_budget or settings.STRUCTURING_L1_CONTEXT_TOKEN_BUDGET
+        self.overlap_tokens = settings.STRUCTURING_L1_WINDOW_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+        self.context_windows: List[TokenWindow] = []
+
         # 模型配置
         self.llm_config = self._build_llm_config().to_model()
 
@@ -56,6 +71,11 @@ class TenderOutlinesL1PromptBuilder():
             self.token_usage = self._calculate_token_usage()
             self._context_initialized = True
 
+    @property
+    def is_windowed(self) -> bool:
+        """是否走分窗口路径"""
+        return len(self.context_windows) > 1
+
     async def output_params(self) -> Tuple[Dict[str,any], List[Dict[str,any]], Dict[str,any]]:
         # 确保上下文已初始化
         await self._ensure_context_initialized()
@@ -68,17 +88,27 @@ class TenderOutlinesL1PromptBuilder():
         }
 
         # 用户输入：指令， 上下文， 补充材料， 输出的格式
-        task_inputs = [{
-            "instruction": self.instruction,
-            "context": self.indexed_doc,
-            "supplement": self.supplement,
-            "output_format": self.output_format,
-        }]
+        if self.is_windowed:
+            task_inputs = [{
+                "instruction": self.instruction,
+                "context": window.text(),
+                "supplement": self._prepare_window_supplement(window),
+                "output_format": self.output_format,
+            } for window in self.context_windows]
+        else:
+            task_inputs = [{
+                "instruction": self.instruction,
+                "context": self.indexed_doc,
+                "supplement": self.supplement,
+                "output_format": self.output_format,
+            }]
 
         # 额外信息： index-path 映射表； 
         meta = {
             "index_path_map": self.index_path_map,
-            "token_usage": self.token_usage
+            "token_usage": self.token_usage,
+            "context_windows": [window.describe() for window in self.context_windows] if self.is_windowed else [],
+            "prefilter": self.prefilter_result.describe() if self.prefilter_result else None,
         }
 
         return prompt_config, task_inputs, meta
@@ -106,25 +136,25 @@ class TenderOutlinesL1PromptBuilder():
             )
         ])
         
-        # 格式化模板
-        raw_prompt = prompt.format_messages(
-            instruction=self.instruction,
-            context=self.indexed_doc,
-            supplement=self.supplement,
-            output_format=self.output_format
-        )
-
-        # 转换为易读的格式
-        formatted_prompt = [
-            {
-                "role": message.type,
-                "content": message.content
-            }
-            for message in raw_prompt
-        ]
-
-        raw_prompts = [raw_prompt]
-        formatted_prompts = [formatted_prompt]
+        _, task_inputs, _ = await self.output_params()
+
+        raw_prompts = []
+        formatted_prompts = []
+        for task_input in task_inputs:
+            # 格式化模板
+            raw_prompt = prompt.format_messages(**task_input)
+
+            # 转换为易读的格式
+            formatted_prompt = [
+                {
+                    "role": message.type,
+                    "content": message.content
+                }
+                for message in raw_prompt
+            ]
+
+            raw_prompts.append(raw_prompt)
+            formatted_prompts.append(formatted_prompt)
 
         return raw_prompts, formatted_prompts
 
@@ -175,12 +205,50 @@ class TenderOutlinesL1PromptBuilder():
         # from app.clients.tiptap.helpers import TiptapUtils
         # indexed_doc, index_path_map = TiptapUtils.extract_indexed_paragraphs(self.doc, 50)
 
-        from app.clients.tiptap.tools import formatted_document_md_with_position
-        indexed_doc = await formatted_document_md_with_position(self.doc)
+        from app.clients.tiptap.tools import get_document_md_with_position, format_md_element
+        document_md = await get_document_md_with_position(self.doc)
+
+        lines = [(ele["position"], format_md_element(ele)) for ele in document_md if ele["content"] != ""]
+        lines = self._prefilter_lines(lines)
+        items = [BudgetItem(key=position, text=line, tokens=count_tokens(line)) for position, line in lines]
+
+        # 与 formatted_document_md_with_position 的输出一致
+        indexed_doc = "\n".join(item.text for item in items)
         index_path_map = {}
 
+        # 超过token预算时切分为重叠窗口
+        if total_tokens(items) > self.context_token_budget:
+            self.context_windows = plan_windows(items, self.context_token_budget, self.overlap_tokens)
+            logger.info(
+                f"L1上下文超过token预算({total_tokens(items)} > {self.context_token_budget})，"
+                f"切分为{len(self.context_windows)}个窗口"
+            )
+        else:
+            self.context_windows = []
+
         return indexed_doc, index_path_map
 
+    def _prefilter_lines(self, lines: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+        """
+        标题候选预筛选：只保留候选标题及少量上下文；候选数不足时保持完整上下文
+        """
+        if not self.prefilter:
+            return lines
+
+        from app.clients.tiptap.tools import DocumentTextIndex
+        heading_filter = HeadingCandidateFilter.from_settings()
+        index = DocumentTextIndex.from_doc(self.doc)
+        candidates = heading_filter.select(index)
+        if candidates is None:
+            self.prefilter_result = heading_filter.unfiltered(lines)
+            return lines
+
+        self.prefilter_result = heading_filter.filter_lines(lines, index, candidates)
+        self.unfiltered_context_tokens = count_tokens("\n".join(line for _, line in lines))
+        self.supplement = self._prepare_prefilter_supplement()
+        logger.info(f"L1标题候选预筛选: {self.prefilter_result.describe()}")
+        return self.prefilter_result.lines
+
 
     def _prepare_supplement(self) -> str:
         """
@@ -188,6 +256,26 @@ class TenderOutlinesL1PromptBuilder():
         """
 
         return "此任务无补充内容"
+
+    def _prepare_window_supplement(self, window: TokenWindow) -> str:
+        """
+        分窗口时的补充说明：告知模型材料A只是文档的一个片段
+        """
+        return f"""
+材料A是完整文档按顺序切分后的第{window.index + 1}/{len(self.context_windows)}个片段（position {window.first_key} 至 {window.last_key}），相邻片段之间有少量重叠。
+- "最高层级"是相对整个文档而言的（通常是"第X章""第X部分"一类的标题），而不是本片段内相对最高的标题。
+- 如果本片段中没有最高层级的标题，输出空列表 []。
+""" + (self._prepare_prefilter_supplement() if self.prefilter_result and self.prefilter_result.applied else "")
+
+    def _prepare_prefilter_supplement(self) -> str:
+        """
+        预筛选后的补充说明：告知模型部分正文已被省略
+        """
+        return """
+材料A已预先去掉了明显不是标题的正文和表格：
+- "[省略N条正文]"表示此处省略了N条正文。
+- 以"..."结尾的条目是被截断的正文，仅作为判断标题的上下文。
+"""
     
 
     def _prepare_output_format(self) -> str:
@@ -239,7 +327,8 @@ class TenderOutlinesL1PromptBuilder():
                     base_url = "https://dashscope.aliyuncs.com/compatible-mode/v1",
                     max_workers = 4,
                     timeout = 30,
-                    retry_times = 3
+                    retry_times = 3,
+                    cache_enabled = True
                 )
 
 
@@ -254,7 +343,14 @@ class TenderOutlinesL1PromptBuilder():
 
         token_usage = {
             "in_tokens" : in_tokens,
+            "windows": len(self.context_windows) if self.is_windowed else 1,
+            "windowed_in_tokens": sum(
+                window.tokens + count_tokens(self._prepare_window_supplement(window))
+                + instruction_tokens + output_format_tokens + prompt_template_tokens
+                for window in self.context_windows
+            ) if self.is_windowed else in_tokens,
             "context_tokens": context_tokens,
+            "unfiltered_context_tokens": self.unfiltered_context_tokens or context_tokens,
             "instruction_tokens": instruction_tokens,
             "supplement_tokens": supplement_tokens,
             "output_format_tokens": output_format_tokens,
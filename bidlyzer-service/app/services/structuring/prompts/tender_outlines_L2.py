@@ -1,11 +1,14 @@
 import os
-from typing import List, Dict, Tuple, Any
+from typing import List, Dict, Tuple, Any, Optional
 import logging
 logger = logging.getLogger(__name__)
 
 from app.services.llm.llm_models import LLMConfigModel
 from langchain_core.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
 from app.services.task_service import count_tokens
+from app.services.token_budget import BudgetItem, plan_windows, pack_bins, total_tokens
+from app.services.heading_candidates import HeadingCandidateFilter
+from app.core.config import settings
 
 
 # 目标 -> 准备好以下内容
@@ -26,14 +29,30 @@ class TenderOutlinesL2PromptBuilder():
     附带： 模拟的prompt： raw_prompt, formatted_prompt
 
     大模型调用： 多个并发调用
+               packing=True 时按章节token数调度：小章节打包到同一个请求，超过预算的章节在段落边界切分（带上文衔接）；
+               packing=False 时每个一级章节一个请求
+    上下文预筛选： prefilter=True 时章节内只保留规则打分选出的子标题候选及少量上下文（见 HeadingCandidateFilter）
     
     """
 
-    def __init__(self, doc: Any):
+    def __init__(self, doc: Any, packing: Optional[bool] = None, context_token_budget: Optional[int] = None, prefilter: Optional[bool] = None):
 
         # 输入参数
         self.doc = doc
 
+        # 标题候选预筛选
+        self.prefilter = settings.STRUCTURING_HEADING_PREFILTER_ENABLED if prefilter is None else prefilter
+        self.prefilter_stats: Optional[Dict[str, Any]] = None
+        self.prefilter_note = ""
+        self.unfiltered_chapters_tokens = 0
+
+        # 请求调度参数
+        self.packing = settings.STRUCTURING_L2_PACKING if packing is None else packing
+        self.context_token_budget = context_token_budget or settings.STRUCTURING_L2_CONTEXT_TOKEN_BUDGET
+        self.overlap_tokens = settings.STRUCTURING_L2_SPLIT_OVERLAP_TOKENS
+        self.max_chapters_per_request = settings.STRUCTURING_L2_MAX_CHAPTERS_PER_REQUEST
+        self.requests: List[Dict[str, Any]] = []
+
         # 模型配置
         self.llm_config = self._build_llm_config().to_model()
 
@@ -73,18 +92,25 @@ class TenderOutlinesL2PromptBuilder():
         }
 
         task_inputs = []
-        for chapter in self.indexed_chapters:
+        for request in self.requests:
             task_params = {
-                "context": chapter["content"],
+                "context": request["context"],
                 "instruction": self.instruction,
-                "supplement": self.supplement,
+                "supplement": request["supplement"],
                 "output_format": self.output_format,
             }
             task_inputs.append(task_params)
 
         meta = {
             "index_path_map": self.index_path_map,
-            "token_usage": self.token_usage
+            "token_usage": self.token_usage,
+            "packing": self.packing,
+            "chapters": len(self.indexed_chapters),
+            "prefilter": self.prefilter_stats,
+            "requests": [
+                {"chapters": request["chapters"], "part": request["part"], "tokens": request["tokens"]}
+                for request in self.requests
+            ],
         }
 
         return prompt_config, task_inputs, meta
@@ -120,15 +146,11 @@ class TenderOutlinesL2PromptBuilder():
         ])
         
         # 格式化模板
+        _, task_inputs, _ = self.output_params()
         raw_prompts = []
         formatted_prompts = []
-        for indexed_chapter in self.indexed_chapters:
-            raw_prompt = prompt.format_messages(
-                context=indexed_chapter["paragraphs"],
-                instruction=self.instruction,
-                supplement=self.supplement,
-                output_format=self.output_format
-            )
+        for task_input in task_inputs:
+            raw_prompt = prompt.format_messages(**task_input)
 
             # 转换为易读的格式
             formatted_prompt = [
@@ -182,12 +204,120 @@ class TenderOutlinesL2PromptBuilder():
         准备请求数据
         """ 
 
-        from app.clients.tiptap.tools import formatted_chapters_md_with_position
-        indexed_chapters = formatted_chapters_md_with_position(self.doc)
+        from app.clients.tiptap.tools import chapters_md_lines_with_position
+        chapters = self._prefilter_chapters(chapters_md_lines_with_position(self.doc))
+
+        # 与 formatted_chapters_md_with_position 的输出一致
+        indexed_chapters = [
+            {"type": "doc", "content": "\n".join(line for _, line in chapter_lines)}
+            for chapter_lines in chapters
+        ]
         index_path_map = {}
 
+        if self.packing:
+            self.requests = self._plan_requests(chapters)
+        else:
+            self.requests = [
+                self._build_request([chapter["content"]], [chapter_lines[0][0]], self.supplement, count_tokens(chapter["content"]))
+                for chapter, chapter_lines in zip(indexed_chapters, chapters)
+            ]
+
+        logger.info(f"L2/L3请求调度: {len(chapters)}个章节 -> {len(self.requests)}个请求 (packing={self.packing})")
         return indexed_chapters, index_path_map
 
+    def _prefilter_chapters(self, chapters: List[List[Tuple[int, str]]]) -> List[List[Tuple[int, str]]]:
+        """
+        标题候选预筛选：每个章节保留章节标题、子标题候选及少量上下文；候选数不足时保持完整章节
+        """
+        if not self.prefilter or not chapters:
+            return chapters
+
+        from app.clients.tiptap.tools import DocumentTextIndex
+        heading_filter = HeadingCandidateFilter.from_settings()
+        index = DocumentTextIndex.from_doc(self.doc)
+        candidates = heading_filter.select(index)
+        if candidates is None:
+            self.prefilter_stats = {"applied": False}
+            return chapters
+
+        results = [
+            heading_filter.filter_lines(chapter_lines, index, candidates, keep=[chapter_lines[0][0]])
+            for chapter_lines in chapters
+        ]
+        self.unfiltered_chapters_tokens = sum(count_tokens(line) for chapter_lines in chapters for _, line in chapter_lines)
+        self.prefilter_stats = {"applied": True}
+        for key in ("lines_in", "lines_out", "candidates", "context", "elided"):
+            self.prefilter_stats[key] = sum(result.describe()[key] for result in results)
+        self.prefilter_note = self._prepare_prefilter_note()
+        self.supplement = self.prefilter_note
+        logger.info(f"L2/L3标题候选预筛选: {self.prefilter_stats}")
+        return [result.lines for result in results]
+
+    @staticmethod
+    def _build_request(contexts: List[str], chapter_positions: List[int], supplement: str, tokens: int, part: Optional[str] = None) -> Dict[str, Any]:
+        return {
+            "context": "\n\n".join(contexts),
+            "supplement": supplement,
+            "chapters": chapter_positions,
+            "part": part,
+            "tokens": tokens,
+        }
+
+    def _plan_requests(self, chapters: List[List[Tuple[int, str]]]) -> List[Dict[str, Any]]:
+        """
+        按章节token数调度请求：
+        - 不超过预算的章节作为整体，用FFD装箱打包到同一请求
+        - 超过预算的章节在段落边界切分，每部分都带章节标题，并重复上一部分末尾的内容作为上文
+        """
+        small_chapters: List[BudgetItem] = []
+        requests: List[Dict[str, Any]] = []
+
+        for chapter_lines in chapters:
+            items = [BudgetItem(key=position, text=line, tokens=count_tokens(line)) for position, line in chapter_lines]
+            chapter_tokens = total_tokens(items)
+            if chapter_tokens > self.context_token_budget and len(items) > 2:
+                requests.extend(self._split_chapter(items))
+            else:
+                small_chapters.append(BudgetItem(
+                    key=items[0].key,
+                    text="\n".join(item.text for item in items),
+                    tokens=chapter_tokens,
+                ))
+
+        for bin_items in pack_bins(small_chapters, self.context_token_budget, self.max_chapters_per_request):
+            supplement = self.supplement if len(bin_items) == 1 else self._prepare_packed_supplement(len(bin_items))
+            requests.append(self._build_request(
+                [item.text for item in bin_items],
+                [item.key for item in bin_items],
+                supplement,
+                total_tokens(bin_items),
+            ))
+
+        requests.sort(key=lambda request: request["chapters"][0])
+        return requests
+
+    def _split_chapter(self, items: List[BudgetItem]) -> List[Dict[str, Any]]:
+        """在段落边界切分超大章节"""
+        title, body = items[0], items[1:]
+        windows = plan_windows(body, max(1, self.context_token_budget - title.tokens), self.overlap_tokens)
+
+        title_text = title.text.split(" | position:")[0].replace("章节标题: ", "", 1)
+        requests = []
+        for window in windows:
+            lines = [title.text] + [
+                f"[上文] {item.text}" if i < window.overlap else item.text
+                for i, item in enumerate(window.items)
+            ]
+            part = f"{window.index + 1}/{len(windows)}"
+            requests.append(self._build_request(
+                ["\n".join(lines)],
+                [title.key],
+                self._prepare_split_supplement(title_text, part),
+                title.tokens + window.tokens,
+                part=part,
+            ))
+        return requests
+
 
     def _prepare_supplement(self) -> str:
         """
@@ -195,6 +325,30 @@ class TenderOutlinesL2PromptBuilder():
         """
 
         return "此任务无补充内容"
+
+    def _prepare_packed_supplement(self, chapter_count: int) -> str:
+        """多个章节打包到同一请求时的补充说明"""
+        return f"""
+材料A包含{chapter_count}个相互独立的章节，每个章节以"章节标题"开头。
+- 请分别识别每个章节内的子标题，level 相对各自章节计算（章节标题的直接子标题 level 为 1）。
+- 不要输出"章节标题"本身。
+""" + self.prefilter_note
+
+    def _prepare_split_supplement(self, chapter_title: str, part: str) -> str:
+        """超大章节切分后的补充说明"""
+        return f"""
+材料A是章节《{chapter_title}》的第{part}部分，第一条"章节标题"仅用于定位。
+- 以"[上文]"开头的条目是上一部分末尾的内容，仅用于判断当前所处的标题层级。
+- level 相对整个章节计算（章节标题的直接子标题 level 为 1）。
+""" + self.prefilter_note
+
+    def _prepare_prefilter_note(self) -> str:
+        """预筛选后的补充说明：告知模型部分正文已被省略"""
+        return """
+材料A已预先去掉了明显不是标题的正文和表格：
+- "[省略N条正文]"表示此处省略了N条正文。
+- 以"..."结尾的条目是被截断的正文，仅作为判断标题的上下文。
+"""
     
 
 
@@ -247,7 +401,9 @@ class TenderOutlinesL2PromptBuilder():
                     base_url = "https://dashscope.aliyuncs.com/compatible-mode/v1",
                     max_workers = 4,
                     timeout = 60,
-                    retry_times = 3
+                    retry_times = 3,
+                    cache_enabled = True,
+                    hedge_enabled = True  # 阶段耗时取决于最慢的章节请求，用对冲请求削减长尾
                 )
     
     def _calculate_token_usage(self) -> Dict[str, int]:
@@ -259,9 +415,18 @@ class TenderOutlinesL2PromptBuilder():
         prompt_template_tokens = count_tokens(self.prompt_template)
         in_tokens = chapters_tokens + instruction_tokens + supplement_tokens + output_format_tokens + prompt_template_tokens
 
+        fixed_tokens = instruction_tokens + output_format_tokens + prompt_template_tokens
+        scheduled_in_tokens = sum(
+            request["tokens"] + count_tokens(request["supplement"]) + fixed_tokens
+            for request in self.requests
+        )
+
         token_usage = {
             "in_tokens": in_tokens,
+            "scheduled_in_tokens": scheduled_in_tokens,
+            "requests": len(self.requests),
             "chapters_tokens": chapters_tokens,
+            "unfiltered_chapters_tokens": self.unfiltered_chapters_tokens or chapters_tokens,
             "instruction_tokens": instruction_tokens,
             "supplement_tokens": supplement_tokens,
             "output_format_tokens": output_format_tokens,
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+标题候选预筛选：召回率与prompt token缩减（不调用大模型，不访问tiptap服务）
+
+运行：
+    PYTHONPATH=. python app/services/structuring/prompts/tests/bench_heading_prefilter.py [tiptap_doc.json ...]
+
+- 不带参数时使用 app/services/tests/fixtures/heading_candidates.py 中的标注样例
+- 传入已完成结构化的文档时，以文档中已有的标题为标注，并把标题节点还原为普通段落后再筛选（模拟原始docx）
+- L1：完整上下文 vs 预筛选后的上下文token数（表格按占位文本计，实际L1中表格为完整markdown，缩减更多）
+- L2/L3：对含一级标题的文档，比较 TenderOutlinesL2PromptBuilder 在预筛选前后的调度输入token
+"""
+
+import sys
+import json
+from copy import deepcopy
+from typing import Dict, Any, List
+
+from app.clients.tiptap.tools import DocumentTextIndex, format_md_element, get_headings
+from app.services.heading_candidates import HeadingCandidateFilter
+from app.services.task_service import count_tokens
+
+
+def flatten_headings(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """把标题节点还原为普通段落"""
+    doc = deepcopy(doc)
+    for node in doc.get("content", []):
+        if isinstance(node, dict) and node.get("type") == "heading":
+            node["type"] = "paragraph"
+            node.pop("attrs", None)
+    return doc
+
+
+def load_samples(paths: List[str]) -> List[Dict[str, Any]]:
+    if not paths:
+        from app.services.tests.fixtures.heading_candidates import labelled_documents
+        return labelled_documents()
+
+    samples = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            doc = json.load(f)
+        headings, _ = get_headings(doc)
+        samples.append({"name": path, "doc": doc, "headings": [h["position"] for h in headings], "flatten": True})
+    return samples
+
+
+def bench_l1(doc: Dict[str, Any], labels: List[int], flatten: bool = False) -> Dict[str, Any]:
+    index = DocumentTextIndex.from_doc(flatten_headings(doc) if flatten else doc)
+    heading_filter = HeadingCandidateFilter.from_settings()
+    lines = [
+        (entry.position, format_md_element({
+            "content": entry.text if entry.type != "table" else "[table]",
+            "position": entry.position,
+        }))
+        for entry in index if entry.text
+    ]
+
+    candidates = heading_filter.select(index) or set()
+    result = heading_filter.filter_lines(lines, index, candidates) if candidates else heading_filter.unfiltered(lines)
+    full = count_tokens("\n".join(line for _, line in lines))
+    filtered = count_tokens("\n".join(line for _, line in result.lines))
+    found = set(labels) & candidates
+    return {
+        "recall": len(found) / len(labels) if labels else 1.0,
+        "precision": len(found) / len(candidates) if candidates else 0.0,
+        "missed": sorted(set(labels) - candidates),
+        "full_tokens": full,
+        "filtered_tokens": filtered,
+        "prefilter": result.describe(),
+    }
+
+
+def bench_l2(doc: Dict[str, Any]) -> Dict[str, Any]:
+    from app.services.structuring.prompts.tender_outlines_L2 import TenderOutlinesL2PromptBuilder
+    usage = {}
+    for prefilter in (False, True):
+        _, _, meta = TenderOutlinesL2PromptBuilder(doc, prefilter=prefilter).output_params()
+        usage[prefilter] = meta["token_usage"]["scheduled_in_tokens"]
+    return usage
+
+
+def main(paths: List[str]):
+    for sample in load_samples(paths):
+        doc, labels = sample["doc"], sample["headings"]
+        l1 = bench_l1(doc, labels, flatten=sample.get("flatten", False))
+        ratio = l1["full_tokens"] / max(1, l1["filtered_tokens"])
+        print(f"[{sample['name']}] 标题数={len(labels)}, 召回率={l1['recall']:.1%}, 精确率={l1['precision']:.1%}, "
+              f"L1上下文token {l1['full_tokens']} -> {l1['filtered_tokens']} (缩减{ratio:.1f}倍)")
+        print(f"    预筛选: {l1['prefilter']}")
+        if l1["missed"]:
+            print(f"    漏掉的标题position: {l1['missed']}")
+
+        if any(isinstance(node, dict) and node.get("type") == "heading" and (node.get("attrs") or {}).get("level") == 1
+               for node in doc.get("content", [])):
+            l2 = bench_l2(doc)
+            print(f"    L2/L3调度输入token {l2[False]} -> {l2[True]} (缩减{l2[False] / max(1, l2[True]):.1f}倍)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
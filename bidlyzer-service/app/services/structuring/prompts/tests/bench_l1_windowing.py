@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+L1大纲分析：单次调用 vs 分窗口调用 的延迟与标题召回率对比（会真实调用大模型）
+
+运行：
+    PYTHONPATH=. python app/services/structuring/prompts/tests/bench_l1_windowing.py <tiptap_doc.json> [token_budget]
+
+- 单次调用路径作为参照：窗口路径的召回率 = 窗口路径命中的单次调用标题 / 单次调用标题数
+- 若文档中已有一级标题（例如已完成结构化的文档），同时报告两种路径相对已有一级标题的召回率
+"""
+
+import sys
+import json
+import time
+import asyncio
+from typing import Set
+
+from app.core.config import settings
+from app.clients.tiptap.tools import get_headings
+from app.services.llm.llm_client import LLMClient
+from app.services.llm.llm_output_processor import LLMOutputProcessor
+from app.services.structuring.prompts.tender_outlines_L1 import TenderOutlinesL1PromptBuilder
+
+
+async def run_path(doc: dict, budget: int) -> dict:
+    builder = TenderOutlinesL1PromptBuilder(doc, context_token_budget=budget)
+    prompt_config, task_inputs, meta = await builder.output_params()
+
+    start = time.perf_counter()
+    raw_results = await LLMClient(prompt_config).process_with_limit(task_inputs)
+    elapsed = time.perf_counter() - start
+
+    processor = LLMOutputProcessor()
+    headings = processor.dedupe_by_position(processor.merge_outputs(raw_results))
+    return {
+        "requests": len(task_inputs),
+        "seconds": elapsed,
+        "in_tokens": meta["token_usage"]["windowed_in_tokens"],
+        "positions": {item["position"] for item in headings if isinstance(item, dict) and "position" in item},
+    }
+
+
+def recall(found: Set[int], reference: Set[int]) -> float:
+    return len(found & reference) / len(reference) if reference else 1.0
+
+
+async def main(path: str, budget: int):
+    with open(path, "r", encoding="utf-8") as f:
+        doc = json.load(f)
+
+    # 关闭响应缓存，保证两次都是真实调用
+    settings.LLM_CACHE_ENABLED = False
+
+    single = await run_path(doc, budget=10 ** 9)
+    windowed = await run_path(doc, budget=budget)
+
+    for name, result in (("单次调用", single), ("分窗口", windowed)):
+        print(f"{name}: 请求数={result['requests']}, 输入token={result['in_tokens']}, "
+              f"耗时={result['seconds']:.1f}s, 标题数={len(result['positions'])}")
+
+    print(f"分窗口相对单次调用的召回率: {recall(windowed['positions'], single['positions']):.1%}")
+    extra = windowed["positions"] - single["positions"]
+    print(f"分窗口额外识别的标题position: {sorted(extra)}")
+
+    headings, _ = get_headings(doc)
+    existing_h1 = {h["position"] for h in headings if h.get("level") == 1}
+    if existing_h1:
+        print(f"相对文档已有一级标题的召回率: 单次调用={recall(single['positions'], existing_h1):.1%}, "
+              f"分窗口={recall(windowed['positions'], existing_h1):.1%}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    asyncio.run(main(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else settings.STRUCTURING_L1_CONTEXT_TOKEN_BUDGET))
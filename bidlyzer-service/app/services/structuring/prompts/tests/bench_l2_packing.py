@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+L2/L3大纲分析：每章一个请求 vs 按token打包/切分 的阶段耗时对比（会真实调用大模型）
+
+运行：
+    PYTHONPATH=. python app/services/structuring/prompts/tests/bench_l2_packing.py <已完成L1的tiptap_doc.json>
+
+报告两种调度方式的请求数、输入token、阶段耗时、单请求最长耗时，以及识别出的标题重合度。
+"""
+
+import sys
+import json
+import time
+import asyncio
+
+from app.core.config import settings
+from app.services.llm.llm_client import LLMClient
+from app.services.llm.llm_models import LLMRequestModel
+from app.services.llm.llm_output_processor import LLMOutputProcessor
+from app.services.structuring.prompts.tender_outlines_L2 import TenderOutlinesL2PromptBuilder
+
+
+async def run_path(doc: dict, packing: bool) -> dict:
+    builder = TenderOutlinesL2PromptBuilder(doc, packing=packing)
+    prompt_config, task_inputs, meta = builder.output_params()
+    service = LLMClient(prompt_config).create_service()
+
+    durations = []
+
+    async def timed(task_input):
+        start = time.perf_counter()
+        result = await service.process(LLMRequestModel(**task_input))
+        durations.append(time.perf_counter() - start)
+        return result
+
+    start = time.perf_counter()
+    raw_results = await asyncio.gather(*[timed(task_input) for task_input in task_inputs])
+    elapsed = time.perf_counter() - start
+
+    processor = LLMOutputProcessor()
+    headings = processor.dedupe_by_position(processor.merge_outputs(raw_results))
+    return {
+        "requests": len(task_inputs),
+        "in_tokens": meta["token_usage"]["scheduled_in_tokens"],
+        "seconds": elapsed,
+        "slowest": max(durations) if durations else 0.0,
+        "headings": {item["position"]: item.get("level") for item in headings if isinstance(item, dict) and "position" in item},
+    }
+
+
+async def main(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        doc = json.load(f)
+
+    # 关闭响应缓存，保证两次都是真实调用
+    settings.LLM_CACHE_ENABLED = False
+
+    per_chapter = await run_path(doc, packing=False)
+    packed = await run_path(doc, packing=True)
+
+    for name, result in (("每章一个请求", per_chapter), ("打包/切分", packed)):
+        print(f"{name}: 请求数={result['requests']}, 输入token={result['in_tokens']}, "
+              f"阶段耗时={result['seconds']:.1f}s, 最慢请求={result['slowest']:.1f}s, 标题数={len(result['headings'])}")
+
+    reference = per_chapter["headings"]
+    same_position = set(reference) & set(packed["headings"])
+    same_level = {p for p in same_position if reference[p] == packed["headings"][p]}
+    if reference:
+        print(f"相对每章一个请求的标题召回率: {len(same_position) / len(reference):.1%}, "
+              f"层级一致率: {len(same_level) / len(reference):.1%}")
+    print(f"阶段耗时变化: {per_chapter['seconds']:.1f}s -> {packed['seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    asyncio.run(main(sys.argv[1]))
@@ -5,7 +5,7 @@
 """
 
 import logging
-from typing import Dict
+from typing import Dict, Optional
 
 from app.clients.tiptap.tools import get_headings, update_nodes_to_headings
 from app.services.structuring.prompts.tender_outlines_L1 import TenderOutlinesL1PromptBuilder
@@ -20,12 +20,12 @@ class OutlineL1Analyzer:
     该分析器处理一级标题分析
     """
     
-    def __init__(self, llm_limit: int = 5):
+    def __init__(self, llm_limit: Optional[int] = None):
         """
         初始化大纲分析器
         
         参数：
-            llm_limit: 每个层级处理的最大LLM请求数
+            llm_limit: 每个层级处理的最大LLM请求数（可选，默认由模型端点的自适应并发控制器决定）
         """
         self.llm_limit = llm_limit
         self.output_processor = LLMOutputProcessor()
@@ -56,7 +56,7 @@ class OutlineL1Analyzer:
         logger.debug(f"L1分析前的文档标题：\n{print_headings}")
         
         # 使用LLM处理
-        analyzer = LLMClient(prompt_config)
+        analyzer = LLMClient(prompt_config, stage="L1", builder=type(prompt_builder).__name__)
 
         if channel_layer and group_name:
             # 创建并行任务，每个任务有唯一ID
@@ -77,8 +77,9 @@ class OutlineL1Analyzer:
             # 原有的并行处理（不带流式输出）
             raw_results = await analyzer.process_with_limit(task_inputs, limit=self.llm_limit)
         
-        # 处理结果
+        # 处理结果（分窗口时相邻窗口有重叠，按position去重）
         clean_parsed_results = self.output_processor.merge_outputs(raw_results)
+        clean_parsed_results = self.output_processor.dedupe_by_position(clean_parsed_results)
         
         # 使用新标题更新文档
         document_h1 = update_nodes_to_headings(tender_document, clean_parsed_results)
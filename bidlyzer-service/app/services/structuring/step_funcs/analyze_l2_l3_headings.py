@@ -5,7 +5,9 @@
 """
 
 import logging
-from typing import Dict
+import time
+from typing import Dict, Optional, List, Any, Callable, Awaitable
+from app.core.config import settings
 from app.clients.tiptap.tools import get_headings, update_nodes_to_headings
 from app.services.structuring.prompts.tender_outlines_L2 import TenderOutlinesL2PromptBuilder
 from app.services.llm.llm_client import LLMClient
@@ -20,12 +22,12 @@ class OutlineL2L3Analyzer:
     该分析器处理二级和三级标题分析
     """
     
-    def __init__(self, llm_limit: int = 5):
+    def __init__(self, llm_limit: Optional[int] = None):
         """
         初始化大纲分析器
         
         参数：
-            llm_limit: 每个层级处理的最大LLM请求数
+            llm_limit: 每个层级处理的最大LLM请求数（可选，默认由模型端点的自适应并发控制器决定）
         """
         self.llm_limit = llm_limit
         self.output_processor = LLMOutputProcessor()
@@ -33,12 +35,21 @@ class OutlineL2L3Analyzer:
         logger.info("OutlineAnalyzer: 初始化完成")
 
     
-    async def analyze(self, document_h1: Dict, channel_layer=None, group_name=None ) -> Dict:
+    async def analyze(
+        self,
+        document_h1: Dict,
+        channel_layer=None,
+        group_name=None,
+        on_partial: Optional[Callable[[Dict, Dict], Awaitable[None]]] = None,
+    ) -> Dict:
         """
         分析文档中的二级和三级标题
         
         参数：
             document_h1: 已应用一级标题的文档
+            on_partial: 部分结果回调 on_partial(部分文档, 进度)（可选）。
+                各请求按完成顺序处理，流式输出中每解析出一个完整标题即累积，
+                按 STRUCTURING_L2_PARTIAL_PUBLISH_INTERVAL 节流发布已应用标题的文档
             
         返回：
             更新了二级和三级标题的文档
@@ -46,6 +57,7 @@ class OutlineL2L3Analyzer:
         logger.info("正在分析二级和三级标题")
         
         # 初始化提示构建器并获取LLM参数
+        stage_start = time.perf_counter()
         prompt_builder = TenderOutlinesL2PromptBuilder(document_h1)
         prompt_config, task_inputs, meta = prompt_builder.output_params()
         
@@ -53,35 +65,38 @@ class OutlineL2L3Analyzer:
         logger.debug("已生成L2/L3提示参数")
         
         # 使用LLM处理
-        analyzer = LLMClient(prompt_config)
-
-        if channel_layer and group_name:
-            # 创建并行任务，每个任务有唯一ID
-            tasks = []
-            for i, task_input in enumerate(task_inputs):
-                # 为每个任务添加ID
-                task_id = f"task_{i}"
-                tasks.append((task_id, task_input))
-                
-            # 并行处理并支持流式输出
-            raw_results = await analyzer.process_parallel_stream(
-                tasks,
-                channel_layer=channel_layer,
-                group_name=group_name,
-                limit=self.llm_limit
-            )
-        else:
-            # 创建并行任务，每个任务有唯一ID（即使没有流式输出）
-            tasks = []
-            for i, task_input in enumerate(task_inputs):
-                task_id = f"task_{i}"
-                tasks.append((task_id, task_input))
-                
-            # 并行处理（不带流式输出）
-            raw_results = await analyzer.process_parallel_stream(tasks, limit=self.llm_limit)
-
-        # 处理结果
+        analyzer = LLMClient(prompt_config, stage="L2L3", builder=type(prompt_builder).__name__)
+
+        # 创建并行任务，每个任务有唯一ID
+        tasks = [(f"task_{i}", task_input) for i, task_input in enumerate(task_inputs)]
+        if not (channel_layer and group_name):
+            # 不带WebSocket流式输出
+            channel_layer, group_name = None, None
+
+        publisher = _PartialHeadingsPublisher(document_h1, len(tasks), on_partial, stage_start)
+
+        # 按完成顺序处理，不等待最慢的请求
+        raw_results = [None] * len(tasks)
+        async for task_id, result in analyzer.process_as_completed(
+            tasks,
+            channel_layer=channel_layer,
+            group_name=group_name,
+            limit=self.llm_limit,
+            on_json_object=publisher.on_object if on_partial else None,
+        ):
+            raw_results[int(task_id.split("_")[1])] = result
+            if on_partial:
+                await publisher.on_task_done(self.output_processor.merge_outputs([result]))
+
+        logger.info(
+            f"L2/L3阶段LLM耗时: {time.perf_counter() - stage_start:.1f}秒, "
+            f"请求数: {len(task_inputs)} (章节数: {meta['chapters']}, packing={meta['packing']}), "
+            f"首个标题: {publisher.first_heading_seconds}秒, 部分结果发布: {publisher.published}次"
+        )
+
+        # 处理结果（切分的章节各部分之间有重叠，按position去重）
         clean_parsed_results = self.output_processor.merge_outputs(raw_results)
+        clean_parsed_results = self.output_processor.dedupe_by_position(clean_parsed_results)
 
         # 调整级别值(每个加1)
         for item in clean_parsed_results:
@@ -99,6 +114,82 @@ class OutlineL2L3Analyzer:
         logger.debug(f"L2/L3分析后的文档标题：\n{print_headings}")
         
         return document_h2h3
-    
 
-    
+
+class _PartialHeadingsPublisher:
+    """
+    累积流式解析出的标题，节流发布已应用这些标题的部分文档
+
+    - 同一position以首次出现的标题为准（与最终结果的dedupe_by_position一致）
+    - 流式过程中按时间间隔节流；每个请求完成时立即发布一次
+    - 回调失败只记录日志，不影响分析主流程
+    """
+
+    def __init__(self, document_h1: Dict, total_tasks: int, on_partial, stage_start: float):
+        self.document_h1 = document_h1
+        self.total_tasks = total_tasks
+        self.on_partial = on_partial
+        self.stage_start = stage_start
+        self.interval = settings.STRUCTURING_L2_PARTIAL_PUBLISH_INTERVAL
+
+        self.headings: Dict[int, Dict] = {}
+        self.completed_tasks = 0
+        self.published = 0
+        self._published_count = 0
+        self._last_publish = 0.0
+        self.first_heading_seconds: Optional[float] = None
+
+    @staticmethod
+    def _is_heading(obj: Any) -> bool:
+        return (
+            isinstance(obj, dict)
+            and isinstance(obj.get("position"), int)
+            and isinstance(obj.get("level"), int)
+            and bool(obj.get("title"))
+        )
+
+    def _add(self, items: List[Any]) -> None:
+        for item in items:
+            if self._is_heading(item):
+                self.headings.setdefault(item["position"], item)
+        if self.headings and self.first_heading_seconds is None:
+            self.first_heading_seconds = round(time.perf_counter() - self.stage_start, 1)
+
+    async def on_object(self, task_id, obj: Any) -> None:
+        """流式输出中解析出一个完整对象"""
+        self._add([obj])
+        await self._publish(force=False)
+
+    async def on_task_done(self, items: List[Any]) -> None:
+        """一个请求完成（以完整输出为准补齐流式过程中遗漏的标题）"""
+        self.completed_tasks += 1
+        self._add(items)
+        await self._publish(force=True)
+
+    async def _publish(self, force: bool) -> None:
+        if not self.on_partial or self.interval <= 0 or len(self.headings) == self._published_count:
+            return
+        now = time.perf_counter()
+        if not force and now - self._last_publish < self.interval:
+            return
+        self._last_publish = now
+        self._published_count = len(self.headings)
+
+        try:
+            # 级别加1，不修改累积的原始对象
+            heading_list = [
+                {**item, "level": item["level"] + 1}
+                for _, item in sorted(self.headings.items())
+            ]
+            partial_document = update_nodes_to_headings(
+                tiptap_doc=self.document_h1,
+                heading_list=heading_list,
+            )
+            await self.on_partial(partial_document, {
+                "completed": self.completed_tasks,
+                "total": self.total_tasks,
+                "headings": len(heading_list),
+            })
+            self.published += 1
+        except Exception as e:
+            logger.warning(f"发布L2/L3部分结果失败: {str(e)}")
@@ -19,6 +19,10 @@ from .step_funcs.docx_extractor import DocxExtractor
 from .step_funcs.analyze_l1_headings import OutlineL1Analyzer
 from .step_funcs.analyze_l2_l3_headings import OutlineL2L3Analyzer
 from .step_funcs.add_intro_headings import AddIntroHeadings
+from app.services.broadcast import publish_partial_document
+from app.services.document_cache import document_stage
+from app.services.llm.telemetry import llm_call_context
+from app.services.llm.scheduler import llm_work_context, INTERACTIVE
 
 logger = logging.getLogger(__name__)
 
@@ -51,25 +55,27 @@ class Structuring:
 
 
         try:
-            # 根据步骤类型执行相应处理
-            if step == ProcessingStep.EXTRACT:
-                await self._process_extract(trace_id)
+            # 根据步骤类型执行相应处理（文档读取按步骤统计Redis传输字节数和解析耗时）
+            with document_stage(step.value):
+                if step == ProcessingStep.EXTRACT:
+                    await self._process_extract(trace_id)
                 
-            elif step == ProcessingStep.ANALYZE_H1:
-                await self._process_analyze_h1(trace_id)
+                elif step == ProcessingStep.ANALYZE_H1:
+                    await self._process_analyze_h1(trace_id)
                 
-            elif step == ProcessingStep.ANALYZE_H2H3:
-                await self._process_analyze_h2h3(trace_id)
+                elif step == ProcessingStep.ANALYZE_H2H3:
+                    await self._process_analyze_h2h3(trace_id)
                 
-            elif step == ProcessingStep.ADD_INTRODUCTION:
-                await self._process_add_introduction(trace_id)
+                elif step == ProcessingStep.ADD_INTRODUCTION:
+                    await self._process_add_introduction(trace_id)
                 
-            elif step == ProcessingStep.REVIEW_STRUCTURE:
-                await self._process_review_structure(trace_id)
+                elif step == ProcessingStep.REVIEW_STRUCTURE:
+                    await self._process_review_structure(trace_id)
                 
-            else:
-                raise ProcessingError(f"未知的处理步骤: {step}")
+                else:
+                    raise ProcessingError(f"未知的处理步骤: {step}")
                 
+
         except Exception as e:
             error_msg = f"处理步骤失败: {str(e)}"
             logger.error(f"[{trace_id}] {error_msg}\n{traceback.format_exc()}")
@@ -111,8 +117,9 @@ class Structuring:
     async def _process_analyze_h1(self, trace_id: str) -> Dict[str, Any]:
         """处理一级标题分析步骤"""
         try:
-            # 获取原始文档
-            document = await self.cache.get_document('raw_document')
+            # 获取原始文档（同时按文档版本登记文本索引，之后的prompt构建和tiptap工具按对象身份直接命中）
+            index = await self.cache.get_document_index('raw_document')
+            document = index.doc if index else None
             if not document:
                 raise ProcessingError("没有可用的文档内容")
             
@@ -124,7 +131,8 @@ class Structuring:
             )
             
             # 执行H1分析
-            h1_document = await self._outline_l1_analyzer.analyze(document, self.project_id)
+            with llm_call_context(project_id=self.project_id), llm_work_context(priority=INTERACTIVE):
+                h1_document = await self._outline_l1_analyzer.analyze(document, self.project_id)
             
             if not h1_document:
                 raise ProcessingError("H1大纲分析失败，结果为空")
@@ -150,8 +158,9 @@ class Structuring:
     async def _process_analyze_h2h3(self, trace_id: str) -> Dict[str, Any]:
         """处理二级/三级标题分析步骤"""
         try:
-            # 获取H1分析结果
-            h1_document = await self.cache.get_document('h1_document')
+            # 获取H1分析结果（同时登记文本索引）
+            index = await self.cache.get_document_index('h1_document')
+            h1_document = index.doc if index else None
             if not h1_document:
                 raise ProcessingError("没有可用的H1分析结果")
             
@@ -163,7 +172,9 @@ class Structuring:
             )
             
             # 执行H2H3分析
-            h2h3_document = await self._outline_l2_l3_analyzer.analyze(h1_document, self.project_id)
+            # 分析过程中按完成顺序发布已识别标题的部分文档
+            with llm_call_context(project_id=self.project_id), llm_work_context(priority=INTERACTIVE):
+                h2h3_document = await self._outline_l2_l3_analyzer.analyze(h1_document, on_partial=self._publish_partial_h2h3)
             
             if not h2h3_document:
                 raise ProcessingError("H2H3大纲分析失败，结果为空")
@@ -186,11 +197,17 @@ class Structuring:
             logger.error(f"[{trace_id}] H2H3分析失败: {str(e)}")
             raise ProcessingError(f"H2H3分析失败: {str(e)}")
     
+    async def _publish_partial_h2h3(self, partial_document: Dict[str, Any], progress: Dict[str, Any]) -> None:
+        """发布H2H3分析的部分结果（只写Redis，并推送SSE事件通知前端拉取）"""
+        if await self.cache.save_partial_document('h2h3_document_partial', partial_document):
+            await publish_partial_document(self.project_id, 'h2h3_document_partial', progress)
+    
     async def _process_add_introduction(self, trace_id: str) -> Dict[str, Any]:
         """处理引言添加步骤"""
         try:
-            # 获取H2H3分析结果
-            h2h3_document = await self.state_manager.cache.get_document('h2h3_document')
+            # 获取H2H3分析结果（同时登记文本索引）
+            index = await self.state_manager.cache.get_document_index('h2h3_document')
+            h2h3_document = index.doc if index else None
             if not h2h3_document:
                 raise ProcessingError("没有可用的H2H3分析结果")
             
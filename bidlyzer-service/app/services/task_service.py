@@ -1,15 +1,20 @@
 # from apps.projects.models import Task, TaskStatus
 from typing import List, Dict
 import tiktoken
-import re
 import json
 import logging
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def _get_encoding():
+    """tokenizer 只加载一次，进程内复用"""
+    return tiktoken.encoding_for_model("gpt-3.5-turbo")
 
 
 def count_tokens(text: str) -> int:
     """计算文本的token数量"""
-    encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")
-    return len(encoding.encode(text))
+    return len(_get_encoding().encode(text))
 
 
 def _clean_llm_JSON_output(output: str) -> str:
@@ -24,23 +29,15 @@ def _clean_llm_JSON_output(output: str) -> str:
     
     转换为:
     {"key": "value"}
+
+    尾随逗号、中文引号、输出被截断等常见问题会被修复（见 JSONExtractor）
     
     :param output: 大模型原始输出
     :return: 清洗后的输出
     """
     
-    # 移除开头的 ```json、```javascript 等代码块标记
-    output = re.sub(r'^```\w*\n', '', output)
-    
-    # 移除结尾的 ``` 标记
-    output = re.sub(r'\n```$', '', output)
-    
-    # 如果整个字符串被代码块包裹，也进行处理
-    output = re.sub(r'^```\w*\n(.*)\n```$', r'\1', output, flags=re.DOTALL)
-    
-    output_json = json.loads(output.strip())
-
-    return output_json
+    from app.services.llm.json_extractor import extract_json
+    return extract_json(output)
 
 
 def merge_outputs_(outputs: List[str]) -> List[Dict]:
@@ -68,7 +65,7 @@ def merge_outputs_(outputs: List[str]) -> List[Dict]:
         except json.JSONDecodeError as e:
             # 如果JSON解析失败，记录错误并跳过此输出
             logger = logging.getLogger(__name__)
-            logger.error(f"JSON解析错误: {str(e)}, 原始输出: {cleaned_parsed_output[:100]}...")
+            logger.error(f"JSON解析错误: {str(e)}, 原始输出: {output[:100]}...")
             continue
     
     # 合并后的结果是Json Dict格式。
@@ -104,7 +101,7 @@ def merge_JSON_outputs(outputs: list, flatten: bool = True) -> str:
                 
         except json.JSONDecodeError as e:
             logger = logging.getLogger(__name__)
-            logger.error(f"合并JSON时解析错误: {str(e)}, 输出: {cleaned_parsed_output[:100]}...")
+            logger.error(f"合并JSON时解析错误: {str(e)}, 输出: {output[:100]}...")
     
     # 合并后的结果是Json Dict格式。
     # 如果 将合并后的结果转换为JSON字符串，可return json.dumps(merged_data, ensure_ascii=False, indent=2)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+一次结构化分析的Redis网络往返次数（内存版Redis计数，不需要Redis服务）
+
+运行：
+    PYTHONPATH=. python app/services/tests/bench_cache_round_trips.py
+
+按结构化流程模拟Cache的调用：初始化状态；每个步骤开始/结束时更新状态（读取最新状态 + 追加状态）、
+发送消息（发布SSE + 追加消息历史）；读取上一步的文档、保存本步的文档；L2/L3分析中发布部分结果；
+最后前端查询状态和消息历史。另外单独统计一次清理项目全部缓存（clean_up）。
+分别统计进程内文档缓存命中（同一进程读写）和未命中（读取由其他worker写入的文档）两种情况。
+报告各环节的往返次数（管道/事务计一次）。
+"""
+
+import asyncio
+import uuid
+from datetime import datetime
+
+from app.core.config import settings
+from app.core.redis_helper import RedisClient
+from app.services import cache as cache_module, cache_persister
+from app.services.bp_msg import AgentMessage, SSEData
+from app.services.broadcast import publish_state_update
+from app.services.bp_state import AgentState, StageEnum, StageStatus
+from app.services.cache import Cache
+from app.services.cache_persister import CachePersister
+from app.services.document_cache import DocumentCache
+from app.services.tests.fixtures.fake_redis import FakeRedis
+
+STEPS = [
+    ("extract", None, "raw_document"),
+    ("analyze_h1", "raw_document", "h1_document"),
+    ("analyze_h2h3", "h1_document", "h2h3_document"),
+    ("add_introduction", "h2h3_document", "intro_document"),
+    ("review_structure", "intro_document", "final_document"),
+]
+PARTIAL_PUBLISHES = 5
+
+
+class FakeStorage:
+    async def save_batch_to_django(self, items):
+        return True
+
+    async def get_from_django(self, params):
+        return {"key_name": params["fields"], "content": None}
+
+    async def clear_storage(self, clear_fields):
+        return True
+
+
+def make_doc(step: str, paragraphs: int = 200) -> dict:
+    return {"type": "doc", "content": [
+        {"type": "paragraph", "content": [{"type": "text", "text": f"{step} 第{i}条 投标人须知"}]} for i in range(paragraphs)
+    ]}
+
+
+async def update_state(cache: Cache, progress: int, status: StageStatus) -> None:
+    state, _ = await cache.get_agent_state()
+    state.overall_progress = progress
+    state.stage_status = status
+    state.updated_at = datetime.now()
+    await cache.save_agent_state(state)
+
+
+async def publish_message(cache: Cache, content: str) -> None:
+    message = AgentMessage(id=str(uuid.uuid4()), event="state_update", retry=3000, data=SSEData(
+        stage="structuring", step=content, message=content, show_results=False, result_key_names=None,
+        required_action=False, action_status=None, action_type=None,
+    ))
+    await publish_state_update(cache.project_id, message)
+
+
+async def measure(redis: FakeRedis, label: str, coro) -> None:
+    trips = redis.round_trips
+    await coro
+    print(f"  {label:<24} 往返 {redis.round_trips - trips:3d}")
+
+
+async def structuring_run(cache: Cache) -> None:
+    await cache.save_agent_state(AgentState(
+        agent_id=cache.project_id, overall_progress=0, active_stage=StageEnum.STRUCTURING,
+        stage_status=StageStatus.NOT_STARTED, stage_task_id=None, created_at=datetime.now(), updated_at=datetime.now(),
+    ))
+    for i, (step, source, target) in enumerate(STEPS):
+        await update_state(cache, i * 20, StageStatus.IN_PROGRESS)
+        await publish_message(cache, f"开始{step}")
+        document = await cache.get_document(source) if source else {}
+        if step == "analyze_h2h3":
+            for _ in range(PARTIAL_PUBLISHES):
+                await cache.save_partial_document("h2h3_document_partial", make_doc("partial"))
+                await RedisClient.publish(cache.get_channel_keys()["sse_channel"], {"event": "partial_document"})
+        await cache.save_document(target, make_doc(step) if not document else {**document, "step": step})
+        await update_state(cache, i * 20 + 20, StageStatus.COMPLETED)
+        await publish_message(cache, f"完成{step}")
+        await cache.flush()
+
+    # 前端查询
+    await cache.get_agent_state()
+    await cache.get_agent_message_history(start=-50)
+
+
+async def main():
+    settings.CACHE_PERSIST_WRITE_BEHIND = False
+    redis = FakeRedis()
+    RedisClient._client = redis
+    RedisClient._binary_client = redis
+    storage = FakeStorage()
+    cache_persister.Storage = cache_module.Storage = lambda project_id: storage
+    DocumentCache.clear()
+    CachePersister.clear()
+
+    for enabled, label in ((True, "进程内文档缓存命中"), (False, "进程内文档缓存未命中")):
+        settings.DOCUMENT_CACHE_ENABLED = enabled
+        redis.data.clear()
+        redis.round_trips = 0
+        cache = Cache(f"bench-project-{enabled}")
+        print(f"一次结构化分析（{label}）：")
+        await measure(redis, "结构化流程", structuring_run(cache))
+        await measure(redis, "clean_up（全部缓存）", cache.clean_up())
+        print(f"  合计往返 {redis.round_trips}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+结构化流程五个版本文档的存储大小：整篇保存 vs 相对raw_document的节点差异（内存版Redis，不需要Redis和django服务）
+
+运行：
+    PYTHONPATH=. python app/services/tests/bench_document_delta.py [MB...]
+
+按招标文件大小（默认 2 / 10 / 30 MB 的合成tiptap文档）模拟各阶段：h1 把少量段落改为一级标题，h2h3 再把约5%的段落改为二三级标题，
+intro 在开头插入前言和目录，final 调整个别标题。
+报告写入Redis的字节数（RedisCodec编码、压缩后）和提交django的JSON字节数，以及保存（计算差异）和其他进程读取（重建）的耗时。
+"""
+
+import asyncio
+import copy
+import random
+import sys
+import time
+
+import orjson
+
+from app.core.config import settings
+from app.core.redis_helper import RedisClient
+from app.core.tests.bench_redis_codec import synthetic_document
+from app.services import cache as cache_module, cache_persister
+from app.services.cache import Cache
+from app.services.cache_persister import CachePersister
+from app.services.document_cache import DocumentCache
+from app.services.document_delta import DocumentDelta
+from app.services.tests.fixtures.fake_redis import FakeRedis
+
+
+class FakeStorage:
+    def __init__(self):
+        self.stored = {}
+
+    async def save_batch_to_django(self, items):
+        for item in items:
+            self.stored[item["key_name"]] = orjson.dumps(item["content"])
+        return True
+
+    async def get_from_django(self, params):
+        return {"key_name": params["fields"], "content": None}
+
+    async def clear_storage(self, clear_fields):
+        return True
+
+
+def with_headings(doc: dict, rng: random.Random, fraction: float, levels) -> dict:
+    doc = copy.deepcopy(doc)
+    for i, node in enumerate(doc["content"]):
+        if node["type"] == "paragraph" and rng.random() < fraction:
+            doc["content"][i] = {"type": "heading", "attrs": {"level": rng.choice(levels)}, "content": node["content"]}
+    return doc
+
+
+def stage_documents(mb: int) -> list:
+    rng = random.Random(mb)
+    raw = synthetic_document(mb * 1024 * 1024, seed=mb)
+    h1 = with_headings(raw, rng, 0.003, [1])
+    h2h3 = with_headings(h1, rng, 0.05, [2, 3])
+    intro = copy.deepcopy(h2h3)
+    intro["content"][0:0] = [
+        {"type": "heading", "attrs": {"level": 1}, "content": [{"type": "text", "text": "前言"}]},
+        {"type": "paragraph", "content": [{"type": "text", "text": "目录 " * 50}]},
+    ]
+    final = copy.deepcopy(intro)
+    final["content"][len(final["content"]) // 2] = {"type": "heading", "attrs": {"level": 2}, "content": [{"type": "text", "text": "评标办法"}]}
+    return [("raw_document", raw), ("h1_document", h1), ("h2h3_document", h2h3), ("intro_document", intro), ("final_document", final)]
+
+
+async def run(documents: list, enabled: bool) -> None:
+    settings.DOCUMENT_DELTA_ENABLED = enabled
+    redis = FakeRedis()
+    RedisClient._client = redis
+    RedisClient._binary_client = redis
+    storage = FakeStorage()
+    cache_persister.Storage = cache_module.Storage = lambda project_id: storage
+    for cls in (DocumentCache, DocumentDelta, CachePersister):
+        cls.clear()
+
+    cache = Cache("bench-project")
+    start = time.perf_counter()
+    for key_name, doc in documents:
+        await cache.save_document(key_name, doc)
+    save_seconds = time.perf_counter() - start
+
+    # 其他进程读取最终文档（进程内缓存未命中，基准文档也需要从Redis读取）
+    DocumentCache.clear()
+    DocumentDelta.clear()
+    start = time.perf_counter()
+    assert await Cache("bench-project").get_document("final_document") == documents[-1][1]
+    read_seconds = time.perf_counter() - start
+
+    keys = cache.get_cache_keys()
+    redis_bytes = sum(len(redis.data[keys[key_name]]) for key_name, _ in documents)
+    django_bytes = sum(len(storage.stored[key_name]) for key_name, _ in documents)
+    label = "节点差异" if enabled else "整篇保存"
+    print(f"  [{label}] Redis {redis_bytes / 1024 / 1024:7.2f} MB, django {django_bytes / 1024 / 1024:7.2f} MB, "
+          f"保存5个版本 {save_seconds:.2f}s, 其他进程读取final {read_seconds:.2f}s")
+
+
+async def main(sizes: list):
+    settings.CACHE_PERSIST_WRITE_BEHIND = False
+    for mb in sizes:
+        documents = stage_documents(mb)
+        print(f"\n合成{mb}MB招标文件（{len(documents[0][1]['content'])}个顶层节点）：")
+        await run(documents, enabled=False)
+        await run(documents, enabled=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main([int(arg) for arg in sys.argv[1:]] or [2, 10, 30]))
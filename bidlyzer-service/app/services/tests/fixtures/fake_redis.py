@@ -0,0 +1,216 @@
+"""
+单元测试用的内存版Redis客户端
+
+用法：install_fake_redis(monkeypatch)，RedisClient的各方法即作用于内存数据
+值按写入时的类型保存（RedisCodec编码后的bytes、原样写入的str），列表以list保存；pipeline中的命令在execute时依次执行
+publish的消息投递给按模式订阅（psubscribe）的FakePubSub；Stream以[(ID, 字段)]列表保存，eval只实现锁释放和XADD_PUBLISH_SCRIPT
+"""
+
+import asyncio
+import fnmatch
+import inspect
+import time
+from app.core.redis_helper import RedisClient, XADD_PUBLISH_SCRIPT, parse_stream_id
+
+
+def install_fake_redis(monkeypatch) -> "FakeRedis":
+    """文本连接和二进制连接都替换为同一个FakeRedis"""
+    fake = FakeRedis()
+    monkeypatch.setattr(RedisClient, "_client", fake)
+    monkeypatch.setattr(RedisClient, "_binary_client", fake)
+    return fake
+
+
+def _round_trip(func):
+    """直接调用的命令计一次网络往返，管道中执行的命令不计（管道execute计一次）"""
+    async def wrapper(self, *args, **kwargs):
+        if not self.in_pipeline:
+            self.round_trips += 1
+        return await func(self, *args, **kwargs)
+    return wrapper
+
+
+class FakeRedis:
+    """
+    内存版Redis，只实现Cache用到的命令
+    commands记录读取类命令，用于断言访问次数；round_trips统计网络往返次数（管道计一次）
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.commands = []
+        self.published = []
+        self.round_trips = 0
+        self.in_pipeline = False
+        self.pubsubs = []
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def pubsub(self):
+        pubsub = FakePubSub(self)
+        self.pubsubs.append(pubsub)
+        return pubsub
+
+    @_round_trip
+    async def get(self, key):
+        self.commands.append("get")
+        value = self.data.get(key)
+        return value if isinstance(value, (str, bytes)) else None
+
+    @_round_trip
+    async def mget(self, keys):
+        self.commands.append("mget")
+        return [value if isinstance(value, (str, bytes)) else None for value in map(self.data.get, keys)]
+
+    @_round_trip
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    @_round_trip
+    async def setex(self, key, expire, value):
+        self.data[key] = value
+        return True
+
+    @_round_trip
+    async def delete(self, *keys):
+        return sum(1 for key in keys if self.data.pop(key, None) is not None)
+
+    @_round_trip
+    async def exists(self, *keys):
+        return sum(1 for key in keys if key in self.data)
+
+    @_round_trip
+    async def publish(self, channel, message):
+        return self._deliver(channel, message)
+
+    def _deliver(self, channel, message):
+        self.published.append((channel, message))
+        receivers = [pubsub for pubsub in self.pubsubs if pubsub.matches(channel)]
+        for pubsub in receivers:
+            pubsub.messages.put_nowait({"type": "pmessage", "pattern": pubsub.patterns[0], "channel": channel, "data": message})
+        return len(receivers)
+
+    @_round_trip
+    async def eval(self, script, numkeys, *args):
+        if script == XADD_PUBLISH_SCRIPT:
+            stream, max_len, expire, channel, message, tail = args
+            stream_id = self._xadd(stream, {"message": message}, max_len)
+            self._deliver(channel, f'{{"stream_id":"{stream_id}"{tail}')
+            return stream_id
+        key, lock_id = args[:2]
+        if self.data.get(key) == lock_id:
+            del self.data[key]
+            return 1
+        return 0
+
+    def _xadd(self, key, fields, max_len):
+        entries = self.data.setdefault(key, [])
+        ms, seq = int(time.time() * 1000), 0
+        if entries:
+            last_ms, last_seq = parse_stream_id(entries[-1][0])
+            if ms <= last_ms:
+                ms, seq = last_ms, last_seq + 1
+        stream_id = f"{ms}-{seq}"
+        entries.append((stream_id, fields))
+        del entries[:-int(max_len)]
+        return stream_id
+
+    @_round_trip
+    async def xrange(self, key, min="-", max="+", count=None):
+        self.commands.append("xrange")
+        exclusive = min.startswith("(")
+        start = parse_stream_id(min.lstrip("(")) if min != "-" else (0, 0)
+        end = parse_stream_id(max) if max != "+" else (float("inf"), 0)
+        entries = [
+            (stream_id, fields) for stream_id, fields in self.data.get(key, [])
+            if (start < parse_stream_id(stream_id) if exclusive else start <= parse_stream_id(stream_id)) and parse_stream_id(stream_id) <= end
+        ]
+        return entries[:count] if count else entries
+
+    @_round_trip
+    async def lindex(self, key, index):
+        self.commands.append("lindex")
+        items = self.data.get(key, [])
+        try:
+            return items[index]
+        except IndexError:
+            return None
+
+    @_round_trip
+    async def lrange(self, key, start, end):
+        self.commands.append("lrange")
+        return self.data.get(key, [])[start:(end + 1) or None]
+
+    @_round_trip
+    async def llen(self, key):
+        return len(self.data.get(key, []))
+
+    def rpush(self, key, *values):
+        self.data.setdefault(key, []).extend(values)
+        return len(self.data[key])
+
+    def lpush(self, key, *values):
+        items = self.data.setdefault(key, [])
+        for value in values:
+            items.insert(0, value)
+        return len(items)
+
+    def ltrim(self, key, start, end):
+        self.data[key] = self.data[key][start:(end + 1) or None]
+        return True
+
+    def expire(self, key, seconds):
+        return key in self.data
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name, args))
+
+    async def execute(self):
+        self.redis.commands.append("pipeline")
+        self.redis.round_trips += 1
+        self.redis.in_pipeline = True
+        try:
+            results = []
+            for name, args in self.calls:
+                result = getattr(self.redis, name)(*args)
+                results.append(await result if inspect.isawaitable(result) else result)
+            return results
+        finally:
+            self.redis.in_pipeline = False
+
+
+class FakePubSub:
+    def __init__(self, redis):
+        self.redis = redis
+        self.patterns = []
+        self.messages = asyncio.Queue()
+        self.closed = False
+
+    def matches(self, channel):
+        return not self.closed and any(fnmatch.fnmatchcase(channel, pattern) for pattern in self.patterns)
+
+    async def psubscribe(self, *patterns):
+        self.patterns.extend(patterns)
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        try:
+            message = await asyncio.wait_for(self.messages.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if isinstance(message, Exception):
+            raise message
+        return message
+
+    async def close(self):
+        self.closed = True
+        self.redis.pubsubs.remove(self)
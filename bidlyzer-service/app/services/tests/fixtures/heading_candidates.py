@@ -0,0 +1,154 @@
+"""
+标题候选预筛选的标注样例
+
+按招标文件的常见版式生成 Tiptap 文档，并标注正文中所有层级标题的position（不含封面和目录）：
+- plain_numbered: docx未设置标题样式，标题靠"第X章 / 一、/ 1.1"编号和加粗区分，含目录、列表项、条款、表格
+- styled_h1: 一级标题已是 heading 节点，子标题为"（一）"编号，目录带 toc 样式
+- toc_match_only: 标题既无编号也不加粗，只能通过与目录条目匹配识别
+
+生成过程使用固定随机种子，结果稳定。
+"""
+
+import random
+from typing import Dict, List, Any
+
+CN_NUMBERS = "一二三四五六七八九十"
+
+CLAUSES = [
+    "投标人应按招标文件的要求编制投标文件，投标文件应对招标文件提出的实质性要求和条件作出响应，否则其投标将被否决。",
+    "投标人须在投标截止时间前将投标文件递交至指定地点，逾期送达或者未送达指定地点的投标文件，招标人不予受理。",
+    "评标委员会按照招标文件规定的评标方法和标准，对投标文件进行评审和比较，并推荐合格的中标候选人，评标过程严格保密。",
+    "中标人应当按照合同约定履行义务，完成中标项目，不得向他人转让中标项目，也不得将中标项目肢解后分别向他人转让。",
+    "投标保证金应当从投标人基本账户转出，以银行转账、银行保函或者保险机构出具的保证保险等形式提交，金额不超过项目估算价的百分之二。",
+    "招标人对已发出的招标文件进行必要的澄清或者修改的，应当在投标截止时间至少十五日前，以书面形式通知所有获取招标文件的潜在投标人。",
+    "投标文件的正本和副本均应使用不能擦去的墨水打印或书写，由投标人的法定代表人或其委托代理人签字并加盖单位公章。",
+    "评标委员会可以书面方式要求投标人对投标文件中含义不明确的内容作必要的澄清、说明或补正，但不得改变投标文件的实质性内容。",
+]
+
+
+class LabelledDocument:
+    """逐个追加节点，同时记录标题的position"""
+
+    def __init__(self, name: str, seed: int):
+        self.name = name
+        self.rng = random.Random(seed)
+        self.nodes: List[Dict[str, Any]] = []
+        self.headings: List[int] = []
+
+    def add(self, node: Dict[str, Any], heading: bool = False) -> None:
+        if heading:
+            self.headings.append(len(self.nodes))
+        self.nodes.append(node)
+
+    def body(self, count: int) -> None:
+        for _ in range(count):
+            self.add(paragraph(self.rng.choice(CLAUSES) + self.rng.choice(CLAUSES)[:self.rng.randint(10, 60)]))
+
+    def list_items(self, count: int, paren: bool = False) -> None:
+        """条款内的编号列表项（不是标题）"""
+        for i in range(1, count + 1):
+            lead = f"（{i}）" if paren else f"{i}、"
+            self.add(paragraph(lead + self.rng.choice(CLAUSES)[:self.rng.randint(25, 70)] + "。"))
+
+    def table(self, rows: int) -> None:
+        self.add({"type": "table", "content": [
+            {"type": "tableRow", "content": [
+                {"type": "tableCell", "content": [paragraph(f"{self.rng.choice(CLAUSES)[:20]}")]}
+                for _ in range(3)
+            ]}
+            for _ in range(rows)
+        ]})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "doc": {"type": "doc", "content": self.nodes}, "headings": self.headings}
+
+
+def paragraph(text: str, bold: bool = False, style: str = None) -> Dict[str, Any]:
+    node = {"type": "paragraph", "content": []}
+    if text:
+        run = {"type": "text", "text": text}
+        if bold:
+            run["marks"] = [{"type": "bold"}]
+        node["content"].append(run)
+    if style:
+        node["attrs"] = {"class": style}
+    return node
+
+
+def heading(text: str, level: int) -> Dict[str, Any]:
+    return {"type": "heading", "attrs": {"level": level}, "content": [{"type": "text", "text": text}]}
+
+
+def plain_numbered() -> Dict[str, Any]:
+    doc = LabelledDocument("plain_numbered", seed=7)
+    for line in ("XX市人民医院医疗设备采购项目", "招 标 文 件", "项目编号：ZB-2024-0815", "招标人：XX市人民医院", "2024.08.15", "目  录"):
+        doc.add(paragraph(line))
+    chapters = ["招标公告", "投标人须知", "评标办法", "合同条款及格式", "采购需求", "投标文件格式"]
+    for i, title in enumerate(chapters):
+        doc.add(paragraph(f"第{CN_NUMBERS[i]}章 {title}........................{3 + i * 7}"))
+
+    for i, title in enumerate(chapters):
+        doc.add(paragraph(f"第{CN_NUMBERS[i]}章 {title}", bold=True), heading=True)
+        doc.add(paragraph(""))
+        for j in range(doc.rng.randint(2, 4)):
+            section = doc.rng.choice(["项目概况", "资格要求", "招标范围", "投标文件的编制", "评审程序", "技术要求"])
+            doc.add(paragraph(f"{CN_NUMBERS[j]}、{section}"), heading=True)
+            for k in range(doc.rng.randint(1, 3)):
+                clause = doc.rng.choice(["总则", "投标报价", "投标有效期", "投标保证金", "样品"])
+                doc.add(paragraph(f"{j + 1}.{k + 1} {clause}"), heading=True)
+                doc.body(doc.rng.randint(2, 5))
+                if doc.rng.random() < 0.4:
+                    doc.list_items(doc.rng.randint(3, 6))
+                if doc.rng.random() < 0.3:
+                    doc.table(3)
+                # 带编号的长条款是正文，不是标题
+                doc.add(paragraph(f"{j + 1}.{k + 1}.1 " + doc.rng.choice(CLAUSES) + doc.rng.choice(CLAUSES)))
+        if title == "投标人须知":
+            doc.add(paragraph("投标人须知前附表", bold=True), heading=True)
+            doc.table(8)
+
+    for i, title in enumerate(["投标函", "法定代表人授权书", "投标报价一览表"]):
+        doc.add(paragraph(f"附件{i + 1}：{title}"), heading=True)
+        doc.body(2)
+    return doc.to_dict()
+
+
+def styled_h1() -> Dict[str, Any]:
+    doc = LabelledDocument("styled_h1", seed=11)
+    doc.add(paragraph("工程施工招标文件"))
+    doc.add(paragraph("目录", style="toc-heading"))
+    parts = ["投标邀请书", "投标人须知", "评标办法（综合评估法）", "合同条款", "工程量清单", "技术标准和要求"]
+    for i, title in enumerate(parts):
+        doc.add(paragraph(f"第{CN_NUMBERS[i]}部分 {title}\t{i * 5 + 1}", style="toc-1"))
+
+    for i, title in enumerate(parts):
+        doc.add(heading(f"第{CN_NUMBERS[i]}部分 {title}", 1), heading=True)
+        for j in range(doc.rng.randint(2, 4)):
+            section = doc.rng.choice(["一般规定", "工程概况", "质量要求", "工期要求", "安全文明施工"])
+            doc.add(paragraph(f"（{CN_NUMBERS[j]}）{section}"), heading=True)
+            doc.body(doc.rng.randint(3, 6))
+            doc.list_items(doc.rng.randint(2, 5), paren=True)
+            if doc.rng.random() < 0.5:
+                doc.table(5)
+    return doc.to_dict()
+
+
+def toc_match_only() -> Dict[str, Any]:
+    doc = LabelledDocument("toc_match_only", seed=13)
+    titles = ["采购公告", "供应商须知", "评审方法和评审标准", "政府采购合同", "服务需求书", "响应文件格式"]
+    doc.add(paragraph("竞争性磋商文件"))
+    doc.add(paragraph("目录"))
+    for i, title in enumerate(titles):
+        doc.add(paragraph(f"{title}…………{2 + i * 6}"))
+
+    for title in titles:
+        doc.add(paragraph(title), heading=True)
+        doc.body(doc.rng.randint(4, 9))
+        if doc.rng.random() < 0.5:
+            doc.table(4)
+    return doc.to_dict()
+
+
+def labelled_documents() -> List[Dict[str, Any]]:
+    """所有标注样例：[{"name", "doc", "headings"}, ...]"""
+    return [plain_numbered(), styled_h1(), toc_match_only()]
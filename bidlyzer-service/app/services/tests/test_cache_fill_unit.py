@@ -0,0 +1,156 @@
+import asyncio
+import pytest
+from datetime import datetime
+from app.core.config import settings
+from app.services import cache_persister
+from app.services.bp_state import AgentState, StageEnum, StageStatus
+from app.services.cache import Cache
+from app.services.cache_fill import CacheFill
+from app.services.cache_persister import CachePersister
+from app.services.document_cache import DocumentCache
+from app.services.tests.fixtures.fake_redis import install_fake_redis
+
+pytestmark = [pytest.mark.unit]
+
+DOC = {"type": "doc", "content": [{"type": "paragraph", "content": [{"type": "text", "text": "投标人须知"}]}]}
+
+
+class SlowStorage:
+    """回源django较慢（多MB文档），记录读取次数"""
+
+    def __init__(self, stored=None, delay=0.05, error=None):
+        self.stored = stored or {}
+        self.delay = delay
+        self.error = error
+        self.reads = []
+
+    async def get_from_django(self, params):
+        self.reads.append(params["fields"])
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.stored.get(params["fields"], {"key_name": params["fields"], "content": None})
+
+    async def save_batch_to_django(self, items):
+        return True
+
+    async def clear_storage(self, clear_fields):
+        return True
+
+
+def make_cache(storage) -> Cache:
+    cache = Cache("p1")
+    cache.storage = storage
+    return cache
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    return install_fake_redis(monkeypatch)
+
+
+@pytest.fixture(autouse=True)
+def clean(redis, monkeypatch):
+    monkeypatch.setattr(cache_persister, "Storage", lambda project_id: SlowStorage())
+    monkeypatch.setattr(settings, "CACHE_PERSIST_WRITE_BEHIND", False)
+    monkeypatch.setattr(settings, "CACHE_FILL_POLL_INTERVAL", 0.01)
+    for cls in (CacheFill, DocumentCache, CachePersister):
+        cls.clear()
+    CacheFill.reset_stats()
+    yield
+    for cls in (CacheFill, DocumentCache, CachePersister):
+        cls.clear()
+    CacheFill.reset_stats()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_document_misses_share_one_fetch():
+    storage = SlowStorage({"final_document": {"key_name": "final_document", "content": DOC}})
+
+    # SSE、文档接口、状态查询各自创建Cache，同时未命中
+    results = await asyncio.gather(*[make_cache(storage).get_document("final_document") for _ in range(5)])
+
+    assert results == [DOC] * 5
+    assert storage.reads == ["final_document"]
+    stats = CacheFill.stats()["keys"]["final_document"]
+    assert (stats["fills"], stats["joined"], stats["max_waiters"]) == (1, 4, 5)
+    assert CacheFill.stats()["inflight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_waits_for_fill_in_other_process(redis):
+    storage = SlowStorage({"h1_document": {"key_name": "h1_document", "content": DOC}})
+    cache = make_cache(storage)
+    lock_key = f"{cache.get_cache_keys()['h1_document']}:fill_lock"
+    redis.data[lock_key] = "other-process"
+
+    async def other_process():
+        await asyncio.sleep(0.05)
+        await make_cache(SlowStorage())._store_document("h1_document", DOC)
+        DocumentCache.clear()
+        del redis.data[lock_key]
+
+    result, _ = await asyncio.gather(cache.get_document("h1_document"), other_process())
+
+    assert result == DOC
+    assert storage.reads == []
+    stats = CacheFill.stats()["keys"]["h1_document"]
+    assert (stats["remote_waits"], stats["remote_hits"], stats["fills"]) == (1, 1, 0)
+
+
+@pytest.mark.asyncio
+async def test_falls_back_to_own_fetch_when_other_process_fails(redis):
+    storage = SlowStorage({"h1_document": {"key_name": "h1_document", "content": DOC}}, delay=0)
+    cache = make_cache(storage)
+    lock_key = f"{cache.get_cache_keys()['h1_document']}:fill_lock"
+    redis.data[lock_key] = "other-process"
+
+    async def other_process_gives_up():
+        await asyncio.sleep(0.03)
+        del redis.data[lock_key]
+
+    result, _ = await asyncio.gather(cache.get_document("h1_document"), other_process_gives_up())
+
+    assert result == DOC
+    assert storage.reads == ["h1_document"]
+    assert lock_key not in redis.data
+
+
+@pytest.mark.asyncio
+async def test_concurrent_state_misses_share_one_fetch():
+    now = datetime(2025, 1, 1)
+    state = AgentState(
+        agent_id="p1", overall_progress=30, active_stage=StageEnum.STRUCTURING, stage_status=StageStatus.IN_PROGRESS,
+        stage_task_id=None, created_at=now, updated_at=now,
+    ).model_dump(mode="json")
+    storage = SlowStorage({"agent_state_history": {"key_name": "agent_state_history", "content": [state]}})
+
+    results = await asyncio.gather(*[make_cache(storage).get_agent_state() for _ in range(3)])
+
+    assert [agent_state.overall_progress for agent_state, _ in results] == [30] * 3
+    assert storage.reads == ["agent_state_history"]
+    assert CacheFill.stats()["keys"]["agent_state_history"]["joined"] == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_shared_fetch():
+    storage = SlowStorage({"final_document": {"key_name": "final_document", "content": DOC}})
+    first = asyncio.ensure_future(make_cache(storage).get_document("final_document"))
+    await asyncio.sleep(0)
+    second = asyncio.ensure_future(make_cache(storage).get_document("final_document"))
+    await asyncio.sleep(0.01)
+    first.cancel()
+
+    assert await second == DOC
+    assert storage.reads == ["final_document"]
+
+
+@pytest.mark.asyncio
+async def test_fetch_error_is_shared_and_counted():
+    storage = SlowStorage(error=RuntimeError("django unavailable"))
+
+    results = await asyncio.gather(*[make_cache(storage).get_document("final_document") for _ in range(3)])
+
+    assert results == [None] * 3
+    assert len(storage.reads) == 1
+    assert CacheFill.stats()["keys"]["final_document"]["errors"] == 1
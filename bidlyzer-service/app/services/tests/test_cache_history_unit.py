@@ -0,0 +1,198 @@
+import json
+import pytest
+from datetime import datetime
+from app.core.config import settings
+from app.core.redis_codec import RedisCodec
+from app.services import cache_persister
+from app.services.cache import Cache
+from app.services.cache_persister import CachePersister
+from app.services.bp_state import AgentState, StageEnum, StageStatus
+from app.services.bp_msg import AgentMessage, SSEData
+from app.services.tests.fixtures.fake_redis import install_fake_redis
+
+pytestmark = [pytest.mark.unit]
+
+PROJECT_ID = "p1"
+
+
+class FakeStorage:
+    def __init__(self, stored=None):
+        self.stored = stored or {}
+        self.batches = []
+
+    async def save_batch_to_django(self, items):
+        self.batches.append(items)
+        for item in items:
+            current = self.stored.get(item["key_name"], {}).get("content")
+            content = (current or []) + item["content"] if item["append"] else item["content"]
+            self.stored[item["key_name"]] = {"key_name": item["key_name"], "content": content}
+        return True
+
+    async def get_from_django(self, params):
+        return self.stored.get(params["fields"], {"key_name": params["fields"], "content": None})
+
+    async def clear_storage(self, clear_fields):
+        return True
+
+
+def make_state(progress: int) -> AgentState:
+    now = datetime(2025, 1, 1, 12, 0, progress % 60)
+    return AgentState(
+        agent_id=PROJECT_ID,
+        overall_progress=progress,
+        active_stage=StageEnum.STRUCTURING,
+        stage_status=StageStatus.IN_PROGRESS,
+        stage_task_id=None,
+        created_at=now,
+        updated_at=now,
+    )
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    return install_fake_redis(monkeypatch)
+
+
+@pytest.fixture
+def cache(redis, monkeypatch):
+    storage = FakeStorage()
+    monkeypatch.setattr(cache_persister, "Storage", lambda project_id: storage)
+    monkeypatch.setattr(settings, "CACHE_PERSIST_WRITE_BEHIND", False)
+    CachePersister.clear()
+    cache = Cache(PROJECT_ID)
+    cache.storage = storage
+    yield cache
+    CachePersister.clear()
+
+
+@pytest.mark.asyncio
+async def test_states_are_appended_and_latest_is_read_by_index(cache, redis):
+    for progress in range(5):
+        assert await cache.save_agent_state(make_state(progress))
+
+    history_key = cache.get_history_keys()["agent_state_history"]
+    assert len(redis.data[history_key]) == 5
+    assert all(RedisCodec.decode(entry)["overall_progress"] == i for i, entry in enumerate(redis.data[history_key]))
+
+    redis.commands.clear()
+    state, history = await cache.get_agent_state()
+    assert state.overall_progress == 4
+    assert history is None
+    assert redis.commands == ["lindex"]
+
+    _, history = await cache.get_agent_state(with_history=True)
+    assert [s.overall_progress for s in history.content] == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.asyncio
+async def test_history_range(cache):
+    for progress in range(5):
+        await cache.save_agent_state(make_state(progress))
+
+    assert [s.overall_progress for s in (await cache.get_agent_state_history(1, 2)).content] == [1, 2]
+    assert [s.overall_progress for s in (await cache.get_agent_state_history(-2)).content] == [3, 4]
+    assert await cache.get_agent_state_history(10, 20) is None
+
+
+@pytest.mark.asyncio
+async def test_history_is_capped(cache, redis):
+    cache.max_state_history = 3
+    for progress in range(5):
+        await cache.save_agent_state(make_state(progress))
+
+    history = await cache.get_agent_state_history()
+    assert [s.overall_progress for s in history.content] == [2, 3, 4]
+
+    # django侧保存完整历史
+    await cache.flush()
+    assert len(cache.storage.stored["agent_state_history"]["content"]) == 5
+
+
+@pytest.mark.asyncio
+async def test_legacy_blob_is_migrated_before_new_entry(cache, redis):
+    legacy_key = cache.get_cache_keys()["agent_state_history"]
+    legacy = {"key_name": "agent_state_history", "content": [make_state(i).model_dump(mode="json") for i in range(3)]}
+    redis.data[legacy_key] = json.dumps(legacy)
+
+    await cache.save_agent_state(make_state(3))
+
+    assert legacy_key not in redis.data
+    history = await cache.get_agent_state_history()
+    assert [s.overall_progress for s in history.content] == [0, 1, 2, 3]
+
+    # 迁移的旧历史已在django中，只追加新的条目
+    await cache.flush()
+    assert [len(item["content"]) for item in cache.storage.batches[-1]] == [1]
+
+
+@pytest.mark.asyncio
+async def test_legacy_blob_is_migrated_on_read(cache, redis):
+    legacy_key = cache.get_cache_keys()["agent_state_history"]
+    legacy = {"key_name": "agent_state_history", "content": [make_state(i).model_dump(mode="json") for i in range(3)]}
+    redis.data[legacy_key] = json.dumps(legacy)
+
+    state, _ = await cache.get_agent_state()
+    assert state.overall_progress == 2
+    assert legacy_key not in redis.data
+    assert len(redis.data[cache.get_history_keys()["agent_state_history"]]) == 3
+
+
+@pytest.mark.asyncio
+async def test_expired_history_is_restored_from_storage(cache, redis):
+    for progress in range(3):
+        await cache.save_agent_state(make_state(progress))
+    await cache.flush()
+    redis.data.pop(cache.get_history_keys()["agent_state_history"])
+
+    await cache.save_agent_state(make_state(3))
+    history = await cache.get_agent_state_history()
+    assert [s.overall_progress for s in history.content] == [0, 1, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_empty_project_has_no_state(cache):
+    assert await cache.get_agent_state() == (None, None)
+    assert await cache.get_agent_message() == (None, None)
+    assert await cache.get_agent_message_history() is None
+
+
+@pytest.mark.asyncio
+async def test_clean_up_removes_history_lists(cache, redis):
+    await cache.save_agent_state(make_state(0))
+    results = await cache.clean_up(["agent_state_history"])
+
+    assert results == {"agent_state_history": True}
+    assert cache.get_history_keys()["agent_state_history"] not in redis.data
+
+
+@pytest.mark.asyncio
+async def test_clean_up_is_one_round_trip(cache, redis):
+    await cache.save_agent_state(make_state(0))
+    await cache.save_document("h1_document", {"type": "doc", "content": [{"type": "paragraph"}]})
+
+    redis.round_trips = 0
+    results = await cache.clean_up()
+
+    assert all(results.values())
+    assert redis.round_trips == 1
+    assert not redis.data
+
+
+@pytest.mark.asyncio
+async def test_message_is_published_in_same_round_trip(cache, redis):
+    message = AgentMessage(id="m1", event="state_update", retry=3000, data=SSEData(
+        stage="structuring", step="analyze_h1", message="开始分析", show_results=False, result_key_names=None,
+        required_action=False, action_status=None, action_type=None,
+    ))
+    await cache.save_agent_message(message)
+
+    redis.round_trips = 0
+    assert await cache.save_agent_message(message, publish=True)
+
+    assert redis.round_trips == 1
+    (channel, published), = redis.published
+    (stream_id, fields), = redis.data[cache.get_channel_keys()["sse_stream"]]
+    assert channel == cache.get_channel_keys()["sse_channel"]
+    assert fields["message"] == message.model_dump_json()
+    assert json.loads(published) == {"stream_id": stream_id, **json.loads(message.model_dump_json())}
+    assert len(redis.data[cache.get_history_keys()["agent_message_history"]]) == 2
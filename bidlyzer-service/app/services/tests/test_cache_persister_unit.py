@@ -0,0 +1,140 @@
+import asyncio
+import pytest
+import pytest_asyncio
+from app.core.config import settings
+from app.services import cache_persister
+from app.services.cache_persister import CachePersister
+
+pytestmark = [pytest.mark.unit]
+
+
+class FakeStorage:
+    """记录每个项目提交的批次，fail_times>0 时前几次提交失败"""
+
+    def __init__(self, fail_times: int = 0):
+        self.batches = []
+        self.fail_times = fail_times
+
+    def __call__(self, project_id):
+        storage = self
+
+        class _ProjectStorage:
+            async def save_batch_to_django(self, items):
+                if storage.fail_times > 0:
+                    storage.fail_times -= 1
+                    raise Exception("Django服务请求失败")
+                storage.batches.append((project_id, items))
+                return True
+
+        return _ProjectStorage()
+
+
+@pytest_asyncio.fixture
+async def storage(monkeypatch):
+    fake = FakeStorage()
+    monkeypatch.setattr(cache_persister, "Storage", fake)
+    monkeypatch.setattr(settings, "CACHE_PERSIST_WRITE_BEHIND", True)
+    monkeypatch.setattr(settings, "CACHE_PERSIST_FLUSH_INTERVAL", 60.0)
+    CachePersister.clear()
+    CachePersister.reset_stats()
+    yield fake
+    CachePersister.clear()
+    CachePersister.reset_stats()
+
+
+@pytest.mark.asyncio
+async def test_writes_are_coalesced_per_project_and_key(storage):
+    for version in range(3):
+        await CachePersister.mark("p1", "h1_document", {"version": version})
+    for entry in range(4):
+        await CachePersister.mark("p1", "agent_message_history", [{"id": entry}], append=True)
+    await CachePersister.mark("p2", "raw_document", {"version": 0})
+
+    assert storage.batches == []
+    assert await CachePersister.flush()
+
+    assert storage.batches == [
+        ("p1", [
+            {"key_name": "h1_document", "content": {"version": 2}, "append": False},
+            {"key_name": "agent_message_history", "content": [{"id": i} for i in range(4)], "append": True},
+        ]),
+        ("p2", [{"key_name": "raw_document", "content": {"version": 0}, "append": False}]),
+    ]
+    stats = CachePersister.stats()
+    assert stats["coalesced"] == 5
+    assert stats["batches"] == 2
+    assert stats["entries_flushed"] == 4
+    assert stats["pending_items"] == 0
+    assert stats["flush_lag"]["samples"] == 3
+
+
+@pytest.mark.asyncio
+async def test_only_new_entries_are_sent_after_flush(storage):
+    await CachePersister.mark("p1", "agent_state_history", [{"id": 0}], append=True)
+    await CachePersister.flush("p1")
+    await CachePersister.mark("p1", "agent_state_history", [{"id": 1}], append=True)
+    await CachePersister.flush("p1")
+
+    assert [items[0]["content"] for _, items in storage.batches] == [[{"id": 0}], [{"id": 1}]]
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_is_retried_in_order(storage):
+    storage.fail_times = 1
+    await CachePersister.mark("p1", "agent_state_history", [{"id": 0}], append=True)
+    await CachePersister.mark("p1", "h1_document", {"version": 0})
+
+    assert not await CachePersister.flush("p1")
+    assert CachePersister.stats()["pending_entries"] == 1
+
+    await CachePersister.mark("p1", "agent_state_history", [{"id": 1}], append=True)
+    await CachePersister.mark("p1", "h1_document", {"version": 1})
+    assert await CachePersister.flush("p1")
+
+    _, items = storage.batches[0]
+    assert items == [
+        {"key_name": "agent_state_history", "content": [{"id": 0}, {"id": 1}], "append": True},
+        {"key_name": "h1_document", "content": {"version": 1}, "append": False},
+    ]
+    assert CachePersister.stats()["failures"] == 1
+
+
+@pytest.mark.asyncio
+async def test_replace_after_append_keeps_latest_value(storage):
+    await CachePersister.mark("p1", "agent_state_history", [{"id": 0}], append=True)
+    await CachePersister.mark("p1", "agent_state_history", [], append=False)
+    await CachePersister.mark("p1", "agent_state_history", [{"id": 1}], append=True)
+    await CachePersister.flush()
+
+    assert storage.batches[0][1] == [{"key_name": "agent_state_history", "content": [{"id": 1}], "append": False}]
+
+
+@pytest.mark.asyncio
+async def test_discard_drops_pending_keys(storage):
+    await CachePersister.mark("p1", "h1_document", {"version": 0})
+    await CachePersister.mark("p1", "raw_document", {"version": 0})
+    await CachePersister.discard("p1", ["h1_document"])
+    await CachePersister.flush()
+
+    assert [item["key_name"] for item in storage.batches[0][1]] == ["raw_document"]
+
+
+@pytest.mark.asyncio
+async def test_background_flush_and_shutdown(storage, monkeypatch):
+    monkeypatch.setattr(settings, "CACHE_PERSIST_FLUSH_INTERVAL", 0.01)
+    await CachePersister.mark("p1", "h1_document", {"version": 0})
+    await asyncio.sleep(0.05)
+    assert len(storage.batches) == 1
+
+    monkeypatch.setattr(settings, "CACHE_PERSIST_FLUSH_INTERVAL", 60.0)
+    await CachePersister.mark("p1", "h1_document", {"version": 1})
+    await CachePersister.shutdown()
+    assert storage.batches[-1][1][0]["content"] == {"version": 1}
+    assert CachePersister.stats()["pending_items"] == 0
+
+
+@pytest.mark.asyncio
+async def test_write_through_when_disabled(storage, monkeypatch):
+    monkeypatch.setattr(settings, "CACHE_PERSIST_WRITE_BEHIND", False)
+    await CachePersister.mark("p1", "h1_document", {"version": 0})
+    assert len(storage.batches) == 1
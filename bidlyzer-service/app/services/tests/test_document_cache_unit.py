@@ -0,0 +1,156 @@
+import json
+import pytest
+from app.core.config import settings
+from app.core.redis_codec import RedisCodec
+from app.clients.tiptap.tools.text_index import document_fingerprint
+from app.services import cache_persister
+from app.services.cache import Cache
+from app.services.cache_persister import CachePersister
+from app.services.document_cache import DocumentCache, document_stage, dump_document
+from app.services.tests.fixtures.fake_redis import install_fake_redis
+
+pytestmark = [pytest.mark.unit]
+
+
+def make_doc(paragraphs: int = 3, text: str = "投标人须知") -> dict:
+    return {"type": "doc", "content": [
+        {"type": "paragraph", "content": [{"type": "text", "text": f"{text}{i}"}]} for i in range(paragraphs)
+    ]}
+
+
+class FakeStorage:
+    def __init__(self):
+        self.stored = {}
+
+    async def save_batch_to_django(self, items):
+        return True
+
+    async def get_from_django(self, params):
+        return self.stored.get(params["fields"], {"key_name": params["fields"], "content": None})
+
+    async def clear_storage(self, clear_fields):
+        return True
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    return install_fake_redis(monkeypatch)
+
+
+@pytest.fixture
+def cache(redis, monkeypatch):
+    storage = FakeStorage()
+    monkeypatch.setattr(cache_persister, "Storage", lambda project_id: storage)
+    monkeypatch.setattr(settings, "CACHE_PERSIST_WRITE_BEHIND", False)
+    DocumentCache.clear()
+    DocumentCache.reset_stats()
+    CachePersister.clear()
+    cache = Cache("p1")
+    cache.storage = storage
+    yield cache
+    DocumentCache.clear()
+    DocumentCache.reset_stats()
+    CachePersister.clear()
+
+
+def test_dump_document_version_is_content_fingerprint():
+    doc = make_doc()
+    payload, version, size = dump_document("raw_document", doc)
+
+    assert version == document_fingerprint(doc)
+    assert RedisCodec.decode(RedisCodec.encode(payload)) == {"key_name": "raw_document", "version": version, "content": doc}
+    assert dump_document("raw_document", make_doc())[1] == version
+    assert dump_document("raw_document", make_doc(text="评标办法"))[1] != version
+
+
+@pytest.mark.asyncio
+async def test_read_after_write_only_probes_version(cache, redis):
+    doc = make_doc()
+    assert await cache.save_document("raw_document", doc)
+
+    redis.commands.clear()
+    with document_stage("analyze_h1"):
+        assert await cache.get_document("raw_document") is doc
+
+    assert redis.commands == ["get"]
+    stage = DocumentCache.stats()["stages"]["analyze_h1"]
+    assert stage["hits"] == 1
+    assert stage["redis_bytes"] == 32
+
+
+@pytest.mark.asyncio
+async def test_version_change_from_other_process_is_detected(cache, redis):
+    await cache.save_document("h1_document", make_doc())
+
+    # 另一个进程写入新版本：Redis中的文档和版本号都已变化
+    newer = make_doc(text="评标办法")
+    payload, version, _ = dump_document("h1_document", newer)
+    encoded = RedisCodec.encode(payload)
+    redis.data[cache.get_cache_keys()["h1_document"]] = encoded
+    redis.data[cache._version_key("h1_document")] = version
+
+    with document_stage("analyze_h2h3"):
+        assert await cache.get_document("h1_document") == newer
+        assert await cache.get_document("h1_document") == newer
+
+    stage = DocumentCache.stats()["stages"]["analyze_h2h3"]
+    assert (stage["reads"], stage["hits"]) == (2, 1)
+    assert stage["redis_bytes"] == len(encoded) + 2 * len(version)
+
+
+@pytest.mark.asyncio
+async def test_legacy_document_without_version(cache, redis):
+    doc = make_doc()
+    redis.data[cache.get_cache_keys()["raw_document"]] = json.dumps({"key_name": "raw_document", "content": doc})
+
+    assert await cache.get_document("raw_document") == doc
+    assert cache._version_key("raw_document") in redis.data
+    assert await cache.get_document("raw_document") == doc
+    assert DocumentCache.stats()["stages"]["unknown"]["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_restore_from_storage_writes_version(cache, redis):
+    doc = make_doc()
+    cache.storage.stored["final_document"] = {"key_name": "final_document", "content": doc}
+
+    assert await cache.get_document("final_document") == doc
+    assert redis.data[cache._version_key("final_document")] == document_fingerprint(doc)
+
+
+@pytest.mark.asyncio
+async def test_document_index_reuses_version(cache):
+    await cache.save_document("raw_document", make_doc())
+    index = await cache.get_document_index("raw_document")
+
+    assert index.fingerprint == document_fingerprint(make_doc())
+    assert await cache.get_document_index("raw_document") is index
+
+
+def test_size_aware_eviction(monkeypatch):
+    DocumentCache.clear()
+    monkeypatch.setattr(settings, "DOCUMENT_CACHE_MAX_BYTES", 250)
+    for i in range(3):
+        DocumentCache.put("p1", f"doc{i}", "v", {"i": i}, size=100)
+
+    assert DocumentCache.get("p1", "doc0", "v") is None
+    assert DocumentCache.get("p1", "doc2", "v") == {"i": 2}
+    assert DocumentCache.stats()["bytes"] == 200
+
+    # 新版本替换旧版本；超过容量的文档不缓存
+    DocumentCache.put("p1", "doc2", "v2", {"i": 22}, size=100)
+    assert DocumentCache.get("p1", "doc2", "v") is None
+    DocumentCache.put("p1", "huge", "v", {}, size=1000)
+    assert DocumentCache.get("p1", "huge", "v") is None
+    assert DocumentCache.stats()["bytes"] == 200
+    DocumentCache.clear()
+    DocumentCache.reset_stats()
+
+
+@pytest.mark.asyncio
+async def test_clean_up_invalidates_documents(cache, redis):
+    await cache.save_document("h1_document", make_doc())
+    await cache.clean_up(["h1_document"])
+
+    assert cache._version_key("h1_document") not in redis.data
+    assert DocumentCache.stats()["entries"] == 0
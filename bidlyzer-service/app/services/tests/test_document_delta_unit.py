@@ -0,0 +1,192 @@
+import copy
+import random
+import orjson
+import pytest
+from app.core.config import settings
+from app.core.redis_codec import RedisCodec
+from app.services import cache as cache_module, cache_persister
+from app.services.cache import Cache
+from app.services.cache_persister import CachePersister
+from app.services.document_cache import DocumentCache
+from app.services.document_delta import DocumentDelta, is_delta
+from app.services.tests.fixtures.fake_redis import install_fake_redis
+
+pytestmark = [pytest.mark.unit]
+
+
+def make_doc(paragraphs: int = 40, text: str = "投标人须知") -> dict:
+    return {"type": "doc", "content": [
+        {"type": "paragraph", "attrs": {"textAlign": "left"}, "content": [{"type": "text", "text": f"{text}第{i}条"}]}
+        for i in range(paragraphs)
+    ]}
+
+
+def with_headings(doc: dict, positions, level: int) -> dict:
+    """模拟分析阶段：把部分段落改为标题"""
+    doc = copy.deepcopy(doc)
+    for i in positions:
+        doc["content"][i] = {"type": "heading", "attrs": {"level": level}, "content": doc["content"][i]["content"]}
+    return doc
+
+
+def jsonb(value):
+    """模拟django JSONB存储：键的顺序改变"""
+    if isinstance(value, dict):
+        return {key: jsonb(value[key]) for key in sorted(value, reverse=True)}
+    if isinstance(value, list):
+        return [jsonb(item) for item in value]
+    return value
+
+
+class FakeStorage:
+    """保存提交的字段（整体替换），读取时按JSONB的方式返回"""
+
+    def __init__(self):
+        self.stored = {}
+
+    async def save_batch_to_django(self, items):
+        for item in items:
+            self.stored[item["key_name"]] = orjson.loads(orjson.dumps(item["content"]))
+        return True
+
+    async def get_from_django(self, params):
+        return {"key_name": params["fields"], "content": jsonb(self.stored.get(params["fields"]))}
+
+    async def clear_storage(self, clear_fields):
+        for key_name in clear_fields:
+            self.stored.pop(key_name, None)
+        return True
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    return install_fake_redis(monkeypatch)
+
+
+@pytest.fixture(autouse=True)
+def clean():
+    for cls in (DocumentCache, DocumentDelta, CachePersister):
+        cls.clear()
+    DocumentDelta.reset_stats()
+    yield
+    for cls in (DocumentCache, DocumentDelta, CachePersister):
+        cls.clear()
+    DocumentDelta.reset_stats()
+
+
+@pytest.fixture
+def storage(redis, monkeypatch):
+    storage = FakeStorage()
+    monkeypatch.setattr(cache_persister, "Storage", lambda project_id: storage)
+    monkeypatch.setattr(cache_module, "Storage", lambda project_id: storage)
+    monkeypatch.setattr(settings, "CACHE_PERSIST_WRITE_BEHIND", False)
+    return storage
+
+
+@pytest.fixture
+def cache(storage) -> Cache:
+    return Cache("p1")
+
+
+def test_diff_and_apply_reconstruct_any_edit():
+    rng = random.Random(7)
+    for trial in range(500):
+        base = {"type": "doc", "content": [{"type": "paragraph", "attrs": {"n": rng.randint(0, 5)}} for _ in range(rng.randint(0, 12))]}
+        content = {"type": "doc", "attrs": {"v": 1}, "content": [{"type": "paragraph", "attrs": {"n": rng.randint(0, 5)}} for _ in range(rng.randint(0, 12))]}
+        delta = DocumentDelta.diff("p1", f"v{trial}", base, content, size=10 ** 6)
+
+        assert DocumentDelta.apply("p1", f"v{trial}", base, orjson.loads(orjson.dumps(delta.to_redis()))) == content
+
+
+def test_delta_keeps_only_changed_nodes():
+    raw = make_doc()
+    h1 = with_headings(raw, [0, 10, 20], level=1)
+    h1["content"].insert(5, {"type": "paragraph", "content": [{"type": "text", "text": "前言"}]})
+
+    delta = DocumentDelta.diff("p1", "v1", raw, h1, size=len(orjson.dumps(h1)))
+
+    assert len(delta.nodes) == 4
+    assert DocumentDelta.apply("p1", "v1", raw, delta.to_storage()) == h1
+
+
+@pytest.mark.asyncio
+async def test_later_versions_are_stored_as_delta_of_raw_document(cache, redis, storage):
+    raw = make_doc()
+    h1 = with_headings(raw, [0, 10, 20], level=1)
+    h2h3 = with_headings(h1, [3, 4, 12, 25], level=2)
+    for key_name, doc in (("raw_document", raw), ("h1_document", h1), ("h2h3_document", h2h3)):
+        assert await cache.save_document(key_name, doc)
+
+    full = RedisCodec.decode(redis.data[cache.get_cache_keys()["raw_document"]])
+    stored = RedisCodec.decode(redis.data[cache.get_cache_keys()["h2h3_document"]])
+    assert "content" in full and "content" not in stored
+    assert len(orjson.dumps(stored)) < len(orjson.dumps(full)) / 3
+    assert is_delta(storage.stored["h2h3_document"]) and not is_delta(storage.stored["raw_document"])
+
+    # 其他进程读取（进程内缓存未命中）：在raw_document上重建，未变化的节点与raw_document共享
+    DocumentCache.clear()
+    document = await Cache("p1").get_document("h2h3_document")
+    assert document == h2h3
+    assert document["content"][1] is (await cache.get_document("raw_document"))["content"][1]
+    assert DocumentDelta.stats()["deltas"] == 2
+
+
+@pytest.mark.asyncio
+async def test_restore_delta_from_django(cache, redis, storage):
+    raw = make_doc()
+    final = with_headings(raw, [0, 7], level=1)
+    await cache.save_document("raw_document", raw)
+    await cache.save_document("final_document", final)
+
+    # Redis缓存过期，django中的数据键顺序被JSONB改变
+    redis.data.clear()
+    DocumentCache.clear()
+    DocumentDelta.clear()
+
+    assert await Cache("p1").get_document("final_document") == final
+    assert is_delta(RedisCodec.decode(redis.data[cache.get_cache_keys()["final_document"]])["delta"])
+
+
+@pytest.mark.asyncio
+async def test_delta_is_invalid_after_base_document_changes(cache):
+    raw = make_doc()
+    await cache.save_document("raw_document", raw)
+    await cache.save_document("h1_document", with_headings(raw, [0], level=1))
+    await cache.save_document("raw_document", make_doc(text="评标办法"))
+    DocumentCache.clear()
+
+    assert await Cache("p1").get_document("h1_document") is None
+    assert DocumentDelta.stats()["base_mismatches"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_large_changes_are_stored_in_full(cache, redis, storage):
+    await cache.save_document("raw_document", make_doc())
+    await cache.save_document("intro_document", make_doc(text="评标办法"))
+
+    assert "content" in RedisCodec.decode(redis.data[cache.get_cache_keys()["intro_document"]])
+    assert not is_delta(storage.stored["intro_document"])
+    assert DocumentDelta.stats()["full"] == 1
+
+
+@pytest.mark.asyncio
+async def test_delta_disabled(cache, redis, monkeypatch):
+    monkeypatch.setattr(settings, "DOCUMENT_DELTA_ENABLED", False)
+    raw = make_doc()
+    await cache.save_document("raw_document", raw)
+    await cache.save_document("h1_document", with_headings(raw, [0], level=1))
+
+    assert "content" in RedisCodec.decode(redis.data[cache.get_cache_keys()["h1_document"]])
+
+
+@pytest.mark.asyncio
+async def test_clean_up_base_document_also_cleans_deltas(cache, redis, storage):
+    raw = make_doc()
+    await cache.save_document("raw_document", raw)
+    await cache.save_document("h1_document", with_headings(raw, [0], level=1))
+
+    results = await cache.clean_up(["raw_document"])
+
+    assert results["h1_document"] is True
+    assert cache.get_cache_keys()["h1_document"] not in redis.data
+    assert "h1_document" not in storage.stored
@@ -0,0 +1,115 @@
+import pytest
+from app.clients.tiptap.tools import DocumentTextIndex, format_md_element
+from app.services.heading_candidates import HeadingCandidateFilter
+from app.services.tests.fixtures.heading_candidates import labelled_documents, paragraph, heading
+
+pytestmark = [pytest.mark.unit]
+
+
+def make_index(nodes):
+    return DocumentTextIndex({"type": "doc", "content": nodes})
+
+
+def document_lines(index):
+    """与L1上下文一致的格式化行（表格的markdown用占位文本代替）"""
+    return [
+        (entry.position, format_md_element({"content": entry.text if entry.type != "table" else "| 表格 |" * 20, "position": entry.position}))
+        for entry in index if entry.text
+    ]
+
+
+@pytest.mark.parametrize("sample", labelled_documents(), ids=lambda sample: sample["name"])
+def test_recall_on_labelled_documents(sample):
+    index = make_index(sample["doc"]["content"])
+    candidates = HeadingCandidateFilter().select(index)
+
+    assert candidates is not None
+    missed = set(sample["headings"]) - candidates
+    assert not missed, f"漏掉的标题: {[index.text(position) for position in sorted(missed)]}"
+
+
+@pytest.mark.parametrize("sample", labelled_documents(), ids=lambda sample: sample["name"])
+def test_filtered_context_is_several_times_smaller(sample):
+    index = make_index(sample["doc"]["content"])
+    heading_filter = HeadingCandidateFilter()
+    lines = document_lines(index)
+
+    result = heading_filter.filter_lines(lines, index, heading_filter.select(index))
+
+    full = sum(len(line) for _, line in lines)
+    filtered = sum(len(line) for _, line in result.lines)
+    assert filtered * 3 < full
+    assert result.lines_in == len(lines)
+
+
+def test_numbering_length_and_bold_features():
+    nodes = [
+        paragraph("第三章 评标办法"),
+        paragraph("二、资格要求"),
+        paragraph("（一）一般规定"),
+        paragraph("1.2.3 投标有效期"),
+        paragraph("投标人须知前附表", bold=True),
+        paragraph("1、投标人应具有独立法人资格，并提供有效的营业执照。"),
+        paragraph("2.1.1 " + "投标人应按招标文件的要求编制投标文件，投标文件应对招标文件提出的实质性要求和条件作出响应。" * 2),
+        paragraph("联系人：张三"),
+        heading("已有的标题", 2),
+    ]
+    candidates = HeadingCandidateFilter().candidates(make_index(nodes))
+
+    assert set(candidates) == {0, 1, 2, 3, 4, 8}
+    assert "numbering:chapter" in candidates[0].reasons
+    assert "bold" in candidates[4].reasons
+
+
+def test_toc_lines_are_excluded_but_matched():
+    nodes = [
+        paragraph("目录"),
+        paragraph("采购公告…………2"),
+        paragraph("服务需求书", style="toc-1"),
+        paragraph("采购公告"),
+        paragraph("服务需求书"),
+        paragraph("采购公告附件"),
+    ]
+    candidates = HeadingCandidateFilter().candidates(make_index(nodes))
+
+    assert set(candidates) == {3, 4}
+    assert "toc_match" in candidates[3].reasons
+
+
+def test_too_few_candidates_falls_back_to_full_context():
+    nodes = [paragraph("正文内容，没有任何编号或格式特征。" * 3) for _ in range(10)]
+    index = make_index(nodes)
+    heading_filter = HeadingCandidateFilter()
+
+    assert heading_filter.select(index) is None
+    result = heading_filter.unfiltered(document_lines(index))
+    assert not result.applied
+    assert len(result.lines) == 10
+
+
+def test_filter_lines_keeps_context_and_marks_gaps():
+    nodes = [paragraph("第一章 总则")] + [paragraph("正文" * 40) for _ in range(5)] + [paragraph("第二章 附则")] + [paragraph("正文" * 40)]
+    index = make_index(nodes)
+    lines = document_lines(index)
+
+    result = HeadingCandidateFilter(context_size=1, context_chars=10).filter_lines(lines, index, {0, 6})
+    kept = dict(result.lines)
+
+    assert list(kept) == [0, 1, 5, 6, 7]
+    assert kept[0] == lines[0][1]
+    assert kept[1] == "content: " + "正文" * 5 + "... | position: 1"
+    assert kept[5].startswith("[省略3条正文]\n")
+    assert (result.candidates, result.context, result.elided) == (2, 3, 3)
+
+
+def test_filter_lines_keeps_extra_positions_and_elides_tables():
+    nodes = [paragraph("章节标题")] + [{"type": "table", "content": []}] + [paragraph("正文" * 40) for _ in range(3)] + [paragraph("一、概述")]
+    index = make_index(nodes)
+    lines = [(position, f"line {position}") for position in range(len(nodes))]
+
+    result = HeadingCandidateFilter(context_size=1).filter_lines(lines, index, {5}, keep=[0])
+    kept = dict(result.lines)
+
+    assert kept[0] == "line 0"
+    assert kept[1] == "[table]: 表格内容此处省略... | position: 1"
+    assert kept[4].startswith("[省略2条正文]\n")
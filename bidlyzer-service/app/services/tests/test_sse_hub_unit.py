@@ -0,0 +1,118 @@
+import asyncio
+import time
+import pytest
+import pytest_asyncio
+from app.core.config import settings
+from app.core.redis_helper import RedisClient
+from app.services.sse_hub import SSEHub, RESYNC
+from app.services.tests.fixtures.fake_redis import install_fake_redis
+
+pytestmark = [pytest.mark.unit]
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    return install_fake_redis(monkeypatch)
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def clean(redis):
+    SSEHub.clear()
+    SSEHub.reset_stats()
+    yield
+    await SSEHub.shutdown()
+    SSEHub.clear()
+    SSEHub.reset_stats()
+
+
+async def wait_subscribed(redis):
+    while not redis.pubsubs or not redis.pubsubs[0].patterns:
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_one_subscription_fans_out_to_connections_of_the_channel(redis):
+    async with SSEHub.connect("p1:sse_channel") as a, SSEHub.connect("p1:sse_channel") as b, SSEHub.connect("p2:sse_channel") as c:
+        await wait_subscribed(redis)
+
+        await RedisClient.publish("p1:sse_channel", {"event": "state_update"})
+        await RedisClient.publish("p3:sse_channel", {"event": "state_update"})
+
+        assert await a.get(timeout=1) == await b.get(timeout=1) == '{"event": "state_update"}'
+        assert await c.get(timeout=0.01) is None
+        assert len(redis.pubsubs) == 1 and redis.pubsubs[0].patterns == [settings.SSE_HUB_CHANNEL_PATTERN]
+
+        stats = SSEHub.stats()
+        assert (stats["connections"], stats["channels"], stats["received"], stats["dispatched"], stats["unrouted"]) == (3, 2, 2, 2, 1)
+        assert stats["dispatch_latency"]["samples"] == 2
+
+    assert SSEHub.stats()["connections"] == 0
+    assert SSEHub.stats()["channels"] == 0
+
+
+@pytest.mark.asyncio
+async def test_idle_connection_blocks_until_timeout():
+    async with SSEHub.connect("p1:sse_channel") as connection:
+        start = time.monotonic()
+        assert await connection.get(timeout=0.05) is None
+        assert time.monotonic() - start >= 0.05
+
+
+@pytest.mark.asyncio
+async def test_full_queue_requests_resync_instead_of_dropping_silently(monkeypatch):
+    monkeypatch.setattr(settings, "SSE_HUB_QUEUE_SIZE", 2)
+    async with SSEHub.connect("p1:sse_channel") as slow, SSEHub.connect("p1:sse_channel") as fast:
+        for i in range(2):
+            SSEHub.dispatch("p1:sse_channel", str(i))
+        assert [await fast.get(timeout=1), await fast.get(timeout=1)] == ["0", "1"]
+
+        # 慢连接溢出：待发送的消息清空，溢出期间的消息也不再入队，只收到一个RESYNC
+        SSEHub.dispatch("p1:sse_channel", "2")
+        SSEHub.dispatch("p1:sse_channel", "3")
+        assert await slow.get(timeout=1) is RESYNC
+        assert await slow.get(timeout=0.01) is None
+        assert [await fast.get(timeout=1), await fast.get(timeout=1)] == ["2", "3"]
+
+        # 重新同步之后照常接收
+        SSEHub.dispatch("p1:sse_channel", "4")
+        assert await slow.get(timeout=1) == "4"
+        stats = SSEHub.stats()
+        assert stats["overflows"] == 1
+        assert stats["dropped"] == 4
+
+
+@pytest.mark.asyncio
+async def test_resubscribes_after_connection_error(redis, monkeypatch):
+    monkeypatch.setattr(SSEHub, "_retry_delay", 0.01)
+    async with SSEHub.connect("p1:sse_channel") as connection:
+        await wait_subscribed(redis)
+        first = redis.pubsubs[0]
+        first.messages.put_nowait(ConnectionError("Connection reset by peer"))
+        while not redis.pubsubs or redis.pubsubs[0] is first:
+            await asyncio.sleep(0.01)
+        await wait_subscribed(redis)
+
+        await RedisClient.publish("p1:sse_channel", "after reconnect")
+        assert await connection.get(timeout=1) == "after reconnect"
+        assert SSEHub.stats()["reconnects"] == 1
+
+
+@pytest.mark.asyncio
+async def test_thousands_of_idle_connections(redis):
+    channels = [f"p{i % 500}:sse_channel" for i in range(2000)]
+    connections = [SSEHub.connect(channel) for channel in channels]
+    entered = [await context.__aenter__() for context in connections]
+    await wait_subscribed(redis)
+
+    waiters = [asyncio.ensure_future(connection.get(timeout=5)) for connection in entered]
+    await RedisClient.publish("p7:sse_channel", "hello")
+    done, pending = await asyncio.wait(waiters, timeout=0.5)
+
+    assert [waiter.result() for waiter in done] == ["hello"] * 4
+    assert SSEHub.stats()["max_connections"] == 2000
+    for waiter in pending:
+        waiter.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    for context in connections:
+        await context.__aexit__(None, None, None)
+    assert SSEHub.stats()["connections"] == 0
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import pytest
+import pytest_asyncio
+from app.core.config import settings
+from app.core.redis_helper import parse_stream_id
+from app.services import cache as cache_module, cache_persister
+from app.services.cache import Cache
+from app.services.bp_msg import AgentMessage, SSEData
+from app.services.sse_hub import SSEHub
+from app.services.tests.fixtures.fake_redis import install_fake_redis
+
+pytestmark = [pytest.mark.unit]
+
+
+class FakeStorage:
+    async def save_batch_to_django(self, items):
+        return True
+
+    async def get_from_django(self, params):
+        return {"key_name": params["fields"], "content": None}
+
+    async def clear_storage(self, clear_fields):
+        return True
+
+
+def make_message(i: int) -> AgentMessage:
+    return AgentMessage(id=f"m{i}", event="state_update", retry=3000, data=SSEData(
+        stage="structuring", step="analyze_h1", message=f"第{i}条消息", show_results=False, result_key_names=None,
+        required_action=False, action_status=None, action_type=None,
+    ))
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    return install_fake_redis(monkeypatch)
+
+
+@pytest.fixture
+def cache(redis, monkeypatch):
+    storage = FakeStorage()
+    monkeypatch.setattr(cache_persister, "Storage", lambda project_id: storage)
+    monkeypatch.setattr(cache_module, "Storage", lambda project_id: storage)
+    monkeypatch.setattr(settings, "CACHE_PERSIST_WRITE_BEHIND", False)
+    return Cache("p1")
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def clean():
+    SSEHub.clear()
+    SSEHub.reset_stats()
+    yield
+    await SSEHub.shutdown()
+    SSEHub.clear()
+    SSEHub.reset_stats()
+
+
+async def publish_messages(cache, redis, count: int) -> list:
+    """发布count条消息，返回各条消息的Stream ID（发布的消息中带有）"""
+    for i in range(count):
+        assert await cache.save_agent_message(make_message(i), publish=True)
+    return [json.loads(message)["stream_id"] for _, message in redis.published[-count:]]
+
+
+@pytest.mark.asyncio
+async def test_replay_returns_only_missed_messages(cache, redis):
+    stream_ids = await publish_messages(cache, redis, 5)
+
+    redis.commands.clear()
+    missed = await cache.get_agent_messages_since(stream_ids[1])
+
+    assert [stream_id for stream_id, _ in missed] == stream_ids[2:]
+    assert [message["id"] for _, message in missed] == ["m2", "m3", "m4"]
+    assert AgentMessage(**missed[0][1]).data.message == "第2条消息"
+    assert redis.commands == ["xrange"]
+    assert await cache.get_agent_messages_since(stream_ids[-1]) == []
+
+
+@pytest.mark.asyncio
+async def test_published_messages_carry_stream_id_in_order(cache, redis):
+    async with SSEHub.connect(cache.get_channel_keys()["sse_channel"]) as connection:
+        while not redis.pubsubs or not redis.pubsubs[0].patterns:
+            await asyncio.sleep(0)
+        stream_ids = await publish_messages(cache, redis, 3)
+
+        received = [json.loads(await connection.get(timeout=1)) for _ in stream_ids]
+
+    assert [message["stream_id"] for message in received] == stream_ids
+    assert [message["id"] for message in received] == ["m0", "m1", "m2"]
+    assert sorted(stream_ids, key=parse_stream_id) == stream_ids
+
+
+@pytest.mark.asyncio
+async def test_trimmed_or_unknown_id_requires_resync(cache, redis, monkeypatch):
+    monkeypatch.setattr(settings, "SSE_STREAM_MAX_LEN", 3)
+    stream_ids = await publish_messages(cache, redis, 5)
+
+    assert len(redis.data[cache.get_channel_keys()["sse_stream"]]) == 3
+    assert await cache.get_agent_messages_since(stream_ids[0]) is None       # 已被截断
+    assert await cache.get_agent_messages_since("m1") is None                # 旧版本的事件id（消息uuid）
+    assert await cache.get_agent_messages_since("1-0") is None               # 不在Stream中
+    assert [message["id"] for _, message in await cache.get_agent_messages_since(stream_ids[2])] == ["m3", "m4"]
+
+
+@pytest.mark.asyncio
+async def test_clean_up_message_history_removes_stream(cache, redis):
+    stream_ids = await publish_messages(cache, redis, 2)
+
+    await cache.clean_up(["agent_message_history"])
+
+    assert cache.get_channel_keys()["sse_stream"] not in redis.data
+    assert await cache.get_agent_messages_since(stream_ids[0]) is None
@@ -0,0 +1,91 @@
+import pytest
+from app.services.token_budget import BudgetItem, plan_windows, pack_bins, total_tokens
+
+pytestmark = [pytest.mark.unit]
+
+
+def make_items(token_counts):
+    return [BudgetItem(key=i, text=f"content: p{i} | position: {i}", tokens=t) for i, t in enumerate(token_counts)]
+
+
+def test_small_input_is_one_window():
+    items = make_items([10, 10, 10])
+    windows = plan_windows(items, budget=100)
+    assert len(windows) == 1
+    assert windows[0].tokens == 30
+
+
+def test_windows_respect_budget_and_cover_all_items():
+    items = make_items([30] * 20)
+    windows = plan_windows(items, budget=100, overlap_tokens=0)
+
+    assert all(window.tokens <= 100 for window in windows)
+    covered = [item.key for window in windows for item in window.items]
+    assert covered == list(range(20))
+
+
+def test_windows_overlap():
+    items = make_items([30] * 20)
+    windows = plan_windows(items, budget=100, overlap_tokens=30)
+
+    assert len(windows) > 1
+    for previous, current in zip(windows, windows[1:]):
+        assert current.overlap == 1
+        assert current.items[0].key == previous.items[-1].key
+        assert current.tokens <= 100
+
+    keys = {item.key for window in windows for item in window.items}
+    assert keys == set(range(20))
+
+
+def test_windows_always_make_progress():
+    # 重叠预算大于窗口内容时也必须向前推进
+    items = make_items([40] * 10)
+    windows = plan_windows(items, budget=100, overlap_tokens=1000)
+    assert windows[-1].last_key == 9
+    assert len(windows) < 10 * 2
+
+
+def test_oversized_item_gets_its_own_window():
+    items = make_items([10, 500, 10])
+    windows = plan_windows(items, budget=100)
+    assert [window.first_key for window in windows] == [0, 1, 2]
+
+
+def test_describe_and_total_tokens():
+    items = make_items([5, 5])
+    window = plan_windows(items, budget=100)[0]
+    assert window.describe() == {"index": 0, "start": 0, "end": 1, "items": 2, "overlap": 0, "tokens": 10}
+    assert total_tokens(items) == 10
+
+
+def test_invalid_budget():
+    with pytest.raises(ValueError):
+        plan_windows(make_items([1]), budget=0)
+
+
+def test_pack_bins_reduces_requests_within_budget():
+    items = make_items([60, 10, 30, 50, 40, 10])
+    bins = pack_bins(items, budget=100)
+
+    assert len(bins) == 2
+    assert all(total_tokens(bin_items) <= 100 for bin_items in bins)
+    assert sorted(item.key for bin_items in bins for item in bin_items) == list(range(6))
+
+
+def test_pack_bins_keeps_input_order():
+    bins = pack_bins(make_items([60, 10, 30, 50, 40, 10]), budget=100)
+    for bin_items in bins:
+        keys = [item.key for item in bin_items]
+        assert keys == sorted(keys)
+    assert [bin_items[0].key for bin_items in bins] == sorted(bin_items[0].key for bin_items in bins)
+
+
+def test_pack_bins_max_items():
+    bins = pack_bins(make_items([1] * 10), budget=100, max_items=3)
+    assert [len(bin_items) for bin_items in bins] == [3, 3, 3, 1]
+
+
+def test_pack_bins_oversized_item_alone():
+    bins = pack_bins(make_items([150, 10]), budget=100)
+    assert [[item.key for item in bin_items] for bin_items in bins] == [[0], [1]]
@@ -0,0 +1,132 @@
+from dataclasses import dataclass, field
+from typing import List, Any, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BudgetItem:
+    """参与token预算规划的最小单元（如一个段落、一个表格）"""
+    key: Any
+    text: str
+    tokens: int
+
+
+@dataclass
+class TokenWindow:
+    """一个窗口：一次LLM请求的上下文"""
+    index: int
+    items: List[BudgetItem] = field(default_factory=list)
+    overlap: int = 0  # 开头从上一个窗口重复带入的条目数
+
+    @property
+    def tokens(self) -> int:
+        return sum(item.tokens for item in self.items)
+
+    @property
+    def first_key(self) -> Any:
+        return self.items[0].key if self.items else None
+
+    @property
+    def last_key(self) -> Any:
+        return self.items[-1].key if self.items else None
+
+    def text(self, separator: str = "\n") -> str:
+        return separator.join(item.text for item in self.items)
+
+    def describe(self) -> dict:
+        return {
+            "index": self.index,
+            "start": self.first_key,
+            "end": self.last_key,
+            "items": len(self.items),
+            "overlap": self.overlap,
+            "tokens": self.tokens,
+        }
+
+
+def plan_windows(items: List[BudgetItem], budget: int, overlap_tokens: int = 0) -> List[TokenWindow]:
+    """
+    将有序条目切分为token数不超过budget的窗口，相邻窗口之间重叠约overlap_tokens个token
+
+    - 条目保持原有顺序，不拆分单个条目
+    - 单个条目超过budget时单独成窗（并记录告警），由调用方决定是否截断
+    - 重叠部分取上一个窗口末尾的条目，保证标题与其后文不会恰好被切断在窗口边界
+    """
+    if budget <= 0:
+        raise ValueError("budget必须大于0")
+
+    windows: List[TokenWindow] = []
+    current = TokenWindow(index=0)
+    current_tokens = 0
+
+    for item in items:
+        if current.items and current_tokens + item.tokens > budget:
+            windows.append(current)
+            carried = _overlap_tail(current.items, overlap_tokens, budget - item.tokens)
+            current = TokenWindow(index=len(windows), items=list(carried), overlap=len(carried))
+            current_tokens = sum(carried_item.tokens for carried_item in carried)
+
+        if item.tokens > budget:
+            logger.warning(f"单个条目超过token预算: key={item.key}, tokens={item.tokens}, budget={budget}")
+
+        current.items.append(item)
+        current_tokens += item.tokens
+
+    if current.items and len(current.items) > current.overlap:
+        windows.append(current)
+
+    return windows
+
+
+def _overlap_tail(items: List[BudgetItem], overlap_tokens: int, room: int) -> List[BudgetItem]:
+    """取上一个窗口末尾不超过overlap_tokens（且不挤占下一个条目空间）的条目"""
+    limit = min(overlap_tokens, room)
+    if limit <= 0:
+        return []
+
+    tail: List[BudgetItem] = []
+    used = 0
+    # 至少留一个条目不重叠，保证窗口向前推进
+    for item in reversed(items[1:]):
+        if used + item.tokens > limit:
+            break
+        tail.insert(0, item)
+        used += item.tokens
+    return tail
+
+
+def pack_bins(items: List[BudgetItem], budget: int, max_items: Optional[int] = None) -> List[List[BudgetItem]]:
+    """
+    首次适应递减（FFD）装箱：把多个小条目装进token数不超过budget的箱子，尽量减少箱子数量
+
+    - 每个箱子最多 max_items 个条目（None表示不限）
+    - 箱子内的条目按输入顺序排列，箱子按首个条目的输入顺序排列
+    - 超过budget的条目单独成箱
+    """
+    if budget <= 0:
+        raise ValueError("budget必须大于0")
+
+    order = {id(item): i for i, item in enumerate(items)}
+    bins: List[List[BudgetItem]] = []
+    loads: List[int] = []
+
+    for item in sorted(items, key=lambda x: x.tokens, reverse=True):
+        for i, load in enumerate(loads):
+            if load + item.tokens <= budget and (max_items is None or len(bins[i]) < max_items):
+                bins[i].append(item)
+                loads[i] += item.tokens
+                break
+        else:
+            bins.append([item])
+            loads.append(item.tokens)
+
+    for bin_items in bins:
+        bin_items.sort(key=lambda x: order[id(x)])
+    bins.sort(key=lambda bin_items: order[id(bin_items[0])])
+    return bins
+
+
+def total_tokens(items: List[BudgetItem]) -> int:
+    return sum(item.tokens for item in items)
@@ -0,0 +1,76 @@
+// 大模型流式输出的客户端还原 - 与后端 stream_coalescer.py 的增量协议对齐
+// 后端把token合并为带序号的增量消息: delta(从offset开始追加) / snapshot(完整快照) / end(最终完整内容)
+// reset: 后端重试请求, 之前的输出作废, 清空内容后重新开始(seq继续递增, generation加一)
+
+export type LLMStreamKind = 'delta' | 'snapshot' | 'end' | 'reset';
+
+export interface LLMStreamMessage {
+  kind: LLMStreamKind;
+  seq: number;
+  offset: number;
+  delta?: string;      // kind为delta时有效
+  content?: string;    // kind为snapshot/end时有效(reset时为空)
+  generation?: number; // 第几次尝试, 每次reset加一
+  task_id?: string | null;
+  finished: boolean;
+}
+
+// 按任务还原流式内容
+export class LLMStreamAssembler {
+  private content: string = '';
+  private lastSeq: number = 0;
+  private waitingSnapshot: boolean = false;  // 出现缺口后, 等待下一次快照重新同步
+  private finished: boolean = false;
+
+  // 应用一条消息, 返回当前可展示的内容
+  apply(message: LLMStreamMessage): string {
+    // 乱序到达的旧消息直接忽略
+    if (message.seq <= this.lastSeq) {
+      return this.content;
+    }
+    this.lastSeq = message.seq;
+
+    if (message.kind === 'snapshot' || message.kind === 'end' || message.kind === 'reset') {
+      this.content = message.content ?? '';
+      this.waitingSnapshot = false;
+      this.finished = message.kind === 'end';
+      return this.content;
+    }
+
+    if (this.waitingSnapshot) {
+      return this.content;
+    }
+
+    const delta = message.delta ?? '';
+    if (message.offset > this.content.length) {
+      // 中途加入或丢失了增量, 保留已有内容, 等待快照
+      this.waitingSnapshot = true;
+      return this.content;
+    }
+    // offset小于当前长度说明收到了重复部分, 只追加新的字符
+    if (message.offset + delta.length >= this.content.length) {
+      this.content = this.content.slice(0, message.offset) + delta;
+    }
+    return this.content;
+  }
+
+  getContent(): string {
+    return this.content;
+  }
+
+  isFinished(): boolean {
+    return this.finished;
+  }
+
+  // 是否处于缺口状态(内容不完整, 等待快照)
+  isStale(): boolean {
+    return this.waitingSnapshot;
+  }
+
+  reset(): void {
+    this.content = '';
+    this.lastSeq = 0;
+    this.waitingSnapshot = false;
+    this.finished = false;
+  }
+}